@@ -1,39 +1,197 @@
-from flask import Flask, request, jsonify
+import json
+import os
+import threading
+import time
+from flask import Flask, Response, g, request, jsonify, stream_with_context
 from flask_cors import CORS
 from services.file_search import FileSearchService
+from services.jobs import JobManager, JobsShuttingDown, SharedJobState
+from services.batch import BatchRunner
+from services.metrics import HTTP_IN_FLIGHT, HTTP_REQUEST_SECONDS, REGISTRY
+from services.results_store import ResultsStore
 from config import Config
 
 app = Flask(__name__)
 CORS(app)
 
+def create_job_manager():
+    """JobManager لهذا الـ process (مع حالة مشتركة بين الـ workers إذا حُدد JOB_STATE_PATH)"""
+    shared_state = None
+    if Config.JOB_STATE_PATH:
+        shared_state = SharedJobState(Config.JOB_STATE_PATH, Config.JOB_MAX_RETAINED, Config.JOB_STALE_SECONDS)
+    return JobManager(
+        max_workers=Config.JOB_MAX_WORKERS,
+        max_retained_jobs=Config.JOB_MAX_RETAINED,
+        shared_state=shared_state
+    )
+
 file_search_service = None
+batch_runner = None
+job_manager = create_job_manager()
+results_store = None
+_results_store_lock = threading.Lock()
 
-def initialize_services():
-    """Initialize File Search service on app startup"""
-    global file_search_service
-    
-    try:
-        Config.validate()
-        print("[INFO] Configuration validated successfully")
-    except ValueError as e:
-        print(f"[ERROR] {e}")
-        print("[INFO] Please check your .env file and ensure all required variables are set")
-        return False
+# حالة التهيئة الخلفية: starting → ready | failed (يعرضها /ready)
+startup_state = {
+    "status": "starting",
+    "error": None,
+    "store_id": None,
+    "started_at": time.time(),
+    "ready_seconds": None
+}
+
+def _initialize_store_background():
+    """بناء الخدمة والتحقق من الـ Store (أو إنشائه ورفع الملفات) بعد أن يبدأ الخادم بالاستماع"""
+    global file_search_service, batch_runner
+    started = time.monotonic()
     
     try:
-        file_search_service = FileSearchService()
+        service = FileSearchService()
         
         print("[INFO] Initializing File Search Store...")
-        store_id = file_search_service.initialize_store()
+        store_id = service.initialize_store()
         print(f"[SUCCESS] File Search Store initialized: {store_id}")
         
-        store_info = file_search_service.get_store_info()
-        print(f"[INFO] Store Info: {store_info}")
+        # المعلومات محفوظة من استدعاء التحقق نفسه، بدون طلب ثانٍ للـ API
+        print(f"[INFO] Store Info: {service.get_store_info()}")
         
-        return True
+        service.warm_up()
+        
+        batch_runner = BatchRunner(
+            service,
+            max_concurrency=Config.BATCH_MAX_CONCURRENCY,
+            max_contracts_per_minute=Config.BATCH_MAX_CONTRACTS_PER_MINUTE
+        )
+        file_search_service = service
+        
+        startup_state.update({
+            "status": "ready",
+            "store_id": store_id,
+            "ready_seconds": round(time.monotonic() - started, 3)
+        })
+        print(f"[SUCCESS] Services ready after {startup_state['ready_seconds']}s")
     except Exception as e:
+        startup_state.update({"status": "failed", "error": str(e)})
         print(f"[ERROR] Failed to initialize services: {e}")
+
+def _reset_after_fork():
+    """
+    حالة جديدة في الـ process الابن (gunicorn مع preload_app، أو أي fork بعد الاستيراد)
+
+    threads الـ executors و connections الـ SQLite/HTTP لا تنتقل عبر fork: كل worker يبني نسخته
+    """
+    global file_search_service, batch_runner, job_manager, results_store, _results_store_lock
+    file_search_service = None
+    batch_runner = None
+    results_store = None
+    _results_store_lock = threading.Lock()
+    job_manager = create_job_manager()
+    startup_state.update({
+        "status": "starting",
+        "error": None,
+        "store_id": None,
+        "started_at": time.time(),
+        "ready_seconds": None
+    })
+
+os.register_at_fork(after_in_child=_reset_after_fork)
+
+def begin_shutdown():
+    """
+    بداية إيقاف الـ worker: /ready يرجع 503 و /jobs يرفض الجديد
+
+    يُستدعى من signal handler: بدون locks أو I/O
+    """
+    startup_state["status"] = "draining"
+    job_manager.stop_accepting()
+
+def drain(timeout):
+    """انتظار الـ jobs الجارية حتى تكتمل (أو تنقضي المهلة) قبل خروج الـ worker"""
+    begin_shutdown()
+    started = time.monotonic()
+    unfinished = job_manager.drain(timeout)
+    if unfinished:
+        print(f"[WARNING] Drain timed out after {timeout:.0f}s, {unfinished} job(s) marked failed")
+    else:
+        print(f"[SUCCESS] All jobs drained in {time.monotonic() - started:.1f}s")
+
+def initialize_services():
+    """
+    Validate configuration and start service initialization in the background
+
+    Only the local config check blocks startup; the store verification/creation runs in a
+    thread so the server binds immediately (readiness is reported by /ready)
+    """
+    try:
+        Config.validate()
+        print("[INFO] Configuration validated successfully")
+    except ValueError as e:
+        print(f"[ERROR] {e}")
+        print("[INFO] Please check your .env file and ensure all required variables are set")
         return False
+    
+    threading.Thread(target=_initialize_store_background, name="service-init", daemon=True).start()
+    return True
+
+def get_results_store():
+    """سجل التحليلات (يُفتح عند أول استخدام، ويستورد ملفات results/ القديمة مرة واحدة)"""
+    global results_store
+    if results_store is None:
+        with _results_store_lock:
+            if results_store is None:
+                store = ResultsStore(Config.RESULTS_STORE_PATH)
+                if Config.RESULTS_LEGACY_DIR:
+                    store.import_json_dir(Config.RESULTS_LEGACY_DIR)
+                results_store = store
+    return results_store
+
+def service_not_ready(message="File Search Service not initialized"):
+    """503 أثناء التهيئة الخلفية (أو بعد فشلها) بدل 500، مع حالة التهيئة"""
+    return jsonify({
+        "error": message,
+        "startup_status": startup_state["status"],
+        "startup_error": startup_state["error"]
+    }), 503
+
+@app.before_request
+def start_request_timer():
+    g.request_started = time.monotonic()
+    HTTP_IN_FLIGHT.inc()
+
+def _request_endpoint():
+    # حسب المسار لا الـ URL الكامل، حتى لا تتضخم الـ labels بمعرفات الـ jobs
+    return request.url_rule.rule if request.url_rule else "unmatched"
+
+def _finish_request_metrics(started, endpoint, method, status):
+    HTTP_IN_FLIGHT.dec()
+    HTTP_REQUEST_SECONDS.observe(
+        time.monotonic() - started,
+        endpoint=endpoint, method=method, status=status
+    )
+
+@app.after_request
+def record_request_metrics(response):
+    """زمن كل طلب API في histogram - للاستجابات المتدفقة (SSE / NDJSON) حتى إغلاق الاستجابة لا أول byte"""
+    started = g.pop("request_started", None)
+    if started is not None:
+        labels = (started, _request_endpoint(), request.method, response.status_code)
+        if response.is_streamed:
+            response.call_on_close(lambda: _finish_request_metrics(*labels))
+        else:
+            _finish_request_metrics(*labels)
+    return response
+
+@app.teardown_request
+def record_failed_request_metrics(exc):
+    """الطلب الذي لم يصل لـ after_request (استثناء غير معالج): إنقاص الـ in-flight وتسجيله كـ 500"""
+    started = g.pop("request_started", None)
+    if started is not None:
+        _finish_request_metrics(started, _request_endpoint(), request.method, 500)
+
+@app.route('/metrics', methods=['GET'])
+def metrics():
+    """Prometheus metrics: phase/request latency histograms, Gemini 429/503 and retry counters, in-flight gauges"""
+    return Response(REGISTRY.render(), mimetype=REGISTRY.CONTENT_TYPE)
 
 @app.route('/health', methods=['GET'])
 def health_check():
@@ -43,25 +201,65 @@ def health_check():
         "message": "File Search API is running"
     })
 
+@app.route('/ready', methods=['GET'])
+def readiness_check():
+    """Readiness probe: 200 only after the store is verified and services are built"""
+    state = dict(startup_state)
+    state["uptime_seconds"] = round(time.time() - state.pop("started_at"), 3)
+    return jsonify(state), 200 if state["status"] == "ready" else 503
+
 @app.route('/store-info', methods=['GET'])
 def store_info():
     """Get File Search Store information"""
     if not file_search_service:
-        return jsonify({
-            "error": "Service not initialized"
-        }), 500
+        return service_not_ready("Service not initialized")
     
-    info = file_search_service.get_store_info()
+    refresh = request.args.get('refresh', 'false').lower() == 'true'
+    info = file_search_service.get_store_info(refresh=refresh)
     return jsonify(info)
 
+@app.route('/cache-stats', methods=['GET'])
+def cache_stats():
+    """Get result cache statistics (hits, misses, evictions)"""
+    if not file_search_service:
+        return service_not_ready("Service not initialized")
+    
+    return jsonify(file_search_service.get_cache_stats())
+
+@app.route('/gateway-stats', methods=['GET'])
+def gateway_stats():
+    """Get Gemini call gateway statistics (throttling, retries, concurrency limit)"""
+    if not file_search_service:
+        return service_not_ready("Service not initialized")
+    
+    return jsonify(file_search_service.get_gateway_stats())
+
+@app.route('/cost-stats', methods=['GET'])
+def cost_stats():
+    """Get the daily token/cost ledger and current per-call token estimates"""
+    if not file_search_service:
+        return service_not_ready("Service not initialized")
+    
+    return jsonify(file_search_service.get_cost_stats())
+
+@app.route('/cache/invalidate', methods=['POST'])
+def cache_invalidate():
+    """Clear result and clause caches (call after the store's contents change)"""
+    if not file_search_service:
+        return service_not_ready("Service not initialized")
+    
+    file_search_service.invalidate_caches()
+    return jsonify({
+        "status": "ok",
+        "message": "Caches invalidated"
+    })
+
 @app.route('/extract_terms', methods=['POST'])
 def extract_terms():
     """Extract key terms endpoint - extracts important clauses from contract"""
     
     if not file_search_service:
-        return jsonify({
-            "error": "File Search Service not initialized"
-        }), 500
+        return service_not_ready()
     
     try:
         data = request.get_json()
@@ -95,6 +293,58 @@ def extract_terms():
             "error": str(e)
         }), 500
 
+def build_file_search_response(contract_text, top_k, chunks, extracted_terms, usage=None, status=None):
+    """Build the /file_search response body (shared with the job API)"""
+    response = {
+        "contract_text": contract_text,
+        "extracted_terms": extracted_terms,
+        "chunks": chunks,
+        "total_chunks": len(chunks),
+        "top_k": top_k,
+        "message": "Two-step process: extracted key terms then searched File Search"
+    }
+    if status is not None:
+        response["partial"] = status.get("partial", False)
+        response["skipped_clauses"] = status.get("skipped_clauses", [])
+        response["elapsed_seconds"] = status.get("elapsed_seconds")
+    if usage is not None:
+        response["usage"] = usage
+    return response
+
+def run_file_search(contract_text, top_k, token_budget=None, deadline_seconds=None, report=None, source="api"):
+    """
+    Run search_chunks and build the response, capturing token usage and partial-result status
+
+    The result is saved to the results store; its ID is returned as analysis_id
+    """
+    usage = {}
+    status = {}
+    
+    def progress(event, data):
+        if event == "usage":
+            usage.update(data)
+        elif event == "search_status":
+            status.update(data)
+        if report:
+            report(event, data)
+    
+    chunks, extracted_terms = file_search_service.search_chunks(
+        contract_text, top_k, progress_callback=progress,
+        token_budget=token_budget, deadline_seconds=deadline_seconds
+    )
+    response = build_file_search_response(
+        contract_text, top_k, chunks, extracted_terms, usage or None, status or None
+    )
+    
+    if Config.RESULTS_STORE_ENABLED:
+        # فشل الحفظ لا يُفشل التحليل نفسه
+        try:
+            response["analysis_id"] = get_results_store().save(response, contract_text, source=source)["analysis_id"]
+        except Exception as e:
+            print(f"[WARNING] Could not save analysis to results store: {e}")
+    
+    return response
+
 @app.route('/file_search', methods=['POST'])
 def file_search():
     """
@@ -104,9 +354,7 @@ def file_search():
     """
     
     if not file_search_service:
-        return jsonify({
-            "error": "File Search Service not initialized"
-        }), 500
+        return service_not_ready()
     
     try:
         data = request.get_json()
@@ -118,6 +366,8 @@ def file_search():
         
         contract_text = data['contract_text']
         top_k = data.get('top_k', Config.TOP_K_CHUNKS)
+        token_budget = data.get('token_budget')
+        deadline_seconds = data.get('deadline_seconds')
         
         if not contract_text.strip():
             return jsonify({
@@ -127,18 +377,7 @@ def file_search():
         print(f"[INFO] Processing two-step file search request with top_k={top_k}")
         
         # ملاحظة: search_chunks الآن يرجع (chunks, extracted_terms)
-        chunks, extracted_terms = file_search_service.search_chunks(contract_text, top_k)
-        
-        response = {
-            "contract_text": contract_text,
-            "extracted_terms": extracted_terms,
-            "chunks": chunks,
-            "total_chunks": len(chunks),
-            "top_k": top_k,
-            "message": "Two-step process: extracted key terms then searched File Search"
-        }
-        
-        return jsonify(response)
+        return jsonify(run_file_search(contract_text, top_k, token_budget, deadline_seconds))
         
     except Exception as e:
         print(f"[ERROR] File search failed: {e}")
@@ -146,6 +385,207 @@ def file_search():
             "error": str(e)
         }), 500
 
+@app.route('/file_search/batch', methods=['POST'])
+def file_search_batch():
+    """
+    Batch file search - accepts JSONL (one {"id", "contract_text", "top_k"} per line)
+    or JSON {"contracts": [...], "skip_ids": [...]}, and streams JSONL results
+    as each contract finishes.
+    """
+    
+    if not file_search_service or not batch_runner:
+        return service_not_ready()
+    
+    skip_ids = set()
+    
+    try:
+        if request.is_json:
+            data = request.get_json()
+            contracts = data.get('contracts', []) if isinstance(data, dict) else data
+            if isinstance(data, dict):
+                skip_ids = set(data.get('skip_ids', []))
+        else:
+            body = request.get_data(as_text=True)
+            contracts = [json.loads(line) for line in body.splitlines() if line.strip()]
+    except (ValueError, AttributeError) as e:
+        return jsonify({
+            "error": f"Invalid batch body: {e}"
+        }), 400
+    
+    if not contracts:
+        return jsonify({
+            "error": "No contracts in request body"
+        }), 400
+    
+    print(f"[INFO] Processing batch of {len(contracts)} contract(s)")
+    
+    def generate():
+        for result in batch_runner.run(contracts, Config.TOP_K_CHUNKS, skip_ids):
+            yield json.dumps(result, ensure_ascii=False) + "\n"
+    
+    return Response(
+        stream_with_context(generate()),
+        mimetype='application/x-ndjson'
+    )
+
+@app.route('/jobs', methods=['POST'])
+def create_job():
+    """
+    Submit a file search job - returns a job ID immediately.
+    Poll GET /jobs/<id> or subscribe to GET /jobs/<id>/events for progress.
+    """
+    
+    if not file_search_service:
+        return service_not_ready()
+    
+    data = request.get_json()
+    
+    if not data or 'contract_text' not in data:
+        return jsonify({
+            "error": "Missing 'contract_text' in request body"
+        }), 400
+    
+    contract_text = data['contract_text']
+    top_k = data.get('top_k', Config.TOP_K_CHUNKS)
+    token_budget = data.get('token_budget')
+    deadline_seconds = data.get('deadline_seconds')
+    
+    if not contract_text.strip():
+        return jsonify({
+            "error": "Contract text cannot be empty"
+        }), 400
+    
+    def work(report):
+        return run_file_search(contract_text, top_k, token_budget, deadline_seconds, report, source="job")
+    
+    try:
+        job_id = job_manager.submit(work)
+    except JobsShuttingDown as e:
+        return jsonify({
+            "error": str(e)
+        }), 503
+    print(f"[INFO] Queued file search job {job_id} with top_k={top_k}")
+    
+    return jsonify({
+        "job_id": job_id,
+        "status": "queued",
+        "status_url": f"/jobs/{job_id}",
+        "events_url": f"/jobs/{job_id}/events"
+    }), 202
+
+@app.route('/jobs/<job_id>', methods=['GET'])
+def get_job(job_id):
+    """Job status with partial progress (terms extracted, phase 1, N of M deep searches)"""
+    job = job_manager.get(job_id)
+    
+    if job is None:
+        return jsonify({
+            "error": "Job not found"
+        }), 404
+    
+    return jsonify(job)
+
+@app.route('/jobs/<job_id>/events', methods=['GET'])
+def job_events(job_id):
+    """Server-Sent Events stream of job progress"""
+    if job_manager.get(job_id, include_result=False) is None:
+        return jsonify({
+            "error": "Job not found"
+        }), 404
+    
+    return Response(
+        stream_with_context(job_manager.stream_events(job_id, max_wait_seconds=Config.JOB_STREAM_MAX_SECONDS)),
+        mimetype='text/event-stream',
+        headers={
+            "Cache-Control": "no-cache",
+            "X-Accel-Buffering": "no"
+        }
+    )
+
+def _int_arg(name, default):
+    try:
+        return int(request.args.get(name, default))
+    except ValueError:
+        return default
+
+def history_disabled():
+    """404 عند تعطيل سجل التحليلات (RESULTS_STORE_ENABLED=false) بدل إنشاء ملف SQLite فارغ"""
+    return jsonify({
+        "error": "Analysis history is disabled (RESULTS_STORE_ENABLED=false)"
+    }), 404
+
+@app.route('/history', methods=['GET'])
+def history():
+    """
+    Saved analyses, newest first - summaries only (no chunks)
+
+    Query params: limit (default 10, max 100), offset (default 0)
+    """
+    if not Config.RESULTS_STORE_ENABLED:
+        return history_disabled()
+    
+    try:
+        page = get_results_store().list(limit=_int_arg('limit', 10), offset=_int_arg('offset', 0))
+        return jsonify(page)
+    except Exception as e:
+        print(f"[ERROR] Listing analysis history failed: {e}")
+        return jsonify({
+            "error": str(e)
+        }), 500
+
+@app.route('/history/search', methods=['GET'])
+def history_search():
+    """
+    Full-text search across saved analyses (terms, issues, chunk text) via the inverted index
+
+    Query params: q (all words must appear in the same term/chunk), clause_id (only that clause's
+    term and the chunks it retrieved), fields (comma-separated: terms,issues,chunks), limit, offset
+    """
+    if not Config.RESULTS_STORE_ENABLED:
+        return history_disabled()
+    
+    query = request.args.get('q', '').strip()
+    clause_id = request.args.get('clause_id', '').strip() or None
+    fields = [f.strip() for f in request.args.get('fields', '').split(',') if f.strip()] or None
+    
+    if not query and not clause_id:
+        return jsonify({
+            "error": "Provide 'q' and/or 'clause_id'"
+        }), 400
+    
+    try:
+        results = get_results_store().search(
+            query, clause_id=clause_id, fields=fields,
+            limit=_int_arg('limit', 10), offset=_int_arg('offset', 0)
+        )
+        return jsonify(results)
+    except Exception as e:
+        print(f"[ERROR] History search failed: {e}")
+        return jsonify({
+            "error": str(e)
+        }), 500
+
+@app.route('/history/<analysis_id>', methods=['GET'])
+def history_item(analysis_id):
+    """Full saved analysis (terms, chunks, contract text) - loaded only when requested"""
+    if not Config.RESULTS_STORE_ENABLED:
+        return history_disabled()
+    
+    try:
+        result = get_results_store().get(analysis_id)
+    except Exception as e:
+        print(f"[ERROR] Loading analysis {analysis_id} failed: {e}")
+        return jsonify({
+            "error": str(e)
+        }), 500
+    
+    if result is None:
+        return jsonify({
+            "error": "Analysis not found"
+        }), 404
+    
+    return jsonify(result)
+
 if __name__ == '__main__':
     print("=" * 60)
     print("GEMINI FILE SEARCH API - Starting Up")
@@ -153,11 +593,24 @@ if __name__ == '__main__':
     
     if initialize_services():
         print("\n" + "=" * 60)
-        print("API READY - Endpoints Available:")
+        print("API STARTING - Endpoints Available (poll /ready):")
         print(f"  - GET  /health")
+        print(f"  - GET  /ready          (Readiness probe, 503 until the store is verified)")
+        print(f"  - GET  /metrics        (Prometheus: latency histograms, 429/503/retry counters, in-flight)")
         print(f"  - GET  /store-info")
+        print(f"  - GET  /cache-stats")
+        print(f"  - POST /cache/invalidate")
+        print(f"  - GET  /gateway-stats")
+        print(f"  - GET  /cost-stats     (Daily token/cost ledger)")
         print(f"  - POST /extract_terms  (Step 1: Extract key terms)")
         print(f"  - POST /file_search    (Two-step: Extract + Search)")
+        print(f"  - POST /file_search/batch (JSONL in, streamed JSONL out)")
+        print(f"  - POST /jobs           (Async file search, returns job ID)")
+        print(f"  - GET  /jobs/<id>      (Job status and partial results)")
+        print(f"  - GET  /jobs/<id>/events (Server-Sent Events progress stream)")
+        print(f"  - GET  /history        (Saved analyses, paginated summaries)")
+        print(f"  - GET  /history/search (Full-text search across saved analyses)")
+        print(f"  - GET  /history/<id>   (Full saved analysis)")
         print("=" * 60 + "\n")
         
         app.run(
@@ -21,6 +21,120 @@ class Config:
     # النتيجة: 12-20+ chunks بدون تكرار (أدقّ وأسرع)
     TOP_K_CHUNKS = int(os.getenv("TOP_K_CHUNKS", "10"))
 
+    # البحث المعمّق المتوازي: الحد الأقصى لعدد عمليات البحث المعمّق المتزامنة
+    # القيمة 1 تعني التنفيذ التسلسلي (السلوك القديم)
+    DEEP_SEARCH_MAX_WORKERS = int(os.getenv("DEEP_SEARCH_MAX_WORKERS", "4"))
+
+    # الوضع المتوازي (pipelined): إطلاق البحث الجماعي والبحث المعمّق معاً بعد الاستخراج
+    # بدلاً من انتظار انتهاء البحث الجماعي أولاً
+    PIPELINED_SEARCH = os.getenv("PIPELINED_SEARCH", "True").lower() == "true"
+
+    # المهلة الكلية لطلب search_chunks بالثواني (0 = بدون مهلة، مثل السلوك السابق)
+    # عند انتهائها يُرجع ما اكتمل مع partial: true وقائمة البنود التي لم يُبحث عنها
+    REQUEST_DEADLINE_SECONDS = float(os.getenv("REQUEST_DEADLINE_SECONDS", "0"))
+
+    # أولوية البحث المعمّق: البنود الحساسة تُرتب حسب درجة الخطورة (الربا > الغرر/الجهالة > الشروط)
+    # الحد الأقصى لعدد البنود التي يُبحث عنها بعمق (0 = بدون حد)
+    DEEP_SEARCH_MAX_CLAUSES = int(os.getenv("DEEP_SEARCH_MAX_CLAUSES", "0"))
+    # مهلة بالثواني من بداية البحث: البنود التي لم تبدأ قبلها تُستبعد (0 = بدون مهلة)
+    DEEP_SEARCH_DEADLINE_SECONDS = float(os.getenv("DEEP_SEARCH_DEADLINE_SECONDS", "0"))
+
+    # طباعة كل span كسطر [TRACE] (الـ trace يُرسل للـ jobs ويُقاس في /metrics في كل الأحوال)
+    TRACE_LOG = os.getenv("TRACE_LOG", "False").lower() == "true"
+
+    # استخراج البنود بـ JSON schema (response_mime_type + response_schema) بدل البحث عن JSON في نص حر
+    EXTRACTION_STRUCTURED_OUTPUT = os.getenv("EXTRACTION_STRUCTURED_OUTPUT", "True").lower() == "true"
+    # عدد محاولات الاستخراج إذا لم تُنتج الاستجابة أي بند صالح حتى بعد الإصلاح المحلي
+    EXTRACTION_MAX_ATTEMPTS = int(os.getenv("EXTRACTION_MAX_ATTEMPTS", "2"))
+
+    # وضع العقود الطويلة: تقسيم العقد على حدود "البند"/"المادة" إلى نوافذ متداخلة
+    # واستخراج البنود منها بالتوازي ثم دمجها (0 في العتبة = تعطيل)
+    LONG_CONTRACT_THRESHOLD_CHARS = int(os.getenv("LONG_CONTRACT_THRESHOLD_CHARS", "30000"))
+    LONG_CONTRACT_WINDOW_CHARS = int(os.getenv("LONG_CONTRACT_WINDOW_CHARS", "15000"))
+    LONG_CONTRACT_OVERLAP_CHARS = int(os.getenv("LONG_CONTRACT_OVERLAP_CHARS", "1500"))
+    LONG_CONTRACT_MAX_WORKERS = int(os.getenv("LONG_CONTRACT_MAX_WORKERS", "4"))
+
+    # استخراج البنود بالـ streaming (generate_content_stream + تحليل JSON تدريجي)
+    # كل بند يُعالج فور اكتمال كائنه، والبنود الحساسة الأخطر يبدأ بحثها المعمّق أثناء الاستخراج
+    STREAMING_EXTRACTION = os.getenv("STREAMING_EXTRACTION", "False").lower() == "true"
+    # أقل درجة خطورة لإطلاق البحث المعمّق قبل انتهاء الاستخراج (الباقي يُرتب بعد الاستخراج كالمعتاد)
+    STREAMING_EARLY_RISK_THRESHOLD = float(os.getenv("STREAMING_EARLY_RISK_THRESHOLD", "1.0"))
+
+    # Retrieval Backend: "file_search" (Gemini File Search) أو "local" (فهرس BM25 محلي فوق context/)
+    RETRIEVAL_BACKEND = os.getenv("RETRIEVAL_BACKEND", "file_search").lower()
+    LOCAL_CHUNK_CHARS = int(os.getenv("LOCAL_CHUNK_CHARS", "1500"))
+    LOCAL_CHUNK_OVERLAP_CHARS = int(os.getenv("LOCAL_CHUNK_OVERLAP_CHARS", "200"))
+    # الفهرس المحلي المحفوظ (mmap) - يُبنى بـ: python main.py build-index
+    LOCAL_INDEX_PERSIST = os.getenv("LOCAL_INDEX_PERSIST", "True").lower() == "true"
+    LOCAL_INDEX_DIR = os.getenv("LOCAL_INDEX_DIR", "context_index")
+
+    # Result Cache Configuration (كاش دائم للنتائج الكاملة حسب محتوى العقد)
+    RESULT_CACHE_ENABLED = os.getenv("RESULT_CACHE_ENABLED", "True").lower() == "true"
+    RESULT_CACHE_PATH = os.getenv("RESULT_CACHE_PATH", "cache/results.sqlite3")
+    RESULT_CACHE_TTL_SECONDS = int(os.getenv("RESULT_CACHE_TTL_SECONDS", str(7 * 24 * 3600)))
+    RESULT_CACHE_MAX_ENTRIES = int(os.getenv("RESULT_CACHE_MAX_ENTRIES", "1000"))
+    RESULT_CACHE_MAX_BYTES = int(os.getenv("RESULT_CACHE_MAX_BYTES", str(200 * 1024 * 1024)))
+
+    # Clause Cache Configuration (كاش البحث المعمّق لكل بند عبر العقود المختلفة)
+    CLAUSE_CACHE_ENABLED = os.getenv("CLAUSE_CACHE_ENABLED", "True").lower() == "true"
+    CLAUSE_CACHE_MAX_ENTRIES = int(os.getenv("CLAUSE_CACHE_MAX_ENTRIES", "2000"))
+    # مدة صلاحية نتيجة البند بالثواني (0 = بدون انتهاء)
+    CLAUSE_CACHE_TTL_SECONDS = float(os.getenv("CLAUSE_CACHE_TTL_SECONDS", str(24 * 3600)))
+
+    # Gemini Call Gateway (حد المعدل والتزامن المتكيّف لكل استدعاءات generate_content)
+    # 0 في RPM/TPM يعني بدون حد
+    GEMINI_REQUESTS_PER_MINUTE = int(os.getenv("GEMINI_REQUESTS_PER_MINUTE", "60"))
+    GEMINI_TOKENS_PER_MINUTE = int(os.getenv("GEMINI_TOKENS_PER_MINUTE", "1000000"))
+    GEMINI_MAX_CONCURRENCY = int(os.getenv("GEMINI_MAX_CONCURRENCY", "8"))
+    # عدد processes الـ API التي تتقاسم حصة RPM/TPM أعلاه (gunicorn يضبطه بعدد الـ workers)
+    API_WORKERS = int(os.getenv("API_WORKERS", "1"))
+    GEMINI_MIN_CONCURRENCY = int(os.getenv("GEMINI_MIN_CONCURRENCY", "1"))
+    GEMINI_MAX_RETRIES = int(os.getenv("GEMINI_MAX_RETRIES", "3"))
+    # كل طلب ناجح يضيف هذه النسبة لميزانية إعادة المحاولة
+    GEMINI_RETRY_BUDGET_RATIO = float(os.getenv("GEMINI_RETRY_BUDGET_RATIO", "0.2"))
+
+    # Connection pooling لاستدعاءات Gemini: عدد الـ clients (round-robin) وحدود اتصالات كل client
+    GEMINI_CLIENT_POOL_SIZE = int(os.getenv("GEMINI_CLIENT_POOL_SIZE", "2"))
+    GEMINI_HTTP_MAX_CONNECTIONS = int(os.getenv("GEMINI_HTTP_MAX_CONNECTIONS", "16"))
+    GEMINI_HTTP_MAX_KEEPALIVE = int(os.getenv("GEMINI_HTTP_MAX_KEEPALIVE", "8"))
+    GEMINI_HTTP_KEEPALIVE_SECONDS = float(os.getenv("GEMINI_HTTP_KEEPALIVE_SECONDS", "120"))
+    # HTTP/2 يُفعّل فقط إذا كانت حزمة h2 مثبتة
+    GEMINI_HTTP2 = os.getenv("GEMINI_HTTP2", "True").lower() == "true"
+    # فتح الاتصالات عند بدء الخادم (طلب metadata خفيف، بدون tokens)
+    GEMINI_PREWARM = os.getenv("GEMINI_PREWARM", "True").lower() == "true"
+
+    # Gemini Stand-in (اختبارات الحمل بدون حصة): "off" | "record" | "replay"
+    # record: تسجيل الاستجابات الحقيقية في GEMINI_STANDIN_FIXTURES
+    # replay: إعادتها محلياً (مع تسجيلات مبنية من results/analysis_*.json) بلا استدعاءات API
+    GEMINI_STANDIN_MODE = os.getenv("GEMINI_STANDIN_MODE", "off").lower()
+    GEMINI_STANDIN_FIXTURES = os.getenv("GEMINI_STANDIN_FIXTURES", "fixtures/gemini_recordings.jsonl")
+    GEMINI_STANDIN_SEED_DIR = os.getenv("GEMINI_STANDIN_SEED_DIR", "results")
+    # توزيع الزمن لكل نوع: fixed:S | uniform:MIN:MAX | lognormal:MEDIAN:SIGMA | recorded
+    GEMINI_STANDIN_LATENCY_EXTRACTION = os.getenv("GEMINI_STANDIN_LATENCY_EXTRACTION", "lognormal:10:0.35")
+    GEMINI_STANDIN_LATENCY_SEARCH = os.getenv("GEMINI_STANDIN_LATENCY_SEARCH", "lognormal:15:0.45")
+    # معامل الزمن (0.01 = أسرع 100 مرة مع نفس شكل التوزيع)
+    GEMINI_STANDIN_TIME_SCALE = float(os.getenv("GEMINI_STANDIN_TIME_SCALE", "1.0"))
+    # نسب الأخطاء المحقونة، وحد طلبات في الدقيقة يرجع 429 عند تجاوزه (0 = بدون حد)
+    GEMINI_STANDIN_ERROR_503_RATE = float(os.getenv("GEMINI_STANDIN_ERROR_503_RATE", "0.0"))
+    GEMINI_STANDIN_ERROR_429_RATE = float(os.getenv("GEMINI_STANDIN_ERROR_429_RATE", "0.0"))
+    GEMINI_STANDIN_RPM = int(os.getenv("GEMINI_STANDIN_RPM", "0"))
+    GEMINI_STANDIN_RANDOM_SEED = int(os.getenv("GEMINI_STANDIN_RANDOM_SEED", "42"))
+
+    # Token/Cost Budget (أسعار Gemini 2.5 Flash من COST_ANALYSIS.md بالدولار لكل مليون token)
+    GEMINI_INPUT_PRICE_PER_MILLION = float(os.getenv("GEMINI_INPUT_PRICE_PER_MILLION", "0.30"))
+    GEMINI_OUTPUT_PRICE_PER_MILLION = float(os.getenv("GEMINI_OUTPUT_PRICE_PER_MILLION", "2.50"))
+    # ميزانية tokens الافتراضية لكل طلب (0 = بدون حد)، ويمكن تمريرها لكل طلب عبر token_budget
+    REQUEST_TOKEN_BUDGET = int(os.getenv("REQUEST_TOKEN_BUDGET", "0"))
+    # أقل top_k مسموح عند تقليص البحث الجماعي بسبب الميزانية
+    BUDGET_MIN_TOP_K = int(os.getenv("BUDGET_MIN_TOP_K", "3"))
+    # التقديرات الأولية قبل توفر قياسات فعلية (البحث الجماعي: لكل chunk مطلوب)
+    ESTIMATED_EXTRACTION_TOKENS = int(os.getenv("ESTIMATED_EXTRACTION_TOKENS", "6000"))
+    ESTIMATED_GENERAL_TOKENS_PER_CHUNK = int(os.getenv("ESTIMATED_GENERAL_TOKENS_PER_CHUNK", "1200"))
+    ESTIMATED_DEEP_SEARCH_TOKENS = int(os.getenv("ESTIMATED_DEEP_SEARCH_TOKENS", "3700"))
+    # الدفتر اليومي (SQLite): يبقى بعد إعادة التشغيل ويجمع كل workers الخادم
+    COST_LEDGER_PATH = os.getenv("COST_LEDGER_PATH", "cache/cost_ledger.sqlite3")
+    COST_LEDGER_RETENTION_DAYS = int(os.getenv("COST_LEDGER_RETENTION_DAYS", "30"))
+
     # المرحلة الأولى: Prompt لاستخراج البنود المهمة من العقد
     # ملاحظة: Keywords باللغة العربية لتطابق embeddings AAOIFI (المستند عربي)
     EXTRACT_KEY_TERMS_PROMPT = os.getenv(
@@ -90,6 +204,14 @@ class Config:
     ركز على الدقة الشرعية العالية، والاقتباسات الحرفية، وتجنب أي تفسير خارجي إلا إذا كان مدعومًا بنص من الكتاب."""
     )
 
+    # Near-Duplicate Merge (دمج الـ chunks المتقاربة بـ MinHash + LSH في مرحلة الدمج)
+    # العتبة = تشابه Jaccard الفعلي على shingles حرفية (1.0 = الدمج الحرفي فقط)
+    # SKETCH_SIZE = طول الـ signature، والـ bands/rows تُحسب منه ومن العتبة
+    NEAR_DUP_ENABLED = os.getenv("NEAR_DUP_ENABLED", "True").lower() == "true"
+    NEAR_DUP_THRESHOLD = float(os.getenv("NEAR_DUP_THRESHOLD", "0.8"))
+    NEAR_DUP_SHINGLE_SIZE = int(os.getenv("NEAR_DUP_SHINGLE_SIZE", "5"))
+    NEAR_DUP_SKETCH_SIZE = int(os.getenv("NEAR_DUP_SKETCH_SIZE", "64"))
+
     # Chunk Schema Configuration (هيكل البيانات المُرجعة من File Search)
     CHUNK_SCHEMA = {
         "description": "قائمة بالـ chunks المسترجعة من File Search",
@@ -98,23 +220,75 @@ class Config:
             "chunk_text": "نص الـ chunk الأصلي من المستند",
             "score": "درجة الصلة (0.0 - 1.0)",
             "uri": "مصدر الملف (URI)",
-            "title": "عنوان الملف أو القسم"
+            "title": "عنوان الملف أو القسم",
+            "sources": "مصادر الاسترجاع: [{phase: general}] أو [{phase: deep, clause_id}]"
         }
     }
 
+    # Job API Configuration (تحليل غير متزامن عبر /jobs)
+    JOB_MAX_WORKERS = int(os.getenv("JOB_MAX_WORKERS", "4"))
+    JOB_MAX_RETAINED = int(os.getenv("JOB_MAX_RETAINED", "200"))
+
+    # Batch Configuration (تحليل دفعات كبيرة من العقود)
+    # حد عام لعدد العقود المتزامنة + ميزانية عقود في الدقيقة (0 = بدون حد)
+    BATCH_MAX_CONCURRENCY = int(os.getenv("BATCH_MAX_CONCURRENCY", "2"))
+    BATCH_MAX_CONTRACTS_PER_MINUTE = int(os.getenv("BATCH_MAX_CONTRACTS_PER_MINUTE", "6"))
+
+    # مدة صلاحية metadata الـ File Search Store المحفوظة لـ /store-info (بالثواني)
+    STORE_INFO_TTL_SECONDS = int(os.getenv("STORE_INFO_TTL_SECONDS", "300"))
+
+    # رفع ملفات context/ إلى الـ Store: رفع متوازي + حلقة متابعة واحدة لكل عمليات الفهرسة
+    # الـ manifest يحفظ hash كل ملف وحالته، فلا يُرفع إلا الجديد/المتغير ويُستأنف الرفع بعد انقطاع
+    UPLOAD_MAX_WORKERS = int(os.getenv("UPLOAD_MAX_WORKERS", "4"))
+    UPLOAD_POLL_INITIAL_SECONDS = float(os.getenv("UPLOAD_POLL_INITIAL_SECONDS", "2"))
+    UPLOAD_POLL_MAX_SECONDS = float(os.getenv("UPLOAD_POLL_MAX_SECONDS", "30"))
+    # عملية فهرسة يفشل الاستعلام عنها هذا العدد من المرات المتتالية، أو لا تكتمل خلال المهلة (0 = بدون حد)،
+    # تُترك: المستأنفة بعد انقطاع يُعاد رفع ملفها، وغيرها يُسجَّل failed
+    UPLOAD_MAX_POLL_FAILURES = int(os.getenv("UPLOAD_MAX_POLL_FAILURES", "5"))
+    UPLOAD_INDEX_TIMEOUT_SECONDS = float(os.getenv("UPLOAD_INDEX_TIMEOUT_SECONDS", "1800"))
+    UPLOAD_MANIFEST_PATH = os.getenv("UPLOAD_MANIFEST_PATH", "cache/upload_manifest.json")
+
+    # سجل التحليلات المحفوظة (SQLite): الـ API يحفظ كل تحليل مكتمل، والواجهة تقرأ السجل بصفحات
+    # ملفات results/analysis_*.json القديمة تُستورد مرة واحدة عند أول استخدام
+    RESULTS_STORE_ENABLED = os.getenv("RESULTS_STORE_ENABLED", "True").lower() == "true"
+    RESULTS_STORE_PATH = os.getenv("RESULTS_STORE_PATH", "cache/results_history.sqlite3")
+    RESULTS_LEGACY_DIR = os.getenv("RESULTS_LEGACY_DIR", "results")
+
     # Flask Configuration
     FLASK_HOST = os.getenv("FLASK_HOST", "0.0.0.0")
     FLASK_PORT = int(os.getenv("FLASK_PORT", "5001"))
     FLASK_DEBUG = os.getenv("FLASK_DEBUG", "False").lower() == "true"
 
+    # Production serving (gunicorn.conf.py): workers متعددة × threads لكل worker (gthread)
+    # كل تحليل يشغل thread وليس الـ process، والتهيئة تتم داخل كل worker بعد الـ fork
+    GUNICORN_WORKERS = int(os.getenv("GUNICORN_WORKERS", "2"))
+    GUNICORN_THREADS = int(os.getenv("GUNICORN_THREADS", "16"))
+    # مهلة الإيقاف: الطلبات والـ jobs الجارية تكتمل خلالها قبل إنهاء الـ worker (التحليل يستغرق 2-4 دقائق)
+    GUNICORN_GRACEFUL_TIMEOUT = int(os.getenv("GUNICORN_GRACEFUL_TIMEOUT", "300"))
+    GUNICORN_KEEPALIVE_SECONDS = int(os.getenv("GUNICORN_KEEPALIVE_SECONDS", "5"))
+
+    # حالة الـ jobs مشتركة بين الـ workers عبر SQLite (فارغ = في الذاكرة فقط، يكفي لـ process واحد)
+    JOB_STATE_PATH = os.getenv("JOB_STATE_PATH", "")
+    # job لم يحدّث الـ worker المالك له الـ heartbeat خلال هذه المدة (أو مات الـ process) يُسجَّل failed عند قراءته
+    JOB_STALE_SECONDS = float(os.getenv("JOB_STALE_SECONDS", "60"))
+    # أقصى مدة لبث /jobs/<id>/events: بعدها حدث stream_timeout بحالة الـ job وإغلاق الاتصال
+    JOB_STREAM_MAX_SECONDS = float(os.getenv("JOB_STREAM_MAX_SECONDS", str((REQUEST_DEADLINE_SECONDS or 300) + 120)))
+
+    # عدد الاتصالات المحفوظة (keep-alive) من الواجهة إلى الـ API
+    FRONTEND_HTTP_POOL_SIZE = int(os.getenv("FRONTEND_HTTP_POOL_SIZE", "10"))
+
     @classmethod
     def validate(cls):
         """التحقق من صحة الإعدادات الأساسية"""
         errors = []
 
-        if not cls.GEMINI_API_KEY:
+        # وضع الـ replay لا يتصل بـ Gemini
+        if not cls.GEMINI_API_KEY and cls.GEMINI_STANDIN_MODE != "replay":
             errors.append("GEMINI_API_KEY is required")
 
+        if cls.GEMINI_STANDIN_MODE not in ("off", "record", "replay"):
+            errors.append("GEMINI_STANDIN_MODE must be off, record or replay")
+
         if errors:
             raise ValueError(f"Configuration errors: {', '.join(errors)}")
 
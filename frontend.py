@@ -1,10 +1,12 @@
 import streamlit as st
 import requests
+from requests.adapters import HTTPAdapter
 import json
-import os
+import time
 from datetime import datetime
 from typing import Optional, Dict, Any, Tuple
 from config import Config
+from services.arabic_normalizer import normalize_arabic
 
 st.set_page_config(
     page_title="تحليل العقود - Gemini File Search",
@@ -15,15 +17,30 @@ st.set_page_config(
 
 # Use 127.0.0.1 for internal connection
 API_BASE_URL = "http://127.0.0.1:{}".format(Config.FLASK_PORT)
-RESULTS_DIR = "results"
+HISTORY_PAGE_SIZE = 10
+# أقصى انتظار لنتيجة job: مهلة التحليل في الـ API + هامش للانتظار في الطابور والحفظ
+JOB_MAX_WAIT_SECONDS = (Config.REQUEST_DEADLINE_SECONDS or 300) + 120
 
-# إنشاء مجلد النتائج إذا لم يكن موجوداً
-os.makedirs(RESULTS_DIR, exist_ok=True)
+@st.cache_resource
+def get_http_session() -> requests.Session:
+    """
+    Session واحدة مشتركة لكل طلبات الواجهة إلى الـ API (keep-alive بدل اتصال TCP جديد لكل طلب)
+
+    cache_resource يحافظ عليها عبر إعادة تشغيل السكربت وبين جلسات المستخدمين
+    """
+    session = requests.Session()
+    adapter = HTTPAdapter(
+        pool_connections=1,
+        pool_maxsize=Config.FRONTEND_HTTP_POOL_SIZE
+    )
+    session.mount("http://", adapter)
+    session.mount("https://", adapter)
+    return session
 
 def check_api_health() -> bool:
     """التحقق من حالة Flask API"""
     try:
-        response = requests.get("{}/health".format(API_BASE_URL), timeout=2)
+        response = get_http_session().get("{}/health".format(API_BASE_URL), timeout=2)
         return response.status_code == 200
     except:
         return False
@@ -31,22 +48,34 @@ def check_api_health() -> bool:
 def get_store_info() -> Optional[Dict[str, Any]]:
     """الحصول على معلومات File Search Store"""
     try:
-        response = requests.get("{}/store-info".format(API_BASE_URL), timeout=5)
+        response = get_http_session().get("{}/store-info".format(API_BASE_URL), timeout=5)
         if response.status_code == 200:
             return response.json()
         return None
     except:
         return None
 
-def file_search_request(contract_text: str, top_k: int = 10) -> Tuple[Optional[Dict[str, Any]], Optional[str]]:
-    """إرسال طلب البحث للـ API"""
+def submit_file_search_job(contract_text: str, top_k: int = 10) -> Tuple[Optional[str], Optional[str]]:
+    """إرسال job بحث غير متزامن للـ API - يرجع job_id فوراً"""
     try:
-        response = requests.post(
-            "{}/file_search".format(API_BASE_URL),
+        response = get_http_session().post(
+            "{}/jobs".format(API_BASE_URL),
             json={"contract_text": contract_text, "top_k": top_k},
-            timeout=300  # زيادة timeout إلى 5 دقائق
+            timeout=10
         )
         
+        if response.status_code == 202:
+            return response.json().get("job_id"), None
+        else:
+            return None, response.json().get("error", "خطأ غير معروف")
+    except Exception as e:
+        return None, str(e)
+
+def get_job_status(job_id: str) -> Tuple[Optional[Dict[str, Any]], Optional[str]]:
+    """الحصول على حالة الـ job والنتائج الجزئية"""
+    try:
+        response = get_http_session().get("{}/jobs/{}".format(API_BASE_URL, job_id), timeout=10)
+        
         if response.status_code == 200:
             return response.json(), None
         else:
@@ -54,26 +83,109 @@ def file_search_request(contract_text: str, top_k: int = 10) -> Tuple[Optional[D
     except Exception as e:
         return None, str(e)
 
-def save_results_to_file(result: Dict[str, Any], contract_text: str) -> str:
-    """حفظ نتائج البحث في ملف JSON"""
-    timestamp = datetime.now().strftime("%Y%m%d_%H%M%S")
-    filename = "analysis_{}.json".format(timestamp)
-    filepath = os.path.join(RESULTS_DIR, filename)
+def job_progress_fraction(progress: Dict[str, Any]) -> float:
+    """تحويل أحداث التقدم إلى نسبة لشريط التقدم (الاستخراج 20% - العام 30% - المعمّق 50%)"""
+    if "total_terms" not in progress:
+        return 0.05
     
-    # تجهيز البيانات
-    output_data = {
-        "timestamp": timestamp,
-        "contract_length": len(contract_text),
-        "total_chunks": result.get("total_chunks", 0),
-        "extracted_terms": result.get("extracted_terms", []),
-        "chunks": result.get("chunks", [])
-    }
+    fraction = 0.2
+    if "general_chunks" in progress:
+        fraction += 0.3
     
-    # حفظ الملف
-    with open(filepath, 'w', encoding='utf-8') as f:
-        json.dump(output_data, f, ensure_ascii=False, indent=2)
+    total = progress.get("deep_searches_total", 0)
+    done = progress.get("deep_searches_done", 0)
+    if total:
+        fraction += 0.5 * done / total
+    elif "general_chunks" in progress:
+        fraction += 0.5
+    
+    return min(fraction, 0.99)
+
+def job_progress_message(progress: Dict[str, Any]) -> str:
+    """وصف نصي لمرحلة التحليل الحالية"""
+    if "total_terms" not in progress:
+        return "⏳ استخراج البنود المهمة من العقد..."
+    
+    parts = ["✅ تم استخراج {} بند".format(progress.get("total_terms", 0))]
+    if "general_chunks" in progress:
+        parts.append("✅ البحث العام ({} chunks)".format(progress.get("general_chunks", 0)))
+    else:
+        parts.append("⏳ البحث العام...")
+    
+    total = progress.get("deep_searches_total", 0)
+    if total:
+        parts.append("🔎 البحث المعمّق {}/{}".format(progress.get("deep_searches_done", 0), total))
+    
+    return " | ".join(parts)
+
+def run_file_search_job(contract_text: str, top_k: int, progress_bar, status_placeholder,
+                        poll_interval: float = 2.0,
+                        max_wait_seconds: float = JOB_MAX_WAIT_SECONDS) -> Tuple[Optional[Dict[str, Any]], Optional[str]]:
+    """إرسال job ومتابعته (polling) مع تحديث شريط التقدم حتى انتهائه أو انقضاء max_wait_seconds"""
+    job_id, error = submit_file_search_job(contract_text, top_k)
+    if error:
+        return None, error
     
-    return filepath
+    deadline = time.monotonic() + max_wait_seconds
+    while True:
+        if time.monotonic() > deadline:
+            return None, "انتهت مهلة انتظار التحليل ({} ثانية) - job: {}".format(int(max_wait_seconds), job_id)
+        
+        job, error = get_job_status(job_id)
+        if error:
+            return None, error
+        
+        progress = job.get("progress", {})
+        status = job.get("status")
+        
+        if status == "completed":
+            return job.get("result"), None
+        if status == "failed":
+            return None, job.get("error", "خطأ غير معروف")
+        
+        progress_bar.progress(job_progress_fraction(progress))
+        status_placeholder.caption(job_progress_message(progress))
+        time.sleep(poll_interval)
+
+def get_history(limit: int = HISTORY_PAGE_SIZE, offset: int = 0) -> Optional[Dict[str, Any]]:
+    """صفحة من سجل التحليلات المحفوظة في الـ API (ملخصات فقط)"""
+    try:
+        response = get_http_session().get(
+            "{}/history".format(API_BASE_URL),
+            params={"limit": limit, "offset": offset},
+            timeout=5
+        )
+        if response.status_code == 200:
+            return response.json()
+        return None
+    except:
+        return None
+
+def search_history(query: str, clause_id: str = "", fields: Optional[list] = None,
+                   limit: int = HISTORY_PAGE_SIZE, offset: int = 0) -> Tuple[Optional[Dict[str, Any]], Optional[str]]:
+    """بحث نصي في كل التحليلات المحفوظة عبر فهرس الـ API"""
+    params = {"q": query, "limit": limit, "offset": offset}
+    if clause_id:
+        params["clause_id"] = clause_id
+    if fields:
+        params["fields"] = ",".join(fields)
+    try:
+        response = get_http_session().get("{}/history/search".format(API_BASE_URL), params=params, timeout=10)
+        if response.status_code == 200:
+            return response.json(), None
+        return None, response.json().get("error", "خطأ غير معروف")
+    except Exception as e:
+        return None, str(e)
+
+def get_history_item(analysis_id: str) -> Optional[Dict[str, Any]]:
+    """النتيجة الكاملة لتحليل محفوظ (تُطلب فقط عند فتحه)"""
+    try:
+        response = get_http_session().get("{}/history/{}".format(API_BASE_URL, analysis_id), timeout=10)
+        if response.status_code == 200:
+            return response.json()
+        return None
+    except:
+        return None
 
 # ============= الواجهة الرئيسية =============
 st.title("⚖️ نظام تحليل العقود - Gemini File Search")
@@ -97,11 +209,11 @@ with st.sidebar:
     
     st.divider()
     
-    # معلومات مجلد النتائج
-    results_count = len([f for f in os.listdir(RESULTS_DIR) if f.endswith('.json')]) if os.path.exists(RESULTS_DIR) else 0
-    st.metric("عدد نتائج البحث المحفوظة", results_count)
+    # عدد التحليلات المحفوظة (من الـ API بدون قراءة النتائج نفسها)
+    history_page = get_history(limit=1)
+    st.metric("عدد نتائج البحث المحفوظة", history_page["total"] if history_page else "-")
     
-    st.info("💾 جميع النتائج يتم حفظها تلقائياً في مجلد `results/`")
+    st.info("💾 جميع النتائج يحفظها الـ API تلقائياً في سجل التحليلات")
 
 # المحتوى الرئيسي
 st.markdown("---")
@@ -144,19 +256,25 @@ if run_search:
         status_container = st.container()
         
         with status_container:
+            status_placeholder = st.empty()
             with st.spinner("⏳ جاري التحليل... (هذا قد يستغرق 2-4 دقائق)"):
-                result, error = file_search_request(contract_input, int(top_k))
+                result, error = run_file_search_job(
+                    contract_input, int(top_k), progress_bar, status_placeholder
+                )
                 progress_bar.progress(100)
+                status_placeholder.empty()
         
         if error:
             st.error("❌ حدث خطأ: {}".format(error))
         elif result:
-            # حفظ النتائج
-            result_path = save_results_to_file(result, contract_input)
-            
-            # عرض النتائج
+            # عرض النتائج (الـ API حفظها في السجل وأرجع analysis_id)
             st.success("✅ تم التحليل بنجاح!")
-            
+
+            # نتيجة جزئية: انتهت مهلة الطلب أو الميزانية قبل اكتمال كل عمليات البحث
+            if result.get("partial"):
+                skipped = ", ".join(s.get("clause_id", "") for s in result.get("skipped_clauses", []))
+                st.warning("⏱️ نتيجة جزئية: لم يكتمل البحث المعمّق لبعض البنود ({})".format(skipped or "-"))
+
             # ملخص النتائج
             col1, col2, col3 = st.columns(3)
             with col1:
@@ -164,7 +282,7 @@ if run_search:
             with col2:
                 st.metric("📊 عدد الـ Chunks", result.get("total_chunks", 0))
             with col3:
-                st.metric("💾 تم الحفظ", os.path.basename(result_path))
+                st.metric("💾 تم الحفظ", result.get("analysis_id", "-"))
             
             st.markdown("---")
             
@@ -197,10 +315,12 @@ if run_search:
                 # شريط البحث داخل الـ chunks
                 search_query = st.text_input("🔍 ابحث في النتائج:", placeholder="ابحث عن كلمة...")
                 
-                # تصفية النتائج
+                # تصفية النتائج (بنفس التطبيع العربي المستخدم في الفهرسة: التشكيل، الهمزات، التاء المربوطة)
                 chunks = result.get('chunks', [])
                 if search_query:
-                    chunks = [c for c in chunks if search_query.lower() in c.get('chunk_text', '').lower()]
+                    normalized_query = normalize_arabic(search_query)
+                    chunks = [c for c in chunks if normalized_query in normalize_arabic(c.get('chunk_text', ''))]
+                st.caption("للبحث في كل التحليلات السابقة استخدم البحث في قسم السجل أدناه")
                 
                 st.write(f"عدد النتائج: **{len(chunks)}** من **{result.get('total_chunks', 0)}**")
                 
@@ -273,25 +393,96 @@ if run_search:
 st.markdown("---")
 st.header("📜 السجل")
 
-if os.path.exists(RESULTS_DIR):
-    result_files = sorted([f for f in os.listdir(RESULTS_DIR) if f.endswith('.json')], reverse=True)
+if "history_offset" not in st.session_state:
+    st.session_state.history_offset = 0
+
+# البحث في كل التحليلات المحفوظة (فهرس الـ API بدل قراءة النتائج)
+with st.expander("🔎 البحث في كل التحليلات", expanded=False):
+    col1, col2, col3 = st.columns([3, 2, 2])
+    with col1:
+        history_query = st.text_input("كلمات البحث:", placeholder="مثال: حلول الأقساط", key="history_query")
+    with col2:
+        history_clause = st.text_input("معرف البند (اختياري):", placeholder="clause_acceleration_on_default",
+                                       key="history_clause")
+    with col3:
+        history_fields = st.multiselect(
+            "البحث في:", ["terms", "issues", "chunks"], default=["terms", "issues", "chunks"],
+            format_func=lambda f: {"terms": "البنود", "issues": "الإشكالات", "chunks": "الـ Chunks"}[f],
+            key="history_fields"
+        )
     
-    if result_files:
-        st.subheader("آخر التحليلات")
-        
-        with st.expander("عرض السجل", expanded=False):
-            for filename in result_files[:10]:  # عرض آخر 10 نتائج
-                st.write(f"📁 {filename}")
-                filepath = os.path.join(RESULTS_DIR, filename)
-                
-                with open(filepath, 'r', encoding='utf-8') as f:
-                    data = json.load(f)
-                    col1, col2, col3 = st.columns(3)
-                    with col1:
-                        st.caption(f"التاريخ: {data.get('timestamp', 'N/A')}")
-                    with col2:
-                        st.caption(f"البنود: {len(data.get('extracted_terms', []))}")
-                    with col3:
-                        st.caption(f"Chunks: {data.get('total_chunks', 0)}")
-    else:
-        st.info("لا توجد نتائج مسبقة")
+    if history_query.strip() or history_clause.strip():
+        found, search_error = search_history(history_query, history_clause.strip(), history_fields)
+        if search_error:
+            st.error("❌ {}".format(search_error))
+        elif found:
+            st.write(f"عدد التحليلات المطابقة: **{found['total']}** ({found['took_ms']} ms)")
+            for item in found["items"]:
+                col1, col2 = st.columns([5, 1])
+                with col1:
+                    st.write(f"📁 {item['analysis_id']} — التاريخ: {item.get('timestamp', 'N/A')}"
+                             f" — مطابقات: {item.get('match_count', 0)}")
+                    for match in item.get("matches", []):
+                        label = match.get("term_id") or f"chunk #{match['position'] + 1}"
+                        st.caption(f"[{match['field']}] {label}: {match.get('snippet', '')}")
+                with col2:
+                    if st.button("📂 عرض", key=f"history_search_open_{item['analysis_id']}"):
+                        st.session_state.history_selected = item["analysis_id"]
+
+history_page = get_history(limit=HISTORY_PAGE_SIZE, offset=st.session_state.history_offset)
+
+if history_page and history_page.get("items"):
+    offset = history_page["offset"]
+    st.subheader("آخر التحليلات ({}-{} من {})".format(
+        offset + 1, offset + len(history_page["items"]), history_page["total"]
+    ))
+    
+    for item in history_page["items"]:
+        col1, col2, col3, col4 = st.columns([3, 1, 1, 1])
+        with col1:
+            st.write(f"📁 {item['analysis_id']}")
+            st.caption(f"التاريخ: {item.get('timestamp', 'N/A')}")
+        with col2:
+            st.caption(f"البنود: {item.get('total_terms', 0)}")
+        with col3:
+            st.caption(f"Chunks: {item.get('total_chunks', 0)}")
+        with col4:
+            # التفاصيل الكاملة تُحمّل فقط عند طلبها
+            if st.button("📂 عرض", key=f"history_open_{item['analysis_id']}"):
+                st.session_state.history_selected = item["analysis_id"]
+    
+    # التنقل بين الصفحات
+    col1, col2 = st.columns(2)
+    with col1:
+        if offset > 0 and st.button("⬅️ الأحدث", use_container_width=True):
+            st.session_state.history_offset = max(0, offset - HISTORY_PAGE_SIZE)
+            st.rerun()
+    with col2:
+        if history_page.get("next_offset") is not None and st.button("الأقدم ➡️", use_container_width=True):
+            st.session_state.history_offset = history_page["next_offset"]
+            st.rerun()
+    
+    selected_id = st.session_state.get("history_selected")
+    if selected_id:
+        selected = get_history_item(selected_id)
+        if selected is None:
+            st.warning("تعذر تحميل التحليل {}".format(selected_id))
+        else:
+            st.subheader("📂 {}".format(selected_id))
+            with st.expander("البنود المستخرجة ({})".format(len(selected.get("extracted_terms", []))), expanded=True):
+                for term in selected.get("extracted_terms", []):
+                    st.markdown(f"**{term.get('term_id')}**: {term.get('term_text')}")
+            with st.expander("الـ Chunks ({})".format(selected.get("total_chunks", 0)), expanded=False):
+                for idx, chunk in enumerate(selected.get("chunks", []), 1):
+                    st.caption(f"#{idx} - {chunk.get('title', '')} (score: {chunk.get('score', 0)})")
+                    st.text(chunk.get("chunk_text", "")[:1000])
+            st.download_button(
+                label="📥 تحميل التحليل (JSON)",
+                data=json.dumps(selected, ensure_ascii=False, indent=2),
+                file_name="{}.json".format(selected_id),
+                mime="application/json"
+            )
+elif history_page is None:
+    st.warning("تعذر تحميل السجل من الـ API")
+else:
+    st.info("لا توجد نتائج مسبقة")
@@ -0,0 +1,91 @@
+"""
+إعدادات gunicorn للـ API (تُقرأ تلقائياً: gunicorn wsgi:app)
+
+- gthread: عدة workers (processes) × threads لكل worker، فالتحليل الطويل يشغل thread لا الـ process
+- التهيئة داخل كل worker بعد الـ fork (post_worker_init)، وليس في الـ master
+- الـ jobs مشتركة بين الـ workers عبر SQLite (JOB_STATE_PATH)، فالـ polling يصل لأي worker
+- الإيقاف (SIGTERM): الـ worker يتوقف عن قبول الاتصالات وطلبات /jobs الجديدة، يكمل الطلبات الجارية،
+  ثم ينتظر الـ jobs الجارية حتى GUNICORN_GRACEFUL_TIMEOUT
+"""
+import os
+import signal
+import time
+
+# قبل استيراد Config: حالة الـ jobs مشتركة افتراضياً عند تعدد الـ workers
+os.environ.setdefault("JOB_STATE_PATH", "cache/jobs.sqlite3")
+
+from config import Config
+
+bind = "{}:{}".format(Config.FLASK_HOST, Config.FLASK_PORT)
+workers = Config.GUNICORN_WORKERS
+worker_class = "gthread"
+threads = Config.GUNICORN_THREADS
+# مع gthread هذه مهلة heartbeat الـ worker وليست مدة الطلب (التحليل قد يستغرق دقائق)
+timeout = 120
+graceful_timeout = Config.GUNICORN_GRACEFUL_TIMEOUT
+keepalive = Config.GUNICORN_KEEPALIVE_SECONDS
+# التطبيق يُستورد داخل كل worker (لا connections أو threads موروثة من الـ master)
+preload_app = False
+accesslog = "-"
+errorlog = "-"
+
+# لحظة استلام SIGTERM في الـ worker (مهلة الـ drain تُحسب منها)
+_shutdown_started = None
+
+
+def on_starting(server):
+    """في الـ master قبل إنشاء الـ workers: فحص الإعدادات مرة واحدة"""
+    try:
+        Config.validate()
+    except ValueError as e:
+        print("[ERROR] {}".format(e))
+        raise SystemExit(1)
+
+    # بدون Store ID كل worker سينشئ Store خاصاً ويرفع الملفات: worker واحد حتى يُحفظ المعرف في .env
+    needs_store = (
+        Config.RETRIEVAL_BACKEND == "file_search"
+        and Config.GEMINI_STANDIN_MODE != "replay"
+        and not Config.FILE_SEARCH_STORE_ID
+    )
+    if needs_store and server.num_workers > 1:
+        print("[WARNING] FILE_SEARCH_STORE_ID is not set: starting 1 worker so only one store is created")
+        server.num_workers = 1
+
+    # الـ workers تُنشأ بـ fork من هنا فترث القيمة: كل worker يأخذ 1/N من حدود RPM/TPM لـ Gemini
+    Config.API_WORKERS = server.num_workers
+    os.environ["API_WORKERS"] = str(server.num_workers)
+
+    print("[INFO] Serving with {} worker(s) x {} thread(s), graceful timeout {}s".format(
+        server.num_workers, threads, graceful_timeout
+    ))
+
+
+def post_worker_init(worker):
+    """تهيئة الخدمات داخل الـ worker (بعد الـ fork) + بداية الـ drain عند SIGTERM"""
+    import app as api
+
+    if not api.initialize_services():
+        raise SystemExit(1)
+
+    handle_exit = worker.handle_exit
+
+    def on_term(sig, frame):
+        global _shutdown_started
+        _shutdown_started = time.monotonic()
+        api.begin_shutdown()
+        handle_exit(sig, frame)
+
+    signal.signal(signal.SIGTERM, on_term)
+
+
+def worker_exit(server, worker):
+    """داخل الـ worker بعد انتهاء الطلبات الجارية: انتظار الـ jobs بما تبقى من المهلة"""
+    # الإيقاف السريع (SIGINT/SIGQUIT) أو خروج الـ worker لسبب آخر: بدون انتظار
+    if _shutdown_started is None:
+        return
+
+    import app as api
+
+    elapsed = time.monotonic() - _shutdown_started
+    # هامش قبل أن يرسل الـ master إشارة SIGKILL
+    api.drain(max(0.0, graceful_timeout - elapsed - 5))
@@ -1,6 +1,204 @@
+import argparse
+import json
+import sys
+
+from config import Config
+
+
+def read_jsonl(path: str):
+    """قراءة سجلات العقود من ملف JSONL (أو stdin عند path = '-')"""
+    stream = sys.stdin if path == "-" else open(path, "r", encoding="utf-8")
+    try:
+        for line_number, line in enumerate(stream, 1):
+            line = line.strip()
+            if not line:
+                continue
+            try:
+                yield json.loads(line)
+            except json.JSONDecodeError as e:
+                print("[WARNING] Skipping invalid JSON on line {}: {}".format(line_number, e), file=sys.stderr)
+    finally:
+        if stream is not sys.stdin:
+            stream.close()
+
+
+def run_batch(args) -> int:
+    """تحليل ملف JSONL من العقود وكتابة النتائج JSONL فور انتهاء كل عقد (قابل للاستئناف)"""
+    from services.file_search import FileSearchService
+    from services.batch import BatchRunner
+
+    try:
+        Config.validate()
+    except ValueError as e:
+        print("[ERROR] {}".format(e))
+        return 1
+
+    service = FileSearchService()
+    service.initialize_store()
+
+    runner = BatchRunner(
+        service,
+        max_concurrency=args.concurrency,
+        max_contracts_per_minute=args.rate
+    )
+
+    # الاستئناف: العقود التي نجحت في تشغيل سابق لا يُعاد تحليلها
+    skip_ids = set() if args.no_resume else BatchRunner.load_completed_ids(args.output)
+    if skip_ids:
+        print("[INFO] Resuming: {} contract(s) already completed in {}".format(len(skip_ids), args.output))
+
+    failed = 0
+    with open(args.output, "a", encoding="utf-8") as out:
+        for result in runner.run(read_jsonl(args.input), args.top_k, skip_ids):
+            out.write(json.dumps(result, ensure_ascii=False) + "\n")
+            out.flush()
+            if result["status"] != "ok":
+                failed += 1
+
+    return 1 if failed else 0
+
+
+def build_index(args) -> int:
+    """بناء الفهرس المحلي المحفوظ بجانب context/ (لا يُعاد البناء إذا لم تتغير الملفات)"""
+    from services.local_retrieval import LocalRetrievalEngine
+
+    engine = LocalRetrievalEngine(
+        Config.CONTEXT_DIR,
+        chunk_chars=Config.LOCAL_CHUNK_CHARS,
+        overlap_chars=Config.LOCAL_CHUNK_OVERLAP_CHARS
+    )
+
+    if args.force:
+        engine.build()
+        engine.save(args.index_dir)
+    else:
+        engine.load_or_build(args.index_dir)
+
+    print("[INFO] Index: {}".format(engine.info()))
+    return 0
+
+
+def sync_context(args) -> int:
+    """رفع ملفات context/ الجديدة أو المتغيرة إلى الـ Store (يُستأنف إذا انقطع رفع سابق)"""
+    from services.file_search import FileSearchService
+
+    try:
+        Config.validate()
+    except ValueError as e:
+        print("[ERROR] {}".format(e))
+        return 1
+
+    if args.workers is not None:
+        Config.UPLOAD_MAX_WORKERS = args.workers
+
+    service = FileSearchService()
+    summary = service.sync_context_files()
+    print("[INFO] Sync: {}".format(json.dumps(summary, ensure_ascii=False)))
+    return 1 if summary.get("failed") else 0
+
+
+def _int_list(value: str):
+    return [int(item) for item in value.split(",") if item.strip()]
+
+
+def run_benchmark(args) -> int:
+    """قياس الـ pipeline مقابل الـ replay stand-in وكتابة النتائج JSON (مع مقارنة اختيارية بتشغيل سابق)"""
+    from services.benchmark import BenchmarkRunner, compare_results
+
+    runner = BenchmarkRunner(
+        time_scale=args.time_scale,
+        extraction_latency=args.extraction_latency,
+        search_latency=args.search_latency,
+        error_503_rate=args.error_503_rate,
+        error_429_rate=args.error_429_rate,
+        seed=args.seed,
+        use_cache=args.cache,
+        keep_rate_limits=args.rate_limits,
+        verbose=args.verbose
+    )
+    results = runner.run(
+        targets=[t.strip() for t in args.targets.split(",") if t.strip()],
+        lengths=_int_list(args.lengths),
+        sensitive=_int_list(args.sensitive),
+        top_ks=_int_list(args.top_k),
+        concurrencies=_int_list(args.concurrency),
+        requests=args.requests
+    )
+
+    with open(args.output, "w", encoding="utf-8") as f:
+        json.dump(results, f, ensure_ascii=False, indent=2)
+    print("[INFO] Benchmark results written to {}".format(args.output))
+
+    if args.baseline:
+        with open(args.baseline, "r", encoding="utf-8") as f:
+            baseline = json.load(f)
+        regressions = compare_results(results, baseline, args.threshold)
+        for regression in regressions:
+            print("[WARNING] Regression in {name}: {metric} {baseline} -> {current}".format(**regression))
+        if regressions:
+            return 1
+        print("[SUCCESS] No regressions against {} (commit {})".format(
+            args.baseline, baseline.get("meta", {}).get("commit")
+        ))
+    return 0
+
+
 def main():
-    print("Hello from repl-nix-workspace!")
+    parser = argparse.ArgumentParser(description="Gemini File Search - contract analysis tools")
+    subparsers = parser.add_subparsers(dest="command", required=True)
+
+    batch = subparsers.add_parser("batch", help="Analyze a JSONL file of contracts")
+    batch.add_argument("--input", "-i", required=True,
+                       help="JSONL input, one {\"id\", \"contract_text\", \"top_k\"} per line ('-' for stdin)")
+    batch.add_argument("--output", "-o", required=True,
+                       help="JSONL output, appended to as each contract finishes")
+    batch.add_argument("--concurrency", "-c", type=int, default=Config.BATCH_MAX_CONCURRENCY,
+                       help="Maximum contracts analyzed at once")
+    batch.add_argument("--rate", type=int, default=Config.BATCH_MAX_CONTRACTS_PER_MINUTE,
+                       help="Maximum contracts started per minute (0 = unlimited)")
+    batch.add_argument("--top-k", type=int, default=Config.TOP_K_CHUNKS,
+                       help="Default top_k for contracts that do not set one")
+    batch.add_argument("--no-resume", action="store_true",
+                       help="Re-analyze contracts already completed in the output file")
+    batch.set_defaults(func=run_batch)
+
+    index = subparsers.add_parser("build-index", help="Build the persisted local retrieval index")
+    index.add_argument("--index-dir", default=Config.LOCAL_INDEX_DIR,
+                       help="Directory for the memory-mapped index files")
+    index.add_argument("--force", action="store_true",
+                       help="Rebuild even if the context files have not changed")
+    index.set_defaults(func=build_index)
+
+    sync = subparsers.add_parser("sync-context", help="Upload new or changed context/ files to the File Search Store")
+    sync.add_argument("--workers", "-w", type=int, default=None,
+                      help="Parallel uploads (default: UPLOAD_MAX_WORKERS)")
+    sync.set_defaults(func=sync_context)
+
+    bench = subparsers.add_parser("benchmark", help="Benchmark search_chunks and /file_search against the replay stand-in")
+    bench.add_argument("--output", "-o", default="benchmark_results.json", help="JSON results file")
+    bench.add_argument("--targets", default="service", help="Comma list of: service, http")
+    bench.add_argument("--lengths", default="3000,40000", help="Contract lengths in characters")
+    bench.add_argument("--sensitive", default="0,4", help="Sensitive clauses per contract")
+    bench.add_argument("--top-k", default="10", help="Phase 1 top_k values")
+    bench.add_argument("--concurrency", default="1,4", help="Concurrent requests")
+    bench.add_argument("--requests", "-n", type=int, default=8, help="Requests per scenario")
+    bench.add_argument("--time-scale", type=float, default=0.01,
+                       help="Multiplier on simulated Gemini latency (1.0 = real time)")
+    bench.add_argument("--extraction-latency", default=Config.GEMINI_STANDIN_LATENCY_EXTRACTION)
+    bench.add_argument("--search-latency", default=Config.GEMINI_STANDIN_LATENCY_SEARCH)
+    bench.add_argument("--error-503-rate", type=float, default=0.0)
+    bench.add_argument("--error-429-rate", type=float, default=0.0)
+    bench.add_argument("--seed", type=int, default=Config.GEMINI_STANDIN_RANDOM_SEED)
+    bench.add_argument("--cache", action="store_true", help="Keep result/clause caches enabled")
+    bench.add_argument("--rate-limits", action="store_true", help="Keep the gateway RPM/TPM limits")
+    bench.add_argument("--baseline", help="Previous results file: exit 1 on p95/throughput/call-count regressions")
+    bench.add_argument("--threshold", type=float, default=0.10, help="Allowed relative slowdown vs --baseline")
+    bench.add_argument("--verbose", action="store_true", help="Show service logs while benchmarking")
+    bench.set_defaults(func=run_benchmark)
+
+    args = parser.parse_args()
+    return args.func(args)
 
 
 if __name__ == "__main__":
-    main()
+    sys.exit(main())
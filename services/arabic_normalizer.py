@@ -0,0 +1,118 @@
+import re
+import unicodedata
+from typing import Iterable, List
+
+
+# رقم إصدار قواعد التطبيع - أي تغيير في الجداول يجب أن يرفعه (يدخل في بصمة الفهرس المحلي)
+NORMALIZER_VERSION = 3
+
+# التشكيل (الحركات، الشدة، السكون، الألف الخنجرية، علامات القرآن)
+_TASHKEEL_RE = re.compile(r"[\u0610-\u061A\u064B-\u065F\u0670\u06D6-\u06ED]")
+_TATWEEL = "\u0640"
+_HORIZONTAL_SPACE_RE = re.compile(r"[ \t\u00a0]+")
+_WHITESPACE_RE = re.compile(r"\s+")
+
+# جداول str.translate (تعمل بسرعة C على النص كاملاً)
+_DIGITS = str.maketrans("٠١٢٣٤٥٦٧٨٩۰۱۲۳۴۵۶۷۸۹", "01234567890123456789")
+# التطويل وعلامات الاتجاه والمسافات الصفرية تُحذف تماماً
+_CLEAN_TABLE = {ord(_TATWEEL): None}
+_CLEAN_TABLE.update({code: None for code in range(0x200B, 0x2010)})
+_CLEAN_TABLE.update(_DIGITS)
+
+_FOLD_TABLE = str.maketrans({
+    "أ": "ا", "إ": "ا", "آ": "ا", "ٱ": "ا",
+    "ى": "ي", "ئ": "ي",
+    "ؤ": "و",
+    "ة": "ه"
+})
+
+# ===== إصلاحات OCR المعروفة (لنص المراجع المفهرس فقط) =====
+# الـ OCR يقرأ ligature "لا" على أنها "ال" (إال بدل إلا، معامالت بدل معاملات)
+# لا تُطبق على نص العقد ولا على الـ chunks المعروضة: بعض الأشكال الخاطئة كلمات صحيحة في سياق آخر
+# (صالة، سالم، وال، بال...)، لذلك الجداول تضم فقط ما لا يوجد بهذا الشكل في العربية الصحيحة
+
+# كلمات مستقلة
+_OCR_WORDS = {
+    "ال": "لا",
+    "إال": "إلا",
+    "أال": "ألا",
+}
+
+# جذوع داخل الكلمات (لا تظهر داخل أي كلمة صحيحة - "عمالت" مثلاً مستبعدة لأنها جزء من "عمالته")
+_OCR_STEMS = {
+    "مالحظ": "ملاحظ",
+    "مالحق": "ملاحق",
+    "عمالء": "عملاء",
+    "معامالت": "معاملات",
+    "تعديالت": "تعديلات",
+    "الالزم": "اللازم",
+    "أخالق": "أخلاق",
+}
+
+_OCR_WORDS_RE = re.compile(
+    r"(?<!\w)(" + "|".join(sorted(map(re.escape, _OCR_WORDS), key=len, reverse=True)) + r")(?!\w)"
+)
+_OCR_STEMS_RE = re.compile("|".join(sorted(map(re.escape, _OCR_STEMS), key=len, reverse=True)))
+# لا توجد كلمة عربية تبدأ بـ "اال": هي دائماً "الا" (االستثمار ← الاستثمار)
+_OCR_ALEF_LAM_RE = re.compile(r"(?<!\w)([وفبك]?)اال")
+
+
+def fix_ocr(text: str) -> str:
+    """
+    إصلاح أخطاء OCR المعروفة في نص المراجع (context/) قبل فهرسته
+
+    للفهرسة فقط: النص المعروض للمستخدم ونص العقد لا يمران بها
+    """
+    text = _OCR_ALEF_LAM_RE.sub(r"\1الا", text)
+    text = _OCR_STEMS_RE.sub(lambda m: _OCR_STEMS[m.group(0)], text)
+    return _OCR_WORDS_RE.sub(lambda m: _OCR_WORDS[m.group(1)], text)
+
+
+def clean_arabic(text: str) -> str:
+    """
+    تنظيف آمن للعرض (يُستخدم لنص الـ chunks والاستعلامات المرسلة لـ Gemini)
+
+    - NFKC (تفكيك أشكال العرض presentation forms والـ ligatures)
+    - حذف التشكيل والتطويل
+    - تحويل الأرقام العربية-الهندية إلى أرقام لاتينية
+    - دمج المسافات الأفقية المتكررة (مع الحفاظ على الأسطر)
+    """
+    if not text:
+        return ""
+    text = unicodedata.normalize("NFKC", text)
+    text = _TASHKEEL_RE.sub("", text).translate(_CLEAN_TABLE)
+    return _HORIZONTAL_SPACE_RE.sub(" ", text).strip()
+
+
+def normalize_arabic(text: str) -> str:
+    """
+    تطبيع كامل للمطابقة (مفاتيح الكاش، إزالة التكرار، الفهرسة والبحث المحلي)
+
+    clean_arabic + توحيد الألف والياء والتاء المربوطة + أحرف صغيرة + دمج كل المسافات
+    """
+    return _WHITESPACE_RE.sub(" ", fold_arabic(clean_arabic(text)))
+
+
+def _lower_char(char: str) -> str:
+    """حرف صغير واحد: الأحرف التي يتغير طولها بـ lower() (مثل 'İ') تأخذ أول حرف من الناتج"""
+    lowered = char.lower()
+    return lowered[:1] or char
+
+
+def fold_arabic(text: str) -> str:
+    """
+    توحيد الألف والياء والتاء المربوطة + أحرف صغيرة فقط (لنص مرّ بـ clean_arabic)
+
+    حرف بحرف: لا يغيّر طول النص ولا حدود الكلمات. str.lower() قد يغيّر الطول ('İ' → حرفان)،
+    فعندها فقط يُطبّق حرفاً بحرف
+    """
+    folded = text.translate(_FOLD_TABLE)
+    lowered = folded.lower()
+    if len(lowered) == len(folded):
+        return lowered
+    return "".join(_lower_char(char) for char in folded)
+
+
+def normalize_many(texts: Iterable[str]) -> List[str]:
+    """تطبيع مجموعة نصوص دفعة واحدة"""
+    return [normalize_arabic(text) for text in texts]
@@ -0,0 +1,170 @@
+import hashlib
+import json
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor, wait, FIRST_COMPLETED
+from typing import Dict, Iterable, Iterator, Optional, Set
+
+
+class BatchRunner:
+    """
+    تشغيل تحليل عدد كبير من العقود عبر FileSearchService (JSONL in / JSONL out)
+
+    - حد عام لعدد العقود قيد التحليل في نفس الوقت (مشترك بين كل الـ batches)
+    - ميزانية معدل (عقود في الدقيقة) لتجنب أخطاء 429/503 من Gemini
+    - النتائج تُرجع فور انتهاء كل عقد (ترتيب الانتهاء وليس ترتيب الإدخال)
+    - الاستئناف: تمرير skip_ids لتخطي العقود التي اكتملت سابقاً
+    """
+
+    def __init__(self, service, max_concurrency: int, max_contracts_per_minute: int):
+        self.service = service
+        self.max_concurrency = max(1, max_concurrency)
+        self.max_contracts_per_minute = max_contracts_per_minute
+
+        # الـ semaphore مشترك بين كل الـ batches لنفس الـ runner (حد عام)
+        self._slots = threading.BoundedSemaphore(self.max_concurrency)
+
+        self._rate_lock = threading.Lock()
+        self._next_start = 0.0
+
+    @staticmethod
+    def record_id(record: Dict) -> str:
+        """معرّف العقد: id أو request_id إن وجد، وإلا hash لنص العقد (ثابت عند الاستئناف)"""
+        for field in ("id", "request_id", "contract_id"):
+            if record.get(field):
+                return str(record[field])
+        contract_text = record.get("contract_text", "")
+        return "sha256:" + hashlib.sha256(contract_text.encode("utf-8")).hexdigest()[:16]
+
+    @staticmethod
+    def load_completed_ids(output_path: str) -> Set[str]:
+        """قراءة ملف النتائج السابق (إن وجد) وإرجاع معرّفات العقود التي نجحت"""
+        completed = set()
+        try:
+            with open(output_path, "r", encoding="utf-8") as f:
+                for line in f:
+                    line = line.strip()
+                    if not line:
+                        continue
+                    try:
+                        record = json.loads(line)
+                    except json.JSONDecodeError:
+                        # سطر ناقص من تشغيل انقطع - سيُعاد تحليل هذا العقد
+                        continue
+                    if record.get("status") == "ok" and not record.get("partial") and record.get("id"):
+                        completed.add(record["id"])
+        except FileNotFoundError:
+            pass
+        return completed
+
+    def _wait_for_rate_budget(self):
+        """انتظار حتى يسمح معدل العقود في الدقيقة ببدء عقد جديد"""
+        if self.max_contracts_per_minute <= 0:
+            return
+
+        interval = 60.0 / self.max_contracts_per_minute
+        with self._rate_lock:
+            now = time.monotonic()
+            start_at = max(now, self._next_start)
+            self._next_start = start_at + interval
+
+        delay = start_at - time.monotonic()
+        if delay > 0:
+            time.sleep(delay)
+
+    def _analyze(self, record: Dict, default_top_k: int) -> Dict:
+        """تحليل عقد واحد - لا يرفع استثناءات بل يرجعها كسجل status=error"""
+        record_id = self.record_id(record)
+        contract_text = record.get("contract_text", "")
+        top_k = record.get("top_k", default_top_k)
+
+        if not contract_text or not contract_text.strip():
+            return {"id": record_id, "status": "error", "error": "Contract text cannot be empty"}
+
+        search_status = {}
+
+        def progress(event: str, data: Dict):
+            if event == "search_status":
+                search_status.update(data)
+
+        with self._slots:
+            self._wait_for_rate_budget()
+            started = time.time()
+            try:
+                chunks, extracted_terms = self.service.search_chunks(
+                    contract_text, top_k,
+                    progress_callback=progress,
+                    token_budget=record.get("token_budget"),
+                    deadline_seconds=record.get("deadline_seconds")
+                )
+            except Exception as e:
+                print("[ERROR] Batch contract {} failed: {}".format(record_id, e))
+                return {
+                    "id": record_id,
+                    "status": "error",
+                    "error": str(e),
+                    "elapsed_seconds": round(time.time() - started, 3)
+                }
+
+        return {
+            "id": record_id,
+            "status": "ok",
+            "contract_length": len(contract_text),
+            "extracted_terms": extracted_terms,
+            "chunks": chunks,
+            "total_chunks": len(chunks),
+            "top_k": top_k,
+            "partial": search_status.get("partial", False),
+            "skipped_clauses": search_status.get("skipped_clauses", []),
+            "elapsed_seconds": round(time.time() - started, 3)
+        }
+
+    def run(self, records: Iterable[Dict], default_top_k: int,
+            skip_ids: Optional[Set[str]] = None) -> Iterator[Dict]:
+        """
+        تحليل العقود وإرجاع النتائج فور انتهاء كل عقد
+
+        Args:
+            records: سجلات العقود (كل سجل يحتوي على contract_text و id/top_k اختيارياً)
+            default_top_k: top_k الافتراضي للسجلات التي لا تحدده
+            skip_ids: معرّفات عقود مكتملة سابقاً (للاستئناف)
+
+        Yields:
+            Dict: سجل نتيجة لكل عقد
+        """
+        skip_ids = skip_ids or set()
+        records_iter = iter(records)
+        skipped = 0
+        finished = 0
+
+        # نافذة محدودة من الـ futures حتى لا نحمّل آلاف العقود في الذاكرة دفعة واحدة
+        window = self.max_concurrency * 2
+
+        with ThreadPoolExecutor(max_workers=self.max_concurrency, thread_name_prefix="batch") as executor:
+            pending = set()
+            exhausted = False
+
+            while pending or not exhausted:
+                while not exhausted and len(pending) < window:
+                    try:
+                        record = next(records_iter)
+                    except StopIteration:
+                        exhausted = True
+                        break
+
+                    if self.record_id(record) in skip_ids:
+                        skipped += 1
+                        continue
+                    pending.add(executor.submit(self._analyze, record, default_top_k))
+
+                if not pending:
+                    continue
+
+                done, pending = wait(pending, return_when=FIRST_COMPLETED)
+                for future in done:
+                    finished += 1
+                    result = future.result()
+                    print("[BATCH] {} finished ({}) - {} done".format(result["id"], result["status"], finished))
+                    yield result
+
+        print("[BATCH] Completed {} contract(s), skipped {} already done".format(finished, skipped))
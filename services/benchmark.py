@@ -0,0 +1,376 @@
+import contextlib
+import itertools
+import json
+import os
+import platform
+import resource
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from typing import Callable, Dict, List, Optional, Sequence
+
+from config import Config
+
+# بنود حساسة (تطابق كلمات _get_sensitive_keywords) وعادية للعقود الاصطناعية
+_SENSITIVE_ISSUES = [["الربا", "فائدة التأخير"], ["الغرر", "الجهالة"], ["الشرط الجائر"], ["الضرر"]]
+_NEUTRAL_ISSUES = ["صياغة غير واضحة"]
+_CLAUSE_BODY = "يلتزم الطرف الأول بتسليم المبيع في الموعد المحدد ويلتزم الطرف الثاني بسداد الثمن على أقساط شهرية متساوية. "
+
+
+def percentile(values: Sequence[float], pct: float) -> Optional[float]:
+    """النسبة المئوية بطريقة nearest-rank (نفس الطريقة في كل تشغيل حتى تتقارن النتائج)"""
+    if not values:
+        return None
+    ordered = sorted(values)
+    rank = max(1, int(-(-pct * len(ordered) // 100)))
+    return ordered[min(rank, len(ordered)) - 1]
+
+
+def current_rss_mb() -> float:
+    """الذاكرة المقيمة الحالية للعملية (Linux: /proc/self/statm، وإلا أقصى قيمة من getrusage)"""
+    try:
+        with open("/proc/self/statm", "r") as f:
+            pages = int(f.read().split()[1])
+        return pages * os.sysconf("SC_PAGE_SIZE") / (1024 * 1024)
+    except (OSError, ValueError, IndexError):
+        return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024
+
+
+class RssSampler:
+    """أعلى RSS أثناء سيناريو واحد (عينة كل interval ثانية في thread خلفي)"""
+
+    def __init__(self, interval: float = 0.05):
+        self.interval = interval
+        self.peak_mb = current_rss_mb()
+        self._stop = threading.Event()
+        self._thread = threading.Thread(target=self._run, name="rss-sampler", daemon=True)
+
+    def _run(self):
+        while not self._stop.wait(self.interval):
+            self.peak_mb = max(self.peak_mb, current_rss_mb())
+
+    def __enter__(self):
+        self._thread.start()
+        return self
+
+    def __exit__(self, *exc):
+        self._stop.set()
+        self._thread.join()
+        self.peak_mb = max(self.peak_mb, current_rss_mb())
+
+
+def synthetic_terms(total_terms: int, sensitive_clauses: int) -> List[Dict]:
+    """بنود مستخرجة اصطناعية: أول sensitive_clauses منها حساسة والباقي عادية"""
+    terms = []
+    for idx in range(max(total_terms, sensitive_clauses)):
+        sensitive = idx < sensitive_clauses
+        terms.append({
+            "term_id": "clause_{}".format(idx + 1),
+            "term_text": "البند {}: {}".format(idx + 1, _CLAUSE_BODY.strip()),
+            "potential_issues": _SENSITIVE_ISSUES[idx % len(_SENSITIVE_ISSUES)] if sensitive else _NEUTRAL_ISSUES,
+            "relevance_reason": "بند اصطناعي للقياس"
+        })
+    return terms
+
+
+def synthetic_contract(length_chars: int, variant: int = 0) -> str:
+    """نص عقد بطول محدد مقسم على "المادة (n)" (يمر بمسار العقود الطويلة عند تجاوز العتبة)"""
+    parts = ["عقد مرابحة رقم {}\n".format(variant)]
+    size = len(parts[0])
+    article = 1
+    while size < length_chars:
+        block = "المادة ({}): {}\n".format(article, _CLAUSE_BODY * 3)
+        parts.append(block)
+        size += len(block)
+        article += 1
+    return "".join(parts)[:max(length_chars, 1)]
+
+
+def synthetic_fixtures(path: str, sensitive_clauses: int, total_terms: int = 8, search_chunks: int = 20) -> str:
+    """
+    ملف تسجيلات للـ replay بمحتوى معروف: استجابة استخراج واحدة واستجابة بحث واحدة
+
+    (كل طلب من نفس النوع يأخذ نفس الاستجابة، فعدد البنود الحساسة ثابت في السيناريو)
+    """
+    chunks = [
+        {"retrieved_context": {
+            "text": "المعيار الشرعي رقم {}: {}".format(idx + 1, "لا يجوز اشتراط زيادة على الدين مقابل التأخير. " * 12),
+            "title": "Shariaah-Standards-ARB.pdf"
+        }}
+        for idx in range(search_chunks)
+    ]
+    records = [
+        {"kind": "extraction", "response": {"candidates": [{"content": {"role": "model", "parts": [
+            {"text": json.dumps(synthetic_terms(total_terms, sensitive_clauses), ensure_ascii=False)}
+        ]}}]}},
+        {"kind": "search", "response": {"candidates": [{
+            "content": {"role": "model", "parts": [{"text": "مقاطع ذات صلة."}]},
+            "grounding_metadata": {"grounding_chunks": chunks}
+        }]}}
+    ]
+    with open(path, "w", encoding="utf-8") as f:
+        for record in records:
+            f.write(json.dumps(record, ensure_ascii=False) + "\n")
+    return path
+
+
+def git_commit() -> Optional[str]:
+    try:
+        return subprocess.check_output(
+            ["git", "rev-parse", "--short", "HEAD"], stderr=subprocess.DEVNULL, text=True,
+            cwd=os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+        ).strip()
+    except Exception:
+        return None
+
+
+def _api_call_counts() -> Dict[str, float]:
+    from services.metrics import GEMINI_CALLS
+    return {
+        "{}_{}".format(kind, outcome): GEMINI_CALLS.value(kind=kind, outcome=outcome)
+        for kind in ("extraction", "general", "deep")
+        for outcome in ("ok", "error", "deadline")
+    }
+
+
+class BenchmarkRunner:
+    """
+    قياس search_chunks و /file_search مقابل الـ replay stand-in (بدون استدعاءات Gemini)
+
+    كل سيناريو (طول العقد × البنود الحساسة × top_k × التزامن × الهدف) يبني خدمة جديدة
+    بنفس seed وتوزيعات الزمن، فتتقارن النتائج بين commits مختلفة على نفس الجهاز
+    """
+
+    def __init__(self, time_scale: float = 0.01, extraction_latency: str = "lognormal:10:0.35",
+                 search_latency: str = "lognormal:15:0.45", error_503_rate: float = 0.0,
+                 error_429_rate: float = 0.0, seed: int = 42, use_cache: bool = False,
+                 keep_rate_limits: bool = False, verbose: bool = False,
+                 log: Callable[[str], None] = None):
+        self.time_scale = time_scale
+        self.extraction_latency = extraction_latency
+        self.search_latency = search_latency
+        self.error_503_rate = error_503_rate
+        self.error_429_rate = error_429_rate
+        self.seed = seed
+        self.use_cache = use_cache
+        self.keep_rate_limits = keep_rate_limits
+        self.verbose = verbose
+        self.log = log or (lambda message: print(message, file=sys.stderr))
+        self._workdir = tempfile.mkdtemp(prefix="contract-bench-")
+        self._devnull = open(os.devnull, "w")
+
+    def _quiet(self):
+        """سطور [INFO]/[TRACE] الكثيرة تؤثر على الزمن تحت التزامن، فتُحجب إلا مع verbose"""
+        return contextlib.nullcontext() if self.verbose else contextlib.redirect_stdout(self._devnull)
+
+    def _configure(self, fixtures_path: str):
+        Config.GEMINI_STANDIN_MODE = "replay"
+        Config.GEMINI_STANDIN_FIXTURES = fixtures_path
+        Config.GEMINI_STANDIN_SEED_DIR = ""
+        Config.GEMINI_STANDIN_LATENCY_EXTRACTION = self.extraction_latency
+        Config.GEMINI_STANDIN_LATENCY_SEARCH = self.search_latency
+        Config.GEMINI_STANDIN_TIME_SCALE = self.time_scale
+        Config.GEMINI_STANDIN_ERROR_503_RATE = self.error_503_rate
+        Config.GEMINI_STANDIN_ERROR_429_RATE = self.error_429_rate
+        Config.GEMINI_STANDIN_RPM = 0
+        Config.GEMINI_STANDIN_RANDOM_SEED = self.seed
+        Config.GEMINI_PREWARM = False
+        Config.RETRIEVAL_BACKEND = "file_search"
+        Config.FILE_SEARCH_STORE_ID = Config.FILE_SEARCH_STORE_ID or "fileSearchStores/benchmark"
+        # العقود الاصطناعية لا تُحفظ في سجل التحليلات الحقيقي
+        Config.RESULTS_STORE_ENABLED = False
+        if not self.use_cache:
+            Config.RESULT_CACHE_ENABLED = False
+            Config.CLAUSE_CACHE_ENABLED = False
+        if not self.keep_rate_limits:
+            # الزمن مضغوط بـ time_scale، فحدود الدقيقة الحقيقية تقيس الـ throttling لا الـ pipeline
+            Config.GEMINI_REQUESTS_PER_MINUTE = 0
+            Config.GEMINI_TOKENS_PER_MINUTE = 0
+
+    def _build_service(self, sensitive_clauses: int):
+        from services.file_search import FileSearchService
+
+        fixtures_path = os.path.join(self._workdir, "fixtures_{}.jsonl".format(sensitive_clauses))
+        synthetic_fixtures(fixtures_path, sensitive_clauses)
+        self._configure(fixtures_path)
+        with self._quiet():
+            service = FileSearchService()
+            service.initialize_store()
+        return service
+
+    @staticmethod
+    def _service_call(service, top_k: int) -> Callable[[str], Dict]:
+        def call(contract_text: str) -> Dict:
+            status = {}
+
+            def progress(event, data):
+                if event == "search_status":
+                    status.update(data)
+
+            service.search_chunks(contract_text, top_k, progress_callback=progress)
+            return {"partial": status.get("partial", False)}
+        return call
+
+    @staticmethod
+    def _http_call(service, top_k: int) -> Callable[[str], Dict]:
+        import app as api
+
+        api.file_search_service = service
+        api.startup_state["status"] = "ready"
+        local = threading.local()
+
+        def call(contract_text: str) -> Dict:
+            # test_client لكل thread (نفس مسار Flask: routing، JSON، hooks المقاييس)
+            if not hasattr(local, "client"):
+                local.client = api.app.test_client()
+            response = local.client.post("/file_search", json={"contract_text": contract_text, "top_k": top_k})
+            if response.status_code != 200:
+                raise RuntimeError("HTTP {}: {}".format(response.status_code, response.get_data(as_text=True)[:200]))
+            return {"partial": bool(response.get_json().get("partial"))}
+        return call
+
+    def run_scenario(self, target: str, contract_chars: int, sensitive_clauses: int, top_k: int,
+                     concurrency: int, requests: int) -> Dict:
+        """تشغيل سيناريو واحد وإرجاع زمن كل طلب (p50/p95/p99) والـ throughput و RSS وعدد الاستدعاءات"""
+        service = self._build_service(sensitive_clauses)
+        call = self._http_call(service, top_k) if target == "http" else self._service_call(service, top_k)
+        # عقد مختلف لكل طلب (نفس الطول) حتى لا يخدمه كاش النتائج عند --cache
+        contracts = [synthetic_contract(contract_chars, variant) for variant in range(requests)]
+
+        latencies: List[float] = []
+        errors: List[str] = []
+        partial = 0
+        lock = threading.Lock()
+
+        def one(contract_text: str):
+            nonlocal partial
+            started = time.perf_counter()
+            try:
+                result = call(contract_text)
+            except Exception as e:
+                with lock:
+                    errors.append("{}: {}".format(type(e).__name__, e)[:200])
+                return
+            elapsed = time.perf_counter() - started
+            with lock:
+                latencies.append(elapsed)
+                partial += 1 if result.get("partial") else 0
+
+        calls_before = _api_call_counts()
+        with self._quiet(), RssSampler() as rss:
+            wall_started = time.perf_counter()
+            with ThreadPoolExecutor(max_workers=max(1, concurrency)) as executor:
+                list(executor.map(one, contracts))
+            wall = time.perf_counter() - wall_started
+        calls_after = _api_call_counts()
+        gateway = service.get_gateway_stats()
+
+        api_calls = {
+            key: int(calls_after[key] - calls_before[key])
+            for key in calls_after if calls_after[key] - calls_before[key]
+        }
+        api_calls["total"] = sum(api_calls.values())
+        return {
+            "name": "{}/chars={}/sensitive={}/top_k={}/concurrency={}".format(
+                target, contract_chars, sensitive_clauses, top_k, concurrency
+            ),
+            "target": target,
+            "contract_chars": contract_chars,
+            "sensitive_clauses": sensitive_clauses,
+            "top_k": top_k,
+            "concurrency": concurrency,
+            "requests": requests,
+            "completed": len(latencies),
+            "errors": len(errors),
+            "error_samples": errors[:3],
+            "partial_results": partial,
+            "latency_seconds": {
+                "p50": _round(percentile(latencies, 50)),
+                "p95": _round(percentile(latencies, 95)),
+                "p99": _round(percentile(latencies, 99)),
+                "mean": _round(sum(latencies) / len(latencies)) if latencies else None,
+                "max": _round(max(latencies)) if latencies else None
+            },
+            "wall_seconds": _round(wall),
+            "throughput_rps": _round(len(latencies) / wall) if wall > 0 else None,
+            "peak_rss_mb": round(rss.peak_mb, 1),
+            "api_calls": api_calls,
+            "gateway": {key: gateway.get(key) for key in ("retries", "overload_errors", "failures", "throttled_seconds")},
+            "stand_in": {key: gateway["client_pool"].get(key) for key in ("calls", "injected_503", "injected_429")}
+        }
+
+    def run(self, targets: Sequence[str], lengths: Sequence[int], sensitive: Sequence[int],
+            top_ks: Sequence[int], concurrencies: Sequence[int], requests: int) -> Dict:
+        """كل تركيبات المعاملات، مع بيانات التشغيل (commit، الإعدادات) للمقارنة بين التشغيلات"""
+        scenarios = []
+        grid = list(itertools.product(targets, lengths, sensitive, top_ks, concurrencies))
+        for idx, (target, length, sensitive_count, top_k, concurrency) in enumerate(grid, 1):
+            self.log("[BENCH] {}/{}: {} chars={} sensitive={} top_k={} concurrency={}".format(
+                idx, len(grid), target, length, sensitive_count, top_k, concurrency
+            ))
+            result = self.run_scenario(target, length, sensitive_count, top_k, concurrency, requests)
+            self.log("[BENCH]   p50={p50}s p95={p95}s p99={p99}s".format(**result["latency_seconds"]) +
+                     " rps={} calls={} errors={}".format(
+                         result["throughput_rps"], result["api_calls"]["total"], result["errors"]
+                     ))
+            scenarios.append(result)
+
+        return {
+            "meta": {
+                "commit": git_commit(),
+                "timestamp": time.strftime("%Y-%m-%dT%H:%M:%S"),
+                "python": platform.python_version(),
+                "platform": platform.platform(),
+                "cpu_count": os.cpu_count(),
+                "time_scale": self.time_scale,
+                "latency": {"extraction": self.extraction_latency, "search": self.search_latency},
+                "error_rates": {"503": self.error_503_rate, "429": self.error_429_rate},
+                "seed": self.seed,
+                "cache": self.use_cache,
+                "rate_limits": self.keep_rate_limits,
+                "requests_per_scenario": requests,
+                "config": {
+                    "PIPELINED_SEARCH": Config.PIPELINED_SEARCH,
+                    "STREAMING_EXTRACTION": Config.STREAMING_EXTRACTION,
+                    "DEEP_SEARCH_MAX_WORKERS": Config.DEEP_SEARCH_MAX_WORKERS,
+                    "DEEP_SEARCH_MAX_CLAUSES": Config.DEEP_SEARCH_MAX_CLAUSES,
+                    "GEMINI_MAX_CONCURRENCY": Config.GEMINI_MAX_CONCURRENCY,
+                    "LONG_CONTRACT_THRESHOLD_CHARS": Config.LONG_CONTRACT_THRESHOLD_CHARS
+                }
+            },
+            "scenarios": scenarios
+        }
+
+
+def _round(value: Optional[float]) -> Optional[float]:
+    return round(value, 4) if value is not None else None
+
+
+def compare_results(current: Dict, baseline: Dict, threshold: float = 0.10) -> List[Dict]:
+    """
+    مقارنة p95 و throughput لكل سيناريو مشترك مع تشغيل سابق
+
+    Returns:
+        List[Dict]: السيناريوهات التي ساءت أكثر من threshold (نسبة)
+    """
+    previous = {scenario["name"]: scenario for scenario in baseline.get("scenarios", [])}
+    regressions = []
+    for scenario in current.get("scenarios", []):
+        old = previous.get(scenario["name"])
+        if not old:
+            continue
+        old_p95, new_p95 = old["latency_seconds"]["p95"], scenario["latency_seconds"]["p95"]
+        if old_p95 and new_p95 and new_p95 > old_p95 * (1 + threshold):
+            regressions.append({"name": scenario["name"], "metric": "p95", "baseline": old_p95, "current": new_p95})
+        old_rps, new_rps = old.get("throughput_rps"), scenario.get("throughput_rps")
+        if old_rps and new_rps and new_rps < old_rps * (1 - threshold):
+            regressions.append({"name": scenario["name"], "metric": "throughput_rps", "baseline": old_rps, "current": new_rps})
+        if scenario["api_calls"].get("total", 0) > old["api_calls"].get("total", 0):
+            regressions.append({
+                "name": scenario["name"], "metric": "api_calls",
+                "baseline": old["api_calls"].get("total", 0), "current": scenario["api_calls"]["total"]
+            })
+    return regressions
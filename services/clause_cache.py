@@ -0,0 +1,110 @@
+import copy
+import hashlib
+import threading
+import time
+from collections import OrderedDict
+from typing import List, Dict, Optional, Tuple
+
+from services.arabic_normalizer import normalize_arabic
+
+
+class ClauseCache:
+    """
+    كاش LRU (في الذاكرة) لنتائج البحث المعمّق على مستوى البند الواحد
+
+    العقود غالباً قوالب متكررة (مرابحة، بيع بالتقسيط) فنفس بنود التعجيل والاحتفاظ بالملكية
+    وغرامة التأخير تظهر في أغلب الطلبات. المفتاح = term_text المُطبّع + potential_issues مرتبة
+    + النموذج + الـ Store، لذلك يُعاد استخدام الـ chunks حتى لو كان العقد ككل جديداً.
+
+    يجب استدعاء invalidate() عند تغيّر محتوى الـ Store (رفع ملفات جديدة)
+
+    - المدخلات تنتهي صلاحيتها بعد ttl_seconds (0 = بدون انتهاء) حتى لا يبقى بند على نتيجة قديمة
+      طوال عمر الـ worker
+    - النتيجة الفارغة (بدون chunks) لا تُخزّن: قد تكون grounding فارغاً عابراً، فيُعاد البحث في المرة القادمة
+    """
+
+    def __init__(self, max_entries: int, ttl_seconds: float = 0):
+        self.max_entries = max_entries
+        self.ttl_seconds = ttl_seconds
+
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.expirations = 0
+
+        # المفتاح → (وقت الحفظ monotonic، الـ chunks)
+        self._entries: "OrderedDict[str, Tuple[float, List[Dict]]]" = OrderedDict()
+        self._lock = threading.Lock()
+
+    @staticmethod
+    def normalize_clause_text(text: str) -> str:
+        """تطبيع نص البند (التطبيع العربي الكامل + المسافات)"""
+        return normalize_arabic(text or "").strip()
+
+    @classmethod
+    def make_key(cls, clause: Dict, model_name: str, store_id: str) -> str:
+        """بناء مفتاح البند من النص المُطبّع والمشاكل الشرعية المرتبة"""
+        issues = sorted(cls.normalize_clause_text(i) for i in clause.get("potential_issues", []))
+        material = "\x00".join([
+            cls.normalize_clause_text(clause.get("term_text", "")),
+            "\x01".join(issues),
+            model_name or "",
+            store_id or ""
+        ])
+        return hashlib.sha256(material.encode("utf-8")).hexdigest()
+
+    def get(self, key: str) -> Optional[List[Dict]]:
+        """قراءة chunks بند من الكاش (نسخة مستقلة لأن الدمج يعدّل uid)"""
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                self.misses += 1
+                return None
+
+            created_at, chunks = entry
+            if self.ttl_seconds > 0 and time.monotonic() - created_at > self.ttl_seconds:
+                del self._entries[key]
+                self.expirations += 1
+                self.misses += 1
+                return None
+
+            self._entries.move_to_end(key)
+            self.hits += 1
+            return copy.deepcopy(chunks)
+
+    def set(self, key: str, chunks: List[Dict]):
+        """حفظ chunks بند ثم إخلاء الأقدم استخداماً إذا تجاوزنا الحد (القائمة الفارغة لا تُحفظ)"""
+        if not chunks:
+            return
+        with self._lock:
+            self._entries[key] = (time.monotonic(), copy.deepcopy(chunks))
+            self._entries.move_to_end(key)
+
+            while self.max_entries > 0 and len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+                self.evictions += 1
+
+    def invalidate(self):
+        """مسح الكاش بالكامل (يُستدعى عند تغيّر محتوى الـ Store)"""
+        with self._lock:
+            cleared = len(self._entries)
+            self._entries.clear()
+
+        print("[CACHE] Clause cache invalidated ({} entries cleared)".format(cleared))
+
+    def stats(self) -> Dict:
+        """إحصائيات الكاش لعرضها في الـ API"""
+        with self._lock:
+            entries = len(self._entries)
+
+        lookups = self.hits + self.misses
+        return {
+            "entries": entries,
+            "hits": self.hits,
+            "misses": self.misses,
+            "evictions": self.evictions,
+            "expirations": self.expirations,
+            "hit_rate": round(self.hits / lookups, 4) if lookups else 0.0,
+            "max_entries": self.max_entries,
+            "ttl_seconds": self.ttl_seconds
+        }
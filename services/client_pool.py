@@ -0,0 +1,109 @@
+import importlib.util
+import itertools
+import threading
+import time
+from typing import Dict, List
+from google import genai
+from google.genai import types
+
+
+def http2_available() -> bool:
+    """HTTP/2 في httpx يحتاج حزمة h2 (اختيارية: pip install "httpx[http2]")"""
+    return importlib.util.find_spec("h2") is not None
+
+
+class GenaiClientPool:
+    """
+    مجموعة genai.Client مشتركة بين threads الـ Flask مع connection pooling صريح
+
+    - كل client له httpx pool خاص (keep-alive + HTTP/2 إن توفر h2) بحدود اتصالات محددة،
+      فلا تتزاحم كل الطلبات المتزامنة على pool واحد
+    - الاستدعاءات توزّع بالتناوب (round-robin) عبر خاصية models
+    - باقي الخصائص (file_search_stores, operations...) تُمرر للـ client الأول،
+      لذا يُستخدم مكان genai.Client مباشرة (في GeminiGateway وغيرها)
+    """
+
+    def __init__(self, api_key: str, size: int = 1, max_connections: int = 20,
+                 max_keepalive_connections: int = 10, keepalive_expiry: float = 60.0,
+                 http2: bool = True):
+        self.size = max(1, size)
+        self.http2 = http2 and http2_available()
+        if http2 and not self.http2:
+            print("[WARNING] HTTP/2 requested but 'h2' is not installed, using HTTP/1.1 keep-alive")
+
+        self._limits = {
+            "max_connections": max_connections,
+            "max_keepalive_connections": max_keepalive_connections,
+            "keepalive_expiry": keepalive_expiry
+        }
+        self._clients: List = [self._create_client(api_key) for _ in range(self.size)]
+        self._cycle = itertools.cycle(self._clients)
+        self._lock = threading.Lock()
+        self._warmed = False
+
+        print("[INFO] Gemini client pool ready (clients={}, max_connections={}, keepalive={}, http2={})".format(
+            self.size, max_connections, max_keepalive_connections, self.http2
+        ))
+
+    def _create_client(self, api_key: str):
+        try:
+            import httpx
+            client_args = {
+                "http2": self.http2,
+                "limits": httpx.Limits(**self._limits)
+            }
+            return genai.Client(api_key=api_key, http_options=types.HttpOptions(client_args=client_args))
+        except Exception as e:
+            # نسخ google-genai القديمة لا تدعم client_args
+            print("[WARNING] Could not configure HTTP pool for Gemini client ({}), using defaults".format(e))
+            return genai.Client(api_key=api_key)
+
+    def _next(self):
+        with self._lock:
+            return next(self._cycle)
+
+    @property
+    def models(self):
+        return self._next().models
+
+    def __getattr__(self, name):
+        # يُستدعى فقط للخصائص غير المعرّفة هنا
+        if name.startswith("_"):
+            raise AttributeError(name)
+        return getattr(self._clients[0], name)
+
+    def warm_up(self, model_name: str) -> Dict:
+        """
+        فتح الاتصالات مسبقاً (TCP + TLS) لكل client بطلب metadata خفيف لا يستهلك tokens
+
+        Returns:
+            Dict: عدد الـ clients الجاهزة والزمن المستغرق
+        """
+        started = time.monotonic()
+        warmed = 0
+        for client in self._clients:
+            try:
+                client.models.get(model=model_name)
+                warmed += 1
+            except Exception as e:
+                print("[WARNING] Gemini client warm-up failed: {}".format(e))
+
+        self._warmed = warmed > 0
+        elapsed = time.monotonic() - started
+        print("[INFO] Warmed {}/{} Gemini client(s) in {:.2f}s".format(warmed, self.size, elapsed))
+        return {"warmed": warmed, "clients": self.size, "seconds": round(elapsed, 3)}
+
+    def warm_up_async(self, model_name: str) -> threading.Thread:
+        """warm_up في thread خلفي حتى لا يؤخر بدء الخادم"""
+        thread = threading.Thread(target=self.warm_up, args=(model_name,), name="genai-warmup", daemon=True)
+        thread.start()
+        return thread
+
+    def stats(self) -> Dict:
+        stats = dict(self._limits)
+        stats.update({
+            "clients": self.size,
+            "http2": self.http2,
+            "warmed": self._warmed
+        })
+        return stats
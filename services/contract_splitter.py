@@ -0,0 +1,85 @@
+import re
+from typing import List
+
+# بداية بند أو مادة في أول السطر: "البند الأول"، "المادة (5)"، "مادة 12"، "بند ثالث عشر"...
+_CLAUSE_BOUNDARY_RE = re.compile(r"^[ \t\-–*#•]*(?:ال)?(?:بند|ماد[ةه])(?=[\s:(\-–0-9٠-٩])", re.MULTILINE)
+
+
+def find_clause_boundaries(text: str) -> List[int]:
+    """مواضع بداية البنود/المواد في النص (بداية النص دائماً موضع أول)"""
+    positions = [0]
+    for match in _CLAUSE_BOUNDARY_RE.finditer(text):
+        if match.start() > 0:
+            positions.append(match.start())
+    return positions
+
+
+def _hard_split(segment: str, window_chars: int) -> List[str]:
+    """تقسيم مقطع أطول من النافذة (ملحق بلا عناوين بنود) عند أقرب سطر أو مسافة"""
+    pieces = []
+    while len(segment) > window_chars:
+        cut = segment.rfind("\n", 0, window_chars)
+        if cut < window_chars // 2:
+            cut = segment.rfind(" ", 0, window_chars)
+        if cut < window_chars // 2:
+            cut = window_chars
+        pieces.append(segment[:cut])
+        segment = segment[cut:]
+    if segment:
+        pieces.append(segment)
+    return pieces
+
+
+def _tail(text: str, overlap_chars: int) -> str:
+    """آخر overlap_chars من النص بدءاً من حدود كلمة"""
+    if overlap_chars <= 0 or not text:
+        return ""
+    tail = text[-overlap_chars:]
+    if len(tail) < len(text):
+        space = tail.find(" ")
+        if 0 <= space < len(tail) // 2:
+            tail = tail[space + 1:]
+    return tail
+
+
+def split_contract(text: str, window_chars: int, overlap_chars: int = 0) -> List[str]:
+    """
+    تقسيم عقد طويل إلى نوافذ متداخلة على حدود البنود ("البند" / "المادة")
+
+    - البنود المتتالية تُجمع في نافذة حتى window_chars
+    - كل نافذة تبدأ بآخر overlap_chars من النافذة السابقة، فالبند الواقع على الحد
+      يظهر كاملاً في إحدى النافذتين على الأقل
+    - العقد الأقصر من window_chars يرجع كنافذة واحدة كما هو
+
+    Args:
+        text: نص العقد
+        window_chars: الحجم الأقصى للنافذة بالأحرف (بدون التداخل)
+        overlap_chars: حجم التداخل بين النوافذ المتتالية
+
+    Returns:
+        List[str]: النوافذ بترتيبها في العقد
+    """
+    if window_chars <= 0 or len(text) <= window_chars:
+        return [text]
+
+    boundaries = find_clause_boundaries(text) + [len(text)]
+    segments = []
+    for start, end in zip(boundaries, boundaries[1:]):
+        segments.extend(_hard_split(text[start:end], window_chars))
+
+    windows = []
+    current = ""
+    for segment in segments:
+        if current and len(current) + len(segment) > window_chars:
+            windows.append(current)
+            current = ""
+        current += segment
+    if current.strip():
+        windows.append(current)
+
+    if overlap_chars <= 0:
+        return windows
+    return [windows[0]] + [
+        _tail(previous, overlap_chars) + window
+        for previous, window in zip(windows, windows[1:])
+    ]
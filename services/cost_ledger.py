@@ -0,0 +1,249 @@
+import sqlite3
+import threading
+import time
+from pathlib import Path
+from typing import Dict, Optional
+
+
+def usage_from_response(response) -> Dict[str, int]:
+    """
+    قراءة استهلاك الـ tokens من usage_metadata لاستجابة generate_content
+
+    - input: prompt + ما يضيفه الـ File Search tool من سياق
+    - output: نص الإجابة + tokens التفكير (thinking)
+    """
+    usage = getattr(response, "usage_metadata", None)
+    if usage is None:
+        return {"input_tokens": 0, "output_tokens": 0, "total_tokens": 0}
+
+    def count(name: str) -> int:
+        return int(getattr(usage, name, None) or 0)
+
+    input_tokens = count("prompt_token_count") + count("tool_use_prompt_token_count")
+    output_tokens = count("candidates_token_count") + count("thoughts_token_count")
+    total_tokens = count("total_token_count") or input_tokens + output_tokens
+    return {"input_tokens": input_tokens, "output_tokens": output_tokens, "total_tokens": total_tokens}
+
+
+def _empty_totals() -> Dict:
+    return {"calls": 0, "input_tokens": 0, "output_tokens": 0, "total_tokens": 0, "cost_usd": 0.0}
+
+
+def _add_usage(totals: Dict, usage: Dict[str, int], cost: float):
+    totals["calls"] += 1
+    totals["input_tokens"] += usage["input_tokens"]
+    totals["output_tokens"] += usage["output_tokens"]
+    totals["total_tokens"] += usage["total_tokens"]
+    totals["cost_usd"] += cost
+
+
+class RequestBudget:
+    """
+    دفتر tokens لطلب search_chunks واحد مع ميزانية اختيارية
+
+    آمن للاستدعاء من threads البحث المعمّق المتوازي: كل استدعاء يحجز تقديره أولاً
+    (reserve) ثم يُسوّى بالاستهلاك الفعلي (settle)، فلا تتجاوز الاستدعاءات المتزامنة الميزانية
+    """
+
+    def __init__(self, max_tokens: int = 0):
+        # 0 = بدون حد (الدفتر يُسجّل فقط)
+        self.max_tokens = max_tokens
+        self.totals = _empty_totals()
+        self.by_phase: Dict[str, Dict] = {}
+        self.reserved = 0
+        self.skipped_calls = 0
+        self._lock = threading.Lock()
+
+    @property
+    def limited(self) -> bool:
+        return self.max_tokens > 0
+
+    @property
+    def used_tokens(self) -> int:
+        return self.totals["total_tokens"]
+
+    def remaining(self) -> Optional[int]:
+        """الرصيد المتبقي بعد الاستهلاك والحجوزات الجارية (None = بدون حد)"""
+        if not self.limited:
+            return None
+        with self._lock:
+            return max(0, self.max_tokens - self.totals["total_tokens"] - self.reserved)
+
+    def reserve(self, estimate: int, force: bool = False) -> bool:
+        """
+        حجز تقدير استدعاء قبل تنفيذه - False إذا لم يعد الرصيد يكفي
+
+        force=True للاستدعاءات الإلزامية (مثل البحث الجماعي): تُحجز دائماً حتى لا
+        تستهلك الاستدعاءات المتزامنة الاختيارية رصيدها
+        """
+        if not self.limited:
+            return True
+        with self._lock:
+            if not force and self.totals["total_tokens"] + self.reserved + estimate > self.max_tokens:
+                self.skipped_calls += 1
+                return False
+            self.reserved += estimate
+            return True
+
+    def settle(self, estimate: int, phase: Optional[str] = None,
+               usage: Optional[Dict[str, int]] = None, cost: float = 0.0):
+        """إلغاء الحجز وتسجيل الاستهلاك الفعلي (usage=None عند فشل الاستدعاء)"""
+        with self._lock:
+            if self.limited:
+                self.reserved = max(0, self.reserved - estimate)
+            if usage is not None:
+                _add_usage(self.totals, usage, cost)
+                _add_usage(self.by_phase.setdefault(phase, _empty_totals()), usage, cost)
+
+    def summary(self) -> Dict:
+        """ملخص الاستهلاك لإرجاعه مع نتيجة الطلب"""
+        with self._lock:
+            totals = dict(self.totals)
+            totals["cost_usd"] = round(totals["cost_usd"], 6)
+            by_phase = {
+                phase: dict(values, cost_usd=round(values["cost_usd"], 6))
+                for phase, values in self.by_phase.items()
+            }
+            return {
+                "token_budget": self.max_tokens or None,
+                "usage": totals,
+                "by_phase": by_phase,
+                "skipped_calls": self.skipped_calls
+            }
+
+
+class CostLedger:
+    """
+    دفتر الاستهلاك على مستوى الخدمة: إجمالي يومي (UTC) + متوسط tokens لكل نوع استدعاء
+
+    - الإجمالي اليومي لكل نوع استدعاء محفوظ في SQLite (db_path)، فيبقى بعد إعادة التشغيل
+      ويجمع كل workers الخادم، ويُحتفظ بآخر retention_days يوماً فقط
+    - المتوسطات (EMA) في الذاكرة لكل worker: تُستخدم لتقدير تكلفة الاستدعاء قبل تنفيذه عند تطبيق
+      ميزانية الطلب، وتبدأ من القيم التقديرية في COST_ANALYSIS.md حتى تتوفر قياسات فعلية
+    """
+
+    def __init__(self, input_price_per_million: float, output_price_per_million: float,
+                 default_estimates: Dict[str, int], db_path: str = ":memory:",
+                 retention_days: int = 30, smoothing: float = 0.2):
+        self.input_price_per_million = input_price_per_million
+        self.output_price_per_million = output_price_per_million
+        self.db_path = db_path
+        self.retention_days = retention_days
+        self.smoothing = smoothing
+
+        self._estimates: Dict[str, float] = {k: float(v) for k, v in default_estimates.items()}
+        # آخر يوم سُجّل فيه استدعاء: حذف الأيام القديمة مرة واحدة عند بداية كل يوم
+        self._current_day: Optional[str] = None
+
+        # sqlite3 connection مشترك بين threads الـ Flask، والـ lock يضمن التسلسل
+        self._lock = threading.Lock()
+
+        if db_path != ":memory:":
+            Path(db_path).parent.mkdir(parents=True, exist_ok=True)
+        self._conn = sqlite3.connect(db_path, check_same_thread=False)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute(
+            """CREATE TABLE IF NOT EXISTS daily_usage (
+                day TEXT NOT NULL,
+                kind TEXT NOT NULL,
+                calls INTEGER NOT NULL,
+                input_tokens INTEGER NOT NULL,
+                output_tokens INTEGER NOT NULL,
+                total_tokens INTEGER NOT NULL,
+                cost_usd REAL NOT NULL,
+                PRIMARY KEY (day, kind)
+            )"""
+        )
+        self._conn.commit()
+
+    def cost(self, usage: Dict[str, int]) -> float:
+        """تكلفة الاستدعاء بالدولار حسب أسعار الإدخال والإخراج"""
+        return (
+            usage["input_tokens"] * self.input_price_per_million +
+            usage["output_tokens"] * self.output_price_per_million
+        ) / 1_000_000
+
+    def estimate(self, kind: str, units: int = 1) -> int:
+        """تقدير tokens استدعاء من نوع kind (units = عدد الوحدات مثل top_k للبحث الجماعي)"""
+        with self._lock:
+            return int(self._estimates.get(kind, 0.0) * max(1, units))
+
+    def _prune(self):
+        """حذف الأيام الأقدم من retention_days - يُستدعى داخل الـ lock وقبل الـ commit"""
+        if self.retention_days > 0:
+            self._conn.execute(
+                """DELETE FROM daily_usage WHERE day NOT IN (
+                       SELECT DISTINCT day FROM daily_usage ORDER BY day DESC LIMIT ?
+                   )""",
+                (self.retention_days,)
+            )
+
+    def record(self, kind: str, usage: Dict[str, int], units: int = 1) -> float:
+        """تسجيل استدعاء في الدفتر اليومي وتحديث متوسط نوعه - يرجع التكلفة"""
+        cost = self.cost(usage)
+        day = time.strftime("%Y-%m-%d", time.gmtime())
+
+        with self._lock:
+            try:
+                self._conn.execute(
+                    """INSERT INTO daily_usage
+                           (day, kind, calls, input_tokens, output_tokens, total_tokens, cost_usd)
+                       VALUES (?, ?, 1, ?, ?, ?, ?)
+                       ON CONFLICT(day, kind) DO UPDATE SET
+                           calls = calls + 1,
+                           input_tokens = input_tokens + excluded.input_tokens,
+                           output_tokens = output_tokens + excluded.output_tokens,
+                           total_tokens = total_tokens + excluded.total_tokens,
+                           cost_usd = cost_usd + excluded.cost_usd""",
+                    (day, kind, usage["input_tokens"], usage["output_tokens"], usage["total_tokens"], cost)
+                )
+                if day != self._current_day:
+                    self._prune()
+                    self._current_day = day
+                self._conn.commit()
+            except sqlite3.Error as e:
+                # الدفتر للعرض فقط: خطأ في القاعدة لا يُفشل الطلب
+                print("[WARNING] Cost ledger write failed: {}".format(e))
+
+            if usage["total_tokens"]:
+                per_unit = usage["total_tokens"] / max(1, units)
+                previous = self._estimates.get(kind)
+                self._estimates[kind] = per_unit if previous is None else (
+                    previous + self.smoothing * (per_unit - previous)
+                )
+
+        return cost
+
+    def stats(self) -> Dict:
+        """الدفتر اليومي والتقديرات الحالية لعرضها في الـ API"""
+        with self._lock:
+            rows = self._conn.execute(
+                """SELECT day, kind, calls, input_tokens, output_tokens, total_tokens, cost_usd
+                   FROM daily_usage ORDER BY day, kind"""
+            ).fetchall()
+            estimates = {kind: int(value) for kind, value in self._estimates.items()}
+
+        days: Dict[str, Dict] = {}
+        for day, kind, calls, input_tokens, output_tokens, total_tokens, cost_usd in rows:
+            ledger = days.setdefault(day, {"totals": _empty_totals(), "by_kind": {}})
+            values = {
+                "calls": calls,
+                "input_tokens": input_tokens,
+                "output_tokens": output_tokens,
+                "total_tokens": total_tokens,
+                "cost_usd": round(cost_usd, 6)
+            }
+            ledger["by_kind"][kind] = values
+            for field in ("calls", "input_tokens", "output_tokens", "total_tokens", "cost_usd"):
+                ledger["totals"][field] += values[field]
+        for ledger in days.values():
+            ledger["totals"]["cost_usd"] = round(ledger["totals"]["cost_usd"], 6)
+
+        return {
+            "pricing_per_million": {
+                "input_usd": self.input_price_per_million,
+                "output_usd": self.output_price_per_million
+            },
+            "estimates": estimates,
+            "days": days
+        }
@@ -1,11 +1,27 @@
 import time
 import json
-import re
-from google import genai
+import threading
 from google.genai import types
 from pathlib import Path
-from typing import List, Dict, Optional, Tuple
+from concurrent.futures import Future, ThreadPoolExecutor, wait
+from typing import Callable, Iterator, List, Dict, Optional, Tuple
 from config import Config
+from services.result_cache import ResultCache
+from services.clause_cache import ClauseCache
+from services.client_pool import GenaiClientPool
+from services.gemini_standin import FixtureStore, RecordingClient, ReplayClient
+from services.gemini_gateway import DeadlineExceeded, GeminiGateway, is_retryable_error
+from services.local_retrieval import LocalRetrievalEngine
+from services.arabic_normalizer import clean_arabic, normalize_arabic, normalize_many
+from services.near_dedup import NearDuplicateMerger
+from services.cost_ledger import CostLedger, RequestBudget, usage_from_response
+from services.risk_scorer import ClauseRiskScorer
+from services.json_stream import JsonArrayStreamParser
+from services.term_schema import TermValidator, build_terms_schema, merge_terms, parse_terms_json
+from services.contract_splitter import split_contract
+from services.ingestion import ContextIngestor, UploadManifest
+from services.metrics import GEMINI_CALLS, GEMINI_TOKENS, SEARCHES_IN_FLIGHT
+from services.tracing import current_span, propagate, set_trace_log, span, start_trace
 
 
 class FileSearchService:
@@ -18,18 +34,150 @@ class FileSearchService:
     2. البحث في File Search باستخدام البنود المستخرجة
     """
 
+    @staticmethod
+    def _worker_share(limit: int, workers: int) -> int:
+        """نصيب worker واحد من حد المعدل (0 = بدون حد يبقى 0)"""
+        if limit <= 0 or workers <= 1:
+            return limit
+        return max(1, limit // workers)
+
     def __init__(self):
         """تهيئة الخدمة بالاتصال بـ Gemini API"""
-        self.client = genai.Client(api_key=Config.GEMINI_API_KEY)
+        set_trace_log(Config.TRACE_LOG)
+        # مجموعة clients مع connection pooling (keep-alive / HTTP2) مشتركة بين كل threads الطلبات
+        # (أو الـ stand-in المحلي لاختبارات الحمل: GEMINI_STANDIN_MODE)
+        self.client = self._create_client()
+        # كل استدعاءات generate_content تمر عبر البوابة (rate limit + AIMD + retries)
+        # حدود RPM/TPM للمشروع كله: كل worker (process) يأخذ نصيبه منها
+        workers = max(1, Config.API_WORKERS)
+        self.gateway = GeminiGateway(
+            self.client,
+            requests_per_minute=self._worker_share(Config.GEMINI_REQUESTS_PER_MINUTE, workers),
+            tokens_per_minute=self._worker_share(Config.GEMINI_TOKENS_PER_MINUTE, workers),
+            max_concurrency=Config.GEMINI_MAX_CONCURRENCY,
+            min_concurrency=Config.GEMINI_MIN_CONCURRENCY,
+            max_retries=Config.GEMINI_MAX_RETRIES,
+            retry_budget_ratio=Config.GEMINI_RETRY_BUDGET_RATIO
+        )
         self.model_name = Config.MODEL_NAME
         self.store_id: Optional[str] = Config.FILE_SEARCH_STORE_ID
         self.context_dir = Config.CONTEXT_DIR
         self.extract_prompt_template = Config.EXTRACT_KEY_TERMS_PROMPT
         self.search_prompt_template = Config.FILE_SEARCH_PROMPT
 
+        # محرك الاسترجاع: "file_search" (Gemini File Search) أو "local" (BM25 offline فوق context/)
+        self.retrieval_backend = Config.RETRIEVAL_BACKEND
+        self.local_engine: Optional[LocalRetrievalEngine] = None
+        if self.retrieval_backend == "local":
+            self.local_engine = LocalRetrievalEngine(
+                self.context_dir,
+                chunk_chars=Config.LOCAL_CHUNK_CHARS,
+                overlap_chars=Config.LOCAL_CHUNK_OVERLAP_CHARS
+            )
+            if Config.LOCAL_INDEX_PERSIST:
+                # فهرس محفوظ بجانب context/ يُفتح عبر mmap (يُعاد بناؤه فقط عند تغيّر الملفات)
+                self.local_engine.load_or_build(Config.LOCAL_INDEX_DIR)
+            else:
+                self.local_engine.build()
+
+        # كاش النتائج الكاملة (اختياري) أمام search_chunks
+        self.result_cache: Optional[ResultCache] = None
+        if Config.RESULT_CACHE_ENABLED:
+            self.result_cache = ResultCache(
+                db_path=Config.RESULT_CACHE_PATH,
+                ttl_seconds=Config.RESULT_CACHE_TTL_SECONDS,
+                max_entries=Config.RESULT_CACHE_MAX_ENTRIES,
+                max_bytes=Config.RESULT_CACHE_MAX_BYTES
+            )
+
+        # كاش البحث المعمّق على مستوى البند (يُعاد استخدامه بين العقود المختلفة)
+        self.clause_cache: Optional[ClauseCache] = None
+        if Config.CLAUSE_CACHE_ENABLED:
+            self.clause_cache = ClauseCache(
+                max_entries=Config.CLAUSE_CACHE_MAX_ENTRIES,
+                ttl_seconds=Config.CLAUSE_CACHE_TTL_SECONDS
+            )
+
+        # دمج الـ chunks المتقاربة (MinHash) في مرحلة الدمج
+        self.chunk_merger = NearDuplicateMerger(
+            threshold=Config.NEAR_DUP_THRESHOLD if Config.NEAR_DUP_ENABLED else 1.0,
+            shingle_size=Config.NEAR_DUP_SHINGLE_SIZE,
+            sketch_size=Config.NEAR_DUP_SKETCH_SIZE
+        )
+
+        # دفتر الـ tokens والتكلفة (يومي + تقديرات لكل نوع استدعاء لتطبيق ميزانية الطلب)
+        self.cost_ledger = CostLedger(
+            input_price_per_million=Config.GEMINI_INPUT_PRICE_PER_MILLION,
+            output_price_per_million=Config.GEMINI_OUTPUT_PRICE_PER_MILLION,
+            default_estimates={
+                "extraction": Config.ESTIMATED_EXTRACTION_TOKENS,
+                "general": Config.ESTIMATED_GENERAL_TOKENS_PER_CHUNK,
+                "deep": Config.ESTIMATED_DEEP_SEARCH_TOKENS
+            },
+            db_path=Config.COST_LEDGER_PATH,
+            retention_days=Config.COST_LEDGER_RETENTION_DAYS
+        )
+
+        # ترتيب البحث المعمّق حسب خطورة البند (محلي، بدون استدعاء نموذج)
+        self.risk_scorer = ClauseRiskScorer()
+
+        # metadata الـ Store محفوظة مؤقتاً: /store-info يُستدعى مع كل إعادة تشغيل لواجهة Streamlit
+        self._store_info: Optional[Dict] = None
+        self._store_info_at = 0.0
+        self._store_info_lock = threading.Lock()
+
         print("[INFO] FileSearchService initialized")
         print("[INFO] Model: {}".format(self.model_name))
         print("[INFO] Context Directory: {}".format(self.context_dir))
+        print("[INFO] Retrieval backend: {}".format(self.retrieval_backend))
+
+    @staticmethod
+    def _create_client():
+        """genai client حسب GEMINI_STANDIN_MODE: حقيقي، حقيقي مع تسجيل، أو replay محلي"""
+        mode = Config.GEMINI_STANDIN_MODE
+        if mode == "replay":
+            fixtures = FixtureStore(Config.GEMINI_STANDIN_FIXTURES)
+            if Config.GEMINI_STANDIN_SEED_DIR:
+                seeded = fixtures.seed_from_results(Config.GEMINI_STANDIN_SEED_DIR)
+                print("[INFO] Seeded {} replay fixture(s) from {}/".format(seeded, Config.GEMINI_STANDIN_SEED_DIR))
+            return ReplayClient(
+                fixtures,
+                extraction_latency=Config.GEMINI_STANDIN_LATENCY_EXTRACTION,
+                search_latency=Config.GEMINI_STANDIN_LATENCY_SEARCH,
+                time_scale=Config.GEMINI_STANDIN_TIME_SCALE,
+                error_503_rate=Config.GEMINI_STANDIN_ERROR_503_RATE,
+                error_429_rate=Config.GEMINI_STANDIN_ERROR_429_RATE,
+                requests_per_minute=Config.GEMINI_STANDIN_RPM,
+                seed=Config.GEMINI_STANDIN_RANDOM_SEED
+            )
+
+        client = GenaiClientPool(
+            api_key=Config.GEMINI_API_KEY,
+            size=Config.GEMINI_CLIENT_POOL_SIZE,
+            max_connections=Config.GEMINI_HTTP_MAX_CONNECTIONS,
+            max_keepalive_connections=Config.GEMINI_HTTP_MAX_KEEPALIVE,
+            keepalive_expiry=Config.GEMINI_HTTP_KEEPALIVE_SECONDS,
+            http2=Config.GEMINI_HTTP2
+        )
+        if mode == "record":
+            return RecordingClient(client, FixtureStore(Config.GEMINI_STANDIN_FIXTURES))
+        return client
+
+    @property
+    def retrieval_id(self) -> Optional[str]:
+        """معرّف مصدر الاسترجاع للكاش: الـ Store أو بصمة الفهرس المحلي (تتغير بتغير الملفات)"""
+        if self.local_engine:
+            return "local:{}".format(self.local_engine.fingerprint)
+        return self.store_id
+
+    def _result_settings(self) -> Dict:
+        """الإعدادات التي تغيّر نتيجة search_chunks لنفس العقد (جزء من مفتاح كاش النتائج)"""
+        return {
+            "deep_search_max_clauses": Config.DEEP_SEARCH_MAX_CLAUSES,
+            "near_dup_threshold": self.chunk_merger.threshold,
+            "extraction_structured_output": Config.EXTRACTION_STRUCTURED_OUTPUT,
+            "retrieval_backend": Config.RETRIEVAL_BACKEND
+        }
 
     def initialize_store(self) -> str:
         """
@@ -42,6 +190,11 @@ class FileSearchService:
         print("FILE SEARCH STORE INITIALIZATION")
         print("="*60)
 
+        # المحرك المحلي لا يحتاج File Search Store
+        if self.local_engine:
+            print("[INFO] Local retrieval backend active, skipping remote store")
+            return self.retrieval_id
+
         # التحقق من وجود Store ID موجود
         if self.store_id:
             print("[INFO] Checking existing Store ID: {}".format(self.store_id))
@@ -49,6 +202,8 @@ class FileSearchService:
                 store = self.client.file_search_stores.get(name=self.store_id)
                 print("[SUCCESS] Connected to existing store: '{}'".format(store.display_name))
                 print("[INFO] Store is active and ready")
+                # نفس الاستجابة تكفي /store-info (بدون استدعاء ثانٍ مطابق)
+                self._cache_store_info(store)
                 return self.store_id
             except Exception as e:
                 print("[WARNING] Could not access store {}".format(self.store_id))
@@ -62,6 +217,7 @@ class FileSearchService:
                 config={'display_name': 'AAOIFI Reference Store'}
             )
             self.store_id = store.name
+            self._cache_store_info(store)
             print("[SUCCESS] New store created: {}".format(self.store_id))
             print("[IMPORTANT] Save this Store ID to .env file:")
             print("[IMPORTANT] FILE_SEARCH_STORE_ID={}".format(self.store_id))
@@ -79,12 +235,20 @@ class FileSearchService:
             print("[ERROR] Failed to create File Search Store: {}".format(e))
             raise
 
-    def _upload_context_files(self):
-        """رفع جميع الملفات من مجلد context/ إلى File Search Store"""
+    def _upload_context_files(self) -> Dict:
+        """
+        رفع ملفات مجلد context/ إلى File Search Store (الجديد والمتغير فقط)
+
+        الرفع متوازٍ (UPLOAD_MAX_WORKERS) ومتابعة الفهرسة في حلقة واحدة مع backoff،
+        والـ manifest (UPLOAD_MANIFEST_PATH) يسمح بالاستئناف بعد انقطاع دون إعادة رفع ما اكتمل
+
+        Returns:
+            Dict: ملخص المزامنة (uploaded, resumed, unchanged, failed, total, seconds)
+        """
 
         if not self.store_id:
             print("[ERROR] Store ID is not set. Cannot upload files.")
-            return
+            return {}
 
         context_path = Path(self.context_dir)
 
@@ -94,47 +258,206 @@ class FileSearchService:
             context_path.mkdir(parents=True, exist_ok=True)
             print("[INFO] Created directory: {}".format(self.context_dir))
             print("[INFO] Please add your AAOIFI reference files to '{}/' folder".format(self.context_dir))
-            return
+            return {}
 
         # البحث عن الملفات
-        files = list(context_path.glob("*"))
+        files = sorted(context_path.glob("*"))
         files = [f for f in files if f.is_file() and not f.name.startswith('.')]
 
         if not files:
             print("[WARNING] No files found in '{}/' directory".format(self.context_dir))
             print("[INFO] Please add your AAOIFI reference files (PDF, TXT, etc.)")
-            return
+            return {}
 
-        print("\n[INFO] Found {} file(s) to upload:".format(len(files)))
+        print("\n[INFO] Found {} file(s) in '{}/':".format(len(files), self.context_dir))
         for f in files:
             print("  - {}".format(f.name))
 
-        # رفع كل ملف
-        uploaded_count = 0
-        for file_path in files:
-            print("\n[UPLOAD] Uploading: {}".format(file_path.name))
-            try:
-                operation = self.client.file_search_stores.upload_to_file_search_store(
-                    file=str(file_path),
-                    file_search_store_name=self.store_id,
-                    config={'display_name': file_path.name}
-                )
+        ingestor = ContextIngestor(
+            self.client,
+            self.store_id,
+            UploadManifest(Config.UPLOAD_MANIFEST_PATH),
+            max_workers=Config.UPLOAD_MAX_WORKERS,
+            poll_initial_seconds=Config.UPLOAD_POLL_INITIAL_SECONDS,
+            poll_max_seconds=Config.UPLOAD_POLL_MAX_SECONDS,
+            max_poll_failures=Config.UPLOAD_MAX_POLL_FAILURES,
+            index_timeout_seconds=Config.UPLOAD_INDEX_TIMEOUT_SECONDS
+        )
+        summary = ingestor.sync(files)
+
+        print("\n[SUMMARY] Uploaded {} file(s), {} unchanged, {} failed ({}s)".format(
+            summary["uploaded"], summary["unchanged"], len(summary["failed"]), summary["seconds"]
+        ))
+        print("="*60 + "\n")
 
-                print("[INDEXING] Waiting for {} to be indexed...".format(file_path.name))
-                while not operation.done:
-                    time.sleep(2)
-                    operation = self.client.operations.get(operation)
+        # محتوى الـ Store تغيّر، النتائج المخزنة لم تعد صالحة
+        if summary["uploaded"]:
+            self.invalidate_caches()
+        return summary
+
+    def sync_context_files(self) -> Dict:
+        """
+        مزامنة context/ مع Store موجود: رفع الملفات الجديدة أو المتغيرة فقط
+
+        Returns:
+            Dict: ملخص المزامنة
+        """
+        if self.local_engine:
+            print("[INFO] Local retrieval backend active, nothing to upload")
+            return {}
+        if not self.store_id:
+            self.initialize_store()
+        return self._upload_context_files()
 
-                uploaded_count += 1
-                print("[SUCCESS] {} uploaded and indexed".format(file_path.name))
+    def _generate(self, kind: str, label: str, budget: Optional[RequestBudget] = None,
+                  units: int = 1, deadline: Optional[float] = None, **request):
+        """
+        استدعاء generate_content عبر البوابة مع تسجيل usage_metadata في الدفاتر
 
+        Args:
+            kind: نوع الاستدعاء في الدفتر (extraction / general / deep)
+            label: اسم الاستدعاء في سجلات البوابة
+            budget: دفتر الطلب الحالي (اختياري)
+            units: وحدات التقدير (top_k للبحث الجماعي)
+            deadline: مهلة الطلب (time.monotonic) - تصبح مهلة HTTP للاستدعاء وتوقف إعادة المحاولة
+
+        Raises:
+            DeadlineExceeded: إذا انتهت المهلة قبل الاستدعاء أو أثناءه
+        """
+        if deadline is not None:
+            remaining = deadline - time.monotonic()
+            if remaining <= 0:
+                raise DeadlineExceeded("{}: request deadline already passed".format(label))
+            # مهلة HTTP = الوقت المتبقي، فلا يبقى استدعاء عالقاً بعد مهلة الطلب
+            request["config"].http_options = types.HttpOptions(timeout=int(remaining * 1000))
+
+        with span("gemini_call", kind=kind, label=label) as call_span:
+            try:
+                response = self.gateway.generate_content(label=label, deadline=deadline, **request)
+            except DeadlineExceeded:
+                GEMINI_CALLS.inc(kind=kind, outcome="deadline")
+                raise
             except Exception as e:
-                print("[ERROR] Failed to upload {}: {}".format(file_path.name, e))
+                if self._deadline_passed(deadline):
+                    GEMINI_CALLS.inc(kind=kind, outcome="deadline")
+                    raise DeadlineExceeded("{}: {}".format(label, e)) from e
+                GEMINI_CALLS.inc(kind=kind, outcome="error")
+                raise
+            GEMINI_CALLS.inc(kind=kind, outcome="ok")
+            usage = self._record_usage(kind, label, usage_from_response(response), budget, units)
+            call_span.set(input_tokens=usage["input_tokens"], output_tokens=usage["output_tokens"])
+        return response
+
+    def _record_usage(self, kind: str, label: str, usage: Dict[str, int],
+                      budget: Optional[RequestBudget] = None, units: int = 1) -> Dict[str, int]:
+        """تسجيل استهلاك استدعاء في دفتر التكلفة وميزانية الطلب وعدادات الـ tokens"""
+        cost = self.cost_ledger.record(kind, usage, units)
+        if budget is not None:
+            budget.settle(0, kind, usage, cost)
+        GEMINI_TOKENS.inc(usage["input_tokens"], kind=kind, direction="input")
+        GEMINI_TOKENS.inc(usage["output_tokens"], kind=kind, direction="output")
+        print("[COST] {}: {} tokens (in={}, out={}) ${:.6f}".format(
+            label, usage["total_tokens"], usage["input_tokens"], usage["output_tokens"], cost
+        ))
+        return usage
+
+    def _generate_stream(self, kind: str, label: str, budget: Optional[RequestBudget] = None,
+                         units: int = 1, deadline: Optional[float] = None, **request) -> Iterator:
+        """
+        نسخة streaming من _generate: تُرجع الأجزاء فور وصولها وتسجّل الاستهلاك بعد آخر جزء
 
-        print("\n[SUMMARY] Successfully uploaded {}/{} files".format(uploaded_count, len(files)))
-        print("="*60 + "\n")
+        Raises:
+            DeadlineExceeded: إذا انتهت المهلة قبل الاستدعاء أو أثناءه
+        """
+        if deadline is not None:
+            remaining = deadline - time.monotonic()
+            if remaining <= 0:
+                raise DeadlineExceeded("{}: request deadline already passed".format(label))
+            request["config"].http_options = types.HttpOptions(timeout=int(remaining * 1000))
+
+        last_usage_chunk = None
+        outcome = "ok"
+        try:
+            for chunk in self.gateway.generate_content_stream(label=label, deadline=deadline, **request):
+                # usage_metadata النهائي يأتي مع آخر جزء (الأجزاء السابقة قد تحمل أرقاماً جزئية)
+                if getattr(chunk, "usage_metadata", None) is not None:
+                    last_usage_chunk = chunk
+                yield chunk
+        except DeadlineExceeded:
+            outcome = "deadline"
+            raise
+        except Exception as e:
+            if self._deadline_passed(deadline):
+                outcome = "deadline"
+                raise DeadlineExceeded("{}: {}".format(label, e)) from e
+            outcome = "error"
+            raise
+        finally:
+            GEMINI_CALLS.inc(kind=kind, outcome=outcome)
+            if last_usage_chunk is not None:
+                self._record_usage(kind, label, usage_from_response(last_usage_chunk), budget, units)
+
+    def _build_extraction_prompt(self, contract_text: str) -> str:
+        """تطبيق prompt الاستخراج على نص العقد (مع fallback عند أخطاء الأقواس في القالب)"""
+        try:
+            return self.extract_prompt_template.format(contract_text=contract_text)
+        except KeyError as e:
+            print("[ERROR] Prompt formatting error (likely curly braces in template): {}".format(e))
+            print("[INFO] Retrying with escaped prompt...")
+            # Fallback: استخدام العقد مباشرة بدون الـ prompt المعقد
+            return "استخرج البنود المهمة من هذا العقد: " + contract_text[:1000]
+
+    def _extraction_config(self) -> types.GenerateContentConfig:
+        """إعدادات استدعاء الاستخراج: JSON schema للبنود عند تفعيل EXTRACTION_STRUCTURED_OUTPUT"""
+        if not Config.EXTRACTION_STRUCTURED_OUTPUT:
+            return types.GenerateContentConfig(
+                response_modalities=["TEXT"]
+            )
+        return types.GenerateContentConfig(
+            response_modalities=["TEXT"],
+            response_mime_type="application/json",
+            response_schema=build_terms_schema()
+        )
 
-    def extract_key_terms(self, contract_text: str) -> List[Dict]:
+    @staticmethod
+    def _parse_terms_text(extracted_text: str) -> List[Dict]:
+        """
+        تحليل نص استجابة الاستخراج إلى قائمة بنود صالحة
+
+        الاستجابة المعطوبة تُصلح محلياً (parse_terms_json)، والبنود الفارغة أو المكررة
+        تُرفض قبل وصولها للبحث (TermValidator)
+        """
+        raw_terms, repaired = parse_terms_json(extracted_text)
+        if repaired and raw_terms:
+            print("[WARNING] Extraction response was not a clean JSON array, recovered {} object(s)".format(
+                len(raw_terms)
+            ))
+        if not raw_terms:
+            print("[ERROR] Could not find JSON array in response")
+            print("[DEBUG] Response preview: {}...".format(extracted_text[:500]))
+            return []
+
+        validator = TermValidator()
+        terms = [term for term in (validator.accept(raw) for raw in raw_terms) if term is not None]
+        if validator.rejected:
+            print("[WARNING] Rejected {} extracted term(s) (empty: {}, duplicate: {})".format(
+                validator.rejected, validator.rejected_empty, validator.rejected_duplicates
+            ))
+        return terms
+
+    @staticmethod
+    def _preview_terms(extracted_terms: List[Dict]):
+        """طباعة معاينة البنود المستخرجة"""
+        print("[SUCCESS] Extracted {} key terms".format(len(extracted_terms)))
+        for i, term in enumerate(extracted_terms[:3]):
+            print("[PREVIEW] Term {}: {} - Issues: {}".format(
+                i+1, 
+                term.get('term_id', 'N/A'),
+                ', '.join(term.get('potential_issues', []))
+            ))
+
+    def extract_key_terms(self, contract_text: str, budget: Optional[RequestBudget] = None,
+                          deadline: Optional[float] = None) -> List[Dict]:
         """
         المرحلة الأولى: استخراج البنود المهمة من العقد
         
@@ -143,6 +466,8 @@ class FileSearchService:
         
         Args:
             contract_text: نص العقد الكامل
+            budget: دفتر tokens الطلب (اختياري)
+            deadline: مهلة الطلب (time.monotonic، اختياري)
             
         Returns:
             List[Dict]: قائمة البنود المستخرجة، كل بند يحتوي على:
@@ -152,74 +477,48 @@ class FileSearchService:
                 - relevance_reason: سبب الأهمية
         """
         
+        with span("extraction", contract_chars=len(contract_text)) as extraction_span:
+            extracted_terms = self._run_extraction(contract_text, budget, deadline)
+            extraction_span.set(terms=len(extracted_terms))
+        return extracted_terms
+
+    def _run_extraction(self, contract_text: str, budget: Optional[RequestBudget] = None,
+                        deadline: Optional[float] = None) -> List[Dict]:
+        """تنفيذ extract_key_terms (استدعاء + إصلاح + إعادة المحاولة) داخل span الاستخراج"""
         print("\n[STEP 1/2] Extracting key terms from contract...")
         print("[INFO] Contract length: {} characters".format(len(contract_text)))
         
         try:
-            # تطبيق prompt الاستخراج
-            try:
-                extraction_prompt = self.extract_prompt_template.format(contract_text=contract_text)
-            except KeyError as e:
-                print("[ERROR] Prompt formatting error (likely curly braces in template): {}".format(e))
-                print("[INFO] Retrying with escaped prompt...")
-                # Fallback: استخدام العقد مباشرة بدون الـ prompt المعقد
-                extraction_prompt = "استخرج البنود المهمة من هذا العقد: " + contract_text[:1000]
-            
-            print("[INFO] Calling Gemini for term extraction...")
-            response = self.client.models.generate_content(
-                model=self.model_name,
-                contents=extraction_prompt,
-                config=types.GenerateContentConfig(
-                    response_modalities=["TEXT"]
+            extraction_prompt = self._build_extraction_prompt(contract_text)
+            attempts = max(1, Config.EXTRACTION_MAX_ATTEMPTS)
+
+            for attempt in range(1, attempts + 1):
+                current_span().set(attempts=attempt)
+                print("[INFO] Calling Gemini for term extraction...")
+                response = self._generate(
+                    "extraction", "Term extraction", budget, deadline=deadline,
+                    model=self.model_name,
+                    contents=extraction_prompt,
+                    config=self._extraction_config()
                 )
-            )
-            
-            # استخراج النص من الاستجابة
-            if not hasattr(response, 'candidates') or not response.candidates:
-                print("[ERROR] No candidates in extraction response")
-                return []
-            
-            candidate = response.candidates[0]
-            if not hasattr(candidate, 'content') or not candidate.content:
-                print("[ERROR] No content in extraction response")
-                return []
-            
-            if not hasattr(candidate.content, 'parts') or not candidate.content.parts:
-                print("[ERROR] No parts in extraction response")
-                return []
-            
-            extracted_text = candidate.content.parts[0].text if hasattr(candidate.content.parts[0], 'text') else None
-            
-            if not extracted_text:
-                print("[ERROR] No text in extraction response")
-                return []
-            
-            print("[DEBUG] Extraction response length: {} characters".format(len(extracted_text)))
-            
-            # استخراج JSON من الاستجابة (قد يكون محاطاً بنص إضافي)
-            # البحث عن أول [ وآخر ]
-            json_match = re.search(r'\[.*\]', extracted_text, re.DOTALL)
-            if json_match:
-                json_str = json_match.group(0)
-                extracted_terms = json.loads(json_str)
-                print("[SUCCESS] Extracted {} key terms".format(len(extracted_terms)))
-                
-                # طباعة معاينة البنود المستخرجة
-                for i, term in enumerate(extracted_terms[:3]):
-                    print("[PREVIEW] Term {}: {} - Issues: {}".format(
-                        i+1, 
-                        term.get('term_id', 'N/A'),
-                        ', '.join(term.get('potential_issues', []))
+
+                extracted_text = self._response_text(response)
+                if extracted_text:
+                    print("[DEBUG] Extraction response length: {} characters".format(len(extracted_text)))
+                    extracted_terms = self._parse_terms_text(extracted_text)
+                    if extracted_terms:
+                        self._preview_terms(extracted_terms)
+                        return extracted_terms
+
+                # استجابة فارغة أو غير قابلة للإصلاح: محاولة جديدة بدل الـ fallback على بداية العقد
+                if attempt < attempts:
+                    print("[WARNING] No valid terms in extraction response, retrying ({}/{})".format(
+                        attempt + 1, attempts
                     ))
-                
-                return extracted_terms
-            else:
-                print("[ERROR] Could not find JSON array in response")
-                print("[DEBUG] Response preview: {}...".format(extracted_text[:500]))
-                return []
-                
-        except json.JSONDecodeError as e:
-            print("[ERROR] Failed to parse JSON from extraction: {}".format(e))
+            return []
+
+        except DeadlineExceeded as e:
+            print("[DEADLINE] Term extraction cut off: {}".format(e))
             return []
         except Exception as e:
             print("[ERROR] Term extraction failed: {}".format(e))
@@ -227,6 +526,164 @@ class FileSearchService:
             traceback.print_exc()
             return []
 
+    @staticmethod
+    def _response_text(response) -> Optional[str]:
+        """نص أول candidate في استجابة الاستخراج (None مع رسالة خطأ إذا لم يوجد)"""
+        if not hasattr(response, 'candidates') or not response.candidates:
+            print("[ERROR] No candidates in extraction response")
+            return None
+        
+        candidate = response.candidates[0]
+        if not hasattr(candidate, 'content') or not candidate.content:
+            print("[ERROR] No content in extraction response")
+            return None
+        
+        if not hasattr(candidate.content, 'parts') or not candidate.content.parts:
+            print("[ERROR] No parts in extraction response")
+            return None
+        
+        extracted_text = candidate.content.parts[0].text if hasattr(candidate.content.parts[0], 'text') else None
+        
+        if not extracted_text:
+            print("[ERROR] No text in extraction response")
+            return None
+        return extracted_text
+
+    def extract_key_terms_stream(self, contract_text: str, budget: Optional[RequestBudget] = None,
+                                 deadline: Optional[float] = None,
+                                 on_term: Optional[Callable[[Dict], None]] = None) -> List[Dict]:
+        """
+        استخراج البنود بالـ streaming: كل بند يُمرر إلى on_term فور اكتمال كائن JSON الخاص به
+
+        يرجع نفس نتيجة extract_key_terms. عند فشل الـ stream قبل وصول أي بند يُعاد الاستخراج
+        بالطريقة العادية، وبعد وصول بنود يُكتفى بما وصل
+
+        Args:
+            contract_text: نص العقد الكامل
+            budget: دفتر tokens الطلب (اختياري)
+            deadline: مهلة الطلب (time.monotonic، اختياري)
+            on_term: دالة تُستدعى لكل بند مكتمل (مثلاً لإطلاق البحث المعمّق مبكراً)
+
+        Returns:
+            List[Dict]: قائمة البنود المستخرجة
+        """
+        print("\n[STEP 1/2] Extracting key terms from contract (streaming)...")
+        print("[INFO] Contract length: {} characters".format(len(contract_text)))
+
+        parser = JsonArrayStreamParser()
+        validator = TermValidator()
+        extracted_terms: List[Dict] = []
+        text_parts: List[str] = []
+        started = time.monotonic()
+
+        def emit(term: Dict):
+            extracted_terms.append(term)
+            if len(extracted_terms) == 1:
+                print("[STREAM] First term after {:.2f}s".format(time.monotonic() - started))
+            if on_term is not None:
+                try:
+                    on_term(term)
+                except Exception as e:
+                    print("[WARNING] Term callback failed for {}: {}".format(term.get("term_id", "unknown"), e))
+
+        try:
+            stream = self._generate_stream(
+                "extraction", "Term extraction (stream)", budget, deadline=deadline,
+                model=self.model_name,
+                contents=self._build_extraction_prompt(contract_text),
+                config=self._extraction_config()
+            )
+            for chunk in stream:
+                text = getattr(chunk, "text", None)
+                if not text:
+                    continue
+                text_parts.append(text)
+                for raw in parser.feed(text):
+                    term = validator.accept(raw)
+                    if term is not None:
+                        emit(term)
+        except DeadlineExceeded as e:
+            print("[DEADLINE] Streaming extraction cut off after {} term(s): {}".format(len(extracted_terms), e))
+            return extracted_terms
+        except Exception as e:
+            if not extracted_terms:
+                print("[WARNING] Streaming extraction failed ({}), falling back to non-streaming call".format(e))
+                terms = self.extract_key_terms(contract_text, budget, deadline)
+                for term in terms:
+                    emit(term)
+                return extracted_terms
+            print("[WARNING] Streaming extraction interrupted after {} term(s): {}".format(len(extracted_terms), e))
+            return extracted_terms
+
+        if parser.errors:
+            print("[WARNING] {} streamed term(s) were not valid JSON".format(parser.errors))
+        if validator.rejected:
+            print("[WARNING] Rejected {} streamed term(s) (empty: {}, duplicate: {})".format(
+                validator.rejected, validator.rejected_empty, validator.rejected_duplicates
+            ))
+
+        # الاستجابة لم تكن مصفوفة كائنات قابلة للتحليل تدريجياً: نفس التحليل على النص الكامل
+        if not extracted_terms:
+            full_text = "".join(text_parts)
+            if not full_text:
+                print("[ERROR] No text in extraction stream")
+                return []
+            for term in self._parse_terms_text(full_text):
+                emit(term)
+
+        if extracted_terms:
+            self._preview_terms(extracted_terms)
+        return extracted_terms
+
+    @staticmethod
+    def _is_long_contract(contract_text: str) -> bool:
+        """هل يُستخرج العقد على نوافذ (LONG_CONTRACT_THRESHOLD_CHARS، 0 = معطّل)"""
+        threshold = Config.LONG_CONTRACT_THRESHOLD_CHARS
+        return threshold > 0 and len(contract_text) >= threshold
+
+    def extract_key_terms_long(self, contract_text: str, budget: Optional[RequestBudget] = None,
+                               deadline: Optional[float] = None) -> List[Dict]:
+        """
+        استخراج البنود من عقد طويل: نوافذ متداخلة على حدود البنود تُستخرج بالتوازي ثم تُدمج
+
+        زمن الاستخراج يبقى قريباً من زمن نافذة واحدة بدل أن يزيد مع طول العقد، وقطع
+        استجابة نافذة واحدة (max output tokens) لا يُفقد بنود باقي العقد
+
+        Args:
+            contract_text: نص العقد الكامل
+            budget: دفتر tokens الطلب (اختياري)
+            deadline: مهلة الطلب (time.monotonic، اختياري)
+
+        Returns:
+            List[Dict]: البنود بعد الدمج وإزالة التكرار عبر النوافذ
+        """
+        windows = split_contract(
+            contract_text, Config.LONG_CONTRACT_WINDOW_CHARS, Config.LONG_CONTRACT_OVERLAP_CHARS
+        )
+        if len(windows) == 1:
+            return self.extract_key_terms(contract_text, budget, deadline)
+
+        max_workers = max(1, min(Config.LONG_CONTRACT_MAX_WORKERS, len(windows)))
+        print("\n[INFO] Long contract ({} characters): extracting from {} window(s) (max_in_flight={})".format(
+            len(contract_text), len(windows), max_workers
+        ))
+
+        with ThreadPoolExecutor(max_workers=max_workers) as executor:
+            futures = [
+                executor.submit(propagate(self.extract_key_terms), window, budget, deadline)
+                for window in windows
+            ]
+            per_window = [future.result() for future in futures]
+
+        for idx, terms in enumerate(per_window):
+            print("[INFO] Window {}/{}: {} term(s)".format(idx + 1, len(windows), len(terms)))
+
+        extracted_terms = merge_terms(per_window)
+        print("[SUCCESS] Merged {} term(s) from {} window(s) ({} before dedup)".format(
+            len(extracted_terms), len(windows), sum(len(terms) for terms in per_window)
+        ))
+        return extracted_terms
+
     def _get_sensitive_keywords(self) -> List[str]:
         """قائمة الكلمات المفتاحية الحساسة التي تحتاج بحث منفصل أعمق"""
         return [
@@ -240,18 +697,320 @@ class FileSearchService:
         فصل البنود الحساسة من البنود العادية
         البنود الحساسة هي التي تحتوي على كلمات مفتاحية حساسة من AAOIFI
         """
-        sensitive_keywords = self._get_sensitive_keywords()
+        sensitive_keywords = normalize_many(self._get_sensitive_keywords())
         sensitive_clauses = []
         
         for term in extracted_terms:
             issues = term.get("potential_issues", [])
             # تحقق إذا كان أي من الكلمات المفتاحية موجود
-            if any(keyword in issues for keyword in sensitive_keywords):
+            # مقارنة بعد التطبيع (تشكيل، همزات، تاء مربوطة) بدل المطابقة الحرفية
+            normalized_issues = {normalize_arabic(issue) for issue in issues}
+            if any(keyword in normalized_issues for keyword in sensitive_keywords):
                 sensitive_clauses.append(term)
         
         return sensitive_clauses
 
-    def search_chunks(self, contract_text: str, top_k: Optional[int] = None) -> Tuple[List[Dict], List[Dict]]:
+    def _deep_search_clause(self, sensitive_clause: Dict,
+                            budget: Optional[RequestBudget] = None,
+                            deadline: Optional[float] = None) -> List[Dict]:
+        """
+        البحث المعمّق لبند حساس واحد (2 chunks فقط) مع retry logic لأخطاء 503
+
+        آمنة للاستدعاء من عدة threads في نفس الوقت (لا تعدّل حالة الخدمة)
+
+        Args:
+            sensitive_clause: البند الحساس كما أرجعه extract_key_terms
+            budget: دفتر tokens الطلب (اختياري)
+            deadline: مهلة الطلب (time.monotonic، اختياري)
+
+        Returns:
+            List[Dict]: الـ chunks المسترجعة لهذا البند (قائمة فارغة عند الفشل)
+
+        Raises:
+            DeadlineExceeded: إذا انتهت مهلة الطلب قبل اكتمال البحث
+        """
+        clause_id = sensitive_clause.get("term_id", "unknown")
+        clause_text = sensitive_clause.get("term_text", "")
+        issues = sensitive_clause.get("potential_issues", [])
+
+        print("\n[DEEP SEARCH] Processing sensitive clause: {}".format(clause_id))
+        print("[INFO] Issues: {}".format(", ".join(issues[:3])))
+
+        if self.local_engine:
+            clause_chunks = self.local_engine.search(self._clause_query(sensitive_clause), 2)
+            print("[SUCCESS] Local deep search retrieved {} chunks for {}".format(len(clause_chunks), clause_id))
+            return clause_chunks
+
+        # نفس البند (نصاً ومشاكلاً) سبق البحث عنه في عقد آخر؟
+        clause_key = None
+        if self.clause_cache:
+            clause_key = ClauseCache.make_key(sensitive_clause, self.model_name, self.retrieval_id)
+            cached_chunks = self.clause_cache.get(clause_key)
+            if cached_chunks is not None:
+                print("[CACHE] Clause cache hit for {} ({} chunks)".format(clause_id, len(cached_chunks)))
+                return cached_chunks
+
+        # بناء prompt منفصل للبند الحساس
+        sensitive_search_prompt = """قم بالبحث الدقيق والعميق في معايير AAOIFI عن المقاطع التي تتعلق مباشرة بالمشاكل الشرعية التالية:
+
+مشاكل شرعية:
+{issues}
+
+نص البند من العقد:
+{clause_text}
+
+ابحث عن:
+1. المعايير الشرعية الدقيقة (رقم المعيار وتفاصيله).
+2. النصوص التي تحتوي على كلمات حاسمة: "لا يجوز"، "محرم"، "يبطل"، "ضرر فعلي"، "غرر"، "ربا".
+3. أمثلة على حالات مشابهة أو مخالفة.
+4. القيود والشروط الدقيقة من AAOIFI.
+
+ركز على الدقة الشرعية العالية والاقتباسات الحرفية.""".format(
+            issues="\n".join(clean_arabic(issue) for issue in issues),
+            clause_text=clean_arabic(clause_text)
+        )
+
+        # استدعاء Gemini للبحث المعمّق (2 chunks فقط) - إعادة المحاولة داخل الـ gateway
+        try:
+            sensitive_response = self._generate(
+                "deep", "Deep search {}".format(clause_id), budget, deadline=deadline,
+                model=self.model_name,
+                contents=sensitive_search_prompt,
+                config=types.GenerateContentConfig(
+                    tools=[types.Tool(
+                        file_search=types.FileSearch(
+                            file_search_store_names=[self.store_id],
+                            top_k=2  # 2 chunks فقط لكل بند حساس (تم تقليله من 5)
+                        )
+                    )],
+                    response_modalities=["TEXT"]
+                )
+            )
+        except DeadlineExceeded:
+            raise
+        except Exception as e:
+            if not is_retryable_error(e):
+                raise
+            print("[ERROR] Sensitive search failed after retries, skipping this clause")
+            sensitive_response = None
+
+        if sensitive_response:
+            clause_chunks = self._extract_grounding_chunks(sensitive_response, 2)
+            # نخزّن فقط الاستجابات الناجحة (وليس البنود التي فشلت بعد كل المحاولات، ولا الفارغة)
+            if clause_key:
+                self.clause_cache.set(clause_key, clause_chunks)
+        else:
+            clause_chunks = []
+        print("[SUCCESS] Deep search retrieved {} chunks for {}".format(
+            len(clause_chunks), clause_id
+        ))
+        return clause_chunks
+
+    @staticmethod
+    def _clean_term(term: Dict) -> Dict:
+        """نسخة من البند بنص ومشاكل شرعية منظّفة (للاستعلامات فقط، البند الأصلي يبقى كما هو)"""
+        cleaned = dict(term)
+        cleaned["term_text"] = clean_arabic(term.get("term_text", ""))
+        cleaned["potential_issues"] = [clean_arabic(issue) for issue in term.get("potential_issues", [])]
+        return cleaned
+
+    @staticmethod
+    def _clause_query(term: Dict) -> str:
+        """استعلام البحث المحلي لبند: نص البند + المشاكل الشرعية"""
+        return "{} {}".format(term.get("term_text", ""), " ".join(term.get("potential_issues", [])))
+
+    def _general_search(self, extracted_clauses_text: str, top_k: int,
+                        extracted_terms: Optional[List[Dict]] = None,
+                        budget: Optional[RequestBudget] = None,
+                        deadline: Optional[float] = None) -> List[Dict]:
+        """
+        Phase 1: البحث الجماعي الشامل لكل البنود المستخرجة مع retry logic لأخطاء 503
+
+        Args:
+            extracted_clauses_text: البنود المستخرجة كنص JSON (أو بداية العقد كـ fallback)
+            top_k: عدد الـ chunks المطلوبة
+            extracted_terms: البنود المستخرجة (يستخدمها المحرك المحلي كاستعلام لكل بند)
+            budget: دفتر tokens الطلب (اختياري)
+            deadline: مهلة الطلب (time.monotonic، اختياري)
+
+        Returns:
+            List[Dict]: الـ chunks المسترجعة من البحث الجماعي
+        """
+        print("\n[PHASE 1/2] General Search for all extracted clauses...")
+        print("[INFO] Using top_k={} for comprehensive coverage".format(top_k))
+
+        if self.local_engine:
+            # استعلام منفصل لكل بند ثم دمج الترتيب (مثل تعليمات الـ prompt للـ File Search)
+            if extracted_terms:
+                queries = [self._clause_query(term) for term in extracted_terms]
+            else:
+                queries = [extracted_clauses_text]
+            general_chunks = self.local_engine.search_many(queries, top_k)
+            print("[SUCCESS] Phase 1 (local) retrieved {} chunks".format(len(general_chunks)))
+            return general_chunks
+        
+        full_prompt = self.search_prompt_template.format(extracted_clauses=extracted_clauses_text)
+
+        print("[SEARCH] Querying Gemini File Search (Phase 1)...")
+        
+        # إعادة المحاولة لأخطاء 429/503 تتم داخل الـ gateway (وتُرفع بعد نفاد المحاولات)
+        response = self._generate(
+            "general", "Phase 1 search", budget, units=top_k, deadline=deadline,
+            model=self.model_name,
+            contents=full_prompt,
+            config=types.GenerateContentConfig(
+                tools=[types.Tool(
+                    file_search=types.FileSearch(
+                        file_search_store_names=[self.store_id],
+                        top_k=top_k
+                    )
+                )],
+                response_modalities=["TEXT"]
+            )
+        )
+
+        # استخراج الـ chunks من الـ grounding metadata
+        general_chunks = self._extract_grounding_chunks(response, top_k)
+        print("[SUCCESS] Phase 1 retrieved {} chunks".format(len(general_chunks)))
+        return general_chunks
+
+    def _run_deep_searches(self, sensitive_clauses: List[Dict],
+                           search_fn: Optional[Callable[[Dict], List[Dict]]] = None,
+                           deadline: Optional[float] = None) -> List[Optional[List[Dict]]]:
+        """
+        Phase 2: تشغيل البحث المعمّق لكل البنود الحساسة (بالتوازي حسب DEEP_SEARCH_MAX_WORKERS)
+
+        النتائج تُجمع بترتيب البنود، لذا الدمج مطابق للمسار التسلسلي
+
+        Args:
+            sensitive_clauses: البنود الحساسة
+            search_fn: دالة البحث لكل بند (افتراضياً _deep_search_clause)
+            deadline: مهلة الطلب (time.monotonic) - ما لم ينتهِ قبلها يرجع None
+
+        Returns:
+            List[Optional[List[Dict]]]: chunks كل بند بنفس ترتيب sensitive_clauses
+        """
+        search_fn = search_fn or self._deep_search_clause
+        max_workers = min(Config.DEEP_SEARCH_MAX_WORKERS, len(sensitive_clauses))
+        if max_workers > 1:
+            print("[INFO] Running deep searches concurrently (max_in_flight={})".format(max_workers))
+            executor = ThreadPoolExecutor(max_workers=max_workers)
+            try:
+                futures = [executor.submit(propagate(search_fn), c) for c in sensitive_clauses]
+                return self._collect_until(futures, deadline)
+            finally:
+                executor.shutdown(wait=deadline is None, cancel_futures=True)
+
+        results = []
+        for clause in sensitive_clauses:
+            results.append(None if self._deadline_passed(deadline) else search_fn(clause))
+        return results
+
+    @staticmethod
+    def _deadline_passed(deadline: Optional[float]) -> bool:
+        """هل انتهت المهلة (deadline بتوقيت time.monotonic، None = بدون مهلة)"""
+        return deadline is not None and time.monotonic() >= deadline
+
+    @staticmethod
+    def _collect_until(futures: List[Future], deadline: Optional[float]) -> List[Optional[List[Dict]]]:
+        """
+        انتظار نتائج الـ futures حتى المهلة فقط
+
+        Returns:
+            النتائج بنفس الترتيب، و None لكل عملية لم تنتهِ قبل المهلة (تُلغى إن لم تبدأ)
+        """
+        timeout = None if deadline is None else max(0.0, deadline - time.monotonic())
+        wait(futures, timeout=timeout)
+
+        results = []
+        for future in futures:
+            if future.done() and not future.cancelled():
+                results.append(future.result())
+            else:
+                future.cancel()
+                results.append(None)
+        return results
+
+    def _prioritize_sensitive_clauses(self, sensitive_clauses: List[Dict],
+                                      already_launched: int = 0) -> Tuple[List[Dict], List[Dict]]:
+        """
+        ترتيب البنود الحساسة حسب درجة الخطورة (الأخطر أولاً) وتطبيق DEEP_SEARCH_MAX_CLAUSES
+
+        Args:
+            sensitive_clauses: البنود الحساسة
+            already_launched: عدد البنود التي بدأ بحثها أثناء الاستخراج (تُحسب من الحد الأقصى)
+
+        Returns:
+            (البنود المعتمدة بترتيب الأولوية، البنود المستبعدة بسبب الحد الأقصى)
+        """
+        ranked = self.risk_scorer.rank(sensitive_clauses)
+        for clause, score in ranked:
+            print("[RISK] {}: {:.2f}".format(clause.get("term_id", "unknown"), score))
+
+        ordered = [clause for clause, _ in ranked]
+        cap = Config.DEEP_SEARCH_MAX_CLAUSES
+        if cap > 0:
+            slots = max(0, cap - already_launched)
+            if len(ordered) > slots:
+                print("[RISK] Capping deep search at {} of {} sensitive clause(s)".format(
+                    cap, len(ordered) + already_launched
+                ))
+                return ordered[:slots], ordered[slots:]
+        return ordered, []
+
+    def _apply_budget(self, budget: RequestBudget, sensitive_clauses: List[Dict],
+                      top_k: int) -> Tuple[List[Dict], int, List[Dict]]:
+        """
+        مواءمة خطة البحث مع الرصيد المتبقي بعد الاستخراج
+
+        1. تقليص عدد البحث المعمّق مع الاحتفاظ بالبنود الأخطر (البنود مرتبة مسبقاً حسب الخطورة)
+        2. إذا لم يكفِ الرصيد للبحث الجماعي نفسه يُقلّص top_k (حتى BUDGET_MIN_TOP_K)
+
+        المحرك المحلي لا يستهلك tokens في الاسترجاع، فلا تتغير خطته
+
+        Returns:
+            (البنود الحساسة المعتمدة، top_k المعتمد، البنود المستبعدة)
+        """
+        if not budget.limited or self.local_engine:
+            return sensitive_clauses, top_k, []
+
+        remaining = budget.remaining()
+        general_cost = self.cost_ledger.estimate("general", top_k)
+        deep_cost = self.cost_ledger.estimate("deep")
+
+        if remaining >= general_cost + deep_cost * len(sensitive_clauses):
+            return sensitive_clauses, top_k, []
+
+        affordable = len(sensitive_clauses)
+        if deep_cost > 0:
+            affordable = max(0, (remaining - general_cost) // deep_cost)
+
+        kept, dropped = sensitive_clauses[:affordable], sensitive_clauses[affordable:]
+
+        if remaining < general_cost:
+            per_chunk = self.cost_ledger.estimate("general")
+            affordable_top_k = remaining // per_chunk if per_chunk else top_k
+            top_k = max(min(Config.BUDGET_MIN_TOP_K, top_k), min(top_k, affordable_top_k))
+
+        print("[BUDGET] Remaining {} tokens: {}/{} deep search(es), top_k={}".format(
+            remaining, len(kept), len(sensitive_clauses), top_k
+        ))
+        return kept, top_k, dropped
+
+    @staticmethod
+    def _report_progress(progress_callback: Optional[Callable[[str, Dict], None]], event: str, **data):
+        """إرسال حدث تقدم للمستدعي (مثل JobManager) دون أن يكسر فشله عملية البحث"""
+        if progress_callback is None:
+            return
+        try:
+            progress_callback(event, data)
+        except Exception as e:
+            print("[WARNING] Progress callback failed for '{}': {}".format(event, e))
+
+    def search_chunks(self, contract_text: str, top_k: Optional[int] = None,
+                      progress_callback: Optional[Callable[[str, Dict], None]] = None,
+                      token_budget: Optional[int] = None,
+                      deadline_seconds: Optional[float] = None) -> Tuple[List[Dict], List[Dict]]:
         """
         البحث الهجين (Hybrid) عن chunks ذات صلة بنص العقد
         
@@ -265,6 +1024,14 @@ class FileSearchService:
         Args:
             contract_text: نص العقد للبحث عنه
             top_k: عدد الـ chunks المطلوبة للبحث الجماعي (اختياري)
+            progress_callback: دالة اختيارية callback(event, data) لأحداث التقدم
+                (terms_extracted, budget_applied, phase1_done, deep_search_done, cache_hit,
+                usage, search_status, trace)
+            token_budget: ميزانية tokens لهذا الطلب (None = REQUEST_TOKEN_BUDGET، 0 = بدون حد)
+                عند اقترابها يُقلّص البحث المعمّق (الأكثر حساسية أولاً) ثم top_k
+            deadline_seconds: المهلة الكلية للطلب (None = REQUEST_DEADLINE_SECONDS، 0 = بدون مهلة)
+                عند انتهائها يُرجع ما اكتمل، ويُبلَّغ عبر حدث search_status بـ partial
+                وقائمة البنود التي لم يُبحث عنها (skipped_clauses)
 
         Returns:
             List[Dict]: {description}
@@ -278,177 +1045,322 @@ class FileSearchService:
             ])
         )
 
-        if not self.store_id:
+        # كل طلب له trace خاص: مراحل الاستخراج و Phase 1 والبحث المعمّق والدمج (مع threads التنفيذ)
+        SEARCHES_IN_FLIGHT.inc()
+        try:
+            with start_trace("search_chunks") as trace:
+                with span("search_chunks", contract_chars=len(contract_text)):
+                    result = self._run_search(contract_text, top_k, progress_callback, token_budget, deadline_seconds)
+                self._report_progress(progress_callback, "trace", spans=trace.to_list())
+            return result
+        finally:
+            SEARCHES_IN_FLIGHT.dec()
+
+    def _run_search(self, contract_text: str, top_k: Optional[int],
+                    progress_callback: Optional[Callable[[str, Dict], None]],
+                    token_budget: Optional[int],
+                    deadline_seconds: Optional[float]) -> Tuple[List[Dict], List[Dict]]:
+        """تنفيذ search_chunks (الكاش، الاستخراج، المرحلتان، الدمج) داخل trace الطلب"""
+        if not self.store_id and not self.local_engine:
             raise ValueError("File Search Store not initialized. Run initialize_store() first.")
 
         if top_k is None:
             top_k = Config.TOP_K_CHUNKS
 
+        budget = RequestBudget(Config.REQUEST_TOKEN_BUDGET if token_budget is None else token_budget)
+
+        # مهلة واحدة (monotonic) تمر عبر الاستخراج و Phase 1 و Phase 2
+        started = time.monotonic()
+        if deadline_seconds is None:
+            deadline_seconds = Config.REQUEST_DEADLINE_SECONDS
+        deadline = started + deadline_seconds if deadline_seconds and deadline_seconds > 0 else None
+
+        # ===== كاش النتائج: نفس العقد بنفس الإعدادات لا يُعاد تحليله =====
+        cache_key = None
+        if self.result_cache:
+            cache_key = ResultCache.make_key(
+                contract_text,
+                self.model_name,
+                self.retrieval_id,
+                top_k,
+                [self.extract_prompt_template, self.search_prompt_template],
+                self._result_settings()
+            )
+            cached = self.result_cache.get(cache_key)
+            if cached is not None:
+                print("[CACHE] Result cache hit ({}...), skipping extraction and search".format(cache_key[:12]))
+                self._report_progress(progress_callback, "cache_hit", total_chunks=len(cached[0]))
+                self._report_progress(progress_callback, "usage", **budget.summary())
+                self._report_progress(progress_callback, "search_status", partial=False, skipped_clauses=[],
+                                      phase1_complete=True, elapsed_seconds=0.0)
+                return cached
+
         print("\n" + "="*60)
         print("HYBRID FILE SEARCH PROCESS (Two-Step + Sensitive Clauses)")
         print("="*60)
 
+        # العقود الطويلة تُستخرج على نوافذ متوازية (بدون streaming، الدمج يحتاج كل النوافذ)
+        long_contract = self._is_long_contract(contract_text)
+        # وضع الـ streaming: البنود الحساسة الأخطر يبدأ بحثها المعمّق أثناء الاستخراج
+        deep_executor: Optional[ThreadPoolExecutor] = None
+        if Config.STREAMING_EXTRACTION and not long_contract:
+            deep_executor = ThreadPoolExecutor(max_workers=max(1, Config.DEEP_SEARCH_MAX_WORKERS))
+
         try:
+            # البنود التي لم يُبحث عنها بعمق: {clause_id, reason: budget | deadline}
+            skipped_lock = threading.Lock()
+            skipped_clauses: List[Dict] = []
+            # بعد المهلة قد تبقى عمليات عالقة في الخلفية: لا تُسجّل شيئاً بعد تجميع النتيجة
+            collected = threading.Event()
+
+            def skip(clause_id: str, reason: str):
+                with skipped_lock:
+                    if not any(s["clause_id"] == clause_id for s in skipped_clauses):
+                        skipped_clauses.append({"clause_id": clause_id, "reason": reason})
+
+            # تغليف عمليات البحث لإرسال أحداث التقدم عند انتهاء كل منها
+            deep_done_lock = threading.Lock()
+            deep_done = [0]
+            # إجمالي البحث المعمّق (يزيد أثناء الاستخراج في وضع الـ streaming)
+            deep_total = [0]
+            phase1_complete = [False]
+
+            # مهلة البحث المعمّق تبدأ من أول إطلاق له: البنود التي لم تبدأ قبلها تُستبعد (الأخطر بدأ أولاً)
+            deep_deadline = [deadline]
+            phase2_started = [False]
+
+            def start_phase2():
+                if phase2_started[0]:
+                    return
+                phase2_started[0] = True
+                if Config.DEEP_SEARCH_DEADLINE_SECONDS > 0:
+                    phase2_deadline = time.monotonic() + Config.DEEP_SEARCH_DEADLINE_SECONDS
+                    deep_deadline[0] = phase2_deadline if deadline is None else min(deadline, phase2_deadline)
+
+            deep_estimate = 0 if self.local_engine else self.cost_ledger.estimate("deep")
+
+            def deep_search(clause: Dict) -> List[Dict]:
+                clause_id = clause.get("term_id", "unknown")
+                chunks = []
+                if self._deadline_passed(deep_deadline[0]):
+                    print("[DEADLINE] Deadline reached, skipping deep search for {}".format(clause_id))
+                    skip(clause_id, "deadline")
+                # الرصيد قد ينفد أثناء التنفيذ (الاستهلاك الفعلي أكبر من التقدير)
+                elif budget.reserve(deep_estimate):
+                    try:
+                        with span("deep_search", clause_id=clause_id) as deep_span:
+                            chunks = self._deep_search_clause(clause, budget, deadline)
+                            deep_span.set(chunks=len(chunks))
+                    except DeadlineExceeded as e:
+                        print("[DEADLINE] Deep search for {} cut off: {}".format(clause_id, e))
+                        skip(clause_id, "deadline")
+                    finally:
+                        budget.settle(deep_estimate)
+                else:
+                    print("[BUDGET] Token budget exhausted, skipping deep search for {}".format(clause_id))
+                    skip(clause_id, "budget")
+                for chunk in chunks:
+                    chunk["sources"] = [{"phase": "deep", "clause_id": clause_id}]
+                if collected.is_set():
+                    return chunks
+                with deep_done_lock:
+                    deep_done[0] += 1
+                    done = deep_done[0]
+                self._report_progress(
+                    progress_callback, "deep_search_done",
+                    clause_id=clause_id,
+                    deep_searches_done=done,
+                    deep_searches_total=deep_total[0]
+                )
+                return chunks
+
+            early_clauses: List[Dict] = []
+            early_futures: List[Future] = []
+
+            def launch_early(term: Dict):
+                """إطلاق البحث المعمّق لبند فور وصوله من الـ stream إذا كان حساساً وخطورته عالية"""
+                if not self._filter_sensitive_clauses([term]):
+                    return
+                score = self.risk_scorer.score(term)
+                if score < Config.STREAMING_EARLY_RISK_THRESHOLD:
+                    return
+                cap = Config.DEEP_SEARCH_MAX_CLAUSES
+                if (cap > 0 and len(early_clauses) >= cap) or self._deadline_passed(deadline):
+                    return
+                # لا نطلق مبكراً ما قد يحرم البحث الجماعي من الرصيد (الباقي يُقرر بعد الاستخراج)
+                if budget.limited and not self.local_engine:
+                    if budget.remaining() < self.cost_ledger.estimate("general", top_k) + deep_estimate:
+                        return
+                start_phase2()
+                print("[STREAM] Early deep search for {} (risk {:.2f})".format(term.get("term_id", "unknown"), score))
+                early_clauses.append(term)
+                deep_total[0] += 1
+                early_futures.append(deep_executor.submit(propagate(deep_search), term))
+
             # ===== المرحلة الأولى: استخراج البنود المهمة =====
-            extracted_terms = self.extract_key_terms(contract_text)
+            if long_contract:
+                with span("long_extraction", contract_chars=len(contract_text)) as extraction_span:
+                    extracted_terms = self.extract_key_terms_long(contract_text, budget, deadline)
+                    extraction_span.set(terms=len(extracted_terms))
+            elif deep_executor is not None:
+                # الاستهلاك الفعلي يُسجّل بعد آخر جزء، فنحجز التقدير أثناء الـ stream
+                extraction_estimate = self.cost_ledger.estimate("extraction")
+                budget.reserve(extraction_estimate, force=True)
+                try:
+                    with span("extraction", contract_chars=len(contract_text), streaming=True) as extraction_span:
+                        extracted_terms = self.extract_key_terms_stream(contract_text, budget, deadline, launch_early)
+                        extraction_span.set(terms=len(extracted_terms), early_deep_searches=len(early_clauses))
+                finally:
+                    budget.settle(extraction_estimate)
+            else:
+                extracted_terms = self.extract_key_terms(contract_text, budget, deadline)
             
             if not extracted_terms:
                 print("[WARNING] No terms extracted, falling back to full contract search")
                 extracted_clauses_text = contract_text[:2000]
             else:
-                extracted_clauses_text = json.dumps(extracted_terms, ensure_ascii=False, indent=2)
-            
-            # ===== المرحلة الثانية: البحث الجماعي (20 chunks) =====
-            print("\n[PHASE 1/2] General Search for all extracted clauses...")
-            print("[INFO] Using top_k={} for comprehensive coverage".format(top_k))
+                extracted_clauses_text = json.dumps(
+                    [self._clean_term(term) for term in extracted_terms], ensure_ascii=False, indent=2
+                )
             
-            full_prompt = self.search_prompt_template.format(extracted_clauses=extracted_clauses_text)
+            # البنود الحساسة معروفة بمجرد انتهاء الاستخراج (لا تعتمد على نتيجة Phase 1)
+            sensitive_clauses = self._filter_sensitive_clauses(extracted_terms) if extracted_terms else []
+            # البنود التي بدأ بحثها أثناء الـ stream لا تُعاد
+            sensitive_clauses = [c for c in sensitive_clauses if not any(c is e for e in early_clauses)]
+
+            if sensitive_clauses or early_clauses:
+                print("\n[INFO] {} sensitive clause(s): {}".format(
+                    len(sensitive_clauses) + len(early_clauses),
+                    ", ".join([c.get("term_id", "unknown") for c in (early_clauses + sensitive_clauses)[:3]])
+                ))
+
+            # ===== ترتيب البحث المعمّق حسب الخطورة (الأخطر أولاً) مع الحد الأقصى =====
+            sensitive_clauses, capped_clauses = self._prioritize_sensitive_clauses(
+                sensitive_clauses, already_launched=len(early_clauses)
+            )
+            capped_skipped = [c.get("term_id", "unknown") for c in capped_clauses]
+
+            # ===== ميزانية الطلب: تقليص الخطة قبل إطلاق عمليات البحث =====
+            requested_top_k = top_k
+            sensitive_clauses, top_k, budget_dropped = self._apply_budget(budget, sensitive_clauses, top_k)
+            for clause in budget_dropped:
+                skip(clause.get("term_id", "unknown"), "budget")
+            if budget_dropped or top_k != requested_top_k:
+                self._report_progress(
+                    progress_callback, "budget_applied",
+                    budget_skipped_clauses=[c.get("term_id", "unknown") for c in budget_dropped],
+                    effective_top_k=top_k
+                )
 
-            print("[SEARCH] Querying Gemini File Search (Phase 1)...")
-            
-            # Retry logic for 503 errors
-            max_retries = 3
-            retry_count = 0
-            response = None
-            
-            while retry_count < max_retries:
+            deep_total[0] += len(sensitive_clauses)
+            self._report_progress(
+                progress_callback, "terms_extracted",
+                extracted_terms=extracted_terms,
+                total_terms=len(extracted_terms),
+                deep_searches_total=deep_total[0],
+                deep_searches_done=deep_done[0],
+                deep_searches_capped=capped_skipped
+            )
+
+            if sensitive_clauses:
+                start_phase2()
+
+            general_estimate = 0 if self.local_engine else self.cost_ledger.estimate("general", top_k)
+
+            def general_search() -> List[Dict]:
+                if self._deadline_passed(deadline):
+                    print("[DEADLINE] Request deadline reached before Phase 1, skipping general search")
+                    return []
+                budget.reserve(general_estimate, force=True)
                 try:
-                    response = self.client.models.generate_content(
-                        model=self.model_name,
-                        contents=full_prompt,
-                        config=types.GenerateContentConfig(
-                            tools=[types.Tool(
-                                file_search=types.FileSearch(
-                                    file_search_store_names=[self.store_id],
-                                    top_k=top_k
-                                )
-                            )],
-                            response_modalities=["TEXT"]
-                        )
-                    )
-                    break  # Success - exit retry loop
-                except Exception as e:
-                    retry_count += 1
-                    if "503" in str(e) or "UNAVAILABLE" in str(e):
-                        print("[WARNING] Got 503 error, retrying... (attempt {}/{})".format(retry_count, max_retries))
-                        if retry_count < max_retries:
-                            time.sleep(2 ** retry_count)  # Exponential backoff
-                        else:
-                            raise
-                    else:
-                        raise
-
-            # استخراج الـ chunks من الـ grounding metadata
-            general_chunks = self._extract_grounding_chunks(response, top_k)
-            print("[SUCCESS] Phase 1 retrieved {} chunks".format(len(general_chunks)))
-            
-            # ===== المرحلة الثالثة: البحث المعمّق للبنود الحساسة (5 chunks إضافية) =====
-            sensitive_chunks = []
-            
-            if extracted_terms:
-                sensitive_clauses = self._filter_sensitive_clauses(extracted_terms)
-                
+                    with span("phase1", top_k=top_k) as phase1_span:
+                        chunks = self._general_search(extracted_clauses_text, top_k, extracted_terms, budget, deadline)
+                        phase1_span.set(chunks=len(chunks))
+                except DeadlineExceeded as e:
+                    print("[DEADLINE] Phase 1 cut off: {}".format(e))
+                    return []
+                finally:
+                    budget.settle(general_estimate)
+                for chunk in chunks:
+                    chunk["sources"] = [{"phase": "general"}]
+                if not collected.is_set():
+                    phase1_complete[0] = True
+                    self._report_progress(progress_callback, "phase1_done", general_chunks=len(chunks))
+                return chunks
+
+            if deep_executor is not None:
+                # ===== وضع الـ streaming: البحث المعمّق للبنود الأخطر بدأ أثناء الاستخراج =====
+                print("\n[PIPELINE] {} deep search(es) started while streaming, {} more after extraction".format(
+                    len(early_clauses), len(sensitive_clauses)
+                ))
+                if Config.PIPELINED_SEARCH:
+                    # executor منفصل للبحث الجماعي حتى لا ينتظر خلف البحث المعمّق المبكر
+                    general_executor = ThreadPoolExecutor(max_workers=1)
+                    try:
+                        futures = [general_executor.submit(propagate(general_search))] + early_futures
+                        futures.extend(deep_executor.submit(propagate(deep_search), c) for c in sensitive_clauses)
+                        results = self._collect_until(futures, deadline)
+                    finally:
+                        general_executor.shutdown(wait=deadline is None, cancel_futures=True)
+                    general_chunks = results[0] or []
+                    per_clause_chunks = results[1:]
+                else:
+                    general_chunks = general_search()
+                    futures = early_futures + [
+                        deep_executor.submit(propagate(deep_search), c) for c in sensitive_clauses
+                    ]
+                    per_clause_chunks = self._collect_until(futures, deadline)
+                deep_executor.shutdown(wait=deadline is None, cancel_futures=True)
+            elif Config.PIPELINED_SEARCH and sensitive_clauses:
+                # ===== الوضع المتوازي: Phase 1 و Phase 2 معاً =====
+                # الزمن الكلي = الاستخراج + أبطأ عملية بحث (بدل مجموع كل عمليات البحث)
+                max_workers = min(Config.DEEP_SEARCH_MAX_WORKERS, len(sensitive_clauses)) + 1
+                print("\n[PIPELINE] Launching Phase 1 and {} deep search(es) together (max_in_flight={})".format(
+                    len(sensitive_clauses), max_workers
+                ))
+                executor = ThreadPoolExecutor(max_workers=max_workers)
+                try:
+                    futures = [executor.submit(propagate(general_search))]
+                    futures.extend(executor.submit(propagate(deep_search), c) for c in sensitive_clauses)
+
+                    # الدمج ينتظر كل العمليات (حتى المهلة فقط)، بنفس ترتيب المسار التسلسلي
+                    results = self._collect_until(futures, deadline)
+                finally:
+                    # عند انتهاء المهلة لا ننتظر الاستدعاءات العالقة (مهلة HTTP تنهيها لاحقاً)
+                    executor.shutdown(wait=deadline is None, cancel_futures=True)
+                general_chunks = results[0] or []
+                per_clause_chunks = results[1:]
+            else:
+                # ===== المرحلة الثانية: البحث الجماعي =====
+                general_chunks = general_search()
+
+                # ===== المرحلة الثالثة: البحث المعمّق للبنود الحساسة (2 chunks لكل بند) =====
                 if sensitive_clauses:
                     print("\n[PHASE 2/2] Deep Search for {} sensitive clause(s)...".format(len(sensitive_clauses)))
-                    print("[INFO] Sensitive clauses: {}".format(
-                        ", ".join([c.get("term_id", "unknown") for c in sensitive_clauses[:3]])
-                    ))
-                    
-                    # بحث منفصل لكل بند حساس
-                    for sensitive_clause in sensitive_clauses:
-                        clause_id = sensitive_clause.get("term_id", "unknown")
-                        clause_text = sensitive_clause.get("term_text", "")
-                        issues = sensitive_clause.get("potential_issues", [])
-                        
-                        print("\n[DEEP SEARCH] Processing sensitive clause: {}".format(clause_id))
-                        print("[INFO] Issues: {}".format(", ".join(issues[:3])))
-                        
-                        # بناء prompt منفصل للبند الحساس
-                        sensitive_search_prompt = """قم بالبحث الدقيق والعميق في معايير AAOIFI عن المقاطع التي تتعلق مباشرة بالمشاكل الشرعية التالية:
+                    per_clause_chunks = self._run_deep_searches(sensitive_clauses, deep_search, deadline)
+                else:
+                    if extracted_terms:
+                        print("\n[PHASE 2/2] No sensitive clauses found, skipping deep search")
+                    per_clause_chunks = []
 
-مشاكل شرعية:
-{issues}
+            collected.set()
 
-نص البند من العقد:
-{clause_text}
-
-ابحث عن:
-1. المعايير الشرعية الدقيقة (رقم المعيار وتفاصيله).
-2. النصوص التي تحتوي على كلمات حاسمة: "لا يجوز"، "محرم"، "يبطل"، "ضرر فعلي"، "غرر"، "ربا".
-3. أمثلة على حالات مشابهة أو مخالفة.
-4. القيود والشروط الدقيقة من AAOIFI.
+            sensitive_chunks = []
+            for clause, clause_chunks in zip(early_clauses + sensitive_clauses, per_clause_chunks):
+                if clause_chunks is None:
+                    # لم ينتهِ قبل المهلة (أُلغي أو ما زال عالقاً)
+                    skip(clause.get("term_id", "unknown"), "deadline")
+                    continue
+                sensitive_chunks.extend(clause_chunks)
 
-ركز على الدقة الشرعية العالية والاقتباسات الحرفية.""".format(
-                            issues="\n".join(issues),
-                            clause_text=clause_text
-                        )
-                        
-                        # استدعاء Gemini للبحث المعمّق (2 chunks فقط) مع retry logic
-                        max_retries_sensitive = 3
-                        retry_count_sensitive = 0
-                        sensitive_response = None
-                        
-                        while retry_count_sensitive < max_retries_sensitive:
-                            try:
-                                sensitive_response = self.client.models.generate_content(
-                                    model=self.model_name,
-                                    contents=sensitive_search_prompt,
-                                    config=types.GenerateContentConfig(
-                                        tools=[types.Tool(
-                                            file_search=types.FileSearch(
-                                                file_search_store_names=[self.store_id],
-                                                top_k=2  # 2 chunks فقط لكل بند حساس (تم تقليله من 5)
-                                            )
-                                        )],
-                                        response_modalities=["TEXT"]
-                                    )
-                                )
-                                break  # Success - exit retry loop
-                            except Exception as e:
-                                retry_count_sensitive += 1
-                                if "503" in str(e) or "UNAVAILABLE" in str(e):
-                                    print("[WARNING] Got 503 error for sensitive search, retrying... (attempt {}/{})".format(
-                                        retry_count_sensitive, max_retries_sensitive))
-                                    if retry_count_sensitive < max_retries_sensitive:
-                                        time.sleep(2 ** retry_count_sensitive)  # Exponential backoff
-                                    else:
-                                        print("[ERROR] Sensitive search failed after retries, skipping this clause")
-                                        sensitive_response = None
-                                        break
-                                else:
-                                    raise
-                        
-                        if sensitive_response:
-                            clause_chunks = self._extract_grounding_chunks(sensitive_response, 2)
-                        else:
-                            clause_chunks = []
-                        print("[SUCCESS] Deep search retrieved {} chunks for {}".format(
-                            len(clause_chunks), clause_id
-                        ))
-                        sensitive_chunks.extend(clause_chunks)
-                else:
-                    print("\n[PHASE 2/2] No sensitive clauses found, skipping deep search")
-            
             # ===== دمج النتائج (إزالة التكرار) =====
             print("\n[MERGE] Combining general and sensitive chunks...")
             
-            # استخدام dict لإزالة التكرار بناءً على chunk_text
-            chunk_dict = {}
-            
-            # أضف البنود العامة أولاً
-            for chunk in general_chunks:
-                chunk_text = chunk.get("chunk_text", "")
-                if chunk_text and chunk_text not in chunk_dict:
-                    chunk_dict[chunk_text] = chunk
-            
-            # أضف البنود الحساسة (قد تكون بنود جديدة أكثر دقة)
-            for chunk in sensitive_chunks:
-                chunk_text = chunk.get("chunk_text", "")
-                if chunk_text and chunk_text not in chunk_dict:
-                    chunk_dict[chunk_text] = chunk
-            
-            # تحويل dict إلى list
-            all_chunks = list(chunk_dict.values())
+            # إزالة التكرار الحرفي والمتقارب (MinHash): البنود العامة أولاً ثم الحساسة
+            # (قد تكون بنود جديدة أكثر دقة)، مع الاحتفاظ بالأعلى score ودمج المصادر
+            with span("merge", input_chunks=len(general_chunks) + len(sensitive_chunks)) as merge_span:
+                all_chunks = self.chunk_merger.merge(general_chunks + sensitive_chunks)
+                merge_span.set(output_chunks=len(all_chunks))
             
             # إعادة ترقيم الـ chunks
             for idx, chunk in enumerate(all_chunks):
@@ -458,6 +1370,38 @@ class FileSearchService:
                 len(all_chunks), len(general_chunks), len(sensitive_chunks)
             ))
             print("="*60 + "\n")
+
+            # نتيجة جزئية: انتهت المهلة أو الميزانية قبل اكتمال كل المراحل
+            partial = bool(skipped_clauses) or not phase1_complete[0]
+            if partial:
+                print("[DEADLINE] Returning partial result after {:.1f}s (phase1_complete={}, skipped: {})".format(
+                    time.monotonic() - started,
+                    phase1_complete[0],
+                    ", ".join("{}:{}".format(s["clause_id"], s["reason"]) for s in skipped_clauses) or "none"
+                ))
+
+            # لا نخزّن نتائج الـ fallback (فشل الاستخراج) ولا النتائج الجزئية أو المقلّصة
+            # بسبب الميزانية حتى لا نثبّت نتيجة ضعيفة
+            if cache_key and extracted_terms and not partial and top_k == requested_top_k:
+                self.result_cache.set(cache_key, all_chunks, extracted_terms)
+
+            usage = budget.summary()
+            usage.update({
+                "budget_skipped_clauses": [s["clause_id"] for s in skipped_clauses if s["reason"] == "budget"],
+                "effective_top_k": top_k
+            })
+            print("[COST] Request used {} tokens (${:.6f}){}".format(
+                usage["usage"]["total_tokens"], usage["usage"]["cost_usd"],
+                ", budget {}".format(budget.max_tokens) if budget.limited else ""
+            ))
+            self._report_progress(progress_callback, "usage", **usage)
+            self._report_progress(
+                progress_callback, "search_status",
+                partial=partial,
+                skipped_clauses=list(skipped_clauses),
+                phase1_complete=phase1_complete[0],
+                elapsed_seconds=round(time.monotonic() - started, 3)
+            )
             
             # إرجاع chunks و extracted_terms
             return all_chunks, extracted_terms
@@ -467,6 +1411,9 @@ class FileSearchService:
             import traceback
             traceback.print_exc()
             raise
+        finally:
+            if deep_executor is not None:
+                deep_executor.shutdown(wait=False, cancel_futures=True)
 
     def _extract_grounding_chunks(self, response, top_k: int) -> List[Dict]:
         """
@@ -490,6 +1437,13 @@ class FileSearchService:
             ])
         )
 
+        with span("grounding_extract", top_k=top_k) as grounding_span:
+            chunks = self._parse_grounding_chunks(response, top_k)
+            grounding_span.set(chunks=len(chunks))
+        return chunks
+
+    def _parse_grounding_chunks(self, response, top_k: int) -> List[Dict]:
+        """تحويل grounding_chunks/supports في الاستجابة إلى chunks (منطق _extract_grounding_chunks)"""
         chunks = []
 
         # التحقق من وجود candidates
@@ -534,7 +1488,7 @@ class FileSearchService:
 
                     # النص الأصلي من PDF
                     if hasattr(retrieved, 'text'):
-                        chunk_data["chunk_text"] = retrieved.text
+                        chunk_data["chunk_text"] = clean_arabic(retrieved.text)
                     
                     # URI للملف
                     if hasattr(retrieved, 'uri'):
@@ -585,7 +1539,7 @@ class FileSearchService:
                 # استخراج من segment (نص Gemini)
                 if hasattr(support, 'segment') and support.segment:
                     if hasattr(support.segment, 'text'):
-                        chunk_data["chunk_text"] = support.segment.text
+                        chunk_data["chunk_text"] = clean_arabic(support.segment.text)
 
                 # استخراج confidence scores
                 if hasattr(support, 'confidence_scores') and support.confidence_scores:
@@ -602,14 +1556,83 @@ class FileSearchService:
         print("[ERROR] No chunks found in grounding_chunks or grounding_supports")
         return chunks
 
-    def get_store_info(self) -> Dict:
+    def get_cache_stats(self) -> Dict:
+        """إحصائيات كاش النتائج وكاش البنود (hits/misses/evictions)"""
+        result_stats = {"enabled": False}
+        if self.result_cache:
+            result_stats = self.result_cache.stats()
+            result_stats["enabled"] = True
+
+        clause_stats = {"enabled": False}
+        if self.clause_cache:
+            clause_stats = self.clause_cache.stats()
+            clause_stats["enabled"] = True
+
+        return {
+            "result_cache": result_stats,
+            "clause_cache": clause_stats
+        }
+
+    def get_cost_stats(self) -> Dict:
+        """دفتر الـ tokens والتكلفة اليومي مع تقديرات كل نوع استدعاء"""
+        stats = self.cost_ledger.stats()
+        stats["request_token_budget"] = Config.REQUEST_TOKEN_BUDGET
+        return stats
+
+    def get_gateway_stats(self) -> Dict:
+        """إحصائيات بوابة Gemini (الطلبات، إعادة المحاولة، حد التزامن الحالي، مجموعة الاتصالات)"""
+        stats = self.gateway.stats()
+        stats["client_pool"] = self.client.stats()
+        return stats
+
+    def warm_up(self):
+        """فتح اتصالات Gemini مسبقاً في الخلفية (GEMINI_PREWARM)، فلا يدفع أول طلب ثمن الـ handshake"""
+        if Config.GEMINI_PREWARM and not self.local_engine:
+            self.client.warm_up_async(self.model_name)
+
+    def invalidate_caches(self):
+        """مسح كل الكاشات (يُستدعى عند تغيّر محتوى الـ File Search Store)"""
+        if self.clause_cache:
+            self.clause_cache.invalidate()
+        if self.result_cache:
+            self.result_cache.clear()
+            print("[CACHE] Result cache cleared")
+
+    def _cache_store_info(self, store):
+        """حفظ metadata الـ Store من آخر استجابة get/create"""
+        with self._store_info_lock:
+            self._store_info = {
+                "status": "active",
+                "store_id": self.store_id,
+                "display_name": store.display_name if hasattr(store, 'display_name') else "Unknown",
+                "message": "Store is ready"
+            }
+            self._store_info_at = time.monotonic()
+
+    def get_store_info(self, refresh: bool = False) -> Dict:
         """
         الحصول على معلومات عن File Search Store الحالي
 
+        تُرجع النسخة المحفوظة ما دامت أحدث من STORE_INFO_TTL_SECONDS (إلا مع refresh)
+
+        Args:
+            refresh: تجاهل النسخة المحفوظة والاستعلام من الـ API
+
         Returns:
             Dict: معلومات عن الـ Store
         """
 
+        if self.local_engine:
+            info = self.local_engine.info()
+            info.update({
+                "status": "active",
+                "backend": "local",
+                "store_id": self.retrieval_id,
+                "display_name": "Local BM25 index ({})".format(self.context_dir),
+                "message": "Local index is ready"
+            })
+            return info
+
         if not self.store_id:
             return {
                 "status": "not_initialized",
@@ -617,15 +1640,21 @@ class FileSearchService:
                 "message": "Store not initialized"
             }
 
+        with self._store_info_lock:
+            fresh = (
+                self._store_info is not None
+                and self._store_info["store_id"] == self.store_id
+                and time.monotonic() - self._store_info_at < Config.STORE_INFO_TTL_SECONDS
+            )
+            if fresh and not refresh:
+                info = dict(self._store_info)
+                info["cached"] = True
+                return info
+
         try:
             store = self.client.file_search_stores.get(name=self.store_id)
-
-            return {
-                "status": "active",
-                "store_id": self.store_id,
-                "display_name": store.display_name if hasattr(store, 'display_name') else "Unknown",
-                "message": "Store is ready"
-            }
+            self._cache_store_info(store)
+            return dict(self._store_info)
 
         except Exception as e:
             return {
@@ -633,4 +1662,4 @@ class FileSearchService:
                 "store_id": self.store_id,
                 "error": str(e),
                 "message": "Failed to access store"
-            }
\ No newline at end of file
+            }
@@ -0,0 +1,380 @@
+import random
+import threading
+import time
+from typing import Dict, Iterator, Optional
+
+from services.metrics import (
+    GEMINI_CONCURRENCY_LIMIT, GEMINI_IN_FLIGHT, GEMINI_OVERLOAD_ERRORS, GEMINI_RETRIES
+)
+from services.tracing import current_span
+
+
+class DeadlineExceeded(TimeoutError):
+    """انتهت مهلة الطلب قبل اكتمال الاستدعاء (أو لم يبقَ وقت لإعادة المحاولة)"""
+
+
+def is_retryable_error(error: Exception) -> bool:
+    """أخطاء الضغط المؤقت من Gemini (429 / 503) التي تستحق إعادة المحاولة"""
+    message = str(error)
+    return any(marker in message for marker in ("429", "RESOURCE_EXHAUSTED", "503", "UNAVAILABLE"))
+
+
+def _overload_code(error: Exception) -> str:
+    """رمز خطأ الضغط للمقاييس: 429 (حصة) أو 503 (الخدمة مشغولة)"""
+    message = str(error)
+    return "429" if "429" in message or "RESOURCE_EXHAUSTED" in message else "503"
+
+
+class TokenBucket:
+    """
+    Token bucket بسيط آمن للـ threads (معدل في الدقيقة)
+
+    يسمح بالرصيد السالب (دَين) عند تصحيح الاستهلاك الفعلي بعد الاستجابة،
+    فيتأخر الطلب التالي حتى يُسدَّد الدين
+    """
+
+    def __init__(self, rate_per_minute: float, capacity: Optional[float] = None):
+        self.rate_per_second = rate_per_minute / 60.0
+        self.capacity = capacity if capacity is not None else rate_per_minute
+        self._tokens = self.capacity
+        self._updated = time.monotonic()
+        self._lock = threading.Lock()
+
+    def _refill(self):
+        now = time.monotonic()
+        self._tokens = min(self.capacity, self._tokens + (now - self._updated) * self.rate_per_second)
+        self._updated = now
+
+    def acquire(self, amount: float = 1.0, deadline: Optional[float] = None, label: str = "") -> float:
+        """
+        حجز amount من الرصيد مع الانتظار عند الحاجة
+
+        Args:
+            amount: الكمية المطلوبة
+            deadline: مهلة الطلب (time.monotonic) - إذا كان الانتظار اللازم (مع الدين) يتجاوزها
+                      يُرفع الخطأ فوراً بدل النوم
+            label: اسم الاستدعاء لرسالة الخطأ
+
+        Returns:
+            float: زمن الانتظار بالثواني
+
+        Raises:
+            DeadlineExceeded: إذا لم يكفِ الوقت المتبقي لتوفر الرصيد
+        """
+        if self.rate_per_second <= 0:
+            return 0.0
+
+        # طلب أكبر من السعة الكاملة لا يمكن تلبيته أبداً، نكتفي بملء الـ bucket
+        amount = min(amount, self.capacity)
+        waited = 0.0
+
+        while True:
+            with self._lock:
+                self._refill()
+                if self._tokens >= amount:
+                    self._tokens -= amount
+                    return waited
+                delay = (amount - self._tokens) / self.rate_per_second
+
+            if deadline is not None and time.monotonic() + delay >= deadline:
+                raise DeadlineExceeded("{}: rate limit wait of {:.1f}s would pass the deadline".format(label, delay))
+            time.sleep(delay)
+            waited += delay
+
+    def adjust(self, delta: float):
+        """تصحيح الرصيد بعد معرفة الاستهلاك الفعلي (delta موجب = استهلاك إضافي)"""
+        if self.rate_per_second <= 0:
+            return
+        with self._lock:
+            self._refill()
+            self._tokens = min(self.capacity, self._tokens - delta)
+
+
+class AdaptiveConcurrencyLimiter:
+    """
+    حد تزامن متكيّف بأسلوب AIMD
+
+    - نجاح: زيادة جمعية (limit += 1/limit) حتى max_limit
+    - ضغط (429/503): تخفيض ضربي (limit *= 0.5) حتى min_limit
+    """
+
+    def __init__(self, initial_limit: int, min_limit: int, max_limit: int):
+        self.min_limit = max(1, min_limit)
+        self.max_limit = max(self.min_limit, max_limit)
+        self.limit = float(min(max(initial_limit, self.min_limit), self.max_limit))
+        self.in_flight = 0
+        self._cond = threading.Condition()
+
+    def acquire(self, deadline: Optional[float] = None, label: str = "") -> float:
+        """
+        انتظار مكان ضمن الحد الحالي
+
+        Args:
+            deadline: مهلة الطلب (time.monotonic) - الانتظار لا يتجاوزها
+            label: اسم الاستدعاء لرسالة الخطأ
+
+        Returns:
+            float: مدة الانتظار بالثواني
+
+        Raises:
+            DeadlineExceeded: إذا انتهت المهلة قبل أن يتوفر مكان
+        """
+        started = time.monotonic()
+        with self._cond:
+            while self.in_flight >= int(self.limit):
+                if deadline is None:
+                    self._cond.wait()
+                    continue
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    raise DeadlineExceeded("{}: deadline reached waiting for a concurrency slot".format(label))
+                self._cond.wait(remaining)
+            self.in_flight += 1
+        return time.monotonic() - started
+
+    def release(self, overloaded: bool = False):
+        with self._cond:
+            self.in_flight -= 1
+            if overloaded:
+                self.limit = max(self.min_limit, self.limit * 0.5)
+            else:
+                self.limit = min(self.max_limit, self.limit + 1.0 / self.limit)
+            self._cond.notify_all()
+
+
+class GeminiGateway:
+    """
+    بوابة موحّدة لكل استدعاءات generate_content في FileSearchService
+
+    - Token bucket للطلبات في الدقيقة (RPM) والـ tokens في الدقيقة (TPM)
+    - تزامن متكيّف (AIMD) ينخفض تلقائياً عند 429/503
+    - إعادة محاولة مع exponential backoff و full jitter
+    - ميزانية إعادة المحاولة: كل طلب ناجح يضيف retry_budget_ratio، وكل إعادة محاولة تستهلك 1،
+      فلا تتضاعف الطلبات أثناء انقطاع الخدمة
+    """
+
+    # تقدير تقريبي لعدد الأحرف لكل token (النص عربي في الغالب)
+    CHARS_PER_TOKEN = 3
+    # تقدير ثابت لحجم الاستجابة + سياق File Search المسترجع
+    ESTIMATED_OUTPUT_TOKENS = 2000
+
+    def __init__(self, client, requests_per_minute: int, tokens_per_minute: int,
+                 max_concurrency: int, min_concurrency: int, max_retries: int,
+                 retry_budget_ratio: float, retry_budget_cap: float = 20.0):
+        self.client = client
+        self.max_retries = max_retries
+        self.retry_budget_ratio = retry_budget_ratio
+        self.retry_budget_cap = retry_budget_cap
+
+        self.request_bucket = TokenBucket(requests_per_minute)
+        self.token_bucket = TokenBucket(tokens_per_minute)
+        self.concurrency = AdaptiveConcurrencyLimiter(max_concurrency, min_concurrency, max_concurrency)
+
+        self._stats_lock = threading.Lock()
+        self._retry_budget = retry_budget_cap
+        self._stats = {
+            "calls": 0,
+            "successes": 0,
+            "failures": 0,
+            "retries": 0,
+            "overload_errors": 0,
+            "retry_budget_exhausted": 0,
+            "throttled_seconds": 0.0
+        }
+
+        GEMINI_IN_FLIGHT.set_function(lambda: self.concurrency.in_flight)
+        GEMINI_CONCURRENCY_LIMIT.set_function(lambda: int(self.concurrency.limit))
+
+        print("[INFO] Gemini gateway ready (rpm={}, tpm={}, concurrency={}-{})".format(
+            requests_per_minute, tokens_per_minute, min_concurrency, max_concurrency
+        ))
+
+    def _estimate_tokens(self, contents) -> int:
+        return len(str(contents)) // self.CHARS_PER_TOKEN + self.ESTIMATED_OUTPUT_TOKENS
+
+    def _backoff_delay(self, attempt: int) -> float:
+        """Exponential backoff مع full jitter (نفس الأساس 2^n القديم كحد أعلى)"""
+        return random.uniform(0, min(30.0, 2 ** attempt))
+
+    def _acquire_rate(self, estimated_tokens: int, deadline: Optional[float], label: str) -> float:
+        """حجز طلب + tokens من حدود RPM/TPM دون تجاوز المهلة - يرجع زمن الانتظار"""
+        waited = self.request_bucket.acquire(1, deadline, label)
+        try:
+            waited += self.token_bucket.acquire(estimated_tokens, deadline, label)
+        except DeadlineExceeded:
+            # الطلب لن يُرسل: إرجاع حجز RPM
+            self.request_bucket.adjust(-1)
+            raise
+        return waited
+
+    def _take_retry_token(self) -> bool:
+        with self._stats_lock:
+            if self._retry_budget < 1.0:
+                self._stats["retry_budget_exhausted"] += 1
+                return False
+            self._retry_budget -= 1.0
+            self._stats["retries"] += 1
+        GEMINI_RETRIES.inc()
+        span = current_span()
+        if span is not None:
+            span.increment("retries")
+        return True
+
+    def generate_content(self, model: str, contents, config, label: str = "call",
+                         deadline: Optional[float] = None):
+        """
+        استدعاء client.models.generate_content عبر الـ limiter وسياسة إعادة المحاولة
+
+        Args:
+            model: اسم النموذج
+            contents: الـ prompt
+            config: GenerateContentConfig
+            label: وصف مختصر للاستدعاء في السجلات
+            deadline: مهلة الطلب (time.monotonic) - لا تبدأ محاولة ولا انتظار backoff بعدها
+
+        Raises:
+            DeadlineExceeded: إذا انتهت المهلة قبل المحاولة أو كان الـ backoff سيتجاوزها
+            Exception: آخر خطأ عند فشل كل المحاولات أو نفاد ميزانية إعادة المحاولة
+        """
+        estimated_tokens = self._estimate_tokens(contents)
+        attempt = 0
+
+        while True:
+            waited = self._acquire_rate(estimated_tokens, deadline, label)
+            waited += self.concurrency.acquire(deadline, label)
+
+            with self._stats_lock:
+                self._stats["calls"] += 1
+                self._stats["throttled_seconds"] += waited
+
+            overloaded = False
+            try:
+                response = self.client.models.generate_content(
+                    model=model,
+                    contents=contents,
+                    config=config
+                )
+            except Exception as e:
+                overloaded = is_retryable_error(e)
+                self.concurrency.release(overloaded=overloaded)
+                attempt += 1
+
+                with self._stats_lock:
+                    self._stats["failures"] += 1
+                    if overloaded:
+                        self._stats["overload_errors"] += 1
+                if overloaded:
+                    GEMINI_OVERLOAD_ERRORS.inc(code=_overload_code(e))
+
+                if not overloaded or attempt >= self.max_retries or not self._take_retry_token():
+                    raise
+
+                delay = self._backoff_delay(attempt)
+                if deadline is not None and time.monotonic() + delay >= deadline:
+                    raise DeadlineExceeded("{}: no time left to retry after: {}".format(label, e)) from e
+                print("[WARNING] {} got overload error, retrying in {:.1f}s (attempt {}/{})".format(
+                    label, delay, attempt, self.max_retries
+                ))
+                time.sleep(delay)
+                continue
+
+            self.concurrency.release(overloaded=False)
+
+            # تصحيح رصيد TPM بالاستهلاك الفعلي إن توفر usage_metadata
+            usage = getattr(response, "usage_metadata", None)
+            actual_tokens = getattr(usage, "total_token_count", None) if usage else None
+            if actual_tokens:
+                self.token_bucket.adjust(actual_tokens - estimated_tokens)
+
+            with self._stats_lock:
+                self._stats["successes"] += 1
+                self._retry_budget = min(self.retry_budget_cap, self._retry_budget + self.retry_budget_ratio)
+
+            return response
+
+    def generate_content_stream(self, model: str, contents, config, label: str = "stream",
+                                deadline: Optional[float] = None) -> Iterator:
+        """
+        نسخة streaming من generate_content عبر نفس الـ limiter وسياسة إعادة المحاولة
+
+        إعادة المحاولة ممكنة فقط قبل وصول أول جزء (بعدها قد يكون المستهلك تصرّف في الأجزاء)،
+        ومقعد التزامن يبقى محجوزاً حتى ينتهي المستهلك من القراءة
+
+        Yields:
+            أجزاء الاستجابة كما يرجعها client.models.generate_content_stream
+        """
+        estimated_tokens = self._estimate_tokens(contents)
+        attempt = 0
+
+        while True:
+            waited = self._acquire_rate(estimated_tokens, deadline, label)
+            waited += self.concurrency.acquire(deadline, label)
+
+            with self._stats_lock:
+                self._stats["calls"] += 1
+                self._stats["throttled_seconds"] += waited
+
+            received_any = False
+            overloaded = False
+            last_chunk = None
+            try:
+                for chunk in self.client.models.generate_content_stream(
+                    model=model,
+                    contents=contents,
+                    config=config
+                ):
+                    received_any = True
+                    last_chunk = chunk
+                    yield chunk
+            except Exception as e:
+                overloaded = is_retryable_error(e)
+                self.concurrency.release(overloaded=overloaded)
+                attempt += 1
+
+                with self._stats_lock:
+                    self._stats["failures"] += 1
+                    if overloaded:
+                        self._stats["overload_errors"] += 1
+                if overloaded:
+                    GEMINI_OVERLOAD_ERRORS.inc(code=_overload_code(e))
+
+                if (received_any or not overloaded or attempt >= self.max_retries
+                        or not self._take_retry_token()):
+                    raise
+
+                delay = self._backoff_delay(attempt)
+                if deadline is not None and time.monotonic() + delay >= deadline:
+                    raise DeadlineExceeded("{}: no time left to retry after: {}".format(label, e)) from e
+                print("[WARNING] {} got overload error, retrying in {:.1f}s (attempt {}/{})".format(
+                    label, delay, attempt, self.max_retries
+                ))
+                time.sleep(delay)
+                continue
+            except GeneratorExit:
+                # المستهلك توقف عن القراءة مبكراً
+                self.concurrency.release(overloaded=False)
+                raise
+
+            self.concurrency.release(overloaded=False)
+
+            # usage_metadata الكامل يأتي مع آخر جزء
+            usage = getattr(last_chunk, "usage_metadata", None) if last_chunk is not None else None
+            actual_tokens = getattr(usage, "total_token_count", None) if usage else None
+            if actual_tokens:
+                self.token_bucket.adjust(actual_tokens - estimated_tokens)
+
+            with self._stats_lock:
+                self._stats["successes"] += 1
+                self._retry_budget = min(self.retry_budget_cap, self._retry_budget + self.retry_budget_ratio)
+            return
+
+    def stats(self) -> Dict:
+        """إحصائيات البوابة لعرضها في الـ API"""
+        with self._stats_lock:
+            stats = dict(self._stats)
+            stats["retry_budget"] = round(self._retry_budget, 2)
+
+        stats["throttled_seconds"] = round(stats["throttled_seconds"], 3)
+        stats["concurrency_limit"] = int(self.concurrency.limit)
+        stats["in_flight"] = self.concurrency.in_flight
+        return stats
@@ -0,0 +1,513 @@
+import hashlib
+import json
+import math
+import random
+import threading
+import time
+from collections import deque
+from pathlib import Path
+from types import SimpleNamespace
+from typing import Dict, Iterator, List, Optional, Tuple
+from google.genai import types
+
+
+class StandInAPIError(Exception):
+    """خطأ مُحاكى بنفس نص أخطاء Gemini (429 / 503)، فتعامله البوابة كخطأ حقيقي قابل لإعادة المحاولة"""
+
+    def __init__(self, code: int, status: str, message: str):
+        super().__init__("{} {}. {}".format(code, status, message))
+        self.code = code
+        self.status = status
+
+
+def _quota_error() -> StandInAPIError:
+    return StandInAPIError(429, "RESOURCE_EXHAUSTED", "Resource has been exhausted (e.g. check quota).")
+
+
+def request_kind(config) -> str:
+    """نوع الطلب: search (مع File Search tool) أو extraction"""
+    for tool in getattr(config, "tools", None) or []:
+        if getattr(tool, "file_search", None) is not None:
+            return "search"
+    return "extraction"
+
+
+def request_top_k(config) -> Optional[int]:
+    for tool in getattr(config, "tools", None) or []:
+        file_search = getattr(tool, "file_search", None)
+        if file_search is not None:
+            return getattr(file_search, "top_k", None)
+    return None
+
+
+def request_key(model: str, contents, config) -> str:
+    """بصمة الطلب لمطابقة التسجيلات: الموديل + النص + نوع الطلب + top_k"""
+    material = json.dumps(
+        [model, contents if isinstance(contents, str) else repr(contents), request_kind(config), request_top_k(config)],
+        ensure_ascii=False
+    )
+    return hashlib.sha256(material.encode("utf-8")).hexdigest()
+
+
+def dump_response(response) -> Dict:
+    """تحويل استجابة generate_content إلى JSON (مع grounding_metadata و usage_metadata)"""
+    data = response.model_dump(mode="json", exclude_none=True)
+    data.pop("sdk_http_response", None)
+    return data
+
+
+def _namespace(value):
+    if isinstance(value, dict):
+        return SimpleNamespace(**{key: _namespace(item) for key, item in value.items()})
+    if isinstance(value, list):
+        return [_namespace(item) for item in value]
+    return value
+
+
+def load_response(data: Dict):
+    """إعادة بناء الاستجابة من JSON (كائن SDK، أو كائن بنفس الخصائص إذا اختلفت نسخة SDK)"""
+    try:
+        return types.GenerateContentResponse.model_validate(data)
+    except Exception:
+        response = _namespace(data)
+        parts = data.get("candidates", [{}])[0].get("content", {}).get("parts", []) if data.get("candidates") else []
+        response.text = "".join(part.get("text", "") for part in parts) or None
+        return response
+
+
+def _response_text(data: Dict) -> str:
+    candidates = data.get("candidates") or [{}]
+    parts = (candidates[0].get("content") or {}).get("parts") or []
+    return "".join(part.get("text", "") for part in parts)
+
+
+def _estimate_tokens(text: str) -> int:
+    return max(1, len(text) // 4)
+
+
+class LatencyModel:
+    """
+    توزيع زمن الاستجابة من نص إعداد:
+        fixed:2.5          ثابت
+        uniform:1:4        منتظم بين حدين
+        lognormal:10:0.4   log-normal بوسيط (median) و sigma
+        recorded           الزمن المسجّل مع الاستجابة (أو 0 إن لم يوجد)
+    """
+
+    def __init__(self, spec: str, scale: float = 1.0):
+        self.spec = spec
+        self.scale = max(0.0, scale)
+        parts = spec.strip().lower().split(":")
+        self.kind = parts[0]
+        try:
+            self.params = [float(p) for p in parts[1:]]
+        except ValueError:
+            raise ValueError("Invalid latency spec: {}".format(spec))
+        expected = {"fixed": 1, "uniform": 2, "lognormal": 2, "recorded": 0}
+        if self.kind not in expected or len(self.params) != expected[self.kind]:
+            raise ValueError("Invalid latency spec: {}".format(spec))
+
+    def sample(self, rng: random.Random, recorded: Optional[float] = None) -> float:
+        if self.kind == "fixed":
+            value = self.params[0]
+        elif self.kind == "uniform":
+            value = rng.uniform(self.params[0], self.params[1])
+        elif self.kind == "lognormal":
+            value = rng.lognormvariate(math.log(max(self.params[0], 1e-6)), self.params[1])
+        else:
+            value = recorded or 0.0
+        return value * self.scale
+
+
+class FixtureStore:
+    """
+    تسجيلات الاستجابات (JSONL، سطر لكل استجابة) مع مجموعات حسب نوع الطلب
+
+    كل تسجيل: {key, kind, model, top_k, latency_seconds, response, chunks?}
+    """
+
+    def __init__(self, path: Optional[str] = None):
+        self.path = Path(path) if path else None
+        self._by_key: Dict[str, Dict] = {}
+        self._by_kind: Dict[str, List[Dict]] = {"extraction": [], "search": []}
+        self._lock = threading.Lock()
+        if self.path and self.path.exists():
+            self._load()
+
+    def _load(self):
+        with open(self.path, "r", encoding="utf-8") as f:
+            for line in f:
+                line = line.strip()
+                if not line:
+                    continue
+                try:
+                    self.add(json.loads(line))
+                except ValueError:
+                    continue
+
+    def __len__(self) -> int:
+        with self._lock:
+            return sum(len(records) for records in self._by_kind.values())
+
+    def add(self, record: Dict):
+        with self._lock:
+            if record.get("key"):
+                self._by_key[record["key"]] = record
+            self._by_kind.setdefault(record.get("kind", "search"), []).append(record)
+
+    def append(self, record: Dict):
+        """إضافة تسجيل وحفظه في ملف الـ JSONL (وضع التسجيل)"""
+        self.add(record)
+        if not self.path:
+            return
+        with self._lock:
+            self.path.parent.mkdir(parents=True, exist_ok=True)
+            with open(self.path, "a", encoding="utf-8") as f:
+                f.write(json.dumps(record, ensure_ascii=False) + "\n")
+
+    def lookup(self, key: str, kind: str) -> Optional[Dict]:
+        """التسجيل المطابق للطلب، وإلا تسجيل ثابت من نفس النوع (نفس الطلب → نفس الاستجابة دائماً)"""
+        with self._lock:
+            record = self._by_key.get(key)
+            if record is not None:
+                return record
+            pool = self._by_kind.get(kind) or []
+            if not pool:
+                return None
+            return pool[int(key[:12], 16) % len(pool)]
+
+    def has_key(self, key: str) -> bool:
+        with self._lock:
+            return key in self._by_key
+
+    def seed_from_results(self, results_dir: str) -> int:
+        """
+        بناء تسجيلات من ملفات results/analysis_*.json التي تحفظها الواجهة
+
+        كل ملف يعطي استجابة استخراج (extracted_terms كـ JSON) واستجابة بحث
+        (chunks كـ grounding_chunks)، دون usage (يُقدّر عند الإرجاع من طول النص)
+
+        Returns:
+            int: عدد التسجيلات المضافة
+        """
+        added = 0
+        for path in sorted(Path(results_dir).glob("analysis_*.json")):
+            try:
+                with open(path, "r", encoding="utf-8") as f:
+                    result = json.load(f)
+            except (OSError, ValueError):
+                continue
+
+            terms = result.get("extracted_terms") or []
+            if terms:
+                self.add({
+                    "kind": "extraction",
+                    "source": path.name,
+                    "response": {"candidates": [{"content": {"role": "model", "parts": [
+                        {"text": json.dumps(terms, ensure_ascii=False)}
+                    ]}}]}
+                })
+                added += 1
+
+            chunks = [c for c in result.get("chunks") or [] if c.get("chunk_text")]
+            if chunks:
+                grounding_chunks = [
+                    {"retrieved_context": {
+                        key: value for key, value in (
+                            ("text", chunk["chunk_text"]), ("title", chunk.get("title")), ("uri", chunk.get("uri"))
+                        ) if value is not None
+                    }}
+                    for chunk in chunks
+                ]
+                self.add({
+                    "kind": "search",
+                    "source": path.name,
+                    "response": {"candidates": [{
+                        "content": {"role": "model", "parts": [{"text": "تم العثور على {} مقطعاً ذا صلة.".format(len(chunks))}]},
+                        "grounding_metadata": {"grounding_chunks": grounding_chunks}
+                    }]}
+                })
+                added += 1
+        return added
+
+
+class _RecordingModels:
+    def __init__(self, models, recorder: "RecordingClient"):
+        self._models = models
+        self._recorder = recorder
+
+    def generate_content(self, model: str, contents, config=None, **kwargs):
+        started = time.monotonic()
+        response = self._models.generate_content(model=model, contents=contents, config=config, **kwargs)
+        self._recorder.record(model, contents, config, time.monotonic() - started, dump_response(response))
+        return response
+
+    def generate_content_stream(self, model: str, contents, config=None, **kwargs) -> Iterator:
+        started = time.monotonic()
+        dumps = []
+        for chunk in self._models.generate_content_stream(model=model, contents=contents, config=config, **kwargs):
+            dumps.append(dump_response(chunk))
+            yield chunk
+        if dumps:
+            # استجابة مجمّعة (النص كاملاً + metadata آخر جزء) لطلبات غير الـ stream
+            merged = json.loads(json.dumps(dumps[-1]))
+            text = "".join(_response_text(d) for d in dumps)
+            if merged.get("candidates"):
+                merged["candidates"][0].setdefault("content", {})["parts"] = [{"text": text}]
+            self._recorder.record(model, contents, config, time.monotonic() - started, merged, dumps)
+
+    def __getattr__(self, name):
+        return getattr(self._models, name)
+
+
+class RecordingClient:
+    """
+    غلاف حول الـ client الحقيقي يسجّل كل استجابة generate_content (مع grounding_metadata)
+    في ملف الـ fixtures لإعادة تشغيلها لاحقاً بـ ReplayClient
+    """
+
+    def __init__(self, client, fixtures: FixtureStore):
+        self._client = client
+        self.fixtures = fixtures
+        self._recorded = 0
+        self._lock = threading.Lock()
+        print("[INFO] Recording Gemini responses to {}".format(fixtures.path))
+
+    @property
+    def models(self):
+        return _RecordingModels(self._client.models, self)
+
+    def record(self, model: str, contents, config, latency: float, response: Dict, chunks: Optional[List[Dict]] = None):
+        record = {
+            "key": request_key(model, contents, config),
+            "kind": request_kind(config),
+            "model": model,
+            "top_k": request_top_k(config),
+            "latency_seconds": round(latency, 4),
+            "recorded_at": time.time(),
+            "response": response
+        }
+        if chunks:
+            record["chunks"] = chunks
+        try:
+            self.fixtures.append(record)
+            with self._lock:
+                self._recorded += 1
+        except Exception as e:
+            print("[WARNING] Could not record Gemini response: {}".format(e))
+
+    def stats(self) -> Dict:
+        stats = self._client.stats() if hasattr(self._client, "stats") else {}
+        with self._lock:
+            stats.update({"mode": "record", "recorded": self._recorded})
+        return stats
+
+    def __getattr__(self, name):
+        if name.startswith("_"):
+            raise AttributeError(name)
+        return getattr(self._client, name)
+
+
+class _ReplayOperations:
+    def get(self, operation):
+        operation.done = True
+        return operation
+
+
+class _ReplayDocuments:
+    def delete(self, name: str, config=None):
+        return None
+
+
+class _ReplayStores:
+    """Store وهمي: الرفع والفهرسة يكتملان فوراً (المحتوى الفعلي يأتي من التسجيلات)"""
+
+    def __init__(self):
+        self.documents = _ReplayDocuments()
+        self._uploads = 0
+        self._lock = threading.Lock()
+
+    def get(self, name: str):
+        return SimpleNamespace(name=name, display_name="Replay Store ({})".format(name))
+
+    def create(self, config=None):
+        display_name = (config or {}).get("display_name", "Replay Store")
+        return SimpleNamespace(name="fileSearchStores/replay-store", display_name=display_name)
+
+    def upload_to_file_search_store(self, file: str, file_search_store_name: str, config=None):
+        with self._lock:
+            self._uploads += 1
+            index = self._uploads
+        return SimpleNamespace(
+            name="{}/operations/replay-{}".format(file_search_store_name, index),
+            done=True,
+            error=None,
+            response=SimpleNamespace(document_name="{}/documents/replay-{}".format(file_search_store_name, index))
+        )
+
+
+class ReplayClient:
+    """
+    بديل محلي لـ genai.Client يعيد استجابات مسجّلة بدون استهلاك حصة
+
+    - نفس الطلب يعيد تسجيله، وغيره يأخذ تسجيلاً ثابتاً من نفس النوع (extraction / search)
+    - زمن الاستجابة من LatencyModel لكل نوع (مع معامل تسريع time_scale)
+    - حقن أخطاء 503 و 429 بنسب محددة، وحد طلبات في الدقيقة يرجع 429 عند تجاوزه
+    - العشوائية من seed ثابت، فتتكرر نفس السلسلة في كل تشغيل (مع نفس ترتيب الطلبات)
+    """
+
+    def __init__(self, fixtures: FixtureStore, extraction_latency: str = "fixed:0",
+                 search_latency: str = "fixed:0", time_scale: float = 1.0,
+                 error_503_rate: float = 0.0, error_429_rate: float = 0.0,
+                 requests_per_minute: int = 0, seed: int = 0, stream_chunks: int = 4):
+        if not len(fixtures):
+            raise ValueError("Replay mode needs recorded fixtures (record first or seed from results/)")
+        self.fixtures = fixtures
+        self.latency = {
+            "extraction": LatencyModel(extraction_latency, time_scale),
+            "search": LatencyModel(search_latency, time_scale)
+        }
+        self.error_503_rate = max(0.0, error_503_rate)
+        self.error_429_rate = max(0.0, error_429_rate)
+        self.requests_per_minute = max(0, requests_per_minute)
+        self.stream_chunks = max(1, stream_chunks)
+        self.time_scale = time_scale
+        self.file_search_stores = _ReplayStores()
+        self.operations = _ReplayOperations()
+
+        self._rng = random.Random(seed)
+        self._lock = threading.Lock()
+        self._window: deque = deque()
+        self._stats = {"calls": 0, "exact_hits": 0, "injected_503": 0, "injected_429": 0, "rate_limited": 0}
+
+        print("[INFO] Gemini replay stand-in ready ({} fixture(s), 503={:.0%}, 429={:.0%}, rpm={})".format(
+            len(fixtures), self.error_503_rate, self.error_429_rate, self.requests_per_minute or "unlimited"
+        ))
+
+    @property
+    def models(self):
+        return self
+
+    # ===== محاكاة الشبكة والأخطاء =====
+
+    def _admit(self, kind: str, record: Dict) -> Tuple[float, Optional[StandInAPIError]]:
+        """قرار الطلب (زمن الاستجابة وخطأ مُحاكى إن وجد) تحت قفل واحد حتى تبقى السلسلة قابلة للتكرار"""
+        now = time.monotonic()
+        with self._lock:
+            self._stats["calls"] += 1
+            latency = self.latency[kind].sample(self._rng, record.get("latency_seconds"))
+            roll = self._rng.random()
+
+            if self.requests_per_minute:
+                while self._window and now - self._window[0] >= 60.0:
+                    self._window.popleft()
+                if len(self._window) >= self.requests_per_minute:
+                    self._stats["rate_limited"] += 1
+                    return latency, _quota_error()
+                self._window.append(now)
+
+            if roll < self.error_503_rate:
+                self._stats["injected_503"] += 1
+                return latency, StandInAPIError(503, "UNAVAILABLE", "The model is overloaded. Please try again later.")
+            if roll < self.error_503_rate + self.error_429_rate:
+                self._stats["injected_429"] += 1
+                return latency, _quota_error()
+        return latency, None
+
+    def _serve(self, model: str, contents, config):
+        kind = request_kind(config)
+        key = request_key(model, contents, config)
+        record = self.fixtures.lookup(key, kind)
+        if record is None:
+            raise StandInAPIError(404, "NOT_FOUND", "No recorded {} response to replay.".format(kind))
+        if self.fixtures.has_key(key):
+            with self._lock:
+                self._stats["exact_hits"] += 1
+        latency, error = self._admit(kind, record)
+        if error is not None:
+            # الخطأ الحقيقي يصل أسرع من استجابة كاملة
+            time.sleep(latency * 0.1)
+            raise error
+        return kind, record, latency
+
+    def _build(self, record: Dict, contents, config) -> Dict:
+        """نسخة من الاستجابة مع قص الـ chunks إلى top_k وتقدير usage إن لم يُسجّل"""
+        data = json.loads(json.dumps(record["response"]))
+        top_k = request_top_k(config)
+        candidates = data.get("candidates") or []
+        retrieved_text = ""
+        if candidates and candidates[0].get("grounding_metadata"):
+            grounding = candidates[0]["grounding_metadata"]
+            if top_k and grounding.get("grounding_chunks"):
+                grounding["grounding_chunks"] = grounding["grounding_chunks"][:top_k]
+            retrieved_text = "".join(
+                (chunk.get("retrieved_context") or {}).get("text", "")
+                for chunk in grounding.get("grounding_chunks") or []
+            )
+        if "usage_metadata" not in data:
+            prompt_tokens = _estimate_tokens(contents if isinstance(contents, str) else repr(contents))
+            tool_tokens = _estimate_tokens(retrieved_text) if retrieved_text else 0
+            output_tokens = _estimate_tokens(_response_text(data))
+            data["usage_metadata"] = {
+                "prompt_token_count": prompt_tokens,
+                "tool_use_prompt_token_count": tool_tokens,
+                "candidates_token_count": output_tokens,
+                "total_token_count": prompt_tokens + tool_tokens + output_tokens
+            }
+        return data
+
+    # ===== واجهة models =====
+
+    def generate_content(self, model: str, contents, config=None, **kwargs):
+        _, record, latency = self._serve(model, contents, config)
+        time.sleep(latency)
+        return load_response(self._build(record, contents, config))
+
+    def generate_content_stream(self, model: str, contents, config=None, **kwargs) -> Iterator:
+        _, record, latency = self._serve(model, contents, config)
+        if record.get("chunks") and record.get("key") == request_key(model, contents, config):
+            pieces = [json.loads(json.dumps(chunk)) for chunk in record["chunks"]]
+        else:
+            data = self._build(record, contents, config)
+            text = _response_text(data)
+            size = max(1, math.ceil(len(text) / self.stream_chunks))
+            pieces = []
+            for start in range(0, max(len(text), 1), size):
+                piece = {"candidates": [{"content": {"role": "model", "parts": [{"text": text[start:start + size]}]}}]}
+                pieces.append(piece)
+            # الـ metadata (usage و grounding) مع آخر جزء كما في الـ API
+            last = pieces[-1]["candidates"][0]
+            if data.get("candidates") and data["candidates"][0].get("grounding_metadata"):
+                last["grounding_metadata"] = data["candidates"][0]["grounding_metadata"]
+            pieces[-1]["usage_metadata"] = data["usage_metadata"]
+
+        # أول جزء بعد ~30% من الزمن، والباقي موزع بالتساوي
+        time.sleep(latency * 0.3)
+        gap = latency * 0.7 / max(1, len(pieces) - 1)
+        for idx, piece in enumerate(pieces):
+            if idx:
+                time.sleep(gap)
+            yield load_response(piece)
+
+    def get(self, model: str, **kwargs):
+        return SimpleNamespace(name=model)
+
+    # ===== واجهة GenaiClientPool =====
+
+    def warm_up(self, model_name: str) -> Dict:
+        return {"warmed": 1, "clients": 1, "seconds": 0.0}
+
+    def warm_up_async(self, model_name: str) -> None:
+        return None
+
+    def stats(self) -> Dict:
+        with self._lock:
+            stats = dict(self._stats)
+        stats.update({
+            "mode": "replay",
+            "fixtures": len(self.fixtures),
+            "time_scale": self.time_scale,
+            "latency": {kind: model.spec for kind, model in self.latency.items()}
+        })
+        return stats
+
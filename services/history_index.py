@@ -0,0 +1,253 @@
+import math
+import re
+import sqlite3
+from collections import defaultdict
+from typing import Dict, Iterable, List, Optional, Set, Tuple
+
+from services.arabic_normalizer import NORMALIZER_VERSION, clean_arabic, fix_ocr, fold_arabic, normalize_arabic
+from services.local_retrieval import tokenize_arabic
+
+
+# رقم إصدار الفهرس - أي تغيير في التقسيم أو الحقول يجب أن يرفعه (التحليلات تُعاد فهرستها تلقائياً)
+HISTORY_INDEX_VERSION = 1
+
+# الحقول المفهرسة: نص البند ومعرفه وسببه، الإشكالات المحتملة، نص الـ chunk وعنوانه
+FIELDS = ("terms", "issues", "chunks")
+
+_NON_WORD_RE = re.compile(r"[^\w]+", re.UNICODE)
+_SNIPPET_CHARS = 240
+
+
+def search_tokens(text: str) -> List[str]:
+    """
+    tokens الفهرس: tokenize_arabic (تطبيع + light stemming + stopwords)
+    مع الأرقام المفردة التي يحذفها (مثل "المعيار 8")
+    """
+    tokens = tokenize_arabic(text)
+    tokens.extend(word for word in _NON_WORD_RE.split(normalize_arabic(text)) if len(word) == 1 and word.isdigit())
+    return tokens
+
+
+def _index_units(result: Dict) -> Iterable[Tuple[str, int, str, List[str]]]:
+    """وحدات الفهرسة (field, position, text, clause_ids) من نتيجة تحليل"""
+    for position, term in enumerate(result.get("extracted_terms") or []):
+        term_id = term.get("term_id") or ""
+        clause_ids = [term_id] if term_id else []
+        # term_id يُفهرس كنص أيضاً (clause_acceleration_on_default → clause acceleration on default)
+        text = " ".join([term_id.replace("_", " "), term.get("term_text") or "", term.get("relevance_reason") or ""])
+        yield "terms", position, text, clause_ids
+        issues = term.get("potential_issues") or []
+        if issues:
+            yield "issues", position, " ".join(str(issue) for issue in issues), clause_ids
+
+    for position, chunk in enumerate(result.get("chunks") or []):
+        # الـ chunk مرتبط بالبنود التي استرجعته في البحث المعمّق
+        clause_ids = [
+            source.get("clause_id") for source in chunk.get("sources") or []
+            if source.get("clause_id")
+        ]
+        # نص المراجع (OCR): يُصلح للفهرسة فقط، والمقتطف المعروض من النص الأصلي
+        text = fix_ocr(" ".join([chunk.get("title") or "", chunk.get("chunk_text") or ""]))
+        yield "chunks", position, text, clause_ids
+
+
+def unit_text(result: Dict, field: str, position: int) -> str:
+    """نص وحدة واحدة (بند، إشكالاته، أو chunk) من نتيجة تحليل - لعرض المقاطع المطابقة"""
+    if field == "chunks":
+        chunks = result.get("chunks") or []
+        return chunks[position].get("chunk_text", "") if position < len(chunks) else ""
+    terms = result.get("extracted_terms") or []
+    if position >= len(terms):
+        return ""
+    if field == "issues":
+        return "، ".join(str(issue) for issue in terms[position].get("potential_issues") or [])
+    return terms[position].get("term_text", "")
+
+
+def make_snippet(text: str, tokens: Set[str]) -> str:
+    """مقطع قصير من النص حول أول كلمة مطابقة"""
+    words = clean_arabic(text).split()
+    # fold_arabic حرف بحرف (حتى للأحرف التي يغيّر lower() طولها) فيبقى عدد الكلمات نفسه،
+    # والـ token جذع فيكفي البحث عنه داخل الكلمة
+    start = 0
+    for idx, word in enumerate(fold_arabic(" ".join(words)).split(" ")):
+        if any(token in word for token in tokens):
+            start = max(0, idx - 8)
+            break
+    snippet = " ".join(words[start:])
+    if len(snippet) > _SNIPPET_CHARS:
+        snippet = snippet[:_SNIPPET_CHARS].rsplit(" ", 1)[0] + " …"
+    return ("… " if start else "") + snippet
+
+
+class HistoryIndex:
+    """
+    فهرس مقلوب (inverted index) فوق التحليلات المحفوظة، في نفس ملف SQLite لسجل التحليلات
+
+    - وحدة الفهرسة: بند (terms)، إشكالاته (issues)، أو chunk (chunks) داخل تحليل
+    - search_postings: token → (analysis_id, field, position, tf)، مفتاحه يبدأ بالـ token
+      فالبحث قراءة نطاق من الـ B-tree لكل token بدل قراءة كل النتائج
+    - search_links: ربط كل وحدة بالبنود (clause_id) - البند نفسه، أو البنود التي استرجعت الـ chunk
+    - الفهرسة داخل transaction الحفظ نفسها (تحديث تدريجي)، والمطابقة AND: كل tokens الاستعلام
+      في نفس الوحدة، مرتبة بـ tf-idf
+
+    الاستدعاء يتم تحت lock الـ ResultsStore (لا lock خاص هنا)
+    """
+
+    def __init__(self, conn: sqlite3.Connection):
+        self._conn = conn
+        self._conn.execute(
+            """CREATE TABLE IF NOT EXISTS search_postings (
+                token TEXT NOT NULL,
+                analysis_id TEXT NOT NULL,
+                field TEXT NOT NULL,
+                position INTEGER NOT NULL,
+                tf INTEGER NOT NULL,
+                PRIMARY KEY (token, analysis_id, field, position)
+            ) WITHOUT ROWID"""
+        )
+        self._conn.execute(
+            """CREATE TABLE IF NOT EXISTS search_links (
+                clause_id TEXT NOT NULL,
+                analysis_id TEXT NOT NULL,
+                field TEXT NOT NULL,
+                position INTEGER NOT NULL,
+                PRIMARY KEY (clause_id, analysis_id, field, position)
+            ) WITHOUT ROWID"""
+        )
+        self._conn.execute(
+            """CREATE TABLE IF NOT EXISTS search_indexed (
+                analysis_id TEXT PRIMARY KEY,
+                version TEXT NOT NULL,
+                units INTEGER NOT NULL
+            )"""
+        )
+        self._conn.execute("CREATE INDEX IF NOT EXISTS idx_search_postings_analysis ON search_postings(analysis_id)")
+        self._conn.execute("CREATE INDEX IF NOT EXISTS idx_search_links_analysis ON search_links(analysis_id)")
+        self._conn.commit()
+
+    @staticmethod
+    def version() -> str:
+        return "{}.{}".format(HISTORY_INDEX_VERSION, NORMALIZER_VERSION)
+
+    def remove(self, analysis_id: str):
+        for table in ("search_postings", "search_links", "search_indexed"):
+            self._conn.execute("DELETE FROM {} WHERE analysis_id = ?".format(table), (analysis_id,))
+
+    def add(self, analysis_id: str, result: Dict):
+        """فهرسة تحليل واحد (يستبدل فهرسته السابقة إن وجدت)"""
+        self.remove(analysis_id)
+        postings = []
+        links = []
+        units = 0
+        for field, position, text, clause_ids in _index_units(result):
+            counts: Dict[str, int] = defaultdict(int)
+            for token in search_tokens(text):
+                counts[token] += 1
+            if not counts:
+                continue
+            units += 1
+            postings.extend((token, analysis_id, field, position, tf) for token, tf in counts.items())
+            links.extend((clause_id, analysis_id, field, position) for clause_id in set(clause_ids))
+
+        self._conn.executemany(
+            "INSERT OR REPLACE INTO search_postings (token, analysis_id, field, position, tf) VALUES (?, ?, ?, ?, ?)",
+            postings
+        )
+        self._conn.executemany(
+            "INSERT OR REPLACE INTO search_links (clause_id, analysis_id, field, position) VALUES (?, ?, ?, ?)",
+            links
+        )
+        self._conn.execute(
+            "INSERT OR REPLACE INTO search_indexed (analysis_id, version, units) VALUES (?, ?, ?)",
+            (analysis_id, self.version(), units)
+        )
+
+    def stale_ids(self) -> List[str]:
+        """تحليلات غير مفهرسة أو مفهرسة بإصدار أقدم (تحتاج reindex)"""
+        rows = self._conn.execute(
+            """SELECT a.id FROM analyses a LEFT JOIN search_indexed s ON s.analysis_id = a.id
+               WHERE s.analysis_id IS NULL OR s.version != ?""",
+            (self.version(),)
+        ).fetchall()
+        return [row[0] for row in rows]
+
+    def search(self, query: str, clause_id: Optional[str] = None,
+               fields: Optional[Iterable[str]] = None) -> Tuple[List[str], List[Tuple[str, float, List[Tuple[str, int, float]]]]]:
+        """
+        البحث في الفهرس
+
+        Args:
+            query: نص الاستعلام (يُطبّع بنفس تقسيم الفهرسة)
+            clause_id: قصر المطابقة على وحدات هذا البند (البند نفسه أو الـ chunks التي استرجعها)
+            fields: الحقول المبحوث فيها (افتراضياً كلها)
+
+        Returns:
+            (tokens, hits): hits مرتبة تنازلياً (analysis_id, score, [(field, position, score)...])
+        """
+        fields = [field for field in (fields or FIELDS) if field in FIELDS]
+        tokens = sorted(set(search_tokens(query)))
+        if not fields or (not tokens and not clause_id):
+            return tokens, []
+
+        field_placeholders = ",".join("?" * len(fields))
+        allowed = None
+        if clause_id:
+            allowed = {
+                (row[0], row[1], row[2]) for row in self._conn.execute(
+                    "SELECT analysis_id, field, position FROM search_links WHERE clause_id = ? AND field IN ({})".format(
+                        field_placeholders
+                    ),
+                    [clause_id] + fields
+                )
+            }
+
+        # بدون نص: كل وحدات البند بنفس الوزن
+        if not tokens:
+            units = {unit: 1.0 for unit in allowed}
+        else:
+            n_units = self._conn.execute("SELECT COALESCE(SUM(units), 0) FROM search_indexed").fetchone()[0] or 1
+            postings_by_token = []
+            for token in tokens:
+                rows = self._conn.execute(
+                    "SELECT analysis_id, field, position, tf FROM search_postings WHERE token = ? AND field IN ({})".format(
+                        field_placeholders
+                    ),
+                    [token] + fields
+                ).fetchall()
+                if not rows:
+                    return tokens, []
+                postings_by_token.append(rows)
+
+            # AND: التقاطع يبدأ بأندر token
+            postings_by_token.sort(key=len)
+            units = None
+            for rows in postings_by_token:
+                idf = math.log(1 + n_units / len(rows))
+                weights = {(a, f, p): idf * (1 + math.log(tf)) for a, f, p, tf in rows}
+                if units is None:
+                    units = weights if allowed is None else {u: w for u, w in weights.items() if u in allowed}
+                else:
+                    units = {u: score + weights[u] for u, score in units.items() if u in weights}
+                if not units:
+                    return tokens, []
+
+        by_analysis: Dict[str, List[Tuple[str, int, float]]] = defaultdict(list)
+        for (analysis_id, field, position), score in units.items():
+            by_analysis[analysis_id].append((field, position, score))
+
+        hits = []
+        for analysis_id, matches in by_analysis.items():
+            matches.sort(key=lambda match: (-match[2], FIELDS.index(match[0]), match[1]))
+            # أفضل وحدة تحدد الترتيب، وتعدد الوحدات المطابقة يرجّح قليلاً
+            score = matches[0][2] + 0.1 * sum(match[2] for match in matches[1:])
+            hits.append((analysis_id, score, matches))
+        hits.sort(key=lambda hit: (-hit[1], hit[0]))
+        return tokens, hits
+
+    def stats(self) -> Dict:
+        indexed, units = self._conn.execute(
+            "SELECT COUNT(*), COALESCE(SUM(units), 0) FROM search_indexed"
+        ).fetchone()
+        postings = self._conn.execute("SELECT COUNT(*) FROM search_postings").fetchone()[0]
+        return {"indexed_analyses": indexed, "indexed_units": units, "postings": postings, "version": self.version()}
@@ -0,0 +1,315 @@
+import hashlib
+import json
+import os
+import threading
+import time
+from concurrent.futures import FIRST_COMPLETED, Future, ThreadPoolExecutor, wait
+from pathlib import Path
+from typing import Dict, List, Optional, Tuple
+from google.genai import types
+
+MANIFEST_VERSION = 1
+
+
+def file_sha256(path: Path) -> str:
+    digest = hashlib.sha256()
+    with open(path, "rb") as f:
+        for block in iter(lambda: f.read(1 << 20), b""):
+            digest.update(block)
+    return digest.hexdigest()
+
+
+class UploadManifest:
+    """
+    سجل محلي (JSON) لملفات context/ المرفوعة إلى الـ Store
+
+    لكل ملف: sha256، الحجم، الـ store، الحالة (uploading | done | failed)، اسم عملية الفهرسة
+    واسم المستند في الـ Store. يُكتب ذرياً (ملف مؤقت ثم os.replace) بعد كل تغيير،
+    فانقطاع العملية في أي لحظة يترك manifest صالحاً يُستأنف منه
+    """
+
+    def __init__(self, path: str):
+        self.path = Path(path)
+        self._lock = threading.Lock()
+        self._files: Dict[str, Dict] = {}
+        self._load()
+
+    def _load(self):
+        try:
+            with open(self.path, "r", encoding="utf-8") as f:
+                data = json.load(f)
+        except (OSError, ValueError):
+            return
+        if data.get("version") == MANIFEST_VERSION:
+            self._files = data.get("files", {})
+
+    def _save(self):
+        self.path.parent.mkdir(parents=True, exist_ok=True)
+        tmp_path = self.path.with_name(self.path.name + ".tmp.{}".format(os.getpid()))
+        with open(tmp_path, "w", encoding="utf-8") as f:
+            json.dump({"version": MANIFEST_VERSION, "files": self._files}, f, ensure_ascii=False, indent=2)
+        os.replace(tmp_path, self.path)
+
+    def get(self, name: str) -> Optional[Dict]:
+        with self._lock:
+            entry = self._files.get(name)
+            return dict(entry) if entry else None
+
+    def update(self, name: str, **fields):
+        with self._lock:
+            entry = self._files.setdefault(name, {})
+            entry.update(fields)
+            entry["updated_at"] = time.time()
+            self._save()
+
+    def names(self) -> List[str]:
+        with self._lock:
+            return list(self._files)
+
+
+class ContextIngestor:
+    """
+    رفع ملفات المراجع إلى File Search Store بالتوازي مع تخطي ما لم يتغير
+
+    - الملف الذي رُفع لنفس الـ Store بنفس الـ hash لا يُعاد رفعه
+    - الرفع عبر ThreadPoolExecutor بعدد workers محدود
+    - عمليات الفهرسة كلها تُتابع في حلقة واحدة بفاصل يتضاعف (backoff) حتى حد أقصى،
+      ويعود للبداية عند اكتمال أي عملية
+    - الملفات التي كانت "uploading" عند الانقطاع تُستأنف متابعة عمليتها بدل إعادة رفعها
+    - الملف المتغير يُرفع من جديد ثم يُحذف مستنده القديم من الـ Store (best effort)
+    - العملية التي يفشل الاستعلام عنها max_poll_failures مرة متتالية أو تتجاوز index_timeout_seconds
+      تُترك: العملية المستأنفة (ربما انتهت صلاحيتها بعد الانقطاع) يُعاد رفع ملفها مرة واحدة،
+      وغيرها يُسجَّل failed، فلا تدور الحلقة إلى الأبد
+    """
+
+    def __init__(self, client, store_id: str, manifest: UploadManifest, max_workers: int = 4,
+                 poll_initial_seconds: float = 2.0, poll_max_seconds: float = 30.0,
+                 max_poll_failures: int = 5, index_timeout_seconds: float = 1800.0):
+        self.client = client
+        self.store_id = store_id
+        self.manifest = manifest
+        self.max_workers = max(1, max_workers)
+        self.poll_initial_seconds = max(0.1, poll_initial_seconds)
+        self.poll_max_seconds = max(self.poll_initial_seconds, poll_max_seconds)
+        self.max_poll_failures = max(1, max_poll_failures)
+        # 0 = بدون حد زمني للفهرسة
+        self.index_timeout_seconds = index_timeout_seconds
+
+    def _plan(self, files: List[Path]) -> Tuple[List[Tuple[Path, str, Optional[str]]], List[Tuple[Path, str, Dict]], int]:
+        """
+        تصنيف الملفات: للرفع (مع المستند القديم إن تغيّر الملف)، للاستئناف، أو دون تغيير
+
+        Returns:
+            (to_upload, to_resume, unchanged_count)
+        """
+        to_upload = []
+        to_resume = []
+        unchanged = 0
+        for path in files:
+            sha = file_sha256(path)
+            entry = self.manifest.get(path.name)
+            same_store = entry is not None and entry.get("store_id") == self.store_id
+            if same_store and entry.get("sha256") == sha:
+                if entry.get("status") == "done":
+                    unchanged += 1
+                    continue
+                if entry.get("status") == "uploading" and entry.get("operation_name"):
+                    to_resume.append((path, sha, entry))
+                    continue
+            # مستند سابق لنفس الملف في هذا الـ Store (الملف تغيّر) يُحذف بعد نجاح الرفع الجديد
+            old_document = None
+            if same_store:
+                old_document = entry.get("document_name") if entry.get("status") == "done" \
+                    else entry.get("previous_document_name")
+            to_upload.append((path, sha, old_document))
+        return to_upload, to_resume, unchanged
+
+    def _upload(self, path: Path, sha: str, old_document: Optional[str]):
+        print("[UPLOAD] Uploading: {}".format(path.name))
+        operation = self.client.file_search_stores.upload_to_file_search_store(
+            file=str(path),
+            file_search_store_name=self.store_id,
+            config={"display_name": path.name}
+        )
+        # يُسجّل قبل الفهرسة: بعد انقطاع العملية تُتابع هذه العملية بدل رفع الملف مجدداً
+        self.manifest.update(
+            path.name,
+            sha256=sha,
+            size=path.stat().st_size,
+            store_id=self.store_id,
+            status="uploading",
+            operation_name=getattr(operation, "name", None),
+            previous_document_name=old_document
+        )
+        print("[INDEXING] Waiting for {} to be indexed...".format(path.name))
+        return operation
+
+    @staticmethod
+    def _resume_operation(operation_name: str):
+        """كائن عملية من اسمها فقط (للمتابعة عبر operations.get) - None إذا لم تدعمه نسخة SDK"""
+        operation_type = getattr(types, "UploadToFileSearchStoreOperation", None)
+        if operation_type is None:
+            return None
+        try:
+            return operation_type(name=operation_name)
+        except Exception:
+            return None
+
+    def _delete_document(self, document_name: str):
+        try:
+            self.client.file_search_stores.documents.delete(name=document_name, config={"force": True})
+            print("[INFO] Removed previous version from store: {}".format(document_name))
+        except Exception as e:
+            print("[WARNING] Could not remove previous document {}: {}".format(document_name, e))
+
+    def _finish(self, name: str, operation) -> bool:
+        """تسجيل نتيجة عملية فهرسة مكتملة في الـ manifest"""
+        error = getattr(operation, "error", None)
+        if error:
+            self.manifest.update(name, status="failed", error=str(error))
+            print("[ERROR] Indexing failed for {}: {}".format(name, error))
+            return False
+
+        response = getattr(operation, "response", None)
+        document_name = getattr(response, "document_name", None)
+        entry = self.manifest.get(name) or {}
+        old_document = entry.get("previous_document_name")
+        self.manifest.update(
+            name, status="done", document_name=document_name,
+            operation_name=None, previous_document_name=None, error=None
+        )
+        if old_document and old_document != document_name:
+            self._delete_document(old_document)
+        print("[SUCCESS] {} uploaded and indexed".format(name))
+        return True
+
+    def sync(self, files: List[Path]) -> Dict:
+        """
+        مزامنة الملفات مع الـ Store: رفع الجديد والمتغير واستئناف المعلّق
+
+        Args:
+            files: ملفات context/ الحالية
+
+        Returns:
+            Dict: uploaded, resumed, reuploaded, unchanged, failed (أسماء الملفات), total, seconds
+        """
+        started = time.monotonic()
+        to_upload, to_resume, unchanged = self._plan(files)
+        print("[INFO] {} file(s): {} to upload, {} to resume, {} unchanged".format(
+            len(files), len(to_upload), len(to_resume), unchanged
+        ))
+
+        failed: List[str] = []
+        completed = 0
+        reuploaded = 0
+        # العمليات قيد الفهرسة: اسم الملف → كائن العملية، مع بداية المتابعة وعدد أخطاء الاستعلام المتتالية
+        pending: Dict[str, object] = {}
+        pending_since: Dict[str, float] = {}
+        poll_failures: Dict[str, int] = {}
+        # العمليات المستأنفة: تُعاد إلى الرفع إذا لم تعد معروفة للخادم
+        resumable: Dict[str, Tuple[Path, str, Optional[str]]] = {}
+
+        for path, sha, entry in to_resume:
+            operation = self._resume_operation(entry["operation_name"])
+            if operation is None:
+                to_upload.append((path, sha, entry.get("previous_document_name")))
+            else:
+                print("[INDEXING] Resuming indexing of {}".format(path.name))
+                pending[path.name] = operation
+                pending_since[path.name] = time.monotonic()
+                resumable[path.name] = (path, sha, entry.get("previous_document_name"))
+
+        resumed = len(pending)
+        executor = ThreadPoolExecutor(max_workers=self.max_workers)
+        uploads: Dict[Future, str] = {
+            executor.submit(self._upload, path, sha, old_document): path.name
+            for path, sha, old_document in to_upload
+        }
+
+        def give_up(name: str, reason: str):
+            """ترك عملية لا تتقدم: إعادة رفع الملف المستأنف مرة واحدة، وإلا failed"""
+            nonlocal reuploaded
+            del pending[name]
+            pending_since.pop(name, None)
+            poll_failures.pop(name, None)
+            if name in resumable:
+                path, sha, old_document = resumable.pop(name)
+                print("[WARNING] Resumed indexing of {} is not progressing ({}), uploading again".format(name, reason))
+                uploads[executor.submit(self._upload, path, sha, old_document)] = name
+                reuploaded += 1
+                return
+            self.manifest.update(name, status="failed", error=reason)
+            print("[ERROR] Indexing failed for {}: {}".format(name, reason))
+            failed.append(name)
+
+        delay = self.poll_initial_seconds
+        try:
+            while uploads or pending:
+                # الملفات التي انتهى رفعها تنضم لحلقة المتابعة
+                for future in [f for f in uploads if f.done()]:
+                    name = uploads.pop(future)
+                    try:
+                        pending[name] = future.result()
+                        pending_since[name] = time.monotonic()
+                    except Exception as e:
+                        self.manifest.update(name, status="failed", error=str(e))
+                        print("[ERROR] Failed to upload {}: {}".format(name, e))
+                        failed.append(name)
+
+                progressed = False
+                for name, operation in list(pending.items()):
+                    try:
+                        if not getattr(operation, "done", False):
+                            operation = self.client.operations.get(operation)
+                            pending[name] = operation
+                            poll_failures.pop(name, None)
+                    except Exception as e:
+                        poll_failures[name] = poll_failures.get(name, 0) + 1
+                        print("[WARNING] Could not poll indexing of {} ({}/{}): {}".format(
+                            name, poll_failures[name], self.max_poll_failures, e
+                        ))
+                        if poll_failures[name] >= self.max_poll_failures:
+                            give_up(name, "polling failed {} times: {}".format(poll_failures[name], e))
+                            progressed = True
+                        continue
+                    if not getattr(operation, "done", False):
+                        elapsed = time.monotonic() - pending_since[name]
+                        if self.index_timeout_seconds > 0 and elapsed > self.index_timeout_seconds:
+                            give_up(name, "indexing did not finish within {:.0f}s".format(self.index_timeout_seconds))
+                            progressed = True
+                        continue
+
+                    del pending[name]
+                    pending_since.pop(name, None)
+                    progressed = True
+                    if self._finish(name, operation):
+                        completed += 1
+                    else:
+                        failed.append(name)
+
+                if not uploads and not pending:
+                    break
+                # backoff: الفاصل يتضاعف ما دامت لا عملية تكتمل، ورفع جديد ينهي الانتظار مبكراً
+                delay = self.poll_initial_seconds if progressed else min(delay * 2, self.poll_max_seconds)
+                if uploads:
+                    wait(list(uploads), timeout=delay, return_when=FIRST_COMPLETED)
+                else:
+                    time.sleep(delay)
+        finally:
+            executor.shutdown(wait=True)
+
+        stale = [name for name in self.manifest.names() if name not in {f.name for f in files}]
+        if stale:
+            print("[INFO] {} file(s) in manifest no longer in context/ (left in store): {}".format(
+                len(stale), ", ".join(stale)
+            ))
+
+        return {
+            "uploaded": completed,
+            "resumed": resumed,
+            "reuploaded": reuploaded,
+            "unchanged": unchanged,
+            "failed": failed,
+            "total": len(files),
+            "seconds": round(time.monotonic() - started, 3)
+        }
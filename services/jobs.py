@@ -0,0 +1,534 @@
+import json
+import os
+import sqlite3
+import threading
+import time
+import uuid
+from concurrent.futures import ThreadPoolExecutor
+from pathlib import Path
+from typing import Callable, Dict, Iterator, List, Optional, Tuple
+
+
+# حالات الـ job
+JOB_QUEUED = "queued"
+JOB_RUNNING = "running"
+JOB_COMPLETED = "completed"
+JOB_FAILED = "failed"
+
+TERMINAL_STATES = (JOB_COMPLETED, JOB_FAILED)
+
+
+class JobsShuttingDown(RuntimeError):
+    """الـ worker في مرحلة الإيقاف (drain) ولا يقبل jobs جديدة"""
+
+
+class SharedJobState:
+    """
+    نسخة من حالة الـ jobs وأحداثها في SQLite مشتركة بين workers الخادم
+
+    الـ job يُنفَّذ في الـ worker الذي استقبله، لكن GET /jobs/<id> و /events قد يصلان لأي worker:
+    - job_state: آخر حالة لكل job مع رقم تسلسلي (seq) يمنع الكتابة الأقدم من استبدال الأحدث،
+      والـ pid المالك ووقت آخر heartbeat
+    - job_events: كل حدث صف مستقل مفتاحه (job_id, seq)، فالكتابة إضافة صف لا إعادة كتابة القائمة
+    - الـ worker المالك يحدّث heartbeat_at دورياً للـ jobs الجارية؛ القارئ يسجّل الـ job failed إذا
+      مات الـ process المالك أو توقف الـ heartbeat أكثر من stale_seconds (SIGKILL / OOM)
+    - الاتصال يُفتح لكل process (آمن بعد fork)، والـ workers على نفس الجهاز (فحص الـ pid محلي)
+    """
+
+    def __init__(self, db_path: str, max_retained_jobs: int, stale_seconds: float = 60.0):
+        self.db_path = db_path
+        self.max_retained_jobs = max_retained_jobs
+        self.stale_seconds = stale_seconds
+        self._lock = threading.Lock()
+        self._conn = None
+        self._pid = None
+
+        Path(db_path).parent.mkdir(parents=True, exist_ok=True)
+        with self._lock:
+            conn = self._connection()
+            with conn:
+                conn.execute(
+                    """CREATE TABLE IF NOT EXISTS job_state (
+                        job_id TEXT PRIMARY KEY,
+                        seq INTEGER NOT NULL,
+                        owner_pid INTEGER NOT NULL,
+                        status TEXT NOT NULL,
+                        finished_at REAL,
+                        heartbeat_at REAL NOT NULL,
+                        job TEXT NOT NULL
+                    )"""
+                )
+                conn.execute(
+                    """CREATE TABLE IF NOT EXISTS job_events (
+                        job_id TEXT NOT NULL,
+                        seq INTEGER NOT NULL,
+                        event TEXT NOT NULL,
+                        PRIMARY KEY (job_id, seq)
+                    ) WITHOUT ROWID"""
+                )
+
+    def _connection(self) -> sqlite3.Connection:
+        """اتصال الـ process الحالي - يُستدعى داخل الـ lock"""
+        if self._conn is None or self._pid != os.getpid():
+            self._conn = sqlite3.connect(self.db_path, timeout=10, check_same_thread=False)
+            self._conn.execute("PRAGMA journal_mode=WAL")
+            self._pid = os.getpid()
+        return self._conn
+
+    def put(self, job_id: str, seq: int, job: Dict, event: Dict):
+        """حفظ الحدث رقم seq مع حالة الـ job بعده"""
+        row = (
+            job_id, seq, os.getpid(), job["status"], job.get("finished_at"), time.time(),
+            json.dumps(job, ensure_ascii=False)
+        )
+        with self._lock:
+            conn = self._connection()
+            with conn:
+                # أحداث بعد حالة نهائية (job سجّله قارئ failed) لا تُضاف، والأقدم منها تصل بأي ترتيب
+                conn.execute(
+                    """INSERT OR IGNORE INTO job_events (job_id, seq, event)
+                       SELECT ?, ?, ? WHERE NOT EXISTS (
+                           SELECT 1 FROM job_state WHERE job_id = ? AND seq < ? AND status IN (?, ?)
+                       )""",
+                    (job_id, seq, json.dumps(event, ensure_ascii=False), job_id, seq) + TERMINAL_STATES
+                )
+                conn.execute(
+                    """INSERT INTO job_state (job_id, seq, owner_pid, status, finished_at, heartbeat_at, job)
+                       VALUES (?, ?, ?, ?, ?, ?, ?)
+                       ON CONFLICT(job_id) DO UPDATE SET
+                           seq = excluded.seq, owner_pid = excluded.owner_pid, status = excluded.status,
+                           finished_at = excluded.finished_at, heartbeat_at = excluded.heartbeat_at,
+                           job = excluded.job
+                       WHERE excluded.seq > job_state.seq AND job_state.status NOT IN (?, ?)""",
+                    row + TERMINAL_STATES
+                )
+                if job["status"] in TERMINAL_STATES:
+                    self._prune(conn)
+
+    def _prune(self, conn: sqlite3.Connection):
+        """حذف أقدم الـ jobs المنتهية (وأحداثها) عند تجاوز الحد - داخل الـ transaction"""
+        conn.execute(
+            """DELETE FROM job_state WHERE finished_at IS NOT NULL AND job_id NOT IN (
+                   SELECT job_id FROM job_state WHERE finished_at IS NOT NULL
+                   ORDER BY finished_at DESC LIMIT ?
+               )""",
+            (self.max_retained_jobs,)
+        )
+        conn.execute("DELETE FROM job_events WHERE job_id NOT IN (SELECT job_id FROM job_state)")
+
+    def heartbeat(self, job_ids: List[str]):
+        """تحديث heartbeat_at للـ jobs الجارية التي يملكها هذا الـ process"""
+        if not job_ids:
+            return
+        with self._lock:
+            conn = self._connection()
+            with conn:
+                conn.executemany(
+                    "UPDATE job_state SET heartbeat_at = ? WHERE job_id = ? AND owner_pid = ?",
+                    [(time.time(), job_id, os.getpid()) for job_id in job_ids]
+                )
+
+    @staticmethod
+    def _owner_alive(pid: int) -> bool:
+        if pid == os.getpid():
+            return True
+        try:
+            os.kill(pid, 0)
+        except ProcessLookupError:
+            return False
+        except PermissionError:
+            return True
+        return True
+
+    def get(self, job_id: str) -> Optional[Tuple[Dict, int]]:
+        """
+        آخر حالة للـ job ورقم آخر حدث
+
+        الـ job غير المنتهي الذي مات مالكه أو توقف الـ heartbeat الخاص به يُسجَّل failed هنا
+        """
+        with self._lock:
+            row = self._connection().execute(
+                "SELECT seq, owner_pid, status, heartbeat_at, job FROM job_state WHERE job_id = ?", (job_id,)
+            ).fetchone()
+        if row is None:
+            return None
+        seq, owner_pid, status, heartbeat_at, job_json = row
+        job = json.loads(job_json)
+        if status in TERMINAL_STATES:
+            return job, seq
+
+        if not self._owner_alive(owner_pid):
+            reason = "Worker process {} exited before the job finished".format(owner_pid)
+        elif time.time() - heartbeat_at > self.stale_seconds:
+            reason = "Worker process {} stopped reporting for {:.0f}s".format(owner_pid, time.time() - heartbeat_at)
+        else:
+            return job, seq
+        return self._fail_orphan(job_id, seq, job, reason)
+
+    def _fail_orphan(self, job_id: str, seq: int, job: Dict, reason: str) -> Tuple[Dict, int]:
+        """تسجيل job بلا مالك حي كـ failed (مرة واحدة: الكتابة مشروطة بنفس الـ seq المقروء)"""
+        print("[WARNING] Job {} marked failed: {}".format(job_id, reason))
+        job.update({"status": JOB_FAILED, "error": reason, "finished_at": time.time()})
+        job.setdefault("progress", {})["stage"] = JOB_FAILED
+        event = {"event": JOB_FAILED, "data": {"error": reason}, "timestamp": job["finished_at"]}
+
+        with self._lock:
+            conn = self._connection()
+            with conn:
+                updated = conn.execute(
+                    """UPDATE job_state SET seq = ?, status = ?, finished_at = ?, job = ?
+                       WHERE job_id = ? AND seq = ?""",
+                    (seq + 1, JOB_FAILED, job["finished_at"], json.dumps(job, ensure_ascii=False), job_id, seq)
+                ).rowcount
+                if updated:
+                    conn.execute(
+                        "INSERT OR REPLACE INTO job_events (job_id, seq, event) VALUES (?, ?, ?)",
+                        (job_id, seq + 1, json.dumps(event, ensure_ascii=False))
+                    )
+        if not updated:
+            # قارئ آخر أو المالك كتب قبلنا
+            return self.get(job_id)
+        return job, seq + 1
+
+    def events(self, job_id: str, after_seq: int = 0) -> List[Tuple[int, Dict]]:
+        """أحداث الـ job بعد after_seq بالترتيب"""
+        with self._lock:
+            rows = self._connection().execute(
+                "SELECT seq, event FROM job_events WHERE job_id = ? AND seq > ? ORDER BY seq",
+                (job_id, after_seq)
+            ).fetchall()
+        return [(seq, json.loads(event)) for seq, event in rows]
+
+
+class JobManager:
+    """
+    إدارة jobs التحليل غير المتزامنة (بديل عن إبقاء طلب HTTP مفتوحاً لدقائق)
+
+    - submit() يرجع job_id فوراً وينفّذ العمل في worker pool محدود
+    - كل job يسجّل أحداث التقدم (progress events) التي يرسلها search_chunks
+    - get() يرجع الحالة والنتائج الجزئية، و stream_events() يغذي Server-Sent Events
+    - مع shared_state: كل تغيير يُنسخ إلى SQLite فتُقرأ الـ jobs من أي worker (gunicorn متعدد العمليات)،
+      و thread خلفي يحدّث heartbeat الـ jobs الجارية حتى يميّزها القراء عن jobs worker مات
+    - stop_accepting() ثم drain() عند إيقاف الـ worker: لا jobs جديدة، وانتظار الجارية حتى مهلة محددة
+    """
+
+    def __init__(self, max_workers: int, max_retained_jobs: int, shared_state: Optional[SharedJobState] = None):
+        self.max_workers = max_workers
+        self.max_retained_jobs = max_retained_jobs
+        self.shared_state = shared_state
+        self._accepting = True
+        # رقم تسلسلي لكل job: ترتيب الكتابات إلى shared_state من threads مختلفة
+        self._seq: Dict[str, int] = {}
+        self._heartbeat_thread = None
+
+        self._executor = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix="job")
+        self._jobs: Dict[str, Dict] = {}
+        self._events: Dict[str, List[Dict]] = {}
+
+        # Condition واحد يوقظ كل مستمعي الـ SSE عند أي حدث جديد
+        self._cond = threading.Condition()
+
+        print("[INFO] JobManager ready (max_workers={})".format(max_workers))
+
+    def submit(self, work: Callable[[Callable[[str, Dict], None]], Dict]) -> str:
+        """
+        إضافة job جديد للطابور
+
+        Args:
+            work: دالة تستقبل progress_callback(event, data) وترجع النتيجة النهائية (Dict)
+
+        Returns:
+            str: معرّف الـ job
+
+        Raises:
+            JobsShuttingDown: إذا كان الـ worker في مرحلة الإيقاف
+        """
+        if not self._accepting:
+            raise JobsShuttingDown("Server is shutting down, not accepting new jobs")
+
+        job_id = uuid.uuid4().hex
+
+        with self._cond:
+            self._jobs[job_id] = {
+                "job_id": job_id,
+                "status": JOB_QUEUED,
+                "created_at": time.time(),
+                "started_at": None,
+                "finished_at": None,
+                "progress": {},
+                "result": None,
+                "error": None
+            }
+            self._events[job_id] = []
+            self._prune()
+
+        self._add_event(job_id, "queued", {})
+        self._ensure_heartbeat()
+        self._executor.submit(self._run, job_id, work)
+        return job_id
+
+    def _ensure_heartbeat(self):
+        """تشغيل thread الـ heartbeat عند أول job في هذا الـ process (لا threads قبل fork الـ workers)"""
+        if self.shared_state is None:
+            return
+        with self._cond:
+            if self._heartbeat_thread is not None and self._heartbeat_thread.is_alive():
+                return
+            self._heartbeat_thread = threading.Thread(target=self._heartbeat_loop, name="job-heartbeat", daemon=True)
+            self._heartbeat_thread.start()
+
+    def _heartbeat_loop(self):
+        interval = max(1.0, self.shared_state.stale_seconds / 4)
+        while True:
+            time.sleep(interval)
+            with self._cond:
+                running = [
+                    job_id for job_id, job in self._jobs.items()
+                    if job["status"] not in TERMINAL_STATES
+                ]
+            try:
+                self.shared_state.heartbeat(running)
+            except sqlite3.Error as e:
+                print("[WARNING] Could not update job heartbeat: {}".format(e))
+
+    def _run(self, job_id: str, work: Callable[[Callable[[str, Dict], None]], Dict]):
+        """تنفيذ الـ job داخل الـ worker pool"""
+        with self._cond:
+            if self._jobs[job_id]["status"] in TERMINAL_STATES:
+                # أُلغي أثناء الانتظار في الطابور (انتهت مهلة الـ drain)
+                return
+            self._jobs[job_id]["status"] = JOB_RUNNING
+            self._jobs[job_id]["started_at"] = time.time()
+        self._add_event(job_id, "running", {})
+
+        def report(event: str, data: Dict):
+            # بعد أن سجّل drain() الـ job كـ failed يستمر العمل في الـ thread، لكن أحداثه لا تُنشر
+            with self._cond:
+                finished = self._jobs.get(job_id, {}).get("status") in TERMINAL_STATES
+            if not finished:
+                self._add_event(job_id, event, data)
+
+        try:
+            result = work(report)
+        except Exception as e:
+            print("[ERROR] Job {} failed: {}".format(job_id, e))
+            if self._finish(job_id, JOB_FAILED, error=str(e)):
+                self._add_event(job_id, JOB_FAILED, {"error": str(e)})
+            return
+
+        if self._finish(job_id, JOB_COMPLETED, result=result):
+            self._add_event(job_id, JOB_COMPLETED, {})
+
+    def _finish(self, job_id: str, status: str, result: Optional[Dict] = None, error: Optional[str] = None) -> bool:
+        """
+        تسجيل الحالة النهائية مرة واحدة فقط
+
+        Returns:
+            bool: False إذا كان الـ job منتهياً بالفعل (سجّله drain() كـ failed) فلا يُرسل حدث نهائي ثانٍ
+        """
+        with self._cond:
+            job = self._jobs.get(job_id)
+            if job is None or job["status"] in TERMINAL_STATES:
+                print("[WARNING] Job {} finished after it was already marked {}, dropping its {} state".format(
+                    job_id, job["status"] if job else "pruned", status
+                ))
+                return False
+            job["status"] = status
+            job["result"] = result
+            job["error"] = error
+            job["finished_at"] = time.time()
+        return True
+
+    def _add_event(self, job_id: str, event: str, data: Dict):
+        """تسجيل حدث تقدم ودمج بياناته في progress ثم إيقاظ مستمعي الـ SSE"""
+        with self._cond:
+            job = self._jobs.get(job_id)
+            if job is None:
+                return
+
+            job["progress"].update(data)
+            job["progress"]["stage"] = event
+            item = {
+                "event": event,
+                "data": data,
+                "timestamp": time.time()
+            }
+            self._events[job_id].append(item)
+            self._cond.notify_all()
+
+            if self.shared_state is None:
+                return
+            self._seq[job_id] = self._seq.get(job_id, 0) + 1
+            seq = self._seq[job_id]
+            snapshot = dict(job)
+            snapshot["progress"] = dict(job["progress"])
+
+        # الكتابة خارج الـ lock (I/O)، والـ seq يمنع حالة أقدم من استبدال أحدث
+        try:
+            self.shared_state.put(job_id, seq, snapshot, item)
+        except sqlite3.Error as e:
+            print("[WARNING] Could not persist job {} state: {}".format(job_id, e))
+
+    def _prune(self):
+        """حذف أقدم الـ jobs المنتهية عند تجاوز الحد - يُستدعى داخل الـ lock"""
+        finished = [
+            job for job in self._jobs.values()
+            if job["status"] in TERMINAL_STATES
+        ]
+        excess = len(self._jobs) - self.max_retained_jobs
+        for job in sorted(finished, key=lambda j: j["finished_at"])[:max(excess, 0)]:
+            del self._jobs[job["job_id"]]
+            del self._events[job["job_id"]]
+            self._seq.pop(job["job_id"], None)
+
+    def get(self, job_id: str, include_result: bool = True) -> Optional[Dict]:
+        """حالة الـ job مع النتائج الجزئية (progress) والنتيجة النهائية إن وجدت"""
+        with self._cond:
+            job = self._jobs.get(job_id)
+            if job is not None:
+                snapshot = dict(job)
+                snapshot["progress"] = dict(job["progress"])
+
+        if job is None:
+            # job يملكه worker آخر
+            shared = self.shared_state.get(job_id) if self.shared_state else None
+            if shared is None:
+                return None
+            snapshot = shared[0]
+
+        if not include_result:
+            snapshot.pop("result", None)
+        return snapshot
+
+    def stream_events(self, job_id: str, heartbeat_seconds: float = 15.0,
+                      max_wait_seconds: Optional[float] = None) -> Iterator[str]:
+        """
+        مولّد Server-Sent Events لأحداث الـ job (يبدأ من أول حدث ويتوقف عند انتهاء الـ job)
+
+        بعد max_wait_seconds يُرسل حدث stream_timeout بحالة الـ job ويُغلق البث (يعيد العميل الاتصال أو يستعلم)
+        """
+        deadline = time.monotonic() + max_wait_seconds if max_wait_seconds else None
+
+        with self._cond:
+            local = job_id in self._jobs
+        if not local and self.shared_state is not None:
+            yield from self._stream_shared_events(job_id, heartbeat_seconds, deadline)
+            return
+
+        index = 0
+
+        while True:
+            timed_out = None
+            with self._cond:
+                if job_id not in self._jobs:
+                    return
+
+                events = self._events[job_id]
+                if index >= len(events):
+                    status = self._jobs[job_id]["status"]
+                    if status in TERMINAL_STATES:
+                        return
+                    remaining = deadline - time.monotonic() if deadline is not None else heartbeat_seconds
+                    if remaining <= 0:
+                        timed_out = status
+                    else:
+                        self._cond.wait(timeout=min(heartbeat_seconds, remaining))
+                        events = self._events.get(job_id, [])
+
+                pending = events[index:]
+                index += len(pending)
+
+            if timed_out is not None:
+                yield self._timeout_event(job_id, timed_out)
+                return
+            if not pending:
+                # تعليق SSE للحفاظ على الاتصال مفتوحاً عبر الـ proxies
+                yield ": keep-alive\n\n"
+                continue
+
+            for item in pending:
+                yield self._format_event(item)
+
+    def _format_event(self, item: Dict) -> str:
+        return "event: {}\ndata: {}\n\n".format(
+            item["event"],
+            json.dumps(item["data"], ensure_ascii=False)
+        )
+
+    def _timeout_event(self, job_id: str, status: str) -> str:
+        return self._format_event({"event": "stream_timeout", "data": {"job_id": job_id, "status": status}})
+
+    def _stream_shared_events(self, job_id: str, heartbeat_seconds: float, deadline: Optional[float],
+                              poll_seconds: float = 0.5) -> Iterator[str]:
+        """أحداث job يملكه worker آخر: قراءة الأحداث الجديدة فقط (بعد آخر seq مُرسل) من shared_state"""
+        sent_seq = 0
+        last_sent = time.monotonic()
+
+        while True:
+            shared = self.shared_state.get(job_id)
+            if shared is None:
+                return
+            job, _ = shared
+
+            for seq, item in self.shared_state.events(job_id, sent_seq):
+                yield self._format_event(item)
+                sent_seq = seq
+                last_sent = time.monotonic()
+
+            if job["status"] in TERMINAL_STATES:
+                return
+            if deadline is not None and time.monotonic() >= deadline:
+                yield self._timeout_event(job_id, job["status"])
+                return
+            if time.monotonic() - last_sent >= heartbeat_seconds:
+                yield ": keep-alive\n\n"
+                last_sent = time.monotonic()
+            time.sleep(poll_seconds)
+
+    def stop_accepting(self):
+        """بداية الإيقاف: submit() يرفض الـ jobs الجديدة (آمن من signal handler: بدون locks)"""
+        self._accepting = False
+
+    def drain(self, timeout: float) -> int:
+        """
+        انتظار الـ jobs الجارية والمنتظرة حتى تنتهي أو تنقضي المهلة
+
+        ما يبقى بعد المهلة يُسجَّل failed (فيرى العميل حالة نهائية بدل job مفقود)
+
+        Returns:
+            int: عدد الـ jobs التي لم تكتمل قبل المهلة
+        """
+        self.stop_accepting()
+        deadline = time.monotonic() + max(0.0, timeout)
+
+        with self._cond:
+            while True:
+                unfinished = [
+                    job_id for job_id, job in self._jobs.items()
+                    if job["status"] not in TERMINAL_STATES
+                ]
+                remaining = deadline - time.monotonic()
+                if not unfinished or remaining <= 0:
+                    break
+                self._cond.wait(timeout=min(remaining, 1.0))
+
+            for job_id in unfinished:
+                self._jobs[job_id]["status"] = JOB_FAILED
+                self._jobs[job_id]["error"] = "Server shut down before the job finished"
+                self._jobs[job_id]["finished_at"] = time.time()
+
+        for job_id in unfinished:
+            self._add_event(job_id, JOB_FAILED, {"error": "Server shut down before the job finished"})
+
+        self._executor.shutdown(wait=False, cancel_futures=True)
+        return len(unfinished)
+
+    def stats(self) -> Dict:
+        """عدد الـ jobs حسب الحالة"""
+        with self._cond:
+            counts = {JOB_QUEUED: 0, JOB_RUNNING: 0, JOB_COMPLETED: 0, JOB_FAILED: 0}
+            for job in self._jobs.values():
+                counts[job["status"]] += 1
+
+        counts["max_workers"] = self.max_workers
+        return counts
@@ -0,0 +1,78 @@
+import json
+from typing import Dict, List
+
+
+class JsonArrayStreamParser:
+    """
+    محلل تدريجي لمصفوفة JSON من الكائنات تصل على دفعات (streaming)
+
+    يُغذّى بأجزاء النص كما تصل من generate_content_stream ويرجع كل كائن فور إغلاق
+    قوسه، دون انتظار نهاية الاستجابة. يتجاهل أي نص قبل أول "[" (مثل ```json)
+    ويتتبع النصوص والـ escapes حتى لا تُحسب الأقواس داخل نص البند.
+    """
+
+    def __init__(self):
+        self._started = False
+        self._finished = False
+        self._depth = 0
+        self._in_string = False
+        self._escape = False
+        self._current: List[str] = []
+        self.errors = 0
+
+    @property
+    def finished(self) -> bool:
+        """هل أُغلقت المصفوفة الخارجية"""
+        return self._finished
+
+    def feed(self, text: str) -> List[Dict]:
+        """إضافة جزء نصي جديد وإرجاع الكائنات التي اكتملت فيه"""
+        items = []
+        for char in text:
+            if self._finished:
+                break
+
+            if not self._started:
+                if char == "[":
+                    self._started = True
+                continue
+
+            if self._depth > 0:
+                self._current.append(char)
+
+            if self._in_string:
+                if self._escape:
+                    self._escape = False
+                elif char == "\\":
+                    self._escape = True
+                elif char == '"':
+                    self._in_string = False
+                continue
+
+            if char == '"':
+                self._in_string = True
+            elif char in "{[":
+                if self._depth == 0:
+                    # بداية عنصر جديد (المصفوفات المتداخلة كعنصر مباشر تُتجاهل عند الفك)
+                    self._current = [char]
+                self._depth += 1
+            elif char in "}]":
+                if self._depth == 0:
+                    if char == "]":
+                        self._finished = True
+                    continue
+                self._depth -= 1
+                if self._depth == 0:
+                    item = self._decode("".join(self._current))
+                    self._current = []
+                    if item is not None:
+                        items.append(item)
+        return items
+
+    def _decode(self, raw: str):
+        try:
+            value = json.loads(raw)
+        except json.JSONDecodeError:
+            self.errors += 1
+            return None
+        return value if isinstance(value, dict) else None
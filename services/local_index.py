@@ -0,0 +1,179 @@
+import json
+import mmap
+import os
+import sys
+from array import array
+from pathlib import Path
+from typing import Dict, Iterator, List, Optional, Tuple
+
+
+# رقم إصدار صيغة الملف - أي تغيير في التخطيط أو في التقسيم/التطبيع يجب أن يرفعه
+INDEX_FORMAT_VERSION = 1
+MANIFEST_NAME = "manifest.json"
+
+
+def _pad8(buffer: bytearray):
+    """محاذاة كل قسم على 8 بايت حتى يعمل memoryview.cast مباشرة على الـ mmap"""
+    buffer.extend(b"\0" * (-len(buffer) % 8))
+
+
+def write_index(index_dir: str, chunks: List[Dict], postings: Dict[str, List[Tuple[int, int]]],
+                doc_lengths: List[int], manifest: Dict) -> str:
+    """
+    كتابة الفهرس بصيغة ثنائية مضغوطة قابلة لـ mmap
+
+    التخطيط (كل قسم محاذى على 8 بايت، الترتيب الأصلي للجهاز):
+    - strings:    UTF-8 لكل نصوص الـ chunks والعناوين والـ URIs والـ tokens
+    - chunks:     uint64 × 6 لكل chunk (text_off, text_len, title_off, title_len, uri_off, uri_len)
+    - doc_lengths: uint32 لكل chunk (عدد الـ tokens)
+    - vocab:      uint64 × 4 لكل token (token_off, token_len, postings_start, df)
+    - postings:   uint32 أزواج (doc_id, tf) متتالية لكل token
+
+    الملف الثنائي يُكتب باسم فريد أولاً ثم يُستبدل الـ manifest ذرياً (os.replace)،
+    لذلك الـ workers التي فتحت النسخة القديمة تبقى تعمل بأمان.
+
+    Returns:
+        str: مسار الملف الثنائي
+    """
+    path = Path(index_dir)
+    path.mkdir(parents=True, exist_ok=True)
+
+    strings = bytearray()
+
+    def put(text: str) -> Tuple[int, int]:
+        data = (text or "").encode("utf-8")
+        offset = len(strings)
+        strings.extend(data)
+        return offset, len(data)
+
+    chunk_table = array("Q")
+    for chunk in chunks:
+        for field in ("chunk_text", "title", "uri"):
+            chunk_table.extend(put(chunk.get(field) or ""))
+
+    vocab_table = array("Q")
+    postings_data = array("I")
+    for token in sorted(postings):
+        entries = postings[token]
+        token_off, token_len = put(token)
+        vocab_table.extend((token_off, token_len, len(postings_data) // 2, len(entries)))
+        for doc_id, tf in entries:
+            postings_data.extend((doc_id, tf))
+
+    sections = {}
+    blob = bytearray()
+    for name, data in (
+        ("strings", bytes(strings)),
+        ("chunks", chunk_table.tobytes()),
+        ("doc_lengths", array("I", doc_lengths).tobytes()),
+        ("vocab", vocab_table.tobytes()),
+        ("postings", postings_data.tobytes())
+    ):
+        sections[name] = [len(blob), len(data)]
+        blob.extend(data)
+        _pad8(blob)
+
+    data_name = "index-{}.bin".format(manifest["fingerprint"])
+    tmp_path = path / (data_name + ".tmp.{}".format(os.getpid()))
+    with open(tmp_path, "wb") as f:
+        f.write(blob)
+    os.replace(tmp_path, path / data_name)
+
+    manifest = dict(manifest)
+    manifest.update({
+        "version": INDEX_FORMAT_VERSION,
+        "byteorder": sys.byteorder,
+        "data_file": data_name,
+        "sections": sections,
+        "n_docs": len(chunks),
+        "n_terms": len(postings)
+    })
+    tmp_manifest = path / (MANIFEST_NAME + ".tmp.{}".format(os.getpid()))
+    with open(tmp_manifest, "w", encoding="utf-8") as f:
+        json.dump(manifest, f, ensure_ascii=False, indent=2)
+    os.replace(tmp_manifest, path / MANIFEST_NAME)
+
+    # حذف نسخ الفهرس القديمة (الـ mmap المفتوح عليها يبقى صالحاً على Linux)
+    for old in path.glob("index-*.bin"):
+        if old.name != data_name:
+            try:
+                old.unlink()
+            except OSError:
+                pass
+
+    return str(path / data_name)
+
+
+def read_manifest(index_dir: str) -> Optional[Dict]:
+    """قراءة الـ manifest إن وجد وكان بنفس إصدار الصيغة وترتيب البايتات"""
+    try:
+        with open(Path(index_dir) / MANIFEST_NAME, "r", encoding="utf-8") as f:
+            manifest = json.load(f)
+    except (OSError, ValueError):
+        return None
+
+    if manifest.get("version") != INDEX_FORMAT_VERSION or manifest.get("byteorder") != sys.byteorder:
+        return None
+    return manifest
+
+
+class MappedIndex:
+    """
+    فهرس BM25 مقروء عبر mmap (بدون نسخ للذاكرة)
+
+    صفحات الملف مشتركة بين كل الـ processes التي تفتحه (Flask workers)،
+    ونصوص الـ chunks لا تُفك إلا عند إرجاعها كنتيجة
+    """
+
+    def __init__(self, index_dir: str, manifest: Dict):
+        self.manifest = manifest
+        data_path = Path(index_dir) / manifest["data_file"]
+
+        with open(data_path, "rb") as f:
+            self._mm = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+        view = memoryview(self._mm)
+
+        def section(name: str, fmt: str):
+            offset, length = manifest["sections"][name]
+            return view[offset:offset + length].cast(fmt) if length else view[0:0].cast(fmt)
+
+        self._strings = section("strings", "B")
+        self._chunk_table = section("chunks", "Q")
+        self.doc_lengths = section("doc_lengths", "I")
+        self._postings = section("postings", "I")
+
+        self.n_docs = manifest["n_docs"]
+        self.n_terms = manifest["n_terms"]
+
+        # القاموس صغير (آلاف الـ tokens) فيُحمّل في الذاكرة للبحث السريع
+        vocab_table = section("vocab", "Q")
+        self._vocab: Dict[str, Tuple[int, int]] = {}
+        for i in range(0, len(vocab_table), 4):
+            token_off, token_len, start, df = vocab_table[i:i + 4]
+            token = bytes(self._strings[token_off:token_off + token_len]).decode("utf-8")
+            self._vocab[token] = (start, df)
+
+    def _string(self, offset: int, length: int) -> str:
+        return bytes(self._strings[offset:offset + length]).decode("utf-8")
+
+    def document_frequency(self, token: str) -> int:
+        entry = self._vocab.get(token)
+        return entry[1] if entry else 0
+
+    def postings(self, token: str) -> Iterator[Tuple[int, int]]:
+        """أزواج (doc_id, tf) للـ token مباشرة من الـ mmap"""
+        entry = self._vocab.get(token)
+        if not entry:
+            return iter(())
+        start, df = entry
+        segment = self._postings[start * 2:(start + df) * 2]
+        return zip(segment[0::2], segment[1::2])
+
+    def chunk(self, doc_id: int) -> Dict:
+        base = doc_id * 6
+        text_off, text_len, title_off, title_len, uri_off, uri_len = self._chunk_table[base:base + 6]
+        return {
+            "chunk_text": self._string(text_off, text_len),
+            "title": self._string(title_off, title_len),
+            "uri": self._string(uri_off, uri_len)
+        }
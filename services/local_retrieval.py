@@ -0,0 +1,350 @@
+import hashlib
+import heapq
+import math
+import re
+import time
+from collections import Counter, defaultdict
+from pathlib import Path
+from typing import List, Dict, Optional, Tuple
+
+from services.arabic_normalizer import NORMALIZER_VERSION, clean_arabic, fix_ocr, normalize_arabic
+from services.local_index import MappedIndex, read_manifest, write_index
+
+
+_NON_WORD_RE = re.compile(r"[^\w]+", re.UNICODE)
+_CID_RE = re.compile(r"\(cid:\d+\)")
+
+# سوابق شائعة (حروف الجر والعطف + ال التعريف) تُزال بشرط بقاء جذر كافٍ
+_PREFIXES = ("وبال", "وال", "بال", "كال", "فال", "لل", "ال")
+
+_STOPWORDS = {
+    "في", "من", "علي", "الي", "عن", "ان", "او", "ثم", "هذا", "هذه", "ذلك", "تلك",
+    "التي", "الذي", "الذين", "ما", "لا", "لم", "لن", "قد", "كل", "بين", "مع", "عند",
+    "هو", "هي", "هم", "كان", "كانت", "يكون", "تكون", "اذا", "به", "بها", "له", "لها",
+    "و", "ب", "ل", "ف", "ك"
+}
+
+
+def tokenize_arabic(text: str) -> List[str]:
+    """
+    تقسيم نص عربي إلى tokens مُطبّعة للبحث
+
+    - normalize_arabic (التشكيل، التطويل، توحيد الحروف)
+    - إزالة السوابق الشائعة (ال، وال، بال...) كـ light stemming
+    - حذف الكلمات الشائعة (stopwords) والـ tokens القصيرة جداً
+    """
+    tokens = []
+    for word in _NON_WORD_RE.split(normalize_arabic(text)):
+        if not word or word in _STOPWORDS:
+            continue
+        for prefix in _PREFIXES:
+            if word.startswith(prefix) and len(word) - len(prefix) >= 3:
+                word = word[len(prefix):]
+                break
+        if len(word) >= 2 and word not in _STOPWORDS:
+            tokens.append(word)
+    return tokens
+
+
+class LocalRetrievalEngine:
+    """
+    محرك استرجاع محلي (offline) فوق ملفات context/ بديلاً عن File Search
+
+    - تقسيم ملفات Markdown على العناوين الرئيسية (# ) ثم نوافذ بحجم ثابت مع تداخل
+    - فهرس BM25 مقلوب (inverted index) مع تطبيع عربي
+    - load_or_build(): يفتح الفهرس المحفوظ عبر mmap ولا يعيد البناء إلا إذا تغيّر hash ملف مصدر
+    - النتائج بنفس هيكل _extract_grounding_chunks (Config.CHUNK_SCHEMA)
+    """
+
+    SUPPORTED_SUFFIXES = (".md", ".txt")
+
+    def __init__(self, context_dir: str, chunk_chars: int = 1500, overlap_chars: int = 200,
+                 k1: float = 1.5, b: float = 0.75):
+        self.context_dir = context_dir
+        self.chunk_chars = chunk_chars
+        self.overlap_chars = overlap_chars
+        self.k1 = k1
+        self.b = b
+
+        self.chunks: List[Dict] = []
+        self.postings: Dict[str, List[Tuple[int, int]]] = {}
+        self.doc_lengths: List[int] = []
+        self.avg_doc_length = 0.0
+        self.fingerprint = ""
+        self._source_hashes_built: Dict[str, str] = {}
+
+        # عند تحميل فهرس محفوظ: البيانات تُقرأ من الـ mmap بدل chunks/postings في الذاكرة
+        self._mapped: Optional[MappedIndex] = None
+
+    # ===== بناء الفهرس =====
+
+    def _source_files(self) -> List[Path]:
+        context_path = Path(self.context_dir)
+        if not context_path.exists():
+            return []
+        return sorted(
+            f for f in context_path.glob("*")
+            if f.is_file() and not f.name.startswith(".") and f.suffix.lower() in self.SUPPORTED_SUFFIXES
+        )
+
+    @staticmethod
+    def _file_hash(path: Path) -> str:
+        digest = hashlib.sha256()
+        with open(path, "rb") as f:
+            for block in iter(lambda: f.read(1 << 20), b""):
+                digest.update(block)
+        return digest.hexdigest()
+
+    def _source_hashes(self) -> Dict[str, str]:
+        """hash لكل ملف مصدر (يحدد متى يجب إعادة بناء الفهرس)"""
+        return {path.name: self._file_hash(path) for path in self._source_files()}
+
+    def _fingerprint(self, source_hashes: Dict[str, str]) -> str:
+        """بصمة الفهرس: ملفات المصدر + إعدادات التقسيم والتطبيع (تدخل في مفاتيح الكاش)"""
+        material = "\n".join("{}:{}".format(name, h) for name, h in sorted(source_hashes.items()))
+        material += "\n" + repr(sorted(self._params().items()))
+        return hashlib.sha256(material.encode("utf-8")).hexdigest()[:16]
+
+    def _params(self) -> Dict:
+        return {
+            "chunk_chars": self.chunk_chars,
+            "overlap_chars": self.overlap_chars,
+            "normalizer": NORMALIZER_VERSION
+        }
+
+    @staticmethod
+    def _clean_line(line: str) -> str:
+        """إزالة بادئة ## (أسطر OCR مقسّمة كعناوين فرعية) وبقايا (cid:N)"""
+        line = _CID_RE.sub("", line)
+        return line.lstrip("#").strip()
+
+    def _split_sections(self, path: Path, text: str) -> List[Dict]:
+        """تقسيم ملف إلى chunks: قسم لكل عنوان رئيسي، ثم نوافذ بحجم chunk_chars"""
+        chunks = []
+        heading = path.stem
+        section_lines: List[Tuple[int, str]] = []
+
+        def flush():
+            window: List[Tuple[int, str]] = []
+            window_chars = 0
+            emitted = False
+            for line_no, line in section_lines:
+                window.append((line_no, line))
+                window_chars += len(line) + 1
+                if window_chars >= self.chunk_chars:
+                    emit(window)
+                    emitted = True
+                    # تداخل: نحتفظ بآخر الأسطر حتى overlap_chars
+                    kept, kept_chars = [], 0
+                    for item in reversed(window):
+                        if kept_chars + len(item[1]) > self.overlap_chars:
+                            break
+                        kept.insert(0, item)
+                        kept_chars += len(item[1]) + 1
+                    window, window_chars = kept, kept_chars
+            # الباقي بعد آخر نافذة يُضاف فقط إذا كان أكثر من مجرد التداخل
+            if window and (not emitted or window_chars > self.overlap_chars):
+                emit(window)
+
+        def emit(window: List[Tuple[int, str]]):
+            body = "\n".join(line for _, line in window)
+            chunks.append({
+                "chunk_text": "{}\n{}".format(heading, body) if heading else body,
+                "title": heading,
+                "uri": "{}/{}#L{}".format(self.context_dir, path.name, window[0][0])
+            })
+
+        for line_no, raw_line in enumerate(text.splitlines(), 1):
+            if raw_line.startswith("# "):
+                flush()
+                heading = self._clean_line(raw_line)
+                section_lines = []
+                continue
+
+            line = self._clean_line(raw_line)
+            if line:
+                section_lines.append((line_no, line))
+
+        flush()
+        return chunks
+
+    def build(self):
+        """قراءة ملفات context/ وتقسيمها وبناء فهرس BM25"""
+        started = time.time()
+        files = self._source_files()
+        source_hashes = {}
+
+        chunks = []
+        for path in files:
+            data = path.read_bytes()
+            source_hashes[path.name] = hashlib.sha256(data).hexdigest()
+            # تنظيف الملف كاملاً دفعة واحدة (أسرع من التنظيف سطراً سطراً)
+            text = clean_arabic(data.decode("utf-8", errors="replace"))
+            chunks.extend(self._split_sections(path, text))
+
+        postings: Dict[str, List[Tuple[int, int]]] = defaultdict(list)
+        doc_lengths = []
+        for doc_id, chunk in enumerate(chunks):
+            # إصلاحات OCR لـ tokens الفهرس فقط - نص الـ chunk المعروض يبقى كما في المرجع
+            counts = Counter(tokenize_arabic(fix_ocr(chunk["chunk_text"])))
+            doc_lengths.append(sum(counts.values()))
+            for token, tf in counts.items():
+                postings[token].append((doc_id, tf))
+
+        self.chunks = chunks
+        self.postings = dict(postings)
+        self.doc_lengths = doc_lengths
+        self.avg_doc_length = (sum(doc_lengths) / len(doc_lengths)) if doc_lengths else 0.0
+        self.fingerprint = self._fingerprint(source_hashes)
+        self._source_hashes_built = source_hashes
+        self._mapped = None
+
+        print("[INFO] Local index built: {} file(s), {} chunks, {} terms in {:.2f}s".format(
+            len(files), len(chunks), len(self.postings), time.time() - started
+        ))
+
+    def save(self, index_dir: str) -> str:
+        """حفظ الفهرس المبني في index_dir بصيغة ثنائية قابلة لـ mmap"""
+        path = write_index(index_dir, self.chunks, self.postings, self.doc_lengths, {
+            "fingerprint": self.fingerprint,
+            "sources": self._source_hashes_built,
+            "params": self._params(),
+            "avg_doc_length": self.avg_doc_length
+        })
+        print("[INFO] Local index saved: {}".format(path))
+        return path
+
+    def load(self, index_dir: str, source_hashes: Optional[Dict[str, str]] = None) -> bool:
+        """
+        فتح الفهرس المحفوظ عبر mmap إذا كان مطابقاً لملفات المصدر والإعدادات الحالية
+
+        Returns:
+            bool: True إذا تم التحميل، False إذا كان الفهرس غير موجود أو قديماً
+        """
+        manifest = read_manifest(index_dir)
+        if manifest is None:
+            return False
+
+        if source_hashes is None:
+            source_hashes = self._source_hashes()
+        if manifest.get("sources") != source_hashes or manifest.get("params") != self._params():
+            return False
+
+        try:
+            mapped = MappedIndex(index_dir, manifest)
+        except (OSError, KeyError, ValueError) as e:
+            print("[WARNING] Could not map local index: {}".format(e))
+            return False
+
+        self._mapped = mapped
+        self.chunks = []
+        self.postings = {}
+        self.doc_lengths = mapped.doc_lengths
+        self.avg_doc_length = manifest["avg_doc_length"]
+        self.fingerprint = manifest["fingerprint"]
+        return True
+
+    def load_or_build(self, index_dir: str):
+        """
+        تحميل الفهرس المحفوظ (شبه فوري) أو إعادة بنائه وحفظه إذا تغيّر أي ملف مصدر
+        """
+        started = time.time()
+        source_hashes = self._source_hashes()
+
+        if self.load(index_dir, source_hashes):
+            print("[INFO] Local index mapped from {} ({} chunks) in {:.3f}s".format(
+                index_dir, self._mapped.n_docs, time.time() - started
+            ))
+            return
+
+        print("[INFO] Local index missing or stale, rebuilding...")
+        self.build()
+        try:
+            self.save(index_dir)
+        except OSError as e:
+            print("[WARNING] Could not persist local index, using in-memory index: {}".format(e))
+            return
+
+        # إعادة الفتح عبر mmap حتى تتشارك الـ workers نفس الصفحات بدل نسخ في الذاكرة
+        self.load(index_dir, source_hashes)
+
+    # ===== الوصول للبيانات (ذاكرة أو mmap) =====
+
+    def _n_docs(self) -> int:
+        return self._mapped.n_docs if self._mapped else len(self.chunks)
+
+    def _get_postings(self, token: str) -> Tuple[int, object]:
+        """(df, iterable of (doc_id, tf)) للـ token"""
+        if self._mapped:
+            return self._mapped.document_frequency(token), self._mapped.postings(token)
+        entries = self.postings.get(token, [])
+        return len(entries), entries
+
+    def _get_chunk(self, doc_id: int) -> Dict:
+        return self._mapped.chunk(doc_id) if self._mapped else self.chunks[doc_id]
+
+    # ===== البحث =====
+
+    def _bm25_scores(self, query: str) -> Dict[int, float]:
+        n_docs = self._n_docs()
+        scores: Dict[int, float] = defaultdict(float)
+
+        for token in set(tokenize_arabic(query)):
+            df, postings = self._get_postings(token)
+            if not df:
+                continue
+            idf = math.log(1 + (n_docs - df + 0.5) / (df + 0.5))
+            for doc_id, tf in postings:
+                norm = self.k1 * (1 - self.b + self.b * self.doc_lengths[doc_id] / self.avg_doc_length)
+                scores[doc_id] += idf * tf * (self.k1 + 1) / (tf + norm)
+
+        return scores
+
+    def _to_chunks(self, ranked: List[Tuple[float, int]]) -> List[Dict]:
+        """تحويل (score, doc_id) إلى هيكل chunk موحّد مع score مُطبّع بين 0 و 1"""
+        if not ranked:
+            return []
+
+        top_score = ranked[0][0] or 1.0
+        results = []
+        for idx, (score, doc_id) in enumerate(ranked):
+            chunk = self._get_chunk(doc_id)
+            results.append({
+                "uid": "chunk_{}".format(idx + 1),
+                "chunk_text": chunk["chunk_text"],
+                "score": round(score / top_score, 4),
+                "uri": chunk["uri"],
+                "title": chunk["title"]
+            })
+        return results
+
+    def search(self, query: str, top_k: int) -> List[Dict]:
+        """بحث BM25 باستعلام واحد"""
+        scores = self._bm25_scores(query)
+        ranked = heapq.nlargest(top_k, ((score, doc_id) for doc_id, score in scores.items()))
+        return self._to_chunks(ranked)
+
+    def search_many(self, queries: List[str], top_k: int, rrf_k: int = 60) -> List[Dict]:
+        """
+        بحث بعدة استعلامات (بند لكل استعلام) ودمجها بـ Reciprocal Rank Fusion
+        حتى لا يطغى بند طويل على بقية البنود في البحث الجماعي
+        """
+        fused: Dict[int, float] = defaultdict(float)
+        per_query = max(top_k, 10)
+
+        for query in queries:
+            scores = self._bm25_scores(query)
+            ranked = heapq.nlargest(per_query, ((score, doc_id) for doc_id, score in scores.items()))
+            for rank, (_, doc_id) in enumerate(ranked):
+                fused[doc_id] += 1.0 / (rrf_k + rank + 1)
+
+        ranked = heapq.nlargest(top_k, ((score, doc_id) for doc_id, score in fused.items()))
+        return self._to_chunks(ranked)
+
+    def info(self) -> Dict:
+        return {
+            "chunks": self._n_docs(),
+            "terms": self._mapped.n_terms if self._mapped else len(self.postings),
+            "fingerprint": self.fingerprint,
+            "memory_mapped": self._mapped is not None
+        }
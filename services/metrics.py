@@ -0,0 +1,223 @@
+import bisect
+import os
+import threading
+from typing import Callable, Dict, List, Optional, Sequence, Tuple
+
+# حدود الـ histogram بالثواني: من استدعاءات محلية سريعة حتى طلبات تحليل كاملة (~4 دقائق)
+DEFAULT_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 20.0, 30.0, 60.0, 120.0, 240.0)
+
+
+def _escape(value) -> str:
+    return str(value).replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')
+
+
+def _format_labels(names: Sequence[str], values: Sequence, extra: Optional[Tuple[str, str]] = None,
+                   const: Sequence[Tuple[str, str]] = ()) -> str:
+    pairs = ['{}="{}"'.format(name, _escape(value)) for name, value in const]
+    pairs.extend('{}="{}"'.format(name, _escape(value)) for name, value in zip(names, values))
+    if extra:
+        pairs.append('{}="{}"'.format(extra[0], extra[1]))
+    return "{" + ",".join(pairs) + "}" if pairs else ""
+
+
+def _format_value(value: float) -> str:
+    if value == float("inf"):
+        return "+Inf"
+    return repr(float(value)) if not float(value).is_integer() else str(int(value))
+
+
+class _Metric:
+    kind = ""
+
+    def __init__(self, name: str, documentation: str, labelnames: Sequence[str] = ()):
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = tuple(labelnames)
+        self._lock = threading.Lock()
+
+    def _key(self, labels: Dict) -> Tuple:
+        return tuple(str(labels.get(name, "")) for name in self.labelnames)
+
+    def render(self, const: Sequence[Tuple[str, str]] = ()) -> List[str]:
+        return ["# HELP {} {}".format(self.name, self.documentation), "# TYPE {} {}".format(self.name, self.kind)]
+
+
+class Counter(_Metric):
+    """عداد تراكمي (لا ينقص)"""
+
+    kind = "counter"
+
+    def __init__(self, name: str, documentation: str, labelnames: Sequence[str] = ()):
+        super().__init__(name, documentation, labelnames)
+        self._values: Dict[Tuple, float] = {}
+
+    def inc(self, amount: float = 1.0, **labels):
+        key = self._key(labels)
+        with self._lock:
+            self._values[key] = self._values.get(key, 0.0) + amount
+
+    def value(self, **labels) -> float:
+        with self._lock:
+            return self._values.get(self._key(labels), 0.0)
+
+    def render(self, const: Sequence[Tuple[str, str]] = ()) -> List[str]:
+        lines = super().render()
+        with self._lock:
+            for key, value in sorted(self._values.items()):
+                lines.append("{}{} {}".format(self.name, _format_labels(self.labelnames, key, const=const), _format_value(value)))
+        return lines
+
+
+class Gauge(_Metric):
+    """قيمة لحظية (in-flight...) - يدوية أو محسوبة عند العرض عبر set_function"""
+
+    kind = "gauge"
+
+    def __init__(self, name: str, documentation: str, labelnames: Sequence[str] = ()):
+        super().__init__(name, documentation, labelnames)
+        self._values: Dict[Tuple, float] = {}
+        self._function: Optional[Callable[[], float]] = None
+
+    def inc(self, amount: float = 1.0, **labels):
+        key = self._key(labels)
+        with self._lock:
+            self._values[key] = self._values.get(key, 0.0) + amount
+
+    def dec(self, amount: float = 1.0, **labels):
+        self.inc(-amount, **labels)
+
+    def set(self, value: float, **labels):
+        with self._lock:
+            self._values[self._key(labels)] = value
+
+    def set_function(self, function: Callable[[], float]):
+        """قراءة القيمة عند كل عرض (مثل in_flight في بوابة Gemini)"""
+        self._function = function
+
+    def render(self, const: Sequence[Tuple[str, str]] = ()) -> List[str]:
+        lines = super().render()
+        if self._function is not None:
+            try:
+                lines.append("{}{} {}".format(self.name, _format_labels((), (), const=const), _format_value(self._function())))
+            except Exception:
+                pass
+            return lines
+        with self._lock:
+            for key, value in sorted(self._values.items()):
+                lines.append("{}{} {}".format(self.name, _format_labels(self.labelnames, key, const=const), _format_value(value)))
+        return lines
+
+
+class Histogram(_Metric):
+    """توزيع زمني بحدود ثابتة (buckets تراكمية بصيغة Prometheus)"""
+
+    kind = "histogram"
+
+    def __init__(self, name: str, documentation: str, labelnames: Sequence[str] = (),
+                 buckets: Sequence[float] = DEFAULT_BUCKETS):
+        super().__init__(name, documentation, labelnames)
+        self.buckets = tuple(sorted(buckets))
+        # لكل مجموعة labels: [عدادات الحدود..., +Inf], المجموع
+        self._series: Dict[Tuple, Tuple[List[int], List[float]]] = {}
+
+    def observe(self, value: float, **labels):
+        key = self._key(labels)
+        index = bisect.bisect_left(self.buckets, value)
+        with self._lock:
+            counts, total = self._series.setdefault(key, ([0] * (len(self.buckets) + 1), [0.0]))
+            counts[index] += 1
+            total[0] += value
+
+    def render(self, const: Sequence[Tuple[str, str]] = ()) -> List[str]:
+        lines = super().render()
+        with self._lock:
+            series = sorted((key, list(counts), total[0]) for key, (counts, total) in self._series.items())
+        for key, counts, total in series:
+            cumulative = 0
+            for bound, count in zip(self.buckets + (float("inf"),), counts):
+                cumulative += count
+                lines.append("{}_bucket{} {}".format(
+                    self.name, _format_labels(self.labelnames, key, ("le", _format_value(bound)), const), cumulative
+                ))
+            labels = _format_labels(self.labelnames, key, const=const)
+            lines.append("{}_sum{} {}".format(self.name, labels, _format_value(total)))
+            lines.append("{}_count{} {}".format(self.name, labels, cumulative))
+        return lines
+
+
+class MetricsRegistry:
+    """
+    سجل المقاييس وعرضها بصيغة Prometheus النصية (text/plain; version=0.0.4)
+
+    السجل داخل الـ process: مع عدة workers في gunicorn كل /metrics يرجع أرقام الـ worker الذي أجاب،
+    لذلك كل سطر يحمل label ثابت pid (التجميع في Prometheus: sum without (pid))
+    """
+
+    CONTENT_TYPE = "text/plain; version=0.0.4; charset=utf-8"
+
+    def __init__(self):
+        self._metrics: Dict[str, _Metric] = {}
+        self._lock = threading.Lock()
+
+    def _register(self, metric: _Metric) -> _Metric:
+        with self._lock:
+            existing = self._metrics.get(metric.name)
+            if existing is not None:
+                return existing
+            self._metrics[metric.name] = metric
+            return metric
+
+    def counter(self, name: str, documentation: str, labelnames: Sequence[str] = ()) -> Counter:
+        return self._register(Counter(name, documentation, labelnames))
+
+    def gauge(self, name: str, documentation: str, labelnames: Sequence[str] = ()) -> Gauge:
+        return self._register(Gauge(name, documentation, labelnames))
+
+    def histogram(self, name: str, documentation: str, labelnames: Sequence[str] = (),
+                  buckets: Sequence[float] = DEFAULT_BUCKETS) -> Histogram:
+        return self._register(Histogram(name, documentation, labelnames, buckets))
+
+    def render(self) -> str:
+        with self._lock:
+            metrics = list(self._metrics.values())
+        # pid وقت العرض (بعد الـ fork) لا وقت الاستيراد
+        const = (("pid", str(os.getpid())),)
+        lines = []
+        for metric in metrics:
+            lines.extend(metric.render(const))
+        return "\n".join(lines) + "\n"
+
+
+# سجل واحد للعملية (كل الخدمات و app.py تكتب فيه)
+REGISTRY = MetricsRegistry()
+
+PHASE_SECONDS = REGISTRY.histogram(
+    "contract_search_phase_seconds", "Duration of traced search phases (spans)", ["phase"]
+)
+GEMINI_CALLS = REGISTRY.counter(
+    "gemini_calls_total", "Gemini generate_content calls by kind and outcome", ["kind", "outcome"]
+)
+GEMINI_OVERLOAD_ERRORS = REGISTRY.counter(
+    "gemini_overload_errors_total", "Gemini 429/503 responses", ["code"]
+)
+GEMINI_RETRIES = REGISTRY.counter(
+    "gemini_retries_total", "Gemini calls retried after an overload error"
+)
+GEMINI_TOKENS = REGISTRY.counter(
+    "gemini_tokens_total", "Tokens reported by usage_metadata", ["kind", "direction"]
+)
+GEMINI_IN_FLIGHT = REGISTRY.gauge(
+    "gemini_in_flight_calls", "Gemini calls currently holding a gateway concurrency slot"
+)
+GEMINI_CONCURRENCY_LIMIT = REGISTRY.gauge(
+    "gemini_concurrency_limit", "Current adaptive (AIMD) concurrency limit of the gateway"
+)
+SEARCHES_IN_FLIGHT = REGISTRY.gauge(
+    "contract_searches_in_flight", "search_chunks calls currently running"
+)
+HTTP_REQUEST_SECONDS = REGISTRY.histogram(
+    "http_request_duration_seconds", "API request latency by route, method and status", ["endpoint", "method", "status"]
+)
+HTTP_IN_FLIGHT = REGISTRY.gauge(
+    "http_requests_in_flight", "API requests currently being handled"
+)
@@ -0,0 +1,157 @@
+import zlib
+from collections import defaultdict
+from typing import Dict, List, Set, Tuple
+
+from services.arabic_normalizer import normalize_arabic
+
+
+# احتمال أدنى أن يصبح زوج تشابهه = العتبة مرشحاً (يحدد عدد الـ bands والـ rows)
+_CANDIDATE_RECALL = 0.99
+_MAX_HASH = 0xFFFFFFFF
+
+
+def _merge_sources(target: Dict, source: Dict):
+    """دمج مصادر الاسترجاع (phase / clause_id) بدون تكرار"""
+    merged = target.setdefault("sources", [])
+    for item in source.get("sources", []):
+        if item not in merged:
+            merged.append(item)
+
+
+def choose_bands(signature_size: int, threshold: float, recall: float = _CANDIDATE_RECALL) -> Tuple[int, int]:
+    """
+    عدد الـ bands والـ rows لـ LSH banding
+
+    زوج تشابهه s يصبح مرشحاً باحتمال 1 - (1 - s^rows)^bands. نختار أكبر rows (أقل مرشحين زائفين)
+    بحيث يبقى هذا الاحتمال عند العتبة >= recall
+
+    Returns:
+        (bands, rows)
+    """
+    for rows in range(signature_size, 0, -1):
+        bands = signature_size // rows
+        if 1 - (1 - threshold ** rows) ** bands >= recall:
+            return bands, rows
+    return signature_size, 1
+
+
+class NearDuplicateMerger:
+    """
+    دمج الـ chunks المتقاربة (overlapping windows / فروق بسيطة) باستخدام MinHash + LSH
+
+    - shingles حرفية بطول shingle_size على النص المُطبّع (hash واحد لكل shingle)
+    - signature بطول sketch_size بأسلوب one-permutation: كل hash يذهب لـ bin، ويُحفظ أصغرها لكل bin
+      (الـ bins الفارغة في النصوص القصيرة تُملأ من أقرب bin غير فارغ)
+    - LSH banding: الـ bands والـ rows محسوبة من العتبة (choose_bands) لتوليد المرشحين،
+      ثم التحقق بتشابه Jaccard الفعلي على الـ shingles
+    - المقارنة دائماً مع signature و shingles الممثل الأصلية، فلا تنجرف المجموعة مع انضمام أعضاء جدد
+    - يُحتفظ بالـ chunk الأعلى score كممثل، وتُدمج مصادر الاسترجاع (sources) لكل المجموعة
+    """
+
+    def __init__(self, threshold: float = 0.8, shingle_size: int = 5, sketch_size: int = 64):
+        self.threshold = threshold
+        self.shingle_size = shingle_size
+        self.sketch_size = sketch_size
+        self.bands, self.rows = choose_bands(sketch_size, min(threshold, 0.999))
+
+    def shingles(self, text: str) -> Set[int]:
+        """hashes الـ shingles الحرفية للنص المُطبّع"""
+        normalized = normalize_arabic(text)
+        size = self.shingle_size
+        if len(normalized) <= size:
+            pieces = {normalized}
+        else:
+            pieces = {normalized[i:i + size] for i in range(len(normalized) - size + 1)}
+        return {zlib.crc32(piece.encode("utf-8")) for piece in pieces}
+
+    def signature(self, hashes: Set[int]) -> List[int]:
+        """one-permutation MinHash signature بطول sketch_size"""
+        k = self.sketch_size
+        bins: List[int] = [-1] * k
+        for value in hashes:
+            idx = value % k
+            if bins[idx] < 0 or value < bins[idx]:
+                bins[idx] = value
+        if all(value < 0 for value in bins):
+            return bins
+
+        # densification: الـ bin الفارغ يأخذ قيمة أقرب bin غير فارغ على يمينه مع إزاحة بالمسافة
+        # (نفس القاعدة للنصين، فالـ bins المتطابقة تبقى متطابقة)
+        signature = list(bins)
+        for idx in range(k):
+            if bins[idx] >= 0:
+                continue
+            distance = 1
+            while bins[(idx + distance) % k] < 0:
+                distance += 1
+            signature[idx] = (bins[(idx + distance) % k] + distance * 0x9E3779B1) & _MAX_HASH
+        return signature
+
+    def band_keys(self, signature: List[int]) -> List[Tuple]:
+        rows = self.rows
+        return [(band,) + tuple(signature[band * rows:(band + 1) * rows]) for band in range(self.bands)]
+
+    @staticmethod
+    def similarity(a: Set[int], b: Set[int]) -> float:
+        """تشابه Jaccard على الـ shingles"""
+        if not a or not b:
+            return 0.0
+        shared = len(a & b)
+        return shared / (len(a) + len(b) - shared)
+
+    def merge(self, chunks: List[Dict]) -> List[Dict]:
+        """
+        دمج التكرارات المتقاربة مع الحفاظ على ترتيب أول ظهور لكل مجموعة
+
+        Args:
+            chunks: الـ chunks بترتيب الأولوية (العامة ثم الحساسة)
+
+        Returns:
+            List[Dict]: ممثل واحد لكل مجموعة متقاربة
+        """
+        representatives: List[Dict] = []
+        # shingles الممثل الأصلية (أول chunk في المجموعة) - لا تتغير بانضمام الأعضاء
+        rep_shingles: List[Set[int]] = []
+        exact: Dict[str, int] = {}
+        buckets: Dict[Tuple, List[int]] = defaultdict(list)
+
+        for chunk in chunks:
+            text = chunk.get("chunk_text", "")
+            key = normalize_arabic(text).strip()
+            if not key:
+                continue
+
+            match = exact.get(key)
+            shingles: Set[int] = set()
+
+            if match is None and self.threshold < 1.0:
+                shingles = self.shingles(text)
+                keys = self.band_keys(self.signature(shingles))
+                candidates = {rep_idx for band_key in keys for rep_idx in buckets.get(band_key, ())}
+                best_similarity = 0.0
+                for rep_idx in sorted(candidates):
+                    similarity = self.similarity(shingles, rep_shingles[rep_idx])
+                    if similarity >= self.threshold and similarity > best_similarity:
+                        match, best_similarity = rep_idx, similarity
+
+            if match is None:
+                rep = dict(chunk)
+                rep["sources"] = list(chunk.get("sources", []))
+                representatives.append(rep)
+                rep_idx = len(representatives) - 1
+                exact[key] = rep_idx
+                rep_shingles.append(shingles)
+                if shingles:
+                    for band_key in keys:
+                        buckets[band_key].append(rep_idx)
+                continue
+
+            # دمج في المجموعة: الممثل هو الأعلى score مع الاحتفاظ بموقع المجموعة
+            rep = representatives[match]
+            _merge_sources(rep, chunk)
+            if chunk.get("score", 0.0) > rep.get("score", 0.0):
+                for field in ("chunk_text", "score", "uri", "title"):
+                    rep[field] = chunk.get(field)
+            exact[key] = match
+
+        return representatives
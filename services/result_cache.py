@@ -0,0 +1,198 @@
+import hashlib
+import json
+import sqlite3
+import threading
+import time
+from pathlib import Path
+from typing import List, Dict, Optional, Tuple
+
+from services.arabic_normalizer import normalize_arabic
+
+
+class ResultCache:
+    """
+    كاش دائم (SQLite) لنتائج search_chunks مفهرس حسب محتوى العقد
+
+    المفتاح = hash للنص المُطبّع + اسم النموذج + معرف الـ Store + top_k + hash الـ prompts
+    + بصمة الإعدادات المؤثرة على النتيجة
+    لذلك أي تغيير في الإعدادات يُنتج مفتاحاً جديداً تلقائياً
+
+    يدعم:
+    - انتهاء الصلاحية (TTL)
+    - الإخلاء حسب الحجم بأسلوب LRU (عدد المدخلات وإجمالي البايتات)
+    - عدادات hit/miss لعرضها في /cache-stats (في نفس ملف SQLite، فهي مجموع كل workers الخادم)
+    """
+
+    def __init__(self, db_path: str, ttl_seconds: int, max_entries: int, max_bytes: int):
+        self.db_path = db_path
+        self.ttl_seconds = ttl_seconds
+        self.max_entries = max_entries
+        self.max_bytes = max_bytes
+
+        # sqlite3 connection مشترك بين threads الـ Flask، والـ lock يضمن التسلسل
+        self._lock = threading.Lock()
+
+        Path(db_path).parent.mkdir(parents=True, exist_ok=True)
+        self._conn = sqlite3.connect(db_path, check_same_thread=False)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute(
+            """CREATE TABLE IF NOT EXISTS results (
+                key TEXT PRIMARY KEY,
+                value TEXT NOT NULL,
+                size INTEGER NOT NULL,
+                created_at REAL NOT NULL,
+                last_access REAL NOT NULL
+            )"""
+        )
+        self._conn.execute("CREATE INDEX IF NOT EXISTS idx_results_last_access ON results(last_access)")
+        self._conn.execute(
+            """CREATE TABLE IF NOT EXISTS counters (
+                name TEXT PRIMARY KEY,
+                value INTEGER NOT NULL
+            )"""
+        )
+        self._conn.commit()
+
+        print("[INFO] Result cache ready: {} (ttl={}s, max_entries={})".format(
+            db_path, ttl_seconds, max_entries
+        ))
+
+    def _count(self, name: str, amount: int = 1):
+        """زيادة عداد مشترك - يُستدعى داخل الـ lock وقبل الـ commit"""
+        if amount:
+            self._conn.execute(
+                """INSERT INTO counters (name, value) VALUES (?, ?)
+                   ON CONFLICT(name) DO UPDATE SET value = value + excluded.value""",
+                (name, amount)
+            )
+
+    @staticmethod
+    def normalize_contract_text(contract_text: str) -> str:
+        """تطبيع نص العقد قبل الـ hash (التطبيع العربي الكامل + المسافات)"""
+        return normalize_arabic(contract_text).strip()
+
+    @classmethod
+    def make_key(cls, contract_text: str, model_name: str, store_id: str, top_k: int,
+                 prompt_templates: List[str], settings: Optional[Dict] = None) -> str:
+        """
+        بناء مفتاح الكاش من محتوى العقد وكل الإعدادات المؤثرة على النتيجة
+
+        settings: بصمة إعدادات الخدمة التي تغيّر النتيجة (حد البحث المعمّق، عتبة الدمج...)
+        فتغيير أي منها لا يعيد نتائج محفوظة بالإعدادات السابقة
+        """
+        prompts_hash = hashlib.sha256(
+            "\x00".join(prompt_templates).encode("utf-8")
+        ).hexdigest()
+        settings_hash = hashlib.sha256(
+            json.dumps(settings or {}, sort_keys=True).encode("utf-8")
+        ).hexdigest()
+
+        material = "\x00".join([
+            cls.normalize_contract_text(contract_text),
+            model_name or "",
+            store_id or "",
+            str(top_k),
+            prompts_hash,
+            settings_hash
+        ])
+        return hashlib.sha256(material.encode("utf-8")).hexdigest()
+
+    def get(self, key: str) -> Optional[Tuple[List[Dict], List[Dict]]]:
+        """
+        قراءة نتيجة من الكاش
+
+        Returns:
+            (chunks, extracted_terms) أو None إذا لم توجد أو انتهت صلاحيتها
+        """
+        now = time.time()
+
+        with self._lock:
+            row = self._conn.execute(
+                "SELECT value, created_at FROM results WHERE key = ?", (key,)
+            ).fetchone()
+
+            if row is None:
+                self._count("misses")
+                self._conn.commit()
+                return None
+
+            value, created_at = row
+            if self.ttl_seconds > 0 and now - created_at > self.ttl_seconds:
+                self._conn.execute("DELETE FROM results WHERE key = ?", (key,))
+                self._count("misses")
+                self._conn.commit()
+                return None
+
+            self._conn.execute("UPDATE results SET last_access = ? WHERE key = ?", (now, key))
+            self._count("hits")
+            self._conn.commit()
+
+        data = json.loads(value)
+        return data["chunks"], data["extracted_terms"]
+
+    def set(self, key: str, chunks: List[Dict], extracted_terms: List[Dict]):
+        """حفظ نتيجة في الكاش ثم إخلاء الأقدم استخداماً إذا تجاوزنا الحدود"""
+        value = json.dumps({"chunks": chunks, "extracted_terms": extracted_terms}, ensure_ascii=False)
+        size = len(value.encode("utf-8"))
+        now = time.time()
+
+        with self._lock:
+            self._conn.execute(
+                "INSERT OR REPLACE INTO results (key, value, size, created_at, last_access) VALUES (?, ?, ?, ?, ?)",
+                (key, value, size, now, now)
+            )
+            self._evict()
+            self._conn.commit()
+
+    def _evict(self):
+        """إخلاء المدخلات المنتهية ثم الأقدم استخداماً (LRU) حتى نعود تحت الحدود - يُستدعى داخل الـ lock"""
+        if self.ttl_seconds > 0:
+            cursor = self._conn.execute(
+                "DELETE FROM results WHERE created_at < ?", (time.time() - self.ttl_seconds,)
+            )
+            self._count("evictions", cursor.rowcount)
+
+        count, total_bytes = self._conn.execute(
+            "SELECT COUNT(*), COALESCE(SUM(size), 0) FROM results"
+        ).fetchone()
+
+        while count > 0 and (
+            (self.max_entries > 0 and count > self.max_entries) or
+            (self.max_bytes > 0 and total_bytes > self.max_bytes)
+        ):
+            key, size = self._conn.execute(
+                "SELECT key, size FROM results ORDER BY last_access ASC LIMIT 1"
+            ).fetchone()
+            self._conn.execute("DELETE FROM results WHERE key = ?", (key,))
+            count -= 1
+            total_bytes -= size
+            self._count("evictions")
+
+    def clear(self):
+        """حذف كل المدخلات (مثلاً بعد تغيير محتوى الـ Store)"""
+        with self._lock:
+            self._conn.execute("DELETE FROM results")
+            self._conn.commit()
+
+    def stats(self) -> Dict:
+        """إحصائيات الكاش لعرضها في الـ API"""
+        with self._lock:
+            count, total_bytes = self._conn.execute(
+                "SELECT COUNT(*), COALESCE(SUM(size), 0) FROM results"
+            ).fetchone()
+            counters = dict(self._conn.execute("SELECT name, value FROM counters").fetchall())
+
+        hits = counters.get("hits", 0)
+        misses = counters.get("misses", 0)
+        lookups = hits + misses
+        return {
+            "entries": count,
+            "bytes": total_bytes,
+            "hits": hits,
+            "misses": misses,
+            "evictions": counters.get("evictions", 0),
+            "hit_rate": round(hits / lookups, 4) if lookups else 0.0,
+            "ttl_seconds": self.ttl_seconds,
+            "max_entries": self.max_entries,
+            "max_bytes": self.max_bytes
+        }
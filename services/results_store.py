@@ -0,0 +1,311 @@
+import json
+import sqlite3
+import threading
+import time
+import uuid
+import zlib
+from datetime import datetime
+from pathlib import Path
+from typing import Dict, Iterable, List, Optional
+
+from services.history_index import HistoryIndex, unit_text, make_snippet
+
+
+class ResultsStore:
+    """
+    سجل التحليلات المحفوظة (SQLite) بدل ملف JSON لكل تحليل في results/
+
+    - جدول analyses: ملخص صغير لكل تحليل (التاريخ، الأعداد، معرفات البنود، بداية العقد)
+      يكفي لعرض السجل والعدادات بدون قراءة الـ chunks
+    - جدول payloads: النتيجة الكاملة مضغوطة (zlib) تُقرأ فقط عند فتح تحليل بعينه
+    - السجل يُقرأ بصفحات (limit/offset) مرتبة من الأحدث
+    - فهرس بحث نصي (HistoryIndex) يُحدّث مع كل حفظ في نفس الـ transaction
+    """
+
+    def __init__(self, db_path: str):
+        self.db_path = db_path
+
+        # sqlite3 connection مشترك بين threads الـ Flask، والـ lock يضمن التسلسل
+        self._lock = threading.Lock()
+
+        Path(db_path).parent.mkdir(parents=True, exist_ok=True)
+        self._conn = sqlite3.connect(db_path, check_same_thread=False)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute(
+            """CREATE TABLE IF NOT EXISTS analyses (
+                id TEXT PRIMARY KEY,
+                created_at REAL NOT NULL,
+                source TEXT NOT NULL,
+                contract_length INTEGER NOT NULL,
+                contract_preview TEXT NOT NULL,
+                total_terms INTEGER NOT NULL,
+                total_chunks INTEGER NOT NULL,
+                top_k INTEGER,
+                partial INTEGER NOT NULL DEFAULT 0,
+                term_ids TEXT NOT NULL,
+                payload_size INTEGER NOT NULL
+            )"""
+        )
+        self._conn.execute("CREATE INDEX IF NOT EXISTS idx_analyses_created_at ON analyses(created_at)")
+        self._conn.execute(
+            """CREATE TABLE IF NOT EXISTS payloads (
+                id TEXT PRIMARY KEY,
+                data BLOB NOT NULL
+            )"""
+        )
+        self._conn.commit()
+        self._index = HistoryIndex(self._conn)
+        self._reindex_stale()
+
+        print("[INFO] Results store ready: {}".format(db_path))
+
+    def _load_payload(self, analysis_id: str) -> Optional[Dict]:
+        row = self._conn.execute("SELECT data FROM payloads WHERE id = ?", (analysis_id,)).fetchone()
+        return json.loads(zlib.decompress(row[0]).decode("utf-8")) if row else None
+
+    def _reindex_stale(self):
+        """فهرسة التحليلات المحفوظة قبل وجود الفهرس (أو بإصدار تطبيع أقدم)"""
+        with self._lock:
+            stale = self._index.stale_ids()
+            if not stale:
+                return
+            started = time.monotonic()
+            with self._conn:
+                for analysis_id in stale:
+                    payload = self._load_payload(analysis_id)
+                    if payload is not None:
+                        self._index.add(analysis_id, payload)
+        print("[INFO] Indexed {} saved analyses for search in {:.2f}s".format(len(stale), time.monotonic() - started))
+
+    @staticmethod
+    def new_id(created_at: float) -> str:
+        """معرف بنفس نمط ملفات results/ القديمة (analysis_YYYYMMDD_HHMMSS) مع لاحقة تمنع التصادم"""
+        return "analysis_{}_{}".format(
+            datetime.fromtimestamp(created_at).strftime("%Y%m%d_%H%M%S"), uuid.uuid4().hex[:6]
+        )
+
+    @staticmethod
+    def _summary_row(row) -> Dict:
+        (analysis_id, created_at, source, contract_length, preview, total_terms,
+         total_chunks, top_k, partial, term_ids, payload_size) = row
+        return {
+            "analysis_id": analysis_id,
+            "created_at": created_at,
+            "timestamp": datetime.fromtimestamp(created_at).strftime("%Y%m%d_%H%M%S"),
+            "source": source,
+            "contract_length": contract_length,
+            "contract_preview": preview,
+            "total_terms": total_terms,
+            "total_chunks": total_chunks,
+            "top_k": top_k,
+            "partial": bool(partial),
+            "term_ids": json.loads(term_ids),
+            "payload_size": payload_size
+        }
+
+    _SUMMARY_COLUMNS = (
+        "id, created_at, source, contract_length, contract_preview, total_terms, "
+        "total_chunks, top_k, partial, term_ids, payload_size"
+    )
+
+    def save(self, result: Dict, contract_text: str, source: str = "api",
+             analysis_id: Optional[str] = None, created_at: Optional[float] = None,
+             contract_length: Optional[int] = None) -> Dict:
+        """
+        حفظ تحليل: الملخص في analyses والنتيجة الكاملة في payloads (في transaction واحدة)
+
+        Args:
+            result: استجابة /file_search (extracted_terms, chunks, usage, partial...)
+            contract_text: نص العقد
+            source: مصدر التحليل (api | job | import)
+            analysis_id: معرف محدد (للاستيراد)، وإلا يُولّد
+            created_at: وقت التحليل (للاستيراد)، وإلا الآن
+            contract_length: طول العقد إذا لم يُحفظ نصه (للاستيراد)
+
+        Returns:
+            Dict: ملخص التحليل المحفوظ (مع analysis_id)
+        """
+        created_at = created_at or time.time()
+        analysis_id = analysis_id or self.new_id(created_at)
+        terms = result.get("extracted_terms") or []
+        chunks = result.get("chunks") or []
+
+        payload = dict(result)
+        payload["contract_text"] = contract_text
+        data = zlib.compress(json.dumps(payload, ensure_ascii=False).encode("utf-8"))
+
+        row = (
+            analysis_id, created_at, source,
+            len(contract_text) if contract_length is None else contract_length,
+            " ".join(contract_text[:200].split()),
+            len(terms), result.get("total_chunks", len(chunks)), result.get("top_k"),
+            1 if result.get("partial") else 0,
+            json.dumps([t.get("term_id") for t in terms if t.get("term_id")], ensure_ascii=False),
+            len(data)
+        )
+        with self._lock:
+            with self._conn:
+                self._conn.execute(
+                    "INSERT OR REPLACE INTO analyses ({}) VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)".format(
+                        self._SUMMARY_COLUMNS
+                    ),
+                    row
+                )
+                self._conn.execute("INSERT OR REPLACE INTO payloads (id, data) VALUES (?, ?)", (analysis_id, data))
+                self._index.add(analysis_id, payload)
+        return self._summary_row(row)
+
+    def list(self, limit: int = 10, offset: int = 0) -> Dict:
+        """
+        صفحة من السجل (الأحدث أولاً) - ملخصات فقط بدون chunks
+
+        Returns:
+            Dict: items, total, limit, offset, next_offset (None في آخر صفحة)
+        """
+        limit = max(1, min(limit, 100))
+        offset = max(0, offset)
+        with self._lock:
+            total = self._conn.execute("SELECT COUNT(*) FROM analyses").fetchone()[0]
+            rows = self._conn.execute(
+                "SELECT {} FROM analyses ORDER BY created_at DESC, id DESC LIMIT ? OFFSET ?".format(
+                    self._SUMMARY_COLUMNS
+                ),
+                (limit, offset)
+            ).fetchall()
+        next_offset = offset + len(rows)
+        return {
+            "items": [self._summary_row(row) for row in rows],
+            "total": total,
+            "limit": limit,
+            "offset": offset,
+            "next_offset": next_offset if next_offset < total else None
+        }
+
+    def get(self, analysis_id: str) -> Optional[Dict]:
+        """النتيجة الكاملة لتحليل واحد (تُفك من payloads عند الطلب فقط)"""
+        with self._lock:
+            summary = self._conn.execute(
+                "SELECT {} FROM analyses WHERE id = ?".format(self._SUMMARY_COLUMNS), (analysis_id,)
+            ).fetchone()
+            result = self._load_payload(analysis_id)
+        if summary is None or result is None:
+            return None
+        result.update(self._summary_row(summary))
+        return result
+
+    def summaries(self, analysis_ids: List[str]) -> List[Dict]:
+        """ملخصات عدة تحليلات بالترتيب المطلوب (المعرفات غير الموجودة تُتجاهل)"""
+        if not analysis_ids:
+            return []
+        placeholders = ",".join("?" * len(analysis_ids))
+        with self._lock:
+            rows = self._conn.execute(
+                "SELECT {} FROM analyses WHERE id IN ({})".format(self._SUMMARY_COLUMNS, placeholders),
+                list(analysis_ids)
+            ).fetchall()
+        by_id = {row[0]: self._summary_row(row) for row in rows}
+        return [by_id[analysis_id] for analysis_id in analysis_ids if analysis_id in by_id]
+
+    def search(self, query: str, clause_id: Optional[str] = None, fields: Optional[Iterable[str]] = None,
+               limit: int = 10, offset: int = 0, max_matches: int = 3) -> Dict:
+        """
+        بحث نصي في كل التحليلات المحفوظة (البنود، الإشكالات، نص الـ chunks)
+
+        Args:
+            query: نص البحث (كل كلماته يجب أن تظهر في نفس البند/الـ chunk)
+            clause_id: قصر البحث على بند (مثل البحث في الـ chunks التي استرجعها هذا البند فقط)
+            fields: terms | issues | chunks (افتراضياً كلها)
+            limit, offset: صفحة النتائج
+            max_matches: عدد المقاطع المطابقة المعروضة لكل تحليل
+
+        Returns:
+            Dict: items (ملخص + matches مع snippet)، total، next_offset، took_ms
+        """
+        started = time.monotonic()
+        limit = max(1, min(limit, 100))
+        offset = max(0, offset)
+        with self._lock:
+            tokens, hits = self._index.search(query, clause_id=clause_id, fields=fields)
+            page = hits[offset:offset + limit]
+            # المقاطع من payloads الصفحة المعروضة فقط
+            payloads = {analysis_id: self._load_payload(analysis_id) for analysis_id, _, _ in page}
+
+        summaries = {item["analysis_id"]: item for item in self.summaries([analysis_id for analysis_id, _, _ in page])}
+        token_set = set(tokens)
+        items = []
+        for analysis_id, score, matches in page:
+            if analysis_id not in summaries:
+                continue
+            payload = payloads.get(analysis_id) or {}
+            terms = payload.get("extracted_terms") or []
+            item = dict(summaries[analysis_id])
+            item["score"] = round(score, 4)
+            item["match_count"] = len(matches)
+            item["matches"] = []
+            for field, position, match_score in matches[:max_matches]:
+                match = {"field": field, "position": position, "score": round(match_score, 4)}
+                if field in ("terms", "issues") and position < len(terms):
+                    match["term_id"] = terms[position].get("term_id")
+                match["snippet"] = make_snippet(unit_text(payload, field, position), token_set)
+                item["matches"].append(match)
+            items.append(item)
+
+        next_offset = offset + len(page)
+        return {
+            "query": query,
+            "clause_id": clause_id,
+            "tokens": tokens,
+            "items": items,
+            "total": len(hits),
+            "limit": limit,
+            "offset": offset,
+            "next_offset": next_offset if next_offset < len(hits) else None,
+            "took_ms": round((time.monotonic() - started) * 1000, 2)
+        }
+
+    def count(self) -> int:
+        with self._lock:
+            return self._conn.execute("SELECT COUNT(*) FROM analyses").fetchone()[0]
+
+    def import_json_dir(self, results_dir: str) -> int:
+        """
+        استيراد ملفات results/analysis_*.json القديمة (مرة واحدة: الملفات المستوردة سابقاً تُتخطى)
+
+        Returns:
+            int: عدد الملفات المستوردة
+        """
+        paths = sorted(Path(results_dir).glob("analysis_*.json"))
+        if not paths:
+            return 0
+        with self._lock:
+            existing = {row[0] for row in self._conn.execute("SELECT id FROM analyses WHERE source = 'import'")}
+
+        imported = 0
+        for path in paths:
+            if path.stem in existing:
+                continue
+            try:
+                with open(path, "r", encoding="utf-8") as f:
+                    data = json.load(f)
+                created_at = datetime.strptime(data.get("timestamp", ""), "%Y%m%d_%H%M%S").timestamp()
+            except (OSError, ValueError) as e:
+                print("[WARNING] Skipping legacy result {}: {}".format(path.name, e))
+                continue
+            # الملفات القديمة لا تحفظ نص العقد (طوله فقط)
+            self.save(
+                data, "", source="import", analysis_id=path.stem, created_at=created_at,
+                contract_length=int(data.get("contract_length", 0))
+            )
+            imported += 1
+
+        if imported:
+            print("[INFO] Imported {} legacy result file(s) from {}/".format(imported, results_dir))
+        return imported
+
+    def stats(self) -> Dict:
+        with self._lock:
+            count, payload_bytes = self._conn.execute(
+                "SELECT COUNT(*), COALESCE(SUM(payload_size), 0) FROM analyses"
+            ).fetchone()
+            index_stats = self._index.stats()
+        return {"analyses": count, "payload_bytes": payload_bytes, "path": self.db_path, "search_index": index_stats}
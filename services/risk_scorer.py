@@ -0,0 +1,109 @@
+import re
+from typing import Dict, List, Tuple
+
+from services.arabic_normalizer import normalize_arabic
+from services.local_retrieval import tokenize_arabic
+
+
+# أوزان فئات المحاذير الشرعية: الربا أخطر من الغرر والجهالة، وهما أخطر من الشروط العامة
+CATEGORY_WEIGHTS = {
+    "riba": 1.0,
+    "gharar": 0.8,
+    "unjust_condition": 0.6,
+    "general": 0.3
+}
+
+# المصطلحات كما في قائمة potential_issues في EXTRACT_KEY_TERMS_PROMPT (وما يشبهها)
+_ISSUE_CATEGORIES = {
+    "riba": [
+        "الربا", "فائدة التأخير", "التعويض غير المشروع", "الزيادة على الدين", "الفائدة"
+    ],
+    "gharar": [
+        "الغرر", "الجهالة", "الغموض", "تحمل المخاطر", "انتقال الملكية"
+    ],
+    "unjust_condition": [
+        "الشرط الباطل", "الشرط الجائر", "الظلم", "الإكراه", "الضرر", "الوعد الملزم",
+        "الشرط الجزائي", "الهبة المعلقة"
+    ]
+}
+
+
+# أرقام النِسب والغرامات في نص البند (0.1%، 2 بالمئة، غرامة 500 ريال يومياً...)
+# الأنماط تُطبّق على نص مُطبّع، فتُبنى كلماتها بـ normalize_arabic (المائة → المايه، فائدة → فايده)
+def _alternation(words: List[str]) -> str:
+    return "|".join(r"\s*".join(map(re.escape, normalize_arabic(word).split())) for word in words)
+
+
+_PERCENT_RE = re.compile(
+    r"\d+(?:[.,]\d+)?\s*(?:%|٪|{})".format(_alternation(["في المائة", "في المئة", "بالمائة", "بالمئة"]))
+)
+_PENALTY_RE = re.compile(
+    r"(?:{})[^.\n]{{0,40}}?\d+|\d+[^.\n]{{0,25}}?(?:{})".format(
+        _alternation(["غرامة", "تعويض", "جزاء", "فائدة", "زيادة"]),
+        _alternation(["يومياً", "شهرياً", "عن كل يوم"])
+    )
+)
+
+
+class ClauseRiskScorer:
+    """
+    تقييم محلي سريع (بدون استدعاء نموذج) لخطورة البند الحساس
+
+    score = وزن أخطر فئة مطابقة
+          + 0.15 لكل مشكلة إضافية مطابقة (حتى 3)
+          + 0.5 لوجود نسبة مئوية و 0.5 لوجود غرامة/تعويض رقمي في term_text
+
+    يُستخدم لترتيب البحث المعمّق (الأخطر أولاً) ولتحديد ما يُستبعد عند الحد الأقصى أو المهلة
+    """
+
+    def __init__(self, category_weights: Dict[str, float] = None):
+        self.category_weights = dict(category_weights or CATEGORY_WEIGHTS)
+        self._issue_category = {
+            normalize_arabic(issue): category
+            for category, issues in _ISSUE_CATEGORIES.items()
+            for issue in issues
+        }
+        # نفس المصطلحات بدون ال التعريف والسوابق (الربا → ربا) للمطابقة الجزئية
+        self._issue_stems = [
+            (" {} ".format(" ".join(tokenize_arabic(issue))), category)
+            for category, issues in _ISSUE_CATEGORIES.items()
+            for issue in issues
+        ]
+
+    def _category(self, normalized_issue: str) -> str:
+        category = self._issue_category.get(normalized_issue)
+        if category:
+            return category
+        # مطابقة جزئية بكلمات كاملة لصيغ مثل "ربا النسيئة" أو "غرر فاحش"
+        stems = " {} ".format(" ".join(tokenize_arabic(normalized_issue)))
+        if not stems.strip():
+            return "general"
+        for term, term_category in self._issue_stems:
+            if term in stems or stems in term:
+                return term_category
+        return "general"
+
+    def score(self, clause: Dict) -> float:
+        """درجة خطورة البند (أعلى = أخطر)"""
+        issues = {normalize_arabic(issue).strip() for issue in clause.get("potential_issues", [])}
+        issues.discard("")
+        weights = sorted(
+            (self.category_weights.get(self._category(issue), 0.0) for issue in issues),
+            reverse=True
+        )
+
+        score = weights[0] if weights else 0.0
+        score += 0.15 * min(3, max(0, len(weights) - 1))
+
+        text = normalize_arabic(clause.get("term_text", ""))
+        if _PERCENT_RE.search(text):
+            score += 0.5
+        if _PENALTY_RE.search(text):
+            score += 0.5
+
+        return round(score, 4)
+
+    def rank(self, clauses: List[Dict]) -> List[Tuple[Dict, float]]:
+        """ترتيب البنود تنازلياً حسب الخطورة (ترتيب مستقر للبنود المتساوية)"""
+        scored = [(clause, self.score(clause)) for clause in clauses]
+        return sorted(scored, key=lambda item: -item[1])
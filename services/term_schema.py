@@ -0,0 +1,227 @@
+import json
+import re
+from typing import Dict, List, Optional, Tuple
+from google.genai import types
+from services.arabic_normalizer import normalize_arabic
+from services.json_stream import JsonArrayStreamParser
+
+
+def build_terms_schema() -> types.Schema:
+    """
+    Schema استجابة الاستخراج (response_schema): مصفوفة بنود بنفس حقول الـ prompt
+
+    النموذج يلتزم بالبنية مباشرة فلا نحتاج للبحث عن JSON داخل نص حر
+    """
+    return types.Schema(
+        type=types.Type.ARRAY,
+        items=types.Schema(
+            type=types.Type.OBJECT,
+            properties={
+                "term_id": types.Schema(type=types.Type.STRING),
+                "term_text": types.Schema(type=types.Type.STRING),
+                "potential_issues": types.Schema(
+                    type=types.Type.ARRAY,
+                    items=types.Schema(type=types.Type.STRING)
+                ),
+                "relevance_reason": types.Schema(type=types.Type.STRING)
+            },
+            required=["term_id", "term_text", "potential_issues"],
+            property_ordering=["term_id", "term_text", "potential_issues", "relevance_reason"]
+        )
+    )
+
+
+class ExtractedTerm:
+    """
+    بند مستخرج بعد التحقق من الأنواع
+
+    باقي الخدمة يتعامل مع البنود كـ dict، لذا التحويل يتم عند حدود الاستخراج فقط (to_dict)
+    """
+
+    _ID_RE = re.compile(r"\W+")
+
+    def __init__(self, term_id: str, term_text: str, potential_issues: List[str], relevance_reason: str = ""):
+        self.term_id = term_id
+        self.term_text = term_text
+        self.potential_issues = potential_issues
+        self.relevance_reason = relevance_reason
+
+    @staticmethod
+    def _text(value) -> str:
+        if value is None:
+            return ""
+        if isinstance(value, (list, tuple)):
+            value = " ".join(str(v) for v in value)
+        return str(value).strip()
+
+    @classmethod
+    def _issues(cls, value) -> List[str]:
+        # النموذج قد يرجع المشاكل كنص واحد مفصول بفواصل بدل قائمة
+        if isinstance(value, str):
+            value = re.split(r"[،,;\n]", value)
+        elif not isinstance(value, (list, tuple)):
+            value = []
+
+        issues = []
+        for issue in value:
+            issue = cls._text(issue)
+            if issue and issue not in issues:
+                issues.append(issue)
+        return issues
+
+    @classmethod
+    def from_raw(cls, raw, index: int = 0) -> Optional["ExtractedTerm"]:
+        """
+        بناء بند من كائن JSON خام، أو None إذا لم يكن قابلاً للاستخدام (بدون نص بند)
+
+        Args:
+            raw: الكائن كما أرجعه النموذج
+            index: ترتيب البند (لتوليد term_id عند غيابه)
+        """
+        if not isinstance(raw, dict):
+            return None
+
+        term_text = cls._text(raw.get("term_text"))
+        if not term_text:
+            return None
+
+        term_id = cls._ID_RE.sub("_", cls._text(raw.get("term_id"))).strip("_")
+        if not term_id:
+            term_id = "clause_{}".format(index + 1)
+
+        return cls(
+            term_id=term_id,
+            term_text=term_text,
+            potential_issues=cls._issues(raw.get("potential_issues")),
+            relevance_reason=cls._text(raw.get("relevance_reason"))
+        )
+
+    def to_dict(self) -> Dict:
+        return {
+            "term_id": self.term_id,
+            "term_text": self.term_text,
+            "potential_issues": list(self.potential_issues),
+            "relevance_reason": self.relevance_reason
+        }
+
+
+class TermValidator:
+    """
+    التحقق من البنود قبل وصولها للبحث: رفض البنود الفارغة والمكررة
+
+    - التكرار يُقاس على نص البند بعد التطبيع (تشكيل، همزات، مسافات)
+    - term_id المكرر لنص مختلف يُعطى لاحقة (_2, _3) حتى تبقى المعرفات فريدة
+    - يعمل بنداً بنداً، لذا يصلح للـ streaming وللاستجابة الكاملة
+    """
+
+    def __init__(self):
+        self._seen_texts = set()
+        self._seen_ids = set()
+        self._count = 0
+        self.rejected_empty = 0
+        self.rejected_duplicates = 0
+
+    def accept(self, raw) -> Optional[Dict]:
+        """إرجاع البند كـ dict نظيف، أو None إذا رُفض"""
+        term = ExtractedTerm.from_raw(raw, self._count)
+        if term is None:
+            self.rejected_empty += 1
+            return None
+
+        text_key = " ".join(normalize_arabic(term.term_text).split())
+        if text_key in self._seen_texts:
+            self.rejected_duplicates += 1
+            return None
+        self._seen_texts.add(text_key)
+
+        base_id, suffix = term.term_id, 2
+        while term.term_id in self._seen_ids:
+            term.term_id = "{}_{}".format(base_id, suffix)
+            suffix += 1
+        self._seen_ids.add(term.term_id)
+
+        self._count += 1
+        return term.to_dict()
+
+    @property
+    def rejected(self) -> int:
+        return self.rejected_empty + self.rejected_duplicates
+
+
+def parse_terms_json(text: str) -> Tuple[List, bool]:
+    """
+    تحليل استجابة الاستخراج مع إصلاح محلي للاستجابات المعطوبة
+
+    1. json.loads مباشرة (الحالة الطبيعية مع response_schema)
+    2. إصلاح: تجاهل أي نص قبل أول "[" (```json مثلاً)، وأخذ كل كائن مكتمل فقط،
+       فالاستجابة المقطوعة (max tokens) أو ذات الفاصلة الزائدة تعطي البنود السليمة
+
+    Returns:
+        (الكائنات الخام، هل احتاجت إلى إصلاح)
+    """
+    stripped = text.strip()
+    try:
+        value = json.loads(stripped)
+    except json.JSONDecodeError:
+        pass
+    else:
+        if isinstance(value, list):
+            return value, False
+        # كائن واحد أو {"terms": [...]}
+        if isinstance(value, dict):
+            for key in ("terms", "items", "clauses"):
+                if isinstance(value.get(key), list):
+                    return value[key], True
+            return [value], True
+
+    parser = JsonArrayStreamParser()
+    return parser.feed(stripped), True
+
+
+# أقل طول (بعد التطبيع) لاعتبار نص بند جزءاً مقطوعاً من بند أطول، وليس مجرد عبارة قصيرة مشتركة
+_MIN_CONTAINED_CHARS = 30
+
+
+def _same_clause(key: str, other: str) -> bool:
+    if key == other:
+        return True
+    shorter, longer = (key, other) if len(key) <= len(other) else (other, key)
+    return len(shorter) >= _MIN_CONTAINED_CHARS and shorter in longer
+
+
+def merge_terms(term_lists: List[List[Dict]]) -> List[Dict]:
+    """
+    دمج البنود المستخرجة من عدة نوافذ لنفس العقد (وضع العقود الطويلة)
+
+    البند الواقع في منطقة التداخل قد يُستخرج مرتين، أحياناً مقطوعاً في إحدى النافذتين:
+    إذا كان نص بند (بعد التطبيع) محتوى في نص بند آخر يُبقى الأطول مع جمع المشاكل الشرعية.
+    الترتيب يتبع أول ظهور في العقد، و term_id يُعاد ضمان تفرده عبر TermValidator.
+    """
+    merged: List[Dict] = []
+    keys: List[str] = []
+
+    for terms in term_lists:
+        for term in terms:
+            key = " ".join(normalize_arabic(term.get("term_text", "")).split())
+            if not key:
+                continue
+
+            match = next((i for i, existing in enumerate(keys) if _same_clause(key, existing)), None)
+            if match is None:
+                merged.append(dict(term))
+                keys.append(key)
+                continue
+
+            kept = merged[match]
+            issues = list(kept.get("potential_issues", []))
+            for issue in term.get("potential_issues", []):
+                if issue not in issues:
+                    issues.append(issue)
+            if len(key) > len(keys[match]):
+                kept = dict(term)
+                keys[match] = key
+            kept["potential_issues"] = issues
+            merged[match] = kept
+
+    validator = TermValidator()
+    return [term for term in (validator.accept(raw) for raw in merged) if term is not None]
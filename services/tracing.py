@@ -0,0 +1,135 @@
+import contextvars
+import itertools
+import threading
+import time
+from contextlib import contextmanager
+from typing import Callable, Dict, List, Optional
+
+from services.metrics import PHASE_SECONDS
+
+_current_trace: contextvars.ContextVar = contextvars.ContextVar("current_trace", default=None)
+_current_span: contextvars.ContextVar = contextvars.ContextVar("current_span", default=None)
+_span_ids = itertools.count(1)
+# طباعة سطر [TRACE] لكل span (معطلة افتراضياً: سطر لكل مرحلة ولكل بند تحت الحمل)
+_log_spans = False
+
+
+def set_trace_log(enabled: bool):
+    """تفعيل/تعطيل طباعة الـ spans (Config.TRACE_LOG)"""
+    global _log_spans
+    _log_spans = enabled
+
+
+class Span:
+    """مقطع زمني واحد (مرحلة) مع خصائصه: clause_id, top_k, retries, chunks, tokens..."""
+
+    def __init__(self, name: str, parent_id: Optional[int], attributes: Dict):
+        self.span_id = next(_span_ids)
+        self.parent_id = parent_id
+        self.name = name
+        self.attributes = dict(attributes)
+        self.started = time.monotonic()
+        self.duration: Optional[float] = None
+        self.error: Optional[str] = None
+
+    def set(self, **attributes):
+        self.attributes.update(attributes)
+
+    def increment(self, key: str, amount: int = 1):
+        self.attributes[key] = self.attributes.get(key, 0) + amount
+
+    def to_dict(self, origin: float) -> Dict:
+        data = {
+            "span_id": self.span_id,
+            "parent_id": self.parent_id,
+            "name": self.name,
+            "start_offset_seconds": round(self.started - origin, 4),
+            "duration_seconds": round(self.duration, 4) if self.duration is not None else None,
+            "attributes": self.attributes
+        }
+        if self.error:
+            data["error"] = self.error
+        return data
+
+
+class Trace:
+    """كل الـ spans لطلب search_chunks واحد (آمن للـ threads)"""
+
+    def __init__(self, name: str):
+        self.name = name
+        self.started = time.monotonic()
+        self._spans: List[Span] = []
+        self._lock = threading.Lock()
+
+    def add(self, span: Span):
+        with self._lock:
+            self._spans.append(span)
+
+    def to_list(self) -> List[Dict]:
+        with self._lock:
+            spans = list(self._spans)
+        return [span.to_dict(self.started) for span in sorted(spans, key=lambda s: s.started)]
+
+
+@contextmanager
+def start_trace(name: str):
+    """بدء trace جديد للطلب الحالي (الـ spans داخل هذا السياق تُجمع فيه)"""
+    trace = Trace(name)
+    token = _current_trace.set(trace)
+    try:
+        yield trace
+    finally:
+        _current_trace.reset(token)
+
+
+@contextmanager
+def span(name: str, **attributes):
+    """
+    قياس زمن مرحلة: يُسجّل في histogram المراحل وفي الـ trace الحالي (إن وجد)
+
+    الاستخدام:
+        with span("deep_search", clause_id=clause_id) as s:
+            ...
+            s.set(chunks=len(chunks))
+    """
+    parent = _current_span.get()
+    current = Span(name, parent.span_id if parent else None, attributes)
+    token = _current_span.set(current)
+    try:
+        yield current
+    except BaseException as e:
+        current.error = type(e).__name__
+        raise
+    finally:
+        _current_span.reset(token)
+        current.duration = time.monotonic() - current.started
+        PHASE_SECONDS.observe(current.duration, phase=name)
+        trace = _current_trace.get()
+        if trace is not None:
+            trace.add(current)
+        if not _log_spans:
+            return
+        details = " ".join("{}={}".format(key, value) for key, value in current.attributes.items())
+        print("[TRACE] {} {:.3f}s{}{}".format(
+            name, current.duration, " " + details if details else "",
+            " error={}".format(current.error) if current.error else ""
+        ))
+
+
+def current_span() -> Optional[Span]:
+    """الـ span المفتوح حالياً في هذا الـ thread/السياق (لإضافة خصائص من طبقات أعمق مثل البوابة)"""
+    return _current_span.get()
+
+
+def propagate(function: Callable) -> Callable:
+    """
+    تمرير سياق الـ trace إلى thread آخر (ThreadPoolExecutor لا ينقل contextvars تلقائياً)
+
+    يُستدعى عند الإرسال: executor.submit(propagate(fn), arg) - نسخة سياق جديدة لكل مهمة
+    """
+    context = contextvars.copy_context()
+
+    def run(*args, **kwargs):
+        return context.run(function, *args, **kwargs)
+
+    return run
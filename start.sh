@@ -1,21 +1,52 @@
-
 #!/bin/bash
 
 echo "Starting Gemini File Search System..."
 echo "======================================"
 
-# Start Flask API in the background
-echo "Starting Flask API on port 5001..."
-python app.py &
+# Start the API under gunicorn (multi-worker, graceful drain on SIGTERM - see gunicorn.conf.py)
+echo "Starting Flask API (gunicorn) on port 5001..."
+gunicorn -c gunicorn.conf.py wsgi:app &
 FLASK_PID=$!
 
-# Wait for Flask to be ready
+# SIGTERM to gunicorn: workers finish in-flight requests and running jobs before exiting
+shutdown() {
+    echo "Stopping services..."
+    kill -TERM $STREAMLIT_PID 2>/dev/null || true
+    kill -TERM $FLASK_PID 2>/dev/null || true
+    wait $FLASK_PID 2>/dev/null
+}
+trap 'shutdown; exit 0' TERM INT
+
+# Wait for Flask to be ready (/ready returns 200 once the store is verified)
 echo "Waiting for Flask API to be ready..."
-sleep 5
+READY_TIMEOUT=${READY_TIMEOUT:-120}
+READY=0
+for ((i = 0; i < READY_TIMEOUT; i++)); do
+    if python -c "import urllib.request; urllib.request.urlopen('http://127.0.0.1:5001/ready', timeout=2)" 2>/dev/null; then
+        echo "Flask API is ready"
+        READY=1
+        break
+    fi
+    if ! kill -0 $FLASK_PID 2>/dev/null; then
+        echo "Flask API exited during startup"
+        exit 1
+    fi
+    sleep 1
+done
+
+# Never start the frontend against an API that is not ready
+if [ "$READY" -ne 1 ]; then
+    echo "ERROR: Flask API was not ready after ${READY_TIMEOUT}s, stopping it"
+    kill -TERM $FLASK_PID 2>/dev/null || true
+    wait $FLASK_PID 2>/dev/null
+    exit 1
+fi
 
-# Start Streamlit
+# Start Streamlit (in the background so the trap above runs as soon as a signal arrives)
 echo "Starting Streamlit Frontend on port 5000..."
-streamlit run frontend.py --server.port=5000 --server.address=0.0.0.0 --server.headless=true
+streamlit run frontend.py --server.port=5000 --server.address=0.0.0.0 --server.headless=true &
+STREAMLIT_PID=$!
+wait $STREAMLIT_PID
 
-# If Streamlit exits, kill Flask
-kill $FLASK_PID 2>/dev/null || true
+# If Streamlit exits, stop Flask (draining in-flight analyses)
+shutdown
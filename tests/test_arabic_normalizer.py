@@ -0,0 +1,73 @@
+import pytest
+
+from services.arabic_normalizer import clean_arabic, fix_ocr, fold_arabic, normalize_arabic
+
+
+@pytest.mark.parametrize("text", [
+    "استئجار صالة المناسبات",
+    "السيد سالم أحمد",
+    "وال المدينة",
+    "لا يشغل بال المشتري",
+    "تحمل عمالته على المقاول",
+])
+def test_clean_arabic_keeps_valid_words(text):
+    assert clean_arabic(text) == text
+
+
+@pytest.mark.parametrize("text", [
+    "استئجار صالة المناسبات",
+    "السيد سالم أحمد",
+    "وال المدينة",
+    "فال حسن",
+    "تحمل عمالته على المقاول",
+])
+def test_fix_ocr_keeps_valid_words(text):
+    assert fix_ocr(text) == text
+
+
+@pytest.mark.parametrize("text, expected", [
+    ("إال إذا", "إلا إذا"),
+    ("االستثمار", "الاستثمار"),
+    ("وااللتزام", "والالتزام"),
+    ("المعامالت المالية", "المعاملات المالية"),
+    ("ال يجوز", "لا يجوز"),
+])
+def test_fix_ocr_repairs_known_ligature_errors(text, expected):
+    assert fix_ocr(text) == expected
+
+
+def test_clean_arabic_does_not_apply_ocr_fixes():
+    assert clean_arabic("المعامالت") == "المعامالت"
+
+
+def test_clean_arabic_strips_tashkeel_tatweel_and_converts_digits():
+    assert clean_arabic("الرِّبَا  مُحَرَّم ١٢٣") == "الربا محرم 123"
+    assert clean_arabic("الـــربا") == "الربا"
+
+
+def test_clean_arabic_keeps_line_breaks():
+    assert clean_arabic("السطر الأول\nالسطر   الثاني") == "السطر الأول\nالسطر الثاني"
+
+
+def test_normalize_arabic_folds_letters_and_whitespace():
+    assert normalize_arabic("نسبة  في المائة\nأو إضافة") == "نسبه في المايه او اضافه"
+    assert normalize_arabic("فائدة على مستحقى") == "فايده علي مستحقي"
+
+
+def test_fold_arabic_preserves_length():
+    text = "أحكام الفائدة المؤجلة"
+    assert len(fold_arabic(text)) == len(text)
+
+
+def test_fold_arabic_preserves_length_when_lower_expands():
+    text = "شركة İSTANBUL للتمويل"
+    folded = fold_arabic(text)
+
+    assert len(folded) == len(text)
+    assert folded == "شركه istanbul للتمويل"
+    assert len(folded.split(" ")) == len(text.split(" "))
+
+
+def test_empty_input():
+    assert clean_arabic("") == ""
+    assert normalize_arabic("") == ""
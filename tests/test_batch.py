@@ -0,0 +1,70 @@
+import json
+import threading
+
+from services.batch import BatchRunner
+
+
+class FakeService:
+    """search_chunks وهمي: مدة كل عقد من نصه، ونتيجة جزئية أو خطأ حسب النص"""
+
+    def __init__(self, delays):
+        self.delays = delays
+        self.calls = []
+        self._lock = threading.Lock()
+
+    def search_chunks(self, contract_text, top_k, progress_callback=None, token_budget=None, deadline_seconds=None):
+        with self._lock:
+            self.calls.append(contract_text)
+        threading.Event().wait(self.delays.get(contract_text, 0))
+        if contract_text == "خطأ":
+            raise RuntimeError("503 UNAVAILABLE")
+        partial = contract_text == "جزئي"
+        progress_callback("search_status", {"partial": partial, "skipped_clauses": ["clause_1"] if partial else []})
+        return [{"chunk_text": contract_text}], [{"term_id": "clause_1"}]
+
+
+def test_load_completed_ids_skips_partial_failed_and_truncated_lines(tmp_path):
+    output = tmp_path / "out.jsonl"
+    lines = [
+        json.dumps({"id": "done", "status": "ok", "partial": False}),
+        json.dumps({"id": "partial", "status": "ok", "partial": True}),
+        json.dumps({"id": "failed", "status": "error"}),
+        "",
+        '{"id": "cut", "status": "o'
+    ]
+    output.write_text("\n".join(lines), encoding="utf-8")
+
+    assert BatchRunner.load_completed_ids(str(output)) == {"done"}
+    assert BatchRunner.load_completed_ids(str(tmp_path / "missing.jsonl")) == set()
+
+
+def test_record_id_is_stable_without_an_id():
+    record = {"contract_text": "عقد بيع"}
+
+    assert BatchRunner.record_id(record) == BatchRunner.record_id(dict(record))
+    assert BatchRunner.record_id({"request_id": 7, "contract_text": "عقد بيع"}) == "7"
+
+
+def test_run_yields_in_completion_order_and_skips_done_ids():
+    service = FakeService({"بطيء": 0.3, "سريع": 0.0, "جزئي": 0.1})
+    runner = BatchRunner(service, max_concurrency=3, max_contracts_per_minute=0)
+    records = [
+        {"id": "slow", "contract_text": "بطيء"},
+        {"id": "fast", "contract_text": "سريع"},
+        {"id": "partial", "contract_text": "جزئي"},
+        {"id": "old", "contract_text": "سابق"},
+        {"id": "empty", "contract_text": "  "},
+        {"id": "error", "contract_text": "خطأ"}
+    ]
+
+    results = list(runner.run(records, default_top_k=5, skip_ids={"old"}))
+
+    order = [result["id"] for result in results]
+    assert order.index("fast") < order.index("partial") < order.index("slow")
+    assert sorted(order) == ["empty", "error", "fast", "partial", "slow"]
+    assert "سابق" not in service.calls
+    by_id = {result["id"]: result for result in results}
+    assert by_id["partial"]["partial"] is True
+    assert by_id["partial"]["skipped_clauses"] == ["clause_1"]
+    assert (by_id["error"]["status"], by_id["empty"]["status"]) == ("error", "error")
+    assert by_id["fast"]["top_k"] == 5
@@ -0,0 +1,46 @@
+from services import clause_cache
+from services.clause_cache import ClauseCache
+
+
+CLAUSE = {"term_text": "يلتزم المشتري بدفع غرامة تأخير", "potential_issues": ["الربا", "الغرامة"]}
+
+
+def test_key_ignores_spelling_and_issue_order():
+    key = ClauseCache.make_key(CLAUSE, "gemini-2.5-flash", "store-1")
+    variant = {"term_text": "يلتزم  المشتري بدفع غرامه تأخير", "potential_issues": ["الغرامة", "الربا"]}
+
+    assert ClauseCache.make_key(variant, "gemini-2.5-flash", "store-1") == key
+    assert ClauseCache.make_key(CLAUSE, "gemini-2.5-flash", "store-2") != key
+
+
+def test_empty_results_are_not_cached():
+    cache = ClauseCache(max_entries=10)
+    cache.set("k", [])
+
+    assert cache.get("k") is None
+    assert cache.stats()["entries"] == 0
+
+
+def test_entries_expire_after_ttl(monkeypatch):
+    now = {"value": 100.0}
+    monkeypatch.setattr(clause_cache.time, "monotonic", lambda: now["value"])
+    cache = ClauseCache(max_entries=10, ttl_seconds=60)
+    cache.set("k", [{"chunk_text": "نص"}])
+
+    now["value"] += 30
+    assert cache.get("k") == [{"chunk_text": "نص"}]
+    now["value"] += 31
+    assert cache.get("k") is None
+    assert cache.stats()["expirations"] == 1
+
+
+def test_lru_eviction_keeps_recently_used():
+    cache = ClauseCache(max_entries=2)
+    cache.set("a", [{"chunk_text": "a"}])
+    cache.set("b", [{"chunk_text": "b"}])
+    cache.get("a")
+    cache.set("c", [{"chunk_text": "c"}])
+
+    assert cache.get("b") is None
+    assert cache.get("a") is not None
+    assert cache.stats()["evictions"] == 1
@@ -0,0 +1,53 @@
+import types
+
+import pytest
+
+from services.client_pool import GenaiClientPool
+
+
+class FakeClient:
+    def __init__(self, index, fail_warm_up=False):
+        self.index = index
+        self.file_search_stores = "stores-{}".format(index)
+        self.models = types.SimpleNamespace(get=self._get, owner=index)
+        self.fail_warm_up = fail_warm_up
+
+    def _get(self, model):
+        if self.fail_warm_up:
+            raise RuntimeError("connection reset")
+        return types.SimpleNamespace(name=model)
+
+
+@pytest.fixture
+def pool(monkeypatch):
+    created = []
+
+    def create(self, api_key):
+        client = FakeClient(len(created), fail_warm_up=len(created) == 1)
+        created.append(client)
+        return client
+
+    monkeypatch.setattr(GenaiClientPool, "_create_client", create)
+    return GenaiClientPool("key", size=3, http2=False)
+
+
+def test_models_rotate_round_robin(pool):
+    owners = [pool.models.owner for _ in range(7)]
+
+    assert owners == [0, 1, 2, 0, 1, 2, 0]
+
+
+def test_other_attributes_pass_through_to_first_client(pool):
+    assert pool.file_search_stores == "stores-0"
+    with pytest.raises(AttributeError):
+        pool._missing
+    with pytest.raises(AttributeError):
+        pool.not_a_client_attribute
+
+
+def test_warm_up_counts_reachable_clients(pool):
+    result = pool.warm_up("gemini-2.5-flash")
+
+    assert (result["warmed"], result["clients"]) == (2, 3)
+    assert pool.stats()["warmed"] is True
+    assert pool.stats()["http2"] is False
@@ -0,0 +1,53 @@
+from services.contract_splitter import find_clause_boundaries, split_contract
+
+
+def _contract(clauses=8, body_words=30):
+    parts = ["عقد مرابحة بين الطرفين\n"]
+    for idx in range(1, clauses + 1):
+        parts.append("البند ({}): ".format(idx) + " ".join(["يلتزم المشتري بالسداد"] * body_words) + "\n")
+    return "".join(parts)
+
+
+def test_clause_boundaries_at_line_starts_only():
+    text = "تمهيد\nالبند الأول: نص\n- المادة (2) نص يشير إلى البند الأول\nمادة 3: نص\nبندقية\n"
+
+    starts = find_clause_boundaries(text)
+
+    assert [text[pos:pos + 5] for pos in starts[1:]] == ["البند", "- الم", "مادة "]
+    assert starts[0] == 0
+
+
+def test_short_contract_is_one_window():
+    text = _contract(clauses=2, body_words=2)
+    assert split_contract(text, window_chars=len(text)) == [text]
+
+
+def test_windows_cover_the_contract_on_clause_boundaries():
+    text = _contract()
+    windows = split_contract(text, window_chars=1500)
+
+    assert len(windows) > 1
+    assert "".join(windows) == text
+    assert all(len(window) <= 1500 for window in windows)
+    assert all(window.startswith("البند") for window in windows[1:])
+
+
+def test_overlap_repeats_the_previous_tail():
+    text = _contract()
+    plain = split_contract(text, window_chars=1500)
+    overlapped = split_contract(text, window_chars=1500, overlap_chars=200)
+
+    assert overlapped[0] == plain[0]
+    for previous, window, base in zip(plain, overlapped[1:], plain[1:]):
+        tail = window[:len(window) - len(base)]
+        assert window.endswith(base)
+        assert 0 < len(tail) <= 200
+        assert previous.endswith(tail)
+
+
+def test_long_segment_without_clause_headings_is_split():
+    text = "ملحق " + " ".join(["جدول الأقساط الشهرية"] * 200)
+    windows = split_contract(text, window_chars=500)
+
+    assert "".join(windows) == text
+    assert all(len(window) <= 500 for window in windows)
@@ -0,0 +1,56 @@
+from services.cost_ledger import CostLedger, RequestBudget
+
+
+def _ledger(db_path, retention_days=30):
+    return CostLedger(0.30, 2.50, {"deep": 3700, "general": 1200}, db_path=db_path, retention_days=retention_days)
+
+
+def _usage(input_tokens, output_tokens):
+    return {"input_tokens": input_tokens, "output_tokens": output_tokens, "total_tokens": input_tokens + output_tokens}
+
+
+def test_daily_totals_survive_restart_and_are_shared(tmp_path):
+    db_path = str(tmp_path / "cost.sqlite3")
+    first, second = _ledger(db_path), _ledger(db_path)
+    first.record("deep", _usage(3000, 400))
+    second.record("general", _usage(10000, 200), units=10)
+
+    days = _ledger(db_path).stats()["days"]
+    assert len(days) == 1
+    ledger = next(iter(days.values()))
+    assert ledger["totals"]["calls"] == 2
+    assert ledger["totals"]["total_tokens"] == 13600
+    assert ledger["by_kind"]["deep"]["cost_usd"] == round((3000 * 0.30 + 400 * 2.50) / 1_000_000, 6)
+
+
+def test_old_days_are_pruned(tmp_path):
+    ledger = _ledger(str(tmp_path / "cost.sqlite3"), retention_days=2)
+    with ledger._conn:
+        for day in ("2026-01-01", "2026-01-02", "2026-01-03"):
+            ledger._conn.execute(
+                "INSERT INTO daily_usage VALUES (?, 'deep', 1, 10, 0, 10, 0.0)", (day,)
+            )
+
+    ledger.record("deep", _usage(100, 10))
+
+    assert len(ledger.stats()["days"]) == 2
+    assert "2026-01-01" not in ledger.stats()["days"]
+
+
+def test_estimates_follow_measured_usage():
+    ledger = CostLedger(0.30, 2.50, {"general": 1200}, smoothing=0.5)
+    ledger.record("general", _usage(4000, 0), units=2)
+
+    assert ledger.estimate("general") == 1600
+    assert ledger.estimate("general", 3) == 4800
+
+
+def test_budget_refuses_optional_calls_beyond_limit():
+    budget = RequestBudget(max_tokens=1000)
+    assert budget.reserve(800)
+    assert not budget.reserve(300)
+    assert budget.reserve(300, force=True)
+
+    budget.settle(800, "deep", _usage(500, 100))
+    assert budget.remaining() == 1000 - 600 - 300
+    assert budget.summary()["skipped_calls"] == 1
@@ -0,0 +1,154 @@
+import json
+import random
+
+import pytest
+
+from config import Config
+from services.file_search import FileSearchService
+
+
+TERMS = [
+    {
+        "term_id": "clause_condition",
+        "term_text": "يحق للطرف الأول فسخ العقد من تلقاء نفسه دون إنذار",
+        "potential_issues": ["الشرط الجائر"],
+        "relevance_reason": "فسخ بدون إعذار"
+    },
+    {
+        "term_id": "clause_gharar",
+        "term_text": "تقدر مساحة الوحدة تحت العجز والزيادة",
+        "potential_issues": ["الغرر", "الجهالة"],
+        "relevance_reason": "جهالة المبيع"
+    },
+    {
+        "term_id": "clause_riba",
+        "term_text": "يلتزم المشتري بدفع فائدة تأخير 2% شهرياً",
+        "potential_issues": ["الربا", "فائدة التأخير"],
+        "relevance_reason": "زيادة مشروطة على الدين"
+    },
+    {
+        "term_id": "clause_delivery",
+        "term_text": "يتم التسليم خلال ستين يوماً",
+        "potential_issues": ["التسليم"],
+        "relevance_reason": "موعد التسليم"
+    }
+]
+# الأخطر أولاً حسب ClauseRiskScorer
+PRIORITY = ["clause_riba", "clause_gharar", "clause_condition"]
+
+WORDS = [
+    "المرابحة", "الإجارة", "السلم", "الاستصناع", "المضاربة", "المشاركة", "الوكالة", "الكفالة",
+    "الحوالة", "الرهن", "الصلح", "الوديعة", "القرض", "الهبة", "الشركة", "الجعالة", "المساقاة",
+    "المزارعة", "الوعد", "الخيار", "العربون", "التورق", "الصكوك", "التأمين", "الزكاة", "الوقف"
+]
+
+
+def _seed_results(directory, search_records=4, chunks_per_record=6):
+    """ملفات analysis_*.json صناعية: تسجيل استخراج واحد وعدة تسجيلات بحث بمقاطع متباعدة"""
+    rng = random.Random(7)
+    directory.mkdir()
+    for record in range(search_records):
+        chunks = [
+            {
+                "chunk_text": " ".join(rng.choice(WORDS) for _ in range(18)),
+                "title": "المعيار {}".format(record + 1),
+                "uri": "uri-{}-{}".format(record, idx)
+            }
+            for idx in range(chunks_per_record)
+        ]
+        result = {"extracted_terms": TERMS if record == 0 else [], "chunks": chunks}
+        path = directory / "analysis_{}.json".format(record)
+        path.write_text(json.dumps(result, ensure_ascii=False), encoding="utf-8")
+
+
+@pytest.fixture
+def make_service(tmp_path, monkeypatch):
+    seed_dir = tmp_path / "results"
+    _seed_results(seed_dir)
+    settings = {
+        "GEMINI_STANDIN_MODE": "replay",
+        "GEMINI_STANDIN_FIXTURES": str(tmp_path / "recordings.jsonl"),
+        "GEMINI_STANDIN_SEED_DIR": str(seed_dir),
+        "GEMINI_STANDIN_LATENCY_EXTRACTION": "fixed:0",
+        "GEMINI_STANDIN_LATENCY_SEARCH": "fixed:0",
+        "GEMINI_STANDIN_TIME_SCALE": 1.0,
+        "GEMINI_STANDIN_ERROR_503_RATE": 0.0,
+        "GEMINI_STANDIN_ERROR_429_RATE": 0.0,
+        "GEMINI_STANDIN_RPM": 0,
+        "GEMINI_REQUESTS_PER_MINUTE": 0,
+        "GEMINI_TOKENS_PER_MINUTE": 0,
+        "API_WORKERS": 1,
+        "FILE_SEARCH_STORE_ID": "fileSearchStores/replay-store",
+        "RETRIEVAL_BACKEND": "file_search",
+        "RESULT_CACHE_ENABLED": False,
+        "CLAUSE_CACHE_ENABLED": False,
+        "STREAMING_EXTRACTION": False,
+        "LONG_CONTRACT_THRESHOLD_CHARS": 0,
+        "DEEP_SEARCH_MAX_CLAUSES": 0,
+        "DEEP_SEARCH_DEADLINE_SECONDS": 0.0,
+        "REQUEST_DEADLINE_SECONDS": 0.0,
+        "REQUEST_TOKEN_BUDGET": 0,
+        "COST_LEDGER_PATH": str(tmp_path / "cost.sqlite3")
+    }
+
+    def make(**overrides):
+        for name, value in dict(settings, **overrides).items():
+            monkeypatch.setattr(Config, name, value)
+        return FileSearchService()
+
+    return make
+
+
+def _search(service, **kwargs):
+    events = {}
+
+    def progress(event, data):
+        events.setdefault(event, []).append(data)
+
+    chunks, terms = service.search_chunks("نص عقد بيع بالتقسيط", top_k=4, progress_callback=progress, **kwargs)
+    return chunks, terms, events
+
+
+def test_pipelined_and_sequential_paths_return_the_same_chunks(make_service):
+    pipelined, terms, _ = _search(make_service(PIPELINED_SEARCH=True, DEEP_SEARCH_MAX_WORKERS=4))
+    sequential, _, _ = _search(make_service(PIPELINED_SEARCH=False, DEEP_SEARCH_MAX_WORKERS=1))
+
+    assert [term["term_id"] for term in terms] == [term["term_id"] for term in TERMS]
+    assert pipelined
+    assert [(c["chunk_text"], c["sources"]) for c in pipelined] == [(c["chunk_text"], c["sources"]) for c in sequential]
+    deep_clauses = [s["clause_id"] for c in pipelined for s in c["sources"] if s["phase"] == "deep"]
+    assert sorted(set(deep_clauses), key=deep_clauses.index) == PRIORITY
+
+
+def test_token_budget_keeps_the_riskiest_deep_searches(make_service):
+    _, _, events = _search(make_service())
+    extraction_tokens = events["usage"][0]["by_phase"]["extraction"]["total_tokens"]
+
+    service = make_service(ESTIMATED_GENERAL_TOKENS_PER_CHUNK=100, ESTIMATED_DEEP_SEARCH_TOKENS=1000)
+    # الرصيد بعد الاستخراج يكفي البحث الجماعي (4 × 100) وبحثاً معمّقاً واحداً
+    _, _, events = _search(service, token_budget=extraction_tokens + 400 + 1500)
+
+    assert events["budget_applied"][0]["budget_skipped_clauses"] == PRIORITY[1:]
+    assert events["terms_extracted"][0]["deep_searches_total"] == 1
+    assert [e["clause_id"] for e in events["deep_search_done"]] == PRIORITY[:1]
+    assert events["usage"][0]["budget_skipped_clauses"] == PRIORITY[1:]
+
+
+def test_deep_search_cap_follows_risk_order(make_service):
+    _, _, events = _search(make_service(DEEP_SEARCH_MAX_CLAUSES=2))
+
+    assert events["terms_extracted"][0]["deep_searches_capped"] == PRIORITY[2:]
+    assert sorted(e["clause_id"] for e in events["deep_search_done"]) == sorted(PRIORITY[:2])
+
+
+def test_expired_deadline_returns_partial_result(make_service):
+    service = make_service(GEMINI_STANDIN_LATENCY_SEARCH="fixed:0.5")
+    chunks, terms, events = _search(service, deadline_seconds=0.2)
+
+    status = events["search_status"][0]
+    assert status["partial"] is True
+    assert status["phase1_complete"] is False
+    assert sorted(s["clause_id"] for s in status["skipped_clauses"]) == sorted(PRIORITY)
+    assert all(s["reason"] == "deadline" for s in status["skipped_clauses"])
+    assert chunks == []
+    assert len(terms) == len(TERMS)
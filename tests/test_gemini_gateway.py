@@ -0,0 +1,85 @@
+import threading
+import time
+
+import pytest
+
+from services.gemini_gateway import AdaptiveConcurrencyLimiter, DeadlineExceeded, GeminiGateway, TokenBucket
+
+
+def test_acquire_waits_until_release():
+    limiter = AdaptiveConcurrencyLimiter(initial_limit=1, min_limit=1, max_limit=1)
+    limiter.acquire()
+    threading.Timer(0.05, limiter.release).start()
+
+    waited = limiter.acquire(deadline=time.monotonic() + 2)
+
+    assert waited >= 0.04
+    assert limiter.in_flight == 1
+
+
+def test_acquire_raises_at_deadline_instead_of_blocking():
+    limiter = AdaptiveConcurrencyLimiter(initial_limit=1, min_limit=1, max_limit=1)
+    limiter.acquire()
+
+    started = time.monotonic()
+    with pytest.raises(DeadlineExceeded):
+        limiter.acquire(deadline=started + 0.1, label="phase1")
+
+    assert time.monotonic() - started < 1.0
+    assert limiter.in_flight == 1
+
+
+def test_acquire_with_passed_deadline_fails_when_full():
+    limiter = AdaptiveConcurrencyLimiter(initial_limit=1, min_limit=1, max_limit=1)
+    limiter.acquire()
+
+    with pytest.raises(DeadlineExceeded):
+        limiter.acquire(deadline=time.monotonic() - 1)
+
+
+def test_overload_halves_limit_and_success_grows_it():
+    limiter = AdaptiveConcurrencyLimiter(initial_limit=8, min_limit=1, max_limit=8)
+    limiter.acquire()
+    limiter.release(overloaded=True)
+    assert limiter.limit == 4
+
+    limiter.acquire()
+    limiter.release()
+    assert limiter.limit == pytest.approx(4.25)
+
+
+def test_token_bucket_raises_before_sleeping_past_the_deadline():
+    bucket = TokenBucket(rate_per_minute=600)
+    bucket.acquire(600)
+    # دين TPM بعد تصحيح الاستهلاك الفعلي: ~30 ثانية انتظار
+    bucket.adjust(300)
+
+    started = time.monotonic()
+    with pytest.raises(DeadlineExceeded):
+        bucket.acquire(1, deadline=started + 1.0, label="deep")
+
+    assert time.monotonic() - started < 0.1
+
+
+def test_token_bucket_waits_when_the_deadline_allows_it():
+    bucket = TokenBucket(rate_per_minute=600)
+    bucket.acquire(600)
+
+    waited = bucket.acquire(1, deadline=time.monotonic() + 2.0)
+
+    assert 0.05 <= waited < 0.5
+
+
+def test_gateway_refunds_request_slot_when_token_wait_would_pass_deadline():
+    gateway = GeminiGateway(
+        client=None, requests_per_minute=60, tokens_per_minute=6000,
+        max_concurrency=1, min_concurrency=1, max_retries=0, retry_budget_ratio=0.0
+    )
+    gateway.token_bucket.acquire(6000)
+    requests_before = gateway.request_bucket._tokens
+
+    with pytest.raises(DeadlineExceeded):
+        gateway.generate_content("model", "x" * 300, None, label="deep", deadline=time.monotonic() + 0.5)
+
+    assert gateway.request_bucket._tokens == pytest.approx(requests_before, abs=0.1)
+    assert gateway.concurrency.in_flight == 0
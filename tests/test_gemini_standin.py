@@ -0,0 +1,105 @@
+import random
+
+import pytest
+from google.genai import types
+
+from services.gemini_standin import FixtureStore, LatencyModel, ReplayClient, StandInAPIError, request_key
+
+MODEL = "gemini-2.5-flash"
+
+
+def _search_config(top_k):
+    return types.GenerateContentConfig(tools=[types.Tool(
+        file_search=types.FileSearch(file_search_store_names=["fileSearchStores/s1"], top_k=top_k)
+    )])
+
+
+def _text_response(text):
+    return {"candidates": [{"content": {"role": "model", "parts": [{"text": text}]}}]}
+
+
+def _search_response(texts):
+    response = _text_response("وُجدت مقاطع")
+    response["candidates"][0]["grounding_metadata"] = {
+        "grounding_chunks": [{"retrieved_context": {"text": text, "title": "المعيار 8"}} for text in texts]
+    }
+    return response
+
+
+def test_exact_recording_wins_and_persists(tmp_path):
+    path = tmp_path / "recordings.jsonl"
+    fixtures = FixtureStore(str(path))
+    key = request_key(MODEL, "استخرج البنود", None)
+    fixtures.append({"key": key, "kind": "extraction", "response": _text_response("[1]")})
+    fixtures.append({"key": "other", "kind": "extraction", "response": _text_response("[2]")})
+
+    reloaded = FixtureStore(str(path))
+    assert len(reloaded) == 2
+    assert reloaded.has_key(key)
+    assert reloaded.lookup(key, "extraction")["response"] == _text_response("[1]")
+
+
+def test_unknown_request_gets_a_stable_recording_of_its_kind():
+    fixtures = FixtureStore()
+    for idx in range(5):
+        fixtures.add({"kind": "search", "response": _search_response(["مقطع {}".format(idx)])})
+    fixtures.add({"kind": "extraction", "response": _text_response("[]")})
+
+    key = request_key(MODEL, "بند جديد", _search_config(2))
+    first = fixtures.lookup(key, "search")
+
+    assert first is fixtures.lookup(key, "search")
+    assert "grounding_metadata" in first["response"]["candidates"][0]
+    assert fixtures.lookup(key, "missing_kind") is None
+
+
+def test_replay_trims_chunks_to_top_k_and_estimates_usage():
+    fixtures = FixtureStore()
+    fixtures.add({"kind": "search", "response": _search_response(["أ", "ب", "ج", "د"])})
+    client = ReplayClient(fixtures)
+
+    response = client.models.generate_content(model=MODEL, contents="ابحث", config=_search_config(2))
+
+    chunks = response.candidates[0].grounding_metadata.grounding_chunks
+    assert [chunk.retrieved_context.text for chunk in chunks] == ["أ", "ب"]
+    assert response.usage_metadata.total_token_count > 0
+    assert client.stats()["calls"] == 1
+
+
+def test_replay_without_recordings_of_a_kind_is_an_error():
+    fixtures = FixtureStore()
+    fixtures.add({"kind": "search", "response": _search_response(["أ"])})
+    client = ReplayClient(fixtures)
+
+    with pytest.raises(StandInAPIError) as error:
+        client.models.generate_content(model=MODEL, contents="استخرج", config=None)
+    assert error.value.code == 404
+    with pytest.raises(ValueError):
+        ReplayClient(FixtureStore())
+
+
+def test_injected_errors_and_rpm_limit():
+    fixtures = FixtureStore()
+    fixtures.add({"kind": "extraction", "response": _text_response("[]")})
+
+    overloaded = ReplayClient(fixtures, error_503_rate=1.0)
+    with pytest.raises(StandInAPIError) as error:
+        overloaded.models.generate_content(model=MODEL, contents="x")
+    assert error.value.code == 503
+
+    limited = ReplayClient(fixtures, requests_per_minute=1)
+    limited.models.generate_content(model=MODEL, contents="x")
+    with pytest.raises(StandInAPIError) as error:
+        limited.models.generate_content(model=MODEL, contents="x")
+    assert error.value.code == 429
+    assert limited.stats()["rate_limited"] == 1
+
+
+def test_latency_specs():
+    rng = random.Random(1)
+
+    assert LatencyModel("fixed:2", scale=0.5).sample(rng) == 1.0
+    assert 1.0 <= LatencyModel("uniform:1:3").sample(rng) <= 3.0
+    assert LatencyModel("recorded").sample(rng, recorded=0.7) == 0.7
+    with pytest.raises(ValueError):
+        LatencyModel("uniform:1")
@@ -0,0 +1,116 @@
+import sqlite3
+
+from services import history_index
+from services.history_index import make_snippet, search_tokens
+from services.results_store import ResultsStore
+
+
+RESULT_A = {
+    "extracted_terms": [
+        {
+            "term_id": "clause_late_payment",
+            "term_text": "يلتزم العميل بدفع غرامة تأخير قدرها 2% شهرياً",
+            "relevance_reason": "غرامة مالية على الدين",
+            "potential_issues": ["الربا", "الزيادة على الدين"],
+        },
+        {"term_id": "clause_delivery", "term_text": "يتم التسليم خلال ثلاثين يوماً", "potential_issues": []},
+    ],
+    "chunks": [
+        {
+            "chunk_text": "يجوز اشتراط غرامة تأخير تصرف في وجوه الخير إال إذا كان المدين معسراً",
+            "title": "المعيار 8",
+            "sources": [{"phase": "deep", "clause_id": "clause_late_payment"}],
+        },
+        {"chunk_text": "التسليم في المرابحة يكون بعد التملك", "title": "المعيار 8", "sources": [{"phase": "general"}]},
+    ],
+}
+RESULT_B = {
+    "extracted_terms": [
+        {"term_id": "clause_rent", "term_text": "تدفع الأجرة مقدماً كل شهر", "potential_issues": ["الجهالة"]},
+    ],
+    "chunks": [],
+}
+
+
+def _store(tmp_path):
+    store = ResultsStore(str(tmp_path / "history.sqlite3"))
+    store.save(RESULT_A, "عقد مرابحة", analysis_id="a")
+    store.save(RESULT_B, "عقد إجارة", analysis_id="b")
+    return store
+
+
+def _ids(response):
+    return [item["analysis_id"] for item in response["items"]]
+
+
+def test_search_tokens_keep_single_digits():
+    assert search_tokens("المعيار 8 والغرامة") == ["معيار", "غرامه", "8"]
+
+
+def test_all_words_must_match_within_one_unit(tmp_path):
+    store = _store(tmp_path)
+
+    assert _ids(store.search("غرامه التاخير")) == ["a"]
+    assert _ids(store.search("الأجرة مقدما")) == ["b"]
+    # كلمتان في بندين مختلفين من نفس التحليل: لا مطابقة
+    assert store.search("غرامة التسليم")["total"] == 0
+
+
+def test_clause_filter_covers_term_and_its_retrieved_chunks(tmp_path):
+    store = _store(tmp_path)
+
+    response = store.search("وجوه الخير", clause_id="clause_late_payment")
+    assert _ids(response) == ["a"]
+    assert [match["field"] for match in response["items"][0]["matches"]] == ["chunks"]
+
+    assert store.search("التسليم", clause_id="clause_late_payment")["total"] == 0
+    assert store.search("", clause_id="clause_delivery")["total"] == 1
+
+
+def test_fields_filter(tmp_path):
+    store = _store(tmp_path)
+
+    assert store.search("الربا", fields=["issues"])["total"] == 1
+    assert store.search("الربا", fields=["chunks"])["total"] == 0
+
+
+def test_ocr_fixed_chunk_is_found_and_snippet_keeps_original_text(tmp_path):
+    store = _store(tmp_path)
+
+    response = store.search("إلا المدين", fields=["chunks"])
+
+    assert _ids(response) == ["a"]
+    assert "إال إذا" in response["items"][0]["matches"][0]["snippet"]
+
+
+def test_resave_replaces_postings(tmp_path):
+    store = _store(tmp_path)
+    store.save(RESULT_B, "عقد مرابحة", analysis_id="a")
+
+    assert _ids(store.search("غرامة")) == []
+    assert sorted(_ids(store.search("الأجرة"))) == ["a", "b"]
+
+
+def test_analyses_indexed_with_an_older_version_are_reindexed(tmp_path, monkeypatch):
+    db_path = str(tmp_path / "history.sqlite3")
+    ResultsStore(db_path).save(RESULT_A, "عقد", analysis_id="a")
+    conn = sqlite3.connect(db_path)
+    with conn:
+        conn.execute("DELETE FROM search_postings")
+        conn.execute("UPDATE search_indexed SET version = '0.0'")
+    conn.close()
+
+    store = ResultsStore(db_path)
+
+    assert _ids(store.search("غرامة")) == ["a"]
+    assert store._index.stats()["version"] == history_index.HistoryIndex.version()
+
+
+def test_snippet_starts_near_first_match():
+    text = " ".join(["كلمة{}".format(i) for i in range(30)] + ["الغرامة", "على", "المدين"])
+
+    snippet = make_snippet(text, {"غرامه"})
+
+    assert snippet.startswith("… ")
+    assert "الغرامة على المدين" in snippet
+    assert "كلمة0 " not in snippet
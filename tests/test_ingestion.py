@@ -0,0 +1,141 @@
+import json
+import types as pytypes
+
+from services.ingestion import MANIFEST_VERSION, ContextIngestor, UploadManifest, file_sha256
+
+
+class FakeClient:
+    """Store وهمي: كل رفع يرجع عملية تكتمل بعد polls_to_done استعلاماً"""
+
+    def __init__(self, polls_to_done=1, unknown_operations=(), never_done=False):
+        self.polls_to_done = polls_to_done
+        self.unknown_operations = set(unknown_operations)
+        self.never_done = never_done
+        self.uploads = []
+        self.deleted = []
+        self._polls = {}
+        self.file_search_stores = pytypes.SimpleNamespace(
+            upload_to_file_search_store=self._upload,
+            documents=pytypes.SimpleNamespace(delete=self._delete)
+        )
+        self.operations = pytypes.SimpleNamespace(get=self._get)
+
+    def _upload(self, file, file_search_store_name, config):
+        self.uploads.append(config["display_name"])
+        return pytypes.SimpleNamespace(name="op-{}".format(len(self.uploads)), done=False)
+
+    def _delete(self, name, config):
+        self.deleted.append(name)
+
+    def _get(self, operation):
+        if operation.name in self.unknown_operations:
+            raise RuntimeError("404 NOT_FOUND: operation {}".format(operation.name))
+        self._polls[operation.name] = self._polls.get(operation.name, 0) + 1
+        if self.never_done or self._polls[operation.name] < self.polls_to_done:
+            return pytypes.SimpleNamespace(name=operation.name, done=False)
+        return pytypes.SimpleNamespace(
+            name=operation.name, done=True, error=None,
+            response=pytypes.SimpleNamespace(document_name="doc-{}".format(operation.name))
+        )
+
+
+def _files(tmp_path, **contents):
+    directory = tmp_path / "context"
+    directory.mkdir(exist_ok=True)
+    paths = []
+    for name, text in contents.items():
+        path = directory / "{}.md".format(name)
+        path.write_text(text, encoding="utf-8")
+        paths.append(path)
+    return paths
+
+
+def _ingestor(client, manifest, **kwargs):
+    kwargs.setdefault("poll_initial_seconds", 0.1)
+    kwargs.setdefault("poll_max_seconds", 0.1)
+    return ContextIngestor(client, "stores/s1", manifest, max_workers=2, **kwargs)
+
+
+def test_manifest_roundtrip_and_version_check(tmp_path):
+    path = tmp_path / "manifest.json"
+    manifest = UploadManifest(str(path))
+    manifest.update("a.md", sha256="x", status="done")
+
+    assert UploadManifest(str(path)).get("a.md")["status"] == "done"
+    assert list(tmp_path.iterdir()) == [path]
+
+    path.write_text(json.dumps({"version": MANIFEST_VERSION + 1, "files": {"a.md": {}}}), encoding="utf-8")
+    assert UploadManifest(str(path)).names() == []
+    path.write_text("{broken", encoding="utf-8")
+    assert UploadManifest(str(path)).names() == []
+
+
+def test_sync_uploads_new_files_and_skips_unchanged(tmp_path):
+    files = _files(tmp_path, a="المعيار 8", b="المعيار 9")
+    manifest = UploadManifest(str(tmp_path / "manifest.json"))
+    client = FakeClient(polls_to_done=2)
+
+    summary = _ingestor(client, manifest).sync(files)
+
+    assert (summary["uploaded"], summary["failed"]) == (2, [])
+    assert manifest.get("a.md")["status"] == "done"
+    assert manifest.get("a.md")["sha256"] == file_sha256(files[0])
+
+    again = _ingestor(client, manifest).sync(files)
+    assert (again["uploaded"], again["unchanged"]) == (0, 2)
+    assert len(client.uploads) == 2
+
+
+def test_changed_file_is_reuploaded_and_old_document_removed(tmp_path):
+    files = _files(tmp_path, a="المعيار 8")
+    manifest = UploadManifest(str(tmp_path / "manifest.json"))
+    client = FakeClient()
+    _ingestor(client, manifest).sync(files)
+    old_document = manifest.get("a.md")["document_name"]
+
+    files[0].write_text("المعيار 8 - نسخة معدلة", encoding="utf-8")
+    summary = _ingestor(client, manifest).sync(files)
+
+    assert summary["uploaded"] == 1
+    assert client.deleted == [old_document]
+    assert manifest.get("a.md")["document_name"] != old_document
+
+
+def test_repeated_poll_errors_mark_the_file_failed(tmp_path):
+    files = _files(tmp_path, a="المعيار 8")
+    manifest = UploadManifest(str(tmp_path / "manifest.json"))
+    client = FakeClient(unknown_operations={"op-1"})
+
+    summary = _ingestor(client, manifest, max_poll_failures=3).sync(files)
+
+    assert summary["failed"] == ["a.md"]
+    assert manifest.get("a.md")["status"] == "failed"
+    assert "polling failed 3 times" in manifest.get("a.md")["error"]
+
+
+def test_unknown_resumed_operation_is_uploaded_again(tmp_path):
+    files = _files(tmp_path, a="المعيار 8")
+    manifest = UploadManifest(str(tmp_path / "manifest.json"))
+    # انقطاع أثناء الفهرسة: العملية المحفوظة لم تعد معروفة للخادم
+    manifest.update(
+        "a.md", sha256=file_sha256(files[0]), store_id="stores/s1",
+        status="uploading", operation_name="op-expired"
+    )
+    client = FakeClient(unknown_operations={"op-expired"})
+
+    summary = _ingestor(client, manifest, max_poll_failures=2).sync(files)
+
+    assert (summary["resumed"], summary["reuploaded"], summary["uploaded"]) == (1, 1, 1)
+    assert summary["failed"] == []
+    assert client.uploads == ["a.md"]
+    assert manifest.get("a.md")["status"] == "done"
+
+
+def test_indexing_timeout_marks_the_file_failed(tmp_path):
+    files = _files(tmp_path, a="المعيار 8")
+    manifest = UploadManifest(str(tmp_path / "manifest.json"))
+
+    summary = _ingestor(FakeClient(never_done=True), manifest, index_timeout_seconds=0.3).sync(files)
+
+    assert summary["failed"] == ["a.md"]
+    assert "did not finish" in manifest.get("a.md")["error"]
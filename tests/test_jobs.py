@@ -0,0 +1,145 @@
+import subprocess
+import sys
+import threading
+import time
+
+from services.jobs import JOB_COMPLETED, JOB_FAILED, JOB_RUNNING, JobManager, SharedJobState
+
+
+def _wait_for(predicate, timeout=5.0):
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        if predicate():
+            return True
+        time.sleep(0.01)
+    return False
+
+
+def _dead_pid():
+    proc = subprocess.Popen([sys.executable, "-c", "pass"])
+    proc.wait()
+    return proc.pid
+
+
+def _running_job(job_id):
+    return {"job_id": job_id, "status": JOB_RUNNING, "finished_at": None, "progress": {"stage": "running"}}
+
+
+def _event(name):
+    return {"event": name, "data": {}, "timestamp": time.time()}
+
+
+def test_job_is_visible_and_streamed_from_another_worker(tmp_path):
+    db_path = str(tmp_path / "jobs.sqlite3")
+    owner = JobManager(2, 10, SharedJobState(db_path, 10))
+    reader = JobManager(2, 10, SharedJobState(db_path, 10))
+
+    def work(report):
+        report("terms_extracted", {"total_terms": 3})
+        return {"chunks": []}
+
+    job_id = owner.submit(work)
+    assert _wait_for(lambda: (reader.get(job_id) or {}).get("status") == JOB_COMPLETED)
+
+    assert reader.get(job_id)["result"] == {"chunks": []}
+    stream = "".join(reader.stream_events(job_id))
+    names = [line.split(": ", 1)[1] for line in stream.splitlines() if line.startswith("event: ")]
+    assert names == ["queued", "running", "terms_extracted", JOB_COMPLETED]
+
+
+def test_events_are_stored_as_rows_and_older_state_is_ignored(tmp_path):
+    state = SharedJobState(str(tmp_path / "jobs.sqlite3"), 10)
+    state.put("job", 2, dict(_running_job("job"), progress={"stage": "phase1_done"}), _event("phase1_done"))
+    state.put("job", 1, _running_job("job"), _event("running"))
+
+    job, seq = state.get("job")
+    assert seq == 2
+    assert job["progress"]["stage"] == "phase1_done"
+    assert [item["event"] for _, item in state.events("job")] == ["running", "phase1_done"]
+    assert [item["event"] for _, item in state.events("job", after_seq=1)] == ["phase1_done"]
+
+
+def test_job_of_dead_worker_is_marked_failed(tmp_path):
+    state = SharedJobState(str(tmp_path / "jobs.sqlite3"), 10)
+    state.put("job", 1, _running_job("job"), _event("running"))
+    dead_pid = _dead_pid()
+    conn = state._connection()
+    with conn:
+        conn.execute("UPDATE job_state SET owner_pid = ?", (dead_pid,))
+
+    job, seq = state.get("job")
+    assert job["status"] == JOB_FAILED
+    assert str(dead_pid) in job["error"]
+    assert seq == 2
+
+    # المالك لا يعيد job مُسجّلاً failed إلى running
+    state.put("job", 3, _running_job("job"), _event("phase1_done"))
+    assert state.get("job")[0]["status"] == JOB_FAILED
+
+    stream = "".join(JobManager(1, 10, state).stream_events("job"))
+    assert stream.rstrip().endswith('"error": "{}"}}'.format(job["error"]))
+
+
+def test_job_with_stale_heartbeat_is_marked_failed(tmp_path):
+    state = SharedJobState(str(tmp_path / "jobs.sqlite3"), 10, stale_seconds=60)
+    state.put("job", 1, _running_job("job"), _event("running"))
+    assert state.get("job")[0]["status"] == JOB_RUNNING
+
+    conn = state._connection()
+    with conn:
+        conn.execute("UPDATE job_state SET heartbeat_at = heartbeat_at - 120")
+    assert state.get("job")[0]["status"] == JOB_FAILED
+
+    state.put("other", 1, _running_job("other"), _event("running"))
+    with conn:
+        conn.execute("UPDATE job_state SET heartbeat_at = heartbeat_at - 120 WHERE job_id = 'other'")
+    state.heartbeat(["other"])
+    assert state.get("other")[0]["status"] == JOB_RUNNING
+
+
+def test_stream_stops_at_max_wait(tmp_path):
+    release = threading.Event()
+    manager = JobManager(1, 10, SharedJobState(str(tmp_path / "jobs.sqlite3"), 10))
+    job_id = manager.submit(lambda report: release.wait(5) and {})
+
+    started = time.monotonic()
+    stream = list(manager.stream_events(job_id, heartbeat_seconds=0.05, max_wait_seconds=0.2))
+    release.set()
+
+    assert time.monotonic() - started < 2.0
+    assert stream[-1].startswith("event: stream_timeout\n")
+
+    reader = JobManager(1, 10, SharedJobState(str(tmp_path / "jobs.sqlite3"), 10))
+    release.clear()
+    job_id = manager.submit(lambda report: release.wait(5) and {})
+    stream = list(reader.stream_events(job_id, heartbeat_seconds=0.05, max_wait_seconds=0.2))
+    release.set()
+    assert stream[-1].startswith("event: stream_timeout\n")
+
+
+def test_job_finishing_after_drain_stays_failed(tmp_path):
+    release = threading.Event()
+    finished = threading.Event()
+    state = SharedJobState(str(tmp_path / "jobs.sqlite3"), 10)
+    manager = JobManager(1, 10, state)
+
+    def work(report):
+        release.wait(5)
+        report("deep_search_done", {"deep_searches_done": 1})
+        finished.set()
+        return {"chunks": []}
+
+    job_id = manager.submit(work)
+    assert _wait_for(lambda: manager.get(job_id)["status"] == JOB_RUNNING)
+
+    assert manager.drain(0.1) == 1
+    release.set()
+    assert finished.wait(5)
+    time.sleep(0.05)
+
+    job = manager.get(job_id)
+    assert job["status"] == JOB_FAILED
+    assert job["result"] is None
+    events = [item["event"] for _, item in state.events(job_id)]
+    assert events == ["queued", "running", JOB_FAILED]
+    assert state.get(job_id)[0]["status"] == JOB_FAILED
@@ -0,0 +1,42 @@
+import json
+
+from services.json_stream import JsonArrayStreamParser
+
+
+TERMS = [
+    {"term_id": "clause_1", "term_text": "غرامة {تأخير} [2%]", "potential_issues": ["الربا"]},
+    {"term_id": "clause_2", "term_text": "نص فيه \"اقتباس\" و \\ شرطة", "potential_issues": []},
+]
+
+
+def test_objects_are_returned_as_soon_as_they_close():
+    text = "```json\n" + json.dumps(TERMS, ensure_ascii=False) + "\n```"
+    parser = JsonArrayStreamParser()
+
+    received = []
+    for idx in range(0, len(text), 7):
+        received.extend(parser.feed(text[idx:idx + 7]))
+
+    assert received == TERMS
+    assert parser.finished
+    assert parser.errors == 0
+
+
+def test_first_object_is_available_before_the_array_ends():
+    text = json.dumps(TERMS, ensure_ascii=False)
+    cut = text.index("}, {") + 1
+    parser = JsonArrayStreamParser()
+
+    assert parser.feed(text[:cut]) == [TERMS[0]]
+    assert not parser.finished
+    assert parser.feed(text[cut:]) == [TERMS[1]]
+
+
+def test_broken_and_non_object_items_are_skipped():
+    parser = JsonArrayStreamParser()
+
+    items = parser.feed('[{"term_id": "a"}, {"term_id": }, [1, 2], {"term_id": "b"}] trailing {"x": 1}')
+
+    assert items == [{"term_id": "a"}, {"term_id": "b"}]
+    assert parser.errors == 1
+    assert parser.finished
@@ -0,0 +1,49 @@
+import json
+
+from services.local_index import MANIFEST_NAME, MappedIndex, read_manifest, write_index
+
+
+CHUNKS = [
+    {"chunk_text": "غرامة التأخير تصرف في وجوه الخير", "title": "المعيار 8", "uri": "context/a.md#L1"},
+    {"chunk_text": "الأجرة معلومة", "title": "", "uri": "context/a.md#L9"},
+]
+POSTINGS = {"غرامه": [(0, 2)], "اجره": [(1, 1)], "معلومه": [(0, 1), (1, 3)]}
+
+
+def _write(index_dir, fingerprint="abc"):
+    return write_index(str(index_dir), CHUNKS, POSTINGS, [6, 2], {"fingerprint": fingerprint, "avg_doc_length": 4.0})
+
+
+def test_roundtrip_through_mmap(tmp_path):
+    _write(tmp_path)
+    manifest = read_manifest(str(tmp_path))
+    index = MappedIndex(str(tmp_path), manifest)
+
+    assert (index.n_docs, index.n_terms) == (2, 3)
+    assert list(index.doc_lengths) == [6, 2]
+    assert [index.chunk(i) for i in range(2)] == CHUNKS
+    assert list(index.postings("معلومه")) == [(0, 1), (1, 3)]
+    assert index.document_frequency("غرامه") == 1
+    assert index.document_frequency("ربا") == 0
+    assert list(index.postings("ربا")) == []
+    assert manifest["avg_doc_length"] == 4.0
+
+
+def test_rewrite_replaces_data_file(tmp_path):
+    first = _write(tmp_path, "one")
+    second = _write(tmp_path, "two")
+
+    assert first != second
+    assert sorted(path.name for path in tmp_path.glob("index-*.bin")) == ["index-two.bin"]
+    assert read_manifest(str(tmp_path))["data_file"] == "index-two.bin"
+
+
+def test_manifest_with_other_format_version_is_ignored(tmp_path):
+    _write(tmp_path)
+    manifest_path = tmp_path / MANIFEST_NAME
+    manifest = json.loads(manifest_path.read_text(encoding="utf-8"))
+    manifest["version"] = 0
+    manifest_path.write_text(json.dumps(manifest), encoding="utf-8")
+
+    assert read_manifest(str(tmp_path)) is None
+    assert read_manifest(str(tmp_path / "missing")) is None
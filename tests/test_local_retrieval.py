@@ -0,0 +1,85 @@
+import pytest
+
+from services.local_retrieval import LocalRetrievalEngine, tokenize_arabic
+
+
+STANDARD = """# المعيار الشرعي رقم 8 المرابحة
+## يجوز للمؤسسة (cid:12)أن تشترط على العميل غرامة تأخير تصرف في وجوه الخير.
+لا يجوز اشتراط زيادة على الدين مقابل التأجيل.
+# المعيار الشرعي رقم 9 الإجارة
+يجب أن تكون الأجرة معلومة عند إبرام عقد الإجارة.
+تحمل المؤجر تبعة هلاك العين المؤجرة.
+"""
+
+
+@pytest.fixture
+def context_dir(tmp_path):
+    directory = tmp_path / "context"
+    directory.mkdir()
+    (directory / "standards.md").write_text(STANDARD, encoding="utf-8")
+    return directory
+
+
+def test_tokenize_strips_articles_and_stopwords():
+    assert tokenize_arabic("والغرامة على المدين في حالة التأخير") == ["غرامه", "مدين", "حاله", "تاخير"]
+
+
+def test_sections_split_on_main_headings(context_dir):
+    engine = LocalRetrievalEngine(str(context_dir))
+    engine.build()
+
+    assert [chunk["title"] for chunk in engine.chunks] == ["المعيار الشرعي رقم 8 المرابحة", "المعيار الشرعي رقم 9 الإجارة"]
+    assert engine.chunks[0]["uri"].endswith("standards.md#L2")
+    assert "(cid" not in engine.chunks[0]["chunk_text"]
+
+
+def test_long_sections_are_windowed_with_overlap(context_dir):
+    lines = ["سطر رقم {} عن الغرامة والتأخير في السداد".format(i) for i in range(40)]
+    (context_dir / "standards.md").write_text("# قسم طويل\n" + "\n".join(lines), encoding="utf-8")
+    engine = LocalRetrievalEngine(str(context_dir), chunk_chars=400, overlap_chars=100)
+    engine.build()
+
+    assert len(engine.chunks) > 1
+    first, second = engine.chunks[0]["chunk_text"].splitlines(), engine.chunks[1]["chunk_text"].splitlines()
+    assert first[-1] in second
+
+
+def test_search_ranks_matching_section_first(context_dir):
+    engine = LocalRetrievalEngine(str(context_dir))
+    engine.build()
+
+    results = engine.search("غرامة التأخير على العميل", top_k=2)
+
+    assert results[0]["title"] == "المعيار الشرعي رقم 8 المرابحة"
+    assert results[0]["score"] == 1.0
+    assert results[0]["uid"] == "chunk_1"
+
+
+def test_search_many_fuses_clauses(context_dir):
+    engine = LocalRetrievalEngine(str(context_dir))
+    engine.build()
+
+    results = engine.search_many(["غرامة تأخير", "الأجرة معلومة"], top_k=2)
+
+    assert {result["title"] for result in results} == {
+        "المعيار الشرعي رقم 8 المرابحة", "المعيار الشرعي رقم 9 الإجارة"
+    }
+
+
+def test_saved_index_is_mapped_and_rebuilt_when_sources_change(context_dir, tmp_path):
+    index_dir = str(tmp_path / "index")
+    engine = LocalRetrievalEngine(str(context_dir))
+    engine.load_or_build(index_dir)
+    built = engine.search("غرامة التأخير", top_k=2)
+
+    mapped = LocalRetrievalEngine(str(context_dir))
+    assert mapped.load(index_dir)
+    assert mapped.info()["memory_mapped"]
+    assert mapped.search("غرامة التأخير", top_k=2) == built
+
+    (context_dir / "standards.md").write_text(STANDARD + "\n# المعيار 10\nالسلم بيع آجل بعاجل.\n", encoding="utf-8")
+    stale = LocalRetrievalEngine(str(context_dir))
+    assert not stale.load(index_dir)
+    stale.load_or_build(index_dir)
+    assert stale.info()["chunks"] == 3
+    assert stale.fingerprint != engine.fingerprint
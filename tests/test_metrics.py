@@ -0,0 +1,18 @@
+import os
+
+from services.metrics import MetricsRegistry
+
+
+def test_every_series_carries_the_worker_pid():
+    registry = MetricsRegistry()
+    registry.counter("calls_total", "calls", ["kind"]).inc(kind="deep")
+    registry.histogram("phase_seconds", "phases", ["phase"], buckets=(1.0,)).observe(0.5, phase="extract")
+    registry.gauge("in_flight", "in flight").set_function(lambda: 2)
+
+    lines = [line for line in registry.render().splitlines() if not line.startswith("#")]
+    pid = 'pid="{}"'.format(os.getpid())
+
+    assert 'calls_total{{{},kind="deep"}} 1'.format(pid) in lines
+    assert 'phase_seconds_bucket{{{},phase="extract",le="1"}} 1'.format(pid) in lines
+    assert 'in_flight{{{}}} 2'.format(pid) in lines
+    assert all(pid in line for line in lines)
@@ -0,0 +1,70 @@
+from services.near_dedup import NearDuplicateMerger, choose_bands
+
+
+SHORT_A = "يجوز للبنك فرض غرامة تأخير على العميل عند التأخر في السداد وتصرف في وجوه الخير والبر"
+SHORT_B = "يجوز للبنك فرض غرامة تأخير على العميل عند التأخر في السداد وتصرف في وجوه الخير والإحسان"
+OTHER = "لا يجوز اشتراط زيادة على أصل الدين مقابل التأجيل لأنها من ربا النسيئة المحرم شرعا"
+
+
+def _chunk(text, score=0.5, phase="general", clause_id=None):
+    return {
+        "chunk_text": text,
+        "score": score,
+        "uri": "uri-{}".format(phase),
+        "title": "المعيار 8",
+        "sources": [{"phase": phase, "clause_id": clause_id}],
+    }
+
+
+def test_choose_bands_keeps_recall_at_threshold():
+    bands, rows = choose_bands(64, 0.8)
+
+    assert bands * rows <= 64
+    assert 1 - (1 - 0.8 ** rows) ** bands >= 0.99
+
+
+def test_short_chunks_differing_by_one_word_are_merged():
+    merger = NearDuplicateMerger(threshold=0.8)
+    assert merger.similarity(merger.shingles(SHORT_A), merger.shingles(SHORT_B)) >= 0.8
+
+    merged = merger.merge([_chunk(SHORT_A, 0.4, "general"), _chunk(SHORT_B, 0.9, "sensitive", "clause_1")])
+
+    assert len(merged) == 1
+    assert merged[0]["chunk_text"] == SHORT_B
+    assert merged[0]["score"] == 0.9
+    assert merged[0]["sources"] == [
+        {"phase": "general", "clause_id": None},
+        {"phase": "sensitive", "clause_id": "clause_1"},
+    ]
+
+
+def test_different_chunks_are_kept():
+    merged = NearDuplicateMerger(threshold=0.8).merge([_chunk(SHORT_A), _chunk(OTHER)])
+
+    assert [chunk["chunk_text"] for chunk in merged] == [SHORT_A, OTHER]
+
+
+def test_exact_duplicates_merge_when_near_dedup_disabled():
+    merger = NearDuplicateMerger(threshold=1.0)
+    merged = merger.merge([_chunk(SHORT_A, phase="general"), _chunk(SHORT_A, phase="sensitive"), _chunk(SHORT_B)])
+
+    assert len(merged) == 2
+    assert len(merged[0]["sources"]) == 2
+
+
+def test_group_does_not_drift_through_chained_members():
+    # كل نص يختلف عن سابقه بكلمة، لكن الأخير بعيد عن الأول: لا يُدمج عبر السلسلة
+    words = SHORT_A.split()
+    replacements = ["المصرف", "يحق", "إلزام", "بدفع", "مبلغ", "إضافي", "حال", "المماطلة"]
+    chain = [SHORT_A]
+    for idx, word in enumerate(replacements):
+        words[idx] = word
+        chain.append(" ".join(words))
+
+    merger = NearDuplicateMerger(threshold=0.8)
+    first = merger.shingles(chain[0])
+    merged = merger.merge([_chunk(text) for text in chain])
+
+    assert len(merged) > 1
+    for rep in merged[1:]:
+        assert merger.similarity(first, merger.shingles(rep["chunk_text"])) < 0.8
@@ -0,0 +1,97 @@
+import itertools
+
+import pytest
+
+from services import result_cache
+from services.result_cache import ResultCache
+
+
+@pytest.fixture
+def clock(monkeypatch):
+    now = {"value": 1000.0}
+    ticks = itertools.count()
+
+    def fake_time():
+        return now["value"] + next(ticks) * 0.001
+
+    monkeypatch.setattr(result_cache.time, "time", fake_time)
+    return now
+
+
+def _cache(tmp_path, ttl=0, max_entries=0, max_bytes=0):
+    return ResultCache(str(tmp_path / "cache.sqlite3"), ttl, max_entries, max_bytes)
+
+
+def test_key_ignores_arabic_spelling_and_whitespace_but_not_settings():
+    args = ("gemini-2.5-flash", "store-1", 10, ["prompt"])
+    key = ResultCache.make_key("يجوز  فرض غرامة\nعلى المدين", *args)
+
+    assert ResultCache.make_key("يَجوز فرض غرامه على المدين", *args) == key
+    assert ResultCache.make_key("يجوز فرض غرامة على المدين", "gemini-2.5-pro", "store-1", 10, ["prompt"]) != key
+    assert ResultCache.make_key("يجوز فرض غرامة على المدين", "gemini-2.5-flash", "store-1", 10, ["prompt 2"]) != key
+
+
+def test_key_changes_with_result_settings():
+    args = ("يجوز فرض غرامة على المدين", "gemini-2.5-flash", "store-1", 10, ["prompt"])
+    settings = {"deep_search_max_clauses": 0, "near_dup_threshold": 0.8}
+    key = ResultCache.make_key(*args, settings)
+
+    assert ResultCache.make_key(*args, dict(reversed(list(settings.items())))) == key
+    assert ResultCache.make_key(*args, dict(settings, deep_search_max_clauses=6)) != key
+    assert ResultCache.make_key(*args, dict(settings, near_dup_threshold=1.0)) != key
+
+
+def test_roundtrip_and_hit_rate(tmp_path, clock):
+    cache = _cache(tmp_path)
+    assert cache.get("k") is None
+
+    cache.set("k", [{"chunk_text": "نص"}], [{"term_id": "clause_1"}])
+
+    assert cache.get("k") == ([{"chunk_text": "نص"}], [{"term_id": "clause_1"}])
+    stats = cache.stats()
+    assert (stats["entries"], stats["hits"], stats["misses"], stats["hit_rate"]) == (1, 1, 1, 0.5)
+
+
+def test_expired_entry_is_a_miss(tmp_path, clock):
+    cache = _cache(tmp_path, ttl=60)
+    cache.set("k", [], [])
+
+    clock["value"] += 61
+
+    assert cache.get("k") is None
+    assert cache.stats()["entries"] == 0
+
+
+def test_least_recently_used_entry_is_evicted(tmp_path, clock):
+    cache = _cache(tmp_path, max_entries=2)
+    cache.set("a", [], [])
+    cache.set("b", [], [])
+    cache.get("a")
+
+    cache.set("c", [], [])
+
+    assert cache.get("b") is None
+    assert cache.get("a") is not None
+    assert cache.get("c") is not None
+    assert cache.stats()["evictions"] == 1
+
+
+def test_byte_limit_evicts_oldest(tmp_path, clock):
+    cache = _cache(tmp_path, max_bytes=200)
+    cache.set("a", [{"chunk_text": "x" * 100}], [])
+    cache.set("b", [{"chunk_text": "y" * 100}], [])
+
+    assert cache.get("a") is None
+    assert cache.stats()["bytes"] <= 200
+
+
+def test_counters_are_shared_between_processes_using_the_same_file(tmp_path, clock):
+    first = _cache(tmp_path)
+    second = _cache(tmp_path)
+    first.set("k", [], [])
+
+    first.get("k")
+    second.get("k")
+    second.get("missing")
+
+    assert (first.stats()["hits"], first.stats()["misses"]) == (2, 1)
@@ -0,0 +1,74 @@
+import json
+
+from services import history_index
+from services.results_store import ResultsStore
+
+
+def _result(idx, partial=False):
+    return {
+        "extracted_terms": [{"term_id": "clause_{}".format(idx), "term_text": "غرامة تأخير رقم {}".format(idx)}],
+        "chunks": [{"chunk_text": "المعيار الشرعي رقم {}".format(idx)}],
+        "top_k": 10,
+        "partial": partial
+    }
+
+
+def test_list_pages_newest_first(tmp_path):
+    store = ResultsStore(str(tmp_path / "history.sqlite3"))
+    for idx in range(5):
+        store.save(_result(idx, partial=idx == 4), "عقد {}".format(idx), analysis_id="a{}".format(idx),
+                   created_at=1000.0 + idx)
+
+    first = store.list(limit=2)
+    second = store.list(limit=2, offset=first["next_offset"])
+    last = store.list(limit=2, offset=second["next_offset"])
+
+    assert [item["analysis_id"] for item in first["items"]] == ["a4", "a3"]
+    assert [item["analysis_id"] for item in second["items"]] == ["a2", "a1"]
+    assert [item["analysis_id"] for item in last["items"]] == ["a0"]
+    assert (first["total"], last["next_offset"]) == (5, None)
+    assert first["items"][0]["partial"] is True
+    assert first["items"][0]["term_ids"] == ["clause_4"]
+    assert "chunks" not in first["items"][0]
+
+
+def test_get_returns_full_payload_with_summary(tmp_path):
+    store = ResultsStore(str(tmp_path / "history.sqlite3"))
+    summary = store.save(_result(1), "نص العقد", source="job")
+
+    result = store.get(summary["analysis_id"])
+
+    assert result["chunks"] == [{"chunk_text": "المعيار الشرعي رقم 1"}]
+    assert result["contract_text"] == "نص العقد"
+    assert result["source"] == "job"
+    assert store.get("missing") is None
+
+
+def test_import_json_dir_is_idempotent(tmp_path):
+    results_dir = tmp_path / "results"
+    results_dir.mkdir()
+    for idx, timestamp in enumerate(["20251124_132515", "20251125_094833"]):
+        data = dict(_result(idx), timestamp=timestamp, contract_length=1200)
+        (results_dir / "analysis_{}.json".format(timestamp)).write_text(json.dumps(data, ensure_ascii=False), "utf-8")
+    (results_dir / "analysis_broken.json").write_text("{", "utf-8")
+
+    store = ResultsStore(str(tmp_path / "history.sqlite3"))
+
+    assert store.import_json_dir(str(results_dir)) == 2
+    assert store.import_json_dir(str(results_dir)) == 0
+    assert store.count() == 2
+    item = store.list()["items"][0]
+    assert (item["analysis_id"], item["source"], item["contract_length"]) == ("analysis_20251125_094833", "import", 1200)
+
+
+def test_normalizer_bump_reindexes_saved_analyses(tmp_path, monkeypatch):
+    db_path = str(tmp_path / "history.sqlite3")
+    ResultsStore(db_path).save(_result(1), "عقد", analysis_id="a")
+    old_version = history_index.HistoryIndex.version()
+
+    monkeypatch.setattr(history_index, "NORMALIZER_VERSION", history_index.NORMALIZER_VERSION + 1)
+    store = ResultsStore(db_path)
+
+    assert store._index.stale_ids() == []
+    assert store._index.stats()["version"] != old_version
+    assert [hit["analysis_id"] for hit in store.search("غرامة")["items"]] == ["a"]
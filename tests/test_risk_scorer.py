@@ -0,0 +1,54 @@
+import pytest
+
+from services.risk_scorer import CATEGORY_WEIGHTS, ClauseRiskScorer
+
+
+@pytest.mark.parametrize("term_text", [
+    "نسبة 2 في المائة",
+    "نسبة 2 بالمئة",
+    "نسبة 0.5%",
+])
+def test_percentage_bonus(term_text):
+    assert ClauseRiskScorer().score({"term_text": term_text}) == 0.5
+
+
+@pytest.mark.parametrize("term_text", [
+    "فائدة 500",
+    "غرامة تأخير قدرها 100 ريال",
+    "يدفع العميل 50 ريالاً يومياً",
+])
+def test_penalty_bonus(term_text):
+    assert ClauseRiskScorer().score({"term_text": term_text}) == 0.5
+
+
+def test_percentage_and_penalty_add_up():
+    clause = {"term_text": "زيادة 2 في المائة عن كل يوم تأخير"}
+    assert ClauseRiskScorer().score(clause) == 1.0
+
+
+@pytest.mark.parametrize("issue, category", [
+    ("الربا", "riba"),
+    ("ربا النسيئة", "riba"),
+    ("فائدة التأخير", "riba"),
+    ("غرر فاحش", "gharar"),
+    ("الشرط الجزائي", "unjust_condition"),
+    ("شرط جزائي", "unjust_condition"),
+    ("مخالفة إجرائية", "general"),
+])
+def test_issue_category(issue, category):
+    assert ClauseRiskScorer().score({"potential_issues": [issue]}) == CATEGORY_WEIGHTS[category]
+
+
+def test_extra_issues_add_to_the_worst_category():
+    clause = {"potential_issues": ["ربا النسيئة", "الغرر", "الجهالة", ""]}
+    assert ClauseRiskScorer().score(clause) == pytest.approx(1.0 + 2 * 0.15)
+
+
+def test_rank_is_descending_and_stable():
+    clauses = [
+        {"term_id": "a", "potential_issues": ["مخالفة"]},
+        {"term_id": "b", "potential_issues": ["ربا النسيئة"], "term_text": "فائدة 2%"},
+        {"term_id": "c", "potential_issues": ["ملاحظة"]},
+    ]
+    ranked = ClauseRiskScorer().rank(clauses)
+    assert [clause["term_id"] for clause, _ in ranked] == ["b", "a", "c"]
@@ -0,0 +1,75 @@
+from services.term_schema import ExtractedTerm, TermValidator, build_terms_schema, merge_terms, parse_terms_json
+
+
+LONG_CLAUSE = "يلتزم المشتري بسداد الأقساط في مواعيدها وفي حالة التأخير يدفع غرامة قدرها 2% عن كل شهر"
+
+
+def test_schema_requires_the_prompt_fields():
+    schema = build_terms_schema()
+
+    assert schema.items.required == ["term_id", "term_text", "potential_issues"]
+    assert list(schema.items.properties) == ["term_id", "term_text", "potential_issues", "relevance_reason"]
+
+
+def test_from_raw_repairs_types_and_rejects_empty_text():
+    term = ExtractedTerm.from_raw(
+        {"term_id": "late fee!", "term_text": ["غرامة", "تأخير"], "potential_issues": "الربا، الغرر, الربا"}, 0
+    )
+
+    assert term.to_dict() == {
+        "term_id": "late_fee",
+        "term_text": "غرامة تأخير",
+        "potential_issues": ["الربا", "الغرر"],
+        "relevance_reason": ""
+    }
+    assert ExtractedTerm.from_raw({"term_id": "x", "term_text": "  "}) is None
+    assert ExtractedTerm.from_raw("نص") is None
+    assert ExtractedTerm.from_raw({"term_text": "بند"}, 4).term_id == "clause_5"
+
+
+def test_validator_drops_duplicates_and_suffixes_ids():
+    validator = TermValidator()
+    accepted = [
+        validator.accept({"term_id": "clause_1", "term_text": "فائدة التأخير"}),
+        validator.accept({"term_id": "clause_1", "term_text": "فائدة  التأخير"}),
+        validator.accept({"term_id": "clause_1", "term_text": "الشرط الجزائي"}),
+        validator.accept({"term_id": "clause_2"})
+    ]
+
+    assert [term and term["term_id"] for term in accepted] == ["clause_1", None, "clause_1_2", None]
+    assert (validator.rejected_duplicates, validator.rejected_empty, validator.rejected) == (1, 1, 2)
+
+
+def test_parse_terms_json_repairs_wrapped_and_truncated_responses():
+    assert parse_terms_json('[{"term_text": "أ"}]') == ([{"term_text": "أ"}], False)
+    assert parse_terms_json('{"terms": [{"term_text": "أ"}]}') == ([{"term_text": "أ"}], True)
+
+    terms, repaired = parse_terms_json('```json\n[{"term_text": "أ"}, {"term_text": "ب"}, {"term_te')
+    assert repaired
+    assert terms == [{"term_text": "أ"}, {"term_text": "ب"}]
+
+
+def test_merge_terms_keeps_longest_overlap_copy_and_unions_issues():
+    first_window = [
+        {"term_id": "clause_1", "term_text": "مدة العقد سنة", "potential_issues": []},
+        {"term_id": "clause_2", "term_text": LONG_CLAUSE[:50], "potential_issues": ["الربا"]}
+    ]
+    second_window = [
+        {"term_id": "clause_1", "term_text": LONG_CLAUSE, "potential_issues": ["فائدة التأخير", "الربا"]},
+        {"term_id": "clause_2", "term_text": "يحق للبائع فسخ العقد", "potential_issues": ["الشرط الجائر"]}
+    ]
+
+    merged = merge_terms([first_window, second_window])
+
+    assert [term["term_text"] for term in merged] == ["مدة العقد سنة", LONG_CLAUSE, "يحق للبائع فسخ العقد"]
+    assert merged[1]["potential_issues"] == ["الربا", "فائدة التأخير"]
+    assert len({term["term_id"] for term in merged}) == 3
+
+
+def test_merge_terms_does_not_fold_short_shared_phrases():
+    merged = merge_terms([
+        [{"term_text": "الثمن", "potential_issues": []}],
+        [{"term_text": "يدفع الثمن نقداً عند التوقيع", "potential_issues": []}]
+    ])
+
+    assert len(merged) == 2
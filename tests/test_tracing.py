@@ -0,0 +1,24 @@
+from services import tracing
+from services.tracing import span, start_trace
+
+
+def test_spans_are_collected_without_trace_lines(capsys):
+    with start_trace("search_chunks") as trace:
+        with span("deep_search", clause_id="clause_1") as s:
+            s.set(chunks=2)
+
+    spans = trace.to_list()
+    assert [item["name"] for item in spans] == ["deep_search"]
+    assert spans[0]["attributes"] == {"clause_id": "clause_1", "chunks": 2}
+    assert "[TRACE]" not in capsys.readouterr().out
+
+
+def test_trace_log_prints_each_span(capsys):
+    tracing.set_trace_log(True)
+    try:
+        with span("merge", chunks=3):
+            pass
+    finally:
+        tracing.set_trace_log(False)
+
+    assert "[TRACE] merge" in capsys.readouterr().out
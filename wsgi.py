@@ -0,0 +1,11 @@
+"""
+WSGI entry point للتشغيل الإنتاجي عبر gunicorn:
+
+    gunicorn -c gunicorn.conf.py wsgi:app
+
+الاستيراد هنا لا يهيئ شيئاً: التهيئة (التحقق من الـ Store، الـ clients، الـ executors) تتم داخل كل worker
+بعد الـ fork من hook الـ post_worker_init في gunicorn.conf.py
+"""
+from app import app
+
+application = app